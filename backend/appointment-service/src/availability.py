@@ -0,0 +1,326 @@
+"""
+Slot availability index: who is free when, at which facility.
+
+Time is cut into fixed slots (15 minutes by default), so a clinician's day at
+a facility is two bitmasks in Python ints: the slots they are open (their
+sessions) and the slots of those still free. A day of 15-minute slots is 96
+bits. Whether 09:00-09:45 is free is one AND; the first run of k free slots
+from slot s is a handful of shifts and ANDs and a lowest-set-bit; booking
+and cancelling flip bits. An interval tree would answer the same questions
+in O(log n) per clinician and day; on a fixed grid the masks do it in a few
+machine words.
+
+Each facility also keeps, per day, the OR of its clinicians' free masks. A
+day where that has no run of k slots has none for any clinician, so a search
+("the next free 30 minutes at any CMA in the Centre-Nord") skips it without
+looking at them, and stops at the first day that has one.
+
+A clinician works at one facility at a time: sessions that overlap one they
+already have, at any facility, are refused, so a slot free at one facility
+is never booked through another.
+
+The index is not thread-safe and never awaits: each call is atomic on the
+event loop, which is what keeps two concurrent bookings of one slot from
+both succeeding within a worker. Past days can no longer be booked; prune()
+forgets them.
+"""
+
+from bisect import bisect_left, insort
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Dict, Iterable, Iterator, List, NamedTuple, Optional, Set, Tuple
+
+DEFAULT_SLOT_MINUTES = 15
+
+
+class InvalidSlot(ValueError):
+    """Times off the slot grid, across midnight, or in the wrong order"""
+
+
+class SlotUnavailable(Exception):
+    """The slots are taken, or outside / overlapping a clinician's sessions"""
+
+
+class Slot(NamedTuple):
+    facility_id: str
+    clinician_id: str
+    start: datetime
+    end: datetime
+
+
+def _runs(mask: int, k: int) -> int:
+    """Bit i set iff bits i .. i+k-1 of mask all are"""
+    have = 1
+    while have < k:
+        step = min(have, k - have)
+        mask &= mask >> step
+        have += step
+    return mask
+
+
+def _lowest(mask: int) -> int:
+    return (mask & -mask).bit_length() - 1
+
+
+def utc(moment: datetime) -> datetime:
+    """Aware UTC; naive times are taken as UTC (Burkina Faso's time zone)"""
+    if moment.tzinfo is None:
+        return moment.replace(tzinfo=timezone.utc)
+    return moment.astimezone(timezone.utc)
+
+
+class AvailabilityIndex:
+    def __init__(self, slot_minutes: int = DEFAULT_SLOT_MINUTES) -> None:
+        if slot_minutes <= 0 or 1440 % slot_minutes:
+            raise ValueError("slot_minutes must divide a day")
+        self.slot_minutes = slot_minutes
+        self.slots_per_day = 1440 // slot_minutes
+        # facility -> day (ordinal) -> clinician -> mask
+        self._open: Dict[str, Dict[int, Dict[str, int]]] = {}
+        self._free: Dict[str, Dict[int, Dict[str, int]]] = {}
+        # facility -> day -> OR of its clinicians' free masks
+        self._summary: Dict[str, Dict[int, int]] = {}
+        # facility -> its days with sessions, sorted
+        self._days: Dict[str, List[int]] = {}
+        # clinician -> day -> open slots at any facility; clinician -> facilities
+        self._clinician_open: Dict[str, Dict[int, int]] = {}
+        self._clinician_facilities: Dict[str, Set[str]] = {}
+
+    # --- time <-> slots -----------------------------------------------------
+
+    def span(self, start: datetime, end: datetime) -> Tuple[int, int]:
+        """(day, mask) of the slots from start to end, both on the grid and
+        on the same day"""
+        start, end = utc(start), utc(end)
+        if end <= start:
+            raise InvalidSlot("end must be after start")
+        day = start.date().toordinal()
+        first, rest = divmod(start.hour * 60 + start.minute, self.slot_minutes)
+        minutes, seconds = divmod((end - start).total_seconds(), 60)
+        count, extra = divmod(int(minutes), self.slot_minutes)
+        if rest or extra or seconds or start.second or start.microsecond:
+            raise InvalidSlot(f"times must be on the {self.slot_minutes}-minute grid")
+        if first + count > self.slots_per_day:
+            raise InvalidSlot("a session or appointment cannot cross midnight")
+        return day, ((1 << count) - 1) << first
+
+    def slots(self, minutes: int) -> int:
+        count, extra = divmod(minutes, self.slot_minutes)
+        if extra or count < 1:
+            raise InvalidSlot(f"durations are multiples of {self.slot_minutes} minutes")
+        return count
+
+    def moment(self, day: int, slot: int) -> datetime:
+        midnight = datetime.combine(date.fromordinal(day), time(), tzinfo=timezone.utc)
+        return midnight + timedelta(minutes=slot * self.slot_minutes)
+
+    def _first_slot(self, not_before: datetime) -> Tuple[int, int]:
+        """First (day, slot) starting at or after not_before"""
+        not_before = utc(not_before)
+        minutes = not_before.hour * 60 + not_before.minute
+        slot = -(-minutes // self.slot_minutes)
+        if slot * self.slot_minutes == minutes and (not_before.second or not_before.microsecond):
+            slot += 1
+        day = not_before.date().toordinal()
+        if slot >= self.slots_per_day:
+            return day + 1, 0
+        return day, slot
+
+    # --- sessions -----------------------------------------------------------
+
+    def open(self, facility_id: str, clinician_id: str, start: datetime, end: datetime) -> None:
+        """Add a session: the clinician is available there from start to end"""
+        day, bits = self.span(start, end)
+        busy = self._clinician_open.get(clinician_id, {}).get(day, 0)
+        if busy & bits:
+            raise SlotUnavailable(f"{clinician_id} already has a session overlapping these times")
+        self._clinician_open.setdefault(clinician_id, {})[day] = busy | bits
+        self._clinician_facilities.setdefault(clinician_id, set()).add(facility_id)
+        opened = self._open.setdefault(facility_id, {}).setdefault(day, {})
+        opened[clinician_id] = opened.get(clinician_id, 0) | bits
+        free = self._free.setdefault(facility_id, {}).setdefault(day, {})
+        free[clinician_id] = free.get(clinician_id, 0) | bits
+        days = self._days.setdefault(facility_id, [])
+        if day not in self._summary.setdefault(facility_id, {}):
+            insort(days, day)
+        self._summary[facility_id][day] = self._summary[facility_id].get(day, 0) | bits
+
+    def close(self, facility_id: str, clinician_id: str, start: datetime, end: datetime,
+              force: bool = False) -> None:
+        """Remove a session; refused while it has bookings unless force"""
+        day, bits = self.span(start, end)
+        opened = self._open.get(facility_id, {}).get(day, {})
+        free = self._free.get(facility_id, {}).get(day, {})
+        own = opened.get(clinician_id, 0) & bits
+        if not force and own & ~free.get(clinician_id, 0):
+            raise SlotUnavailable("the session has booked appointments")
+        if not own:
+            return
+        opened[clinician_id] &= ~own
+        free[clinician_id] &= ~own
+        self._clinician_open[clinician_id][day] &= ~own
+        if not opened[clinician_id]:
+            del opened[clinician_id], free[clinician_id]
+        if not self._clinician_open[clinician_id][day]:
+            del self._clinician_open[clinician_id][day]
+        self._resummarize(facility_id, day)
+
+    def _resummarize(self, facility_id: str, day: int) -> None:
+        free = self._free[facility_id].get(day)
+        if free:
+            summary = 0
+            for mask in free.values():
+                summary |= mask
+            self._summary[facility_id][day] = summary
+            return
+        # No clinician left there that day
+        self._open[facility_id].pop(day, None)
+        self._free[facility_id].pop(day, None)
+        self._summary[facility_id].pop(day, None)
+        days = self._days[facility_id]
+        del days[bisect_left(days, day)]
+
+    # --- bookings -----------------------------------------------------------
+
+    def is_free(self, facility_id: str, clinician_id: str, start: datetime, end: datetime) -> bool:
+        day, bits = self.span(start, end)
+        return self._free.get(facility_id, {}).get(day, {}).get(clinician_id, 0) & bits == bits
+
+    def book(self, facility_id: str, clinician_id: str, start: datetime, end: datetime) -> bool:
+        """Take the slots if they are all free; False (nothing taken) if not"""
+        day, bits = self.span(start, end)
+        free = self._free.get(facility_id, {}).get(day)
+        if free is None or free.get(clinician_id, 0) & bits != bits:
+            return False
+        free[clinician_id] &= ~bits
+        self._resummarize(facility_id, day)
+        return True
+
+    def take(self, facility_id: str, clinician_id: str, start: datetime, end: datetime) -> None:
+        """Mark the slots booked whatever their state (a booking made elsewhere)"""
+        day, bits = self.span(start, end)
+        free = self._free.get(facility_id, {}).get(day)
+        if free is not None and clinician_id in free:
+            free[clinician_id] &= ~bits
+            self._resummarize(facility_id, day)
+
+    def release(self, facility_id: str, clinician_id: str, start: datetime, end: datetime) -> None:
+        """Free the slots of a cancelled booking (those still in a session)"""
+        day, bits = self.span(start, end)
+        free = self._free.get(facility_id, {}).get(day)
+        if free is None or clinician_id not in free:
+            return
+        free[clinician_id] |= bits & self._open[facility_id][day][clinician_id]
+        self._summary[facility_id][day] |= free[clinician_id]
+
+    # --- search ---------------------------------------------------------------
+
+    def facilities_of(self, clinician_id: str) -> Set[str]:
+        return set(self._clinician_facilities.get(clinician_id, ()))
+
+    def _first_in_day(self, facility_id: str, day: int, k: int, floor: int, last: int,
+                      clinician_id: Optional[str]) -> Optional[Tuple[int, str]]:
+        """Earliest (slot, clinician) with k free slots starting from slot
+        floor to slot last"""
+        runs = _runs(self._summary[facility_id][day], k) >> floor
+        if not runs or _lowest(runs) + floor > last:
+            return None
+        free = self._free[facility_id][day]
+        if clinician_id is None and len(free) == 1:
+            # The summary is that clinician's mask
+            return _lowest(runs) + floor, next(iter(free))
+        if clinician_id is not None:
+            candidates: Iterable[Tuple[str, int]] = ((clinician_id, free.get(clinician_id, 0)),)
+        else:
+            candidates = sorted(free.items())
+        best: Optional[Tuple[int, str]] = None
+        for clinician, mask in candidates:
+            runs = _runs(mask, k) >> floor
+            if runs:
+                slot = _lowest(runs) + floor
+                if slot <= last and (best is None or slot < best[0]):
+                    best = (slot, clinician)
+        return best
+
+    def first_free(self, facility_ids: Iterable[str], minutes: int, not_before: datetime,
+                   clinician_id: Optional[str] = None, horizon_days: int = 60) -> Optional[Slot]:
+        """The earliest minutes-long free slot at any of the facilities (with
+        clinician_id, that clinician's), starting at or after not_before and
+        within horizon_days; ties go to the lowest facility, then clinician, id"""
+        k = self.slots(minutes)
+        first_day, first_slot = self._first_slot(not_before)
+        last_day = first_day + horizon_days
+        best: Optional[Tuple[int, int, str, str]] = None
+        for facility_id in sorted(set(facility_ids)):
+            days = self._days.get(facility_id)
+            if not days:
+                continue
+            for i in range(bisect_left(days, first_day), len(days)):
+                day = days[i]
+                if day > last_day or (best is not None and day > best[0]):
+                    break
+                # Facilities come in id order: on the best day so far, only
+                # an earlier slot beats it
+                last = best[1] - 1 if best is not None and day == best[0] else self.slots_per_day
+                found = self._first_in_day(
+                    facility_id, day, k, first_slot if day == first_day else 0, last, clinician_id
+                )
+                if found is not None:
+                    best = (day, found[0], facility_id, found[1])
+                    break
+                if best is not None and day == best[0]:
+                    break
+        if best is None:
+            return None
+        day, slot, facility_id, clinician = best
+        return Slot(facility_id, clinician, self.moment(day, slot), self.moment(day, slot + k))
+
+    def free_in_day(self, facility_id: str, day: date, minutes: int,
+                    clinician_id: Optional[str] = None) -> Iterator[Slot]:
+        """Every bookable minutes-long slot at a facility on a day, by start
+        time (a slot may start wherever k free slots follow)"""
+        k = self.slots(minutes)
+        ordinal = day.toordinal()
+        free = self._free.get(facility_id, {}).get(ordinal, {})
+        found = []
+        for clinician, mask in free.items():
+            if clinician_id is not None and clinician != clinician_id:
+                continue
+            runs = _runs(mask, k)
+            while runs:
+                slot = _lowest(runs)
+                runs &= runs - 1
+                found.append((slot, clinician))
+        for slot, clinician in sorted(found):
+            yield Slot(facility_id, clinician,
+                       self.moment(ordinal, slot), self.moment(ordinal, slot + k))
+
+    def prune(self, before: date) -> int:
+        """Forget every day before this one; returns the facility-days dropped"""
+        cutoff = before.toordinal()
+        dropped = 0
+        for facility_id in list(self._days):
+            days = self._days[facility_id]
+            n = bisect_left(days, cutoff)
+            for day in days[:n]:
+                del self._open[facility_id][day], self._free[facility_id][day]
+                del self._summary[facility_id][day]
+            del days[:n]
+            dropped += n
+            if not days:
+                del self._days[facility_id], self._summary[facility_id]
+                del self._open[facility_id], self._free[facility_id]
+        for clinician_id in list(self._clinician_open):
+            by_day = self._clinician_open[clinician_id]
+            for day in [d for d in by_day if d < cutoff]:
+                del by_day[day]
+            if not by_day:
+                del self._clinician_open[clinician_id]
+                self._clinician_facilities.pop(clinician_id, None)
+        return dropped
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "facilities": len(self._days),
+            "clinicians": len(self._clinician_open),
+            "clinician_days": sum(len(days) for days in self._clinician_open.values()),
+        }
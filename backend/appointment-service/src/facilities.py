@@ -0,0 +1,128 @@
+"""
+Facilities as the registry lists them, for resolving ids and regions.
+
+Bookings name registry facilities (by id or short code), and "next free slot
+at any CMA in the Centre-Nord" needs the facilities of a region and type.
+FacilityDirectory keeps the registry's GET /facilities in memory and
+re-fetches it in the background with If-None-Match, so an unchanged registry
+costs a 304 per interval. Selections are kept until the next load: there are
+only as many as regions times types, and searches ask for the same few.
+"""
+
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+import asyncio
+import logging
+import time
+
+import httpx
+
+from danaya_shared.logs import forward_request_id
+
+logger = logging.getLogger(__name__)
+
+
+class Facility(NamedTuple):
+    id: str
+    short_code: str
+    name: str
+    type: str
+    region_id: str
+    region_name: str
+    status: str
+
+
+class FacilityDirectory:
+    def __init__(self, registry_url: str, refresh_interval: float = 300.0,
+                 timeout: float = 3.0) -> None:
+        self.url = registry_url.rstrip("/") + "/facilities"
+        self._refresh_interval = refresh_interval
+        self._timeout = timeout
+        self._by_key: Dict[str, Facility] = {}
+        self._facilities: List[Facility] = []
+        self._selections: Dict[Tuple[Optional[str], Optional[str]], List[Facility]] = {}
+        self._etag: Optional[str] = None
+        self.loaded_at: Optional[float] = None
+        self._lock = asyncio.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._facilities)
+
+    def load(self, facilities: Iterable[Dict[str, Any]]) -> None:
+        loaded = [
+            Facility(*(str(f.get(name) or "") for name in Facility._fields)) for f in facilities
+        ]
+        by_key = {}
+        for facility in loaded:
+            by_key[facility.id] = by_key[facility.short_code] = facility
+        self._facilities, self._by_key, self._selections = loaded, by_key, {}
+        self.loaded_at = time.time()
+
+    def get(self, key: str) -> Optional[Facility]:
+        """By registry id or short code"""
+        return self._by_key.get(key)
+
+    def select(self, region: Optional[str] = None, type: Optional[str] = None) -> List[Facility]:
+        """Active facilities in a region (id or name, any case) of a type"""
+        key = (region.lower() if region else None, type.lower() if type else None)
+        selected = self._selections.get(key)
+        if selected is None:
+            region, type = key
+            selected = [
+                f for f in self._facilities
+                if f.status == "active"
+                and (region is None or region in (f.region_id.lower(), f.region_name.lower()))
+                and (type is None or f.type.lower() == type)
+            ]
+            # Unknown names select nothing and are not kept
+            if selected:
+                self._selections[key] = selected
+        return selected
+
+    async def refresh(self) -> bool:
+        """Fetch the facilities if they changed. True if (re)loaded"""
+        async with self._lock:
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    timeout=self._timeout, event_hooks={"request": [forward_request_id]}
+                )
+            headers = {"If-None-Match": self._etag} if self._etag and self._facilities else {}
+            try:
+                response = await self._client.get(self.url, headers=headers)
+                if response.status_code == 304:
+                    return False
+                response.raise_for_status()
+                self.load(response.json())
+                self._etag = response.headers.get("etag")
+                logger.info(
+                    f"Loaded {len(self)} facilities from the registry",
+                    extra={"event": "facilities_loaded", "facilities": len(self)},
+                )
+                return True
+            except Exception as e:
+                logger.warning(f"Could not load facilities from {self.url}: {e}")
+                return False
+
+    async def start(self) -> None:
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            await self.refresh()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+    async def ping(self) -> dict:
+        # Facilities missing since startup (the registry was down) are fetched again here
+        if not self._facilities:
+            await self.refresh()
+        if not self._facilities:
+            raise RuntimeError(f"No facilities from {self.url}")
+        return {"facilities": len(self)}
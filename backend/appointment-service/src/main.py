@@ -0,0 +1,457 @@
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.middleware.cors import CORSMiddleware
+from contextlib import asynccontextmanager
+from typing import List, Optional
+from datetime import date, datetime, time, timedelta, timezone
+import hashlib
+import logging
+import os
+
+from danaya_shared import logs
+from danaya_shared.health import HealthChecks
+from danaya_shared.jwks import JWKSTokenVerifier, KeySet
+from danaya_shared.logs import RequestContextMiddleware, setup_logging
+from danaya_shared.metrics import LOG_RECORDS_DROPPED, MetricsMiddleware, MetricsPublisher
+from danaya_shared.middleware import TokenAuthMiddleware
+from danaya_shared.responses import JSONResponse, ModelResponse
+from danaya_shared.revocation import RedisRevocations, RevocationList
+
+from .availability import DEFAULT_SLOT_MINUTES, InvalidSlot, SlotUnavailable, utc
+from .facilities import FacilityDirectory
+from .models import (
+    Appointment, AppointmentCreate, NextAppointment, Session, SessionCreate, Slot,
+    generate_appointment_id, generate_session_id,
+)
+from .repository import AppointmentRepository, create_repository
+
+setup_logging("appointment-service")
+logger = logging.getLogger(__name__)
+
+# Tokens are verified locally against auth-service's published keys
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() not in ("0", "false", "no")
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "http://localhost:8001/.well-known/jwks.json")
+REDIS_URL = os.getenv("REDIS_URL")
+# Facilities (ids, regions, types) come from the registry
+REGISTRY_URL = os.getenv("REGISTRY_URL", "http://localhost:8003")
+REGISTRY_REFRESH_INTERVAL = float(os.getenv("REGISTRY_REFRESH_INTERVAL", "300"))
+# Sessions and appointments start and end on this grid
+SLOT_MINUTES = int(os.getenv("SLOT_MINUTES", str(DEFAULT_SLOT_MINUTES)))
+# How far ahead next-slot searches look
+APPOINTMENT_HORIZON_DAYS = int(os.getenv("APPOINTMENT_HORIZON_DAYS", "60"))
+# Seconds between copies of cache counters and sizes into /metrics
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+# Demo clinician sessions at startup; by default only with the in-memory store
+APPOINTMENT_DEMO_DATA = os.getenv("APPOINTMENT_DEMO_DATA")
+
+signing_keys = KeySet(AUTH_JWKS_URL)
+revocations = RevocationList()
+revocation_feed = RedisRevocations(REDIS_URL, revocations)
+token_verifier = JWKSTokenVerifier(signing_keys, revocations=revocations)
+facilities = FacilityDirectory(REGISTRY_URL, refresh_interval=REGISTRY_REFRESH_INTERVAL)
+metrics = MetricsPublisher(METRICS_INTERVAL)
+health = HealthChecks.from_env("danaya-appointment-service", "0.1.0")
+
+async def check_signing_keys() -> dict:
+    # Keys missing since startup (auth-service was down) are fetched again here
+    if not len(signing_keys):
+        await signing_keys.refresh(force=True)
+    if not len(signing_keys):
+        raise RuntimeError(f"No token signing keys from {AUTH_JWKS_URL}")
+    return {"keys": len(signing_keys)}
+
+def demo_sessions(today: date) -> List[Session]:
+    """Weekday sessions over the next two weeks for the demo clinicians, with
+    ids derived from what they are (seeding them again adds nothing)"""
+    schedule = [
+        # (facility, clinician (auth-service user id), from, to)
+        ("BF-CHU-YALG", "USR001", time(8), time(12)),
+        ("BF-CHU-YALG", "USR002", time(8), time(16)),
+        ("BF-CHU-BOBO", "USR004", time(8), time(12)),
+        ("BF-CMA-KAYA", "USR001", time(14), time(17)),
+        ("BF-CMA-DORI", "USR004", time(14), time(17)),
+    ]
+    created_at = datetime.utcnow().isoformat() + "Z"
+    sessions = []
+    for offset in range(14):
+        day = today + timedelta(days=offset)
+        if day.weekday() >= 5:
+            continue
+        for facility_id, clinician_id, start, end in schedule:
+            begins = datetime.combine(day, start, tzinfo=timezone.utc)
+            key = f"{facility_id}|{clinician_id}|{begins.isoformat()}".encode()
+            sessions.append(Session(
+                session_id="SES-" + hashlib.sha1(key).hexdigest()[:10].upper(),
+                facility_id=facility_id,
+                clinician_id=clinician_id,
+                start=begins,
+                end=datetime.combine(day, end, tzinfo=timezone.utc),
+                created_at=created_at,
+            ))
+    return sessions
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    repository = create_repository(SLOT_MINUTES)
+    if repository.backend == "memory" and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning(
+            "APPOINTMENT_STORE=memory with several workers: each worker keeps its own bookings"
+        )
+    await repository.connect()
+    if not APPOINTMENT_DEMO_DATA:
+        seed = repository.backend == "memory"
+    else:
+        seed = APPOINTMENT_DEMO_DATA.lower() not in ("0", "false", "no")
+    if seed:
+        added = await repository.add_sessions(demo_sessions(datetime.now(timezone.utc).date()))
+        logger.info(f"Added {added} demo sessions",
+                    extra={"event": "demo_sessions", "added": added})
+    app.state.appointments = repository
+    await facilities.start()
+    if AUTH_REQUIRED:
+        await signing_keys.start()
+        await revocation_feed.start()
+    metrics.cache("tokens", lambda: token_verifier.hits, lambda: token_verifier.misses,
+                  lambda: len(token_verifier))
+    metrics.store("appointments", repository.estimated_count)
+    metrics.count(LOG_RECORDS_DROPPED, logs.dropped)
+    await metrics.start()
+    health.add("appointments", repository.ping)
+    # Without facilities no booking can be checked, nor a region searched
+    health.add("facilities", facilities.ping)
+    if AUTH_REQUIRED:
+        health.add("signing_keys", check_signing_keys)
+    if REDIS_URL:
+        health.add("redis", revocation_feed.ping, critical=False)
+    health.started()
+    try:
+        yield
+    finally:
+        health.stopped()
+        await metrics.stop()
+        await facilities.stop()
+        await signing_keys.stop()
+        await revocation_feed.stop()
+        await repository.close()
+
+app = FastAPI(
+    title="DANAYA Appointment Service",
+    description="Clinician sessions and appointment booking across registry facilities.",
+    version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=JSONResponse,
+)
+
+app.add_middleware(
+    TokenAuthMiddleware,
+    verifier=token_verifier,
+    keys=signing_keys,
+    enabled=AUTH_REQUIRED,
+)
+
+# Add CORS (added last so it wraps auth and preflights never need a token)
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["http://localhost:3000", "http://localhost:8001"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
+)
+
+# Outermost: times every request, answers /metrics without a token
+app.add_middleware(MetricsMiddleware, publisher=metrics)
+# Around that: the request id, and the sampled request log
+app.add_middleware(RequestContextMiddleware)
+
+def get_repository(request: Request) -> AppointmentRepository:
+    return request.app.state.appointments
+
+def caller_id(request: Request) -> Optional[str]:
+    """The caller's auth-service user id (the token's uid claim), if any"""
+    claims = getattr(request.state, "claims", None) or {}
+    return claims.get("uid")
+
+def resolve_facility(facility_id: str) -> str:
+    """Registry id for an id or short code; 404 if the registry has no such facility"""
+    facility = facilities.get(facility_id)
+    if facility is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Facility '{facility_id}' not found",
+        )
+    return facility.id
+
+def search_facilities(region: Optional[str], type: Optional[str], facility_id: Optional[str],
+                      clinician_id: Optional[str], repo: AppointmentRepository) -> List[str]:
+    """Facility ids a next-slot search covers"""
+    if facility_id:
+        return [resolve_facility(facility_id)]
+    if region or type:
+        found = [f.id for f in facilities.select(region, type)]
+        if not found:
+            raise HTTPException(
+                status_code=status.HTTP_404_NOT_FOUND,
+                detail=f"No active facilities for region={region!r} type={type!r}",
+            )
+        return found
+    if clinician_id:
+        return sorted(repo.index.facilities_of(clinician_id))
+    raise HTTPException(
+        status_code=status.HTTP_400_BAD_REQUEST,
+        detail="Provide facility_id, region and/or type, or clinician_id",
+    )
+
+def invalid(exc: Exception) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(exc))
+
+def conflict(exc: Exception) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_409_CONFLICT, detail=str(exc))
+
+def not_in_past(not_before: Optional[datetime]) -> datetime:
+    """The later of a requested earliest start and now: no slot in the past is
+    offered or booked"""
+    now = datetime.now(timezone.utc)
+    return max(utc(not_before), now) if not_before else now
+
+@app.get("/")
+async def root(repo: AppointmentRepository = Depends(get_repository)):
+    return {
+        "service": "danaya-appointment-service",
+        "version": "0.1.0",
+        "booked_appointments": await repo.count(),
+        "slot_minutes": SLOT_MINUTES,
+        "docs": "/docs",
+    }
+
+app.include_router(health.router())
+
+@app.get("/health")
+async def health_check(response: Response, repo: AppointmentRepository = Depends(get_repository)):
+    ready, report = await health.ready()
+    response.headers["Cache-Control"] = "no-store"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    return {
+        **report,
+        "store": repo.backend,
+        "availability": repo.index.stats(),
+        "timestamp": datetime.utcnow().isoformat() + "Z",
+    }
+
+@app.get("/facilities/{facility_id}/availability", response_model=List[Slot])
+async def facility_availability(
+    facility_id: str,
+    day: date = Query(..., alias="date", description="YYYY-MM-DD (UTC)"),
+    duration_minutes: int = Query(DEFAULT_SLOT_MINUTES, ge=1, le=1440),
+    clinician_id: Optional[str] = None,
+    repo: AppointmentRepository = Depends(get_repository),
+):
+    """Every bookable slot of that length at a facility on a day, by start time"""
+    facility_id = resolve_facility(facility_id)
+    try:
+        slots = list(repo.index.free_in_day(facility_id, day, duration_minutes, clinician_id))
+    except InvalidSlot as exc:
+        raise invalid(exc)
+    return ModelResponse([Slot(**s._asdict()) for s in slots])
+
+@app.get("/slots/next", response_model=Slot)
+async def next_slot(
+    region: Optional[str] = Query(
+        None, description="Region id or name, e.g. BF-REG-05 or Centre-Nord"
+    ),
+    type: Optional[str] = Query(None, description="Facility type, e.g. CMA"),
+    facility_id: Optional[str] = None,
+    clinician_id: Optional[str] = None,
+    duration_minutes: int = Query(DEFAULT_SLOT_MINUTES, ge=1, le=1440),
+    not_before: Optional[datetime] = Query(None, description="Default (and earliest): now"),
+    repo: AppointmentRepository = Depends(get_repository),
+):
+    """The earliest free slot at any matching facility (e.g. any CMA in a region)"""
+    facility_ids = search_facilities(region, type, facility_id, clinician_id, repo)
+    try:
+        slot = repo.index.first_free(
+            facility_ids, duration_minutes, not_in_past(not_before),
+            clinician_id, APPOINTMENT_HORIZON_DAYS,
+        )
+    except InvalidSlot as exc:
+        raise invalid(exc)
+    if slot is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No free slot within {APPOINTMENT_HORIZON_DAYS} days",
+        )
+    return ModelResponse(Slot(**slot._asdict()))
+
+@app.post("/sessions", response_model=Session, status_code=status.HTTP_201_CREATED)
+async def create_session(payload: SessionCreate, request: Request,
+                         repo: AppointmentRepository = Depends(get_repository)):
+    """Open a clinician's hours at a facility for booking (default: the caller's)"""
+    clinician_id = payload.clinician_id or caller_id(request)
+    if not clinician_id:
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="clinician_id is required (the token carries none)",
+        )
+    session = Session(
+        **payload.model_dump(exclude={"facility_id", "clinician_id"}),
+        session_id=generate_session_id(),
+        facility_id=resolve_facility(payload.facility_id),
+        clinician_id=clinician_id,
+        created_at=datetime.utcnow().isoformat() + "Z",
+    )
+    try:
+        await repo.add_session(session)
+    except InvalidSlot as exc:
+        raise invalid(exc)
+    except SlotUnavailable as exc:
+        raise conflict(exc)
+    logger.info("Session created",
+                extra={"event": "session.create", "session_id": session.session_id})
+    return ModelResponse(session, status_code=status.HTTP_201_CREATED)
+
+@app.get("/sessions", response_model=List[Session])
+async def list_sessions(
+    facility_id: Optional[str] = None,
+    clinician_id: Optional[str] = None,
+    day: Optional[date] = Query(None, alias="date"),
+    limit: int = Query(100, ge=1, le=1000),
+    repo: AppointmentRepository = Depends(get_repository),
+):
+    if facility_id:
+        facility_id = resolve_facility(facility_id)
+    return ModelResponse(await repo.sessions(facility_id, clinician_id, day, limit))
+
+@app.delete("/sessions/{session_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_session(session_id: str, repo: AppointmentRepository = Depends(get_repository)):
+    """Close a session; refused (409) while it has booked appointments"""
+    try:
+        deleted = await repo.delete_session(session_id)
+    except SlotUnavailable as exc:
+        raise conflict(exc)
+    if not deleted:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Session '{session_id}' not found",
+        )
+    logger.info("Session deleted", extra={"event": "session.delete", "session_id": session_id})
+    return None
+
+def new_appointment(facility_id: str, clinician_id: str, start: datetime, end: datetime,
+                    patient_id: str, reason: Optional[str]) -> Appointment:
+    now = datetime.utcnow().isoformat() + "Z"
+    return Appointment(
+        appointment_id=generate_appointment_id(),
+        facility_id=facility_id,
+        clinician_id=clinician_id,
+        start=start,
+        end=end,
+        patient_id=patient_id,
+        reason=reason,
+        status="booked",
+        created_at=now,
+        updated_at=now,
+    )
+
+@app.post("/appointments", response_model=Appointment, status_code=status.HTTP_201_CREATED)
+async def book_appointment(payload: AppointmentCreate,
+                           repo: AppointmentRepository = Depends(get_repository)):
+    """Book a given slot; 409 if it is taken or outside the clinician's sessions"""
+    if payload.start < datetime.now(timezone.utc):
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail="start is in the past",
+        )
+    appointment = new_appointment(
+        resolve_facility(payload.facility_id), payload.clinician_id, payload.start, payload.end,
+        payload.patient_id, payload.reason,
+    )
+    try:
+        await repo.book(appointment)
+    except InvalidSlot as exc:
+        raise invalid(exc)
+    except SlotUnavailable as exc:
+        raise conflict(exc)
+    logger.info("Appointment booked",
+                extra={"event": "appointment.book", "appointment_id": appointment.appointment_id})
+    return ModelResponse(appointment, status_code=status.HTTP_201_CREATED)
+
+@app.post("/appointments/next", response_model=Appointment, status_code=status.HTTP_201_CREATED)
+async def book_next_appointment(payload: NextAppointment,
+                                repo: AppointmentRepository = Depends(get_repository)):
+    """Book the earliest free slot at any matching facility, in one step"""
+    facility_ids = search_facilities(
+        payload.region, payload.type, payload.facility_id, payload.clinician_id, repo
+    )
+    try:
+        appointment = await repo.book_first(
+            facility_ids, payload.duration_minutes, not_in_past(payload.not_before),
+            lambda slot: new_appointment(
+                slot.facility_id, slot.clinician_id, slot.start, slot.end,
+                payload.patient_id, payload.reason,
+            ),
+            payload.clinician_id, APPOINTMENT_HORIZON_DAYS,
+        )
+    except InvalidSlot as exc:
+        raise invalid(exc)
+    except SlotUnavailable as exc:
+        raise conflict(exc)
+    if appointment is None:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"No free slot within {APPOINTMENT_HORIZON_DAYS} days",
+        )
+    logger.info("Appointment booked",
+                extra={"event": "appointment.book", "appointment_id": appointment.appointment_id})
+    return ModelResponse(appointment, status_code=status.HTTP_201_CREATED)
+
+@app.get("/appointments", response_model=List[Appointment])
+async def list_appointments(
+    facility_id: Optional[str] = None,
+    clinician_id: Optional[str] = None,
+    patient_id: Optional[str] = None,
+    day: Optional[date] = Query(None, alias="date"),
+    status_: Optional[str] = Query(None, alias="status", pattern="^(booked|cancelled)$"),
+    limit: int = Query(100, ge=1, le=1000),
+    repo: AppointmentRepository = Depends(get_repository),
+):
+    if facility_id:
+        facility_id = resolve_facility(facility_id)
+    return ModelResponse(
+        await repo.list(facility_id, clinician_id, patient_id, day, status_, limit)
+    )
+
+@app.get("/appointments/{appointment_id}", response_model=Appointment)
+async def get_appointment(appointment_id: str,
+                          repo: AppointmentRepository = Depends(get_repository)):
+    appointment = await repo.get(appointment_id)
+    if not appointment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Appointment '{appointment_id}' not found",
+        )
+    return ModelResponse(appointment)
+
+@app.post("/appointments/{appointment_id}/cancel", response_model=Appointment)
+async def cancel_appointment(appointment_id: str,
+                             repo: AppointmentRepository = Depends(get_repository)):
+    """Cancel an appointment and free its slot (cancelling twice is harmless)"""
+    appointment = await repo.cancel(appointment_id, datetime.utcnow().isoformat() + "Z")
+    if not appointment:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Appointment '{appointment_id}' not found",
+        )
+    logger.info("Appointment cancelled",
+                extra={"event": "appointment.cancel", "appointment_id": appointment_id})
+    return ModelResponse(appointment)
+
+if __name__ == "__main__":
+    import uvicorn
+    logger.info("=" * 70)
+    logger.info("🏥 DANAYA Appointment Service Starting")
+    logger.info(
+        f"🗓️ Slots of {SLOT_MINUTES} minutes, searched {APPOINTMENT_HORIZON_DAYS} days ahead"
+    )
+    logger.info("📡 Running on http://localhost:8004")
+    logger.info("=" * 70)
+    uvicorn.run(app, host="0.0.0.0", port=8004, log_level="info")
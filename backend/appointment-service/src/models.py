@@ -0,0 +1,88 @@
+"""Appointment API models shared by the endpoints and storage backends"""
+
+from datetime import datetime
+from pydantic import BaseModel, Field, field_serializer, field_validator, model_validator
+from typing import Literal, Optional
+from uuid import uuid4
+
+from .availability import utc
+
+
+def generate_session_id() -> str:
+    return f"SES-{uuid4().hex[:10].upper()}"
+
+
+def generate_appointment_id() -> str:
+    return f"APT-{uuid4().hex[:10].upper()}"
+
+
+class Period(BaseModel):
+    """start / end in UTC; naive times are taken as UTC"""
+    start: datetime
+    end: datetime
+
+    @field_validator("start", "end")
+    @classmethod
+    def as_utc(cls, value: datetime) -> datetime:
+        return utc(value)
+
+    @field_serializer("start", "end")
+    def iso_z(self, value: datetime) -> str:
+        return value.isoformat().replace("+00:00", "Z")
+
+    @model_validator(mode="after")
+    def ordered(self) -> "Period":
+        if self.end <= self.start:
+            raise ValueError("end must be after start")
+        return self
+
+
+class SessionCreate(Period):
+    facility_id: str = Field(..., description="Registry facility id or short code")
+    clinician_id: Optional[str] = Field(
+        default=None,
+        description="auth-service user id; defaults to the caller's",
+    )
+
+
+class Session(Period):
+    """A clinician's opening hours at a facility, cut into bookable slots"""
+    session_id: str
+    facility_id: str
+    clinician_id: str
+    created_at: str
+
+
+class AppointmentCreate(Period):
+    facility_id: str = Field(..., description="Registry facility id or short code")
+    clinician_id: str = Field(..., description="auth-service user id")
+    patient_id: str = Field(..., min_length=1, max_length=64)
+    reason: Optional[str] = Field(default=None, max_length=500)
+
+
+class NextAppointment(BaseModel):
+    """Book the earliest free slot matching these, wherever it is"""
+    patient_id: str = Field(..., min_length=1, max_length=64)
+    duration_minutes: int = Field(default=15, ge=1, le=1440)
+    region: Optional[str] = Field(default=None, description="Region id or name")
+    type: Optional[str] = Field(default=None, description="Facility type, e.g. CMA")
+    facility_id: Optional[str] = None
+    clinician_id: Optional[str] = None
+    not_before: Optional[datetime] = None
+    reason: Optional[str] = Field(default=None, max_length=500)
+
+
+class Appointment(Period):
+    appointment_id: str
+    facility_id: str
+    clinician_id: str
+    patient_id: str
+    reason: Optional[str] = None
+    status: Literal["booked", "cancelled"]
+    created_at: str
+    updated_at: str
+
+
+class Slot(Period):
+    facility_id: str
+    clinician_id: str
@@ -0,0 +1,520 @@
+"""
+Postgres appointment store (asyncpg).
+
+The database is what stops double booking across workers and nodes: booked
+appointments carry an exclusion constraint (no two booked periods of one
+clinician overlap), as do sessions, so of two requests racing for a slot
+exactly one INSERT succeeds, whichever workers they reached. A booking also
+has to lie within the clinician's sessions at that facility; it locks them
+(FOR SHARE) while it checks, and deleting a session locks it FOR UPDATE
+before checking it has no bookings, so neither can slip past the other.
+
+Each worker answers availability and next-slot queries from its own
+AvailabilityIndex: loaded at connect (sessions and bookings that have not
+ended), kept current by its own writes and by NOTIFY from everyone else's,
+and reloaded whenever the LISTEN connection is lost. The index only proposes
+slots; a slot it shows free that was just booked elsewhere fails the INSERT
+and is marked taken, and book_first() tries the next one. Changes are applied
+once per session / appointment id whichever way they arrive first, so a
+notification overtaking the worker's own update does no harm. Once the
+day (UTC) changes, the first change applied drops everything that ended
+before midnight, so a long-lived worker holds only what can still be booked.
+
+Demo sessions (add_sessions) go in under an advisory lock with ON CONFLICT
+DO NOTHING, so workers starting together seed them once.
+"""
+
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import asyncio
+import json
+import logging
+
+import asyncpg
+from asyncpg import Range
+
+from .availability import SlotUnavailable, utc
+from .models import Appointment, Session
+from .repository import AppointmentRepository
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS clinician_sessions (
+    session_id TEXT PRIMARY KEY,
+    facility_id TEXT NOT NULL,
+    clinician_id TEXT NOT NULL,
+    period TSTZRANGE NOT NULL,
+    created_at TIMESTAMPTZ NOT NULL DEFAULT now(),
+    EXCLUDE USING gist (clinician_id WITH =, period WITH &&)
+);
+CREATE INDEX IF NOT EXISTS clinician_sessions_facility
+    ON clinician_sessions (facility_id, lower(period));
+CREATE INDEX IF NOT EXISTS clinician_sessions_end ON clinician_sessions (upper(period));
+
+CREATE TABLE IF NOT EXISTS appointments (
+    appointment_id TEXT PRIMARY KEY,
+    facility_id TEXT NOT NULL,
+    clinician_id TEXT NOT NULL,
+    patient_id TEXT NOT NULL,
+    reason TEXT,
+    period TSTZRANGE NOT NULL,
+    status TEXT NOT NULL DEFAULT 'booked' CHECK (status IN ('booked', 'cancelled')),
+    created_at TIMESTAMPTZ NOT NULL,
+    updated_at TIMESTAMPTZ NOT NULL,
+    EXCLUDE USING gist (clinician_id WITH =, period WITH &&) WHERE (status = 'booked')
+);
+CREATE INDEX IF NOT EXISTS appointments_facility ON appointments (facility_id, lower(period));
+CREATE INDEX IF NOT EXISTS appointments_clinician ON appointments (clinician_id, lower(period));
+CREATE INDEX IF NOT EXISTS appointments_patient ON appointments (patient_id, lower(period));
+CREATE INDEX IF NOT EXISTS appointments_booked_end
+    ON appointments (upper(period)) WHERE status = 'booked';
+"""
+
+# Serialise schema creation and demo seeding when several workers start at once
+SCHEMA_LOCK_ID = 0x44414E60
+SEED_LOCK_ID = 0x44414E61
+
+CHANNEL = "appointment_changes"
+
+SESSION_COLUMNS = (
+    "session_id, facility_id, clinician_id, lower(period) AS start, upper(period) AS end, "
+    "created_at"
+)
+INSERT_SESSION_SQL = (
+    "INSERT INTO clinician_sessions (session_id, facility_id, clinician_id, period, created_at)"
+)
+APPOINTMENT_COLUMNS = (
+    "appointment_id, facility_id, clinician_id, patient_id, reason, "
+    "lower(period) AS start, upper(period) AS end, status, created_at, updated_at"
+)
+
+# Inserts only if the period lies within the clinician's sessions there,
+# which stay locked until commit
+BOOK_SQL = """
+WITH covering AS (
+    SELECT period FROM clinician_sessions
+    WHERE clinician_id = $3 AND facility_id = $2 AND period && $6
+    FOR SHARE
+)
+INSERT INTO appointments
+    (appointment_id, facility_id, clinician_id, patient_id, reason, period, status,
+     created_at, updated_at)
+SELECT $1::text, $2::text, $3::text, $4::text, $5::text, $6::tstzrange, 'booked',
+       $7::timestamptz, $8::timestamptz
+WHERE $6 <@ (SELECT range_agg(period) FROM covering)
+"""
+
+
+def _to_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _to_iso(value: datetime) -> str:
+    return value.astimezone(timezone.utc).replace(tzinfo=None).isoformat() + "Z"
+
+
+def _session(row: asyncpg.Record) -> Session:
+    return Session(**{**dict(row), "created_at": _to_iso(row["created_at"])})
+
+
+def _appointment(row: asyncpg.Record) -> Appointment:
+    return Appointment(**{
+        **dict(row),
+        "created_at": _to_iso(row["created_at"]),
+        "updated_at": _to_iso(row["updated_at"]),
+    })
+
+
+def _filters(**fields) -> Tuple[str, List[Any]]:
+    """WHERE clause (or '') and its arguments for the fields that are set"""
+    clauses, args = [], []
+    for name, value in fields.items():
+        if value is None:
+            continue
+        if name == "day":
+            midnight = datetime.combine(value, time(), tzinfo=timezone.utc)
+            args += [midnight, midnight + timedelta(days=1)]
+            clauses.append(f"lower(period) >= ${len(args) - 1} AND lower(period) < ${len(args)}")
+        else:
+            args.append(value)
+            clauses.append(f"{name} = ${len(args)}")
+    return (" WHERE " + " AND ".join(clauses)) if clauses else "", args
+
+
+class PostgresAppointmentRepository(AppointmentRepository):
+    """Shared store for multi-worker / multi-node deployments"""
+
+    backend = "postgres"
+
+    def __init__(self, dsn: str, slot_minutes: int, min_size: int = 2, max_size: int = 10) -> None:
+        super().__init__(slot_minutes)
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._pool: Optional[asyncpg.Pool] = None
+        self._listener: Optional[asyncpg.Connection] = None
+        self._reconnect: Optional[asyncio.Task] = None
+        # What the index holds: session id -> (facility, clinician, start, end),
+        # and the booked appointments likewise
+        self._open: Dict[str, tuple] = {}
+        self._booked: Dict[str, tuple] = {}
+        # Ids once applied and since removed (-> their end, to prune them by),
+        # so a late notification is ignored
+        self._gone: Dict[str, datetime] = {}
+        # Notifications received while the index is being (re)loaded
+        self._pending: Optional[List[dict]] = None
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            raise RuntimeError("PostgresAppointmentRepository.connect() has not been awaited")
+        return self._pool
+
+    async def connect(self) -> None:
+        self._pool = await asyncpg.create_pool(
+            self._dsn,
+            min_size=self._min_size,
+            max_size=self._max_size,
+            command_timeout=10,
+        )
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+                await conn.execute(SCHEMA)
+        await self._listen()
+
+    async def close(self) -> None:
+        if self._reconnect is not None:
+            self._reconnect.cancel()
+        listener, self._listener = self._listener, None
+        if listener is not None:
+            listener.remove_termination_listener(self._lost)
+            listener.terminate()
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def ping(self) -> None:
+        await self.pool.fetchval("SELECT 1")
+        if self._listener is None or self._listener.is_closed():
+            raise RuntimeError("not listening for appointment changes")
+
+    # --- the index ------------------------------------------------------------
+
+    async def _listen(self) -> None:
+        """LISTEN, then load the index; what arrives meanwhile is applied after"""
+        self._listener = await asyncpg.connect(self._dsn)
+        self._listener.add_termination_listener(self._lost)
+        self._pending = []
+        await self._listener.add_listener(CHANNEL, self._notified)
+        try:
+            await self._load()
+        finally:
+            pending, self._pending = self._pending, None
+        for change in pending:
+            self._apply(change)
+
+    def _midnight(self) -> datetime:
+        return datetime.combine(self.today, time(), tzinfo=timezone.utc)
+
+    def prune(self, now: Optional[datetime] = None) -> bool:
+        if not super().prune(now):
+            return False
+        midnight = self._midnight()
+        self._open = {k: slot for k, slot in self._open.items() if slot[3] > midnight}
+        self._booked = {k: slot for k, slot in self._booked.items() if slot[3] > midnight}
+        self._gone = {k: end for k, end in self._gone.items() if end > midnight}
+        return True
+
+    async def _load(self) -> None:
+        # Sessions and bookings from midnight on: earlier ones can no longer be booked
+        self.today = datetime.now(timezone.utc).date()
+        since = self._midnight()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction(isolation="repeatable_read", readonly=True):
+                sessions = await conn.fetch(
+                    "SELECT session_id, facility_id, clinician_id, lower(period) AS start, "
+                    "upper(period) AS end FROM clinician_sessions WHERE upper(period) > $1",
+                    since,
+                )
+                booked = await conn.fetch(
+                    "SELECT appointment_id, facility_id, clinician_id, lower(period) AS start, "
+                    "upper(period) AS end FROM appointments "
+                    "WHERE status = 'booked' AND upper(period) > $1",
+                    since,
+                )
+        self.index = type(self.index)(self.index.slot_minutes)
+        self._open, self._booked, self._gone = {}, {}, {}
+        for row in sessions:
+            self._apply({"op": "open", "id": row["session_id"], **self._slot(row)})
+        for row in booked:
+            self._apply({"op": "take", "id": row["appointment_id"], **self._slot(row)})
+        logger.info(
+            f"Loaded {len(sessions)} sessions and {len(booked)} bookings",
+            extra={"event": "availability_loaded",
+                   "sessions": len(sessions), "booked": len(booked)},
+        )
+
+    @staticmethod
+    def _slot(row) -> dict:
+        return {
+            "facility_id": row["facility_id"],
+            "clinician_id": row["clinician_id"],
+            "start": row["start"].isoformat(),
+            "end": row["end"].isoformat(),
+        }
+
+    def _notified(self, connection, pid, channel, payload: str) -> None:
+        change = json.loads(payload)
+        if self._pending is not None:
+            self._pending.append(change)
+        else:
+            self._apply(change)
+
+    def _apply(self, change: dict) -> None:
+        """Bring the index up to date with one change, at most once per id"""
+        self.prune()
+        op, key = change["op"], change["id"]
+        if key in self._gone:
+            return
+        slot = (
+            change["facility_id"], change["clinician_id"],
+            utc(datetime.fromisoformat(change["start"])),
+            utc(datetime.fromisoformat(change["end"])),
+        )
+        if slot[3] <= self._midnight():
+            # Over before today: the index no longer holds that day
+            return
+        try:
+            if op == "open" and key not in self._open:
+                self.index.open(*slot)
+                self._open[key] = slot
+            elif op == "close" and key in self._open:
+                self.index.close(*self._open.pop(key), force=True)
+                self._gone[key] = slot[3]
+            elif op == "take" and key not in self._booked:
+                self.index.take(*slot)
+                self._booked[key] = slot
+            elif op == "release":
+                if key in self._booked:
+                    self.index.release(*self._booked.pop(key))
+                self._gone[key] = slot[3]
+        except (SlotUnavailable, ValueError) as e:
+            # Only if the index has drifted from the database: start over
+            logger.warning(f"Could not apply {op} {key} ({e}); reloading",
+                           extra={"event": "availability_drift"})
+            self._schedule_reload()
+
+    def _lost(self, connection) -> None:
+        logger.warning("Lost the appointment changes listener", extra={"event": "listener_lost"})
+        self._listener = None
+        self._schedule_reload()
+
+    def _schedule_reload(self) -> None:
+        if self._reconnect is None or self._reconnect.done():
+            self._reconnect = asyncio.create_task(self._relisten())
+
+    async def _relisten(self) -> None:
+        delay = 1.0
+        while True:
+            try:
+                if self._listener is not None and not self._listener.is_closed():
+                    self._pending = []
+                    try:
+                        await self._load()
+                    finally:
+                        pending, self._pending = self._pending, None
+                    for change in pending:
+                        self._apply(change)
+                else:
+                    await self._listen()
+                return
+            except Exception as e:
+                logger.warning(f"Could not reload availability: {e}")
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, 30.0)
+
+    async def _notify(self, conn: asyncpg.Connection, change: dict) -> None:
+        """Tell every worker (delivered on commit, in commit order)"""
+        await conn.execute("SELECT pg_notify($1, $2)", CHANNEL, json.dumps(change))
+
+    # --- sessions ---------------------------------------------------------------
+
+    async def count(self) -> int:
+        return await self.pool.fetchval("SELECT count(*) FROM appointments WHERE status = 'booked'")
+
+    async def estimated_count(self) -> int:
+        """Bookings that have not ended, as the index holds them (no query)"""
+        return len(self._booked)
+
+    @staticmethod
+    def _opened(s: Session) -> dict:
+        return {"op": "open", "id": s.session_id, "facility_id": s.facility_id,
+                "clinician_id": s.clinician_id, "start": s.start.isoformat(),
+                "end": s.end.isoformat()}
+
+    async def add_session(self, session: Session) -> None:
+        s = session
+        change = self._opened(s)
+        # Off-grid times are refused before they reach the database
+        self.index.span(s.start, s.end)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                try:
+                    await conn.execute(
+                        f"{INSERT_SESSION_SQL} VALUES ($1, $2, $3, $4, $5)",
+                        s.session_id, s.facility_id, s.clinician_id,
+                        Range(s.start, s.end), _to_timestamp(s.created_at),
+                    )
+                except asyncpg.ExclusionViolationError:
+                    raise SlotUnavailable(
+                        f"{s.clinician_id} already has a session overlapping these times"
+                    )
+                await self._notify(conn, change)
+        self._apply(change)
+
+    async def add_sessions(self, sessions: Iterable[Session]) -> int:
+        sessions = list(sessions)
+        for s in sessions:
+            self.index.span(s.start, s.end)
+        changes = []
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Workers seeding at once take turns: the later ones find every row there
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SEED_LOCK_ID)
+                for s in sessions:
+                    added = await conn.fetchval(
+                        f"{INSERT_SESSION_SQL} VALUES ($1, $2, $3, $4, $5) "
+                        "ON CONFLICT DO NOTHING RETURNING session_id",
+                        s.session_id, s.facility_id, s.clinician_id,
+                        Range(s.start, s.end), _to_timestamp(s.created_at),
+                    )
+                    if added is not None:
+                        changes.append(self._opened(s))
+                        await self._notify(conn, changes[-1])
+        for change in changes:
+            self._apply(change)
+        return len(changes)
+
+    async def get_session(self, session_id: str) -> Optional[Session]:
+        row = await self.pool.fetchrow(
+            f"SELECT {SESSION_COLUMNS} FROM clinician_sessions WHERE session_id = $1", session_id
+        )
+        return _session(row) if row else None
+
+    async def sessions(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                       day: Optional[date] = None, limit: int = 100) -> List[Session]:
+        where, args = _filters(facility_id=facility_id, clinician_id=clinician_id, day=day)
+        rows = await self.pool.fetch(
+            f"SELECT {SESSION_COLUMNS} FROM clinician_sessions{where} "
+            f"ORDER BY lower(period), session_id LIMIT ${len(args) + 1}",
+            *args, limit,
+        )
+        return [_session(row) for row in rows]
+
+    async def delete_session(self, session_id: str) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    f"SELECT {SESSION_COLUMNS} FROM clinician_sessions "
+                    "WHERE session_id = $1 FOR UPDATE",
+                    session_id,
+                )
+                if row is None:
+                    return False
+                # A statement after the lock: sees bookings committed while we waited for it
+                if await conn.fetchval(
+                    "SELECT EXISTS (SELECT 1 FROM appointments WHERE clinician_id = $1 "
+                    "AND facility_id = $2 AND status = 'booked' AND period && $3)",
+                    row["clinician_id"], row["facility_id"], Range(row["start"], row["end"]),
+                ):
+                    raise SlotUnavailable("the session has booked appointments")
+                await conn.execute(
+                    "DELETE FROM clinician_sessions WHERE session_id = $1", session_id
+                )
+                change = {"op": "close", "id": session_id, **self._slot(row)}
+                await self._notify(conn, change)
+        self._apply(change)
+        return True
+
+    # --- appointments -----------------------------------------------------------
+
+    async def book(self, appointment: Appointment) -> None:
+        a = appointment
+        change = {"op": "take", "id": a.appointment_id, "facility_id": a.facility_id,
+                  "clinician_id": a.clinician_id, "start": a.start.isoformat(),
+                  "end": a.end.isoformat()}
+        self.index.span(a.start, a.end)
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                try:
+                    status = await conn.execute(
+                        BOOK_SQL,
+                        a.appointment_id, a.facility_id, a.clinician_id, a.patient_id, a.reason,
+                        Range(a.start, a.end),
+                        _to_timestamp(a.created_at), _to_timestamp(a.updated_at),
+                    )
+                except asyncpg.ExclusionViolationError:
+                    taken = True
+                else:
+                    taken = False
+                    if status == "INSERT 0 0":
+                        raise SlotUnavailable("the slot is outside the clinician's sessions there")
+                    await self._notify(conn, change)
+        if taken:
+            await self._catch_up(a)
+            raise SlotUnavailable("the slot is not free")
+        self._apply(change)
+
+    async def _catch_up(self, appointment: Appointment) -> None:
+        """Apply the bookings that beat this one now, rather than when their
+        notifications arrive, so book_first() does not propose them again"""
+        a = appointment
+        rows = await self.pool.fetch(
+            "SELECT appointment_id, facility_id, clinician_id, lower(period) AS start, "
+            "upper(period) AS end FROM appointments "
+            "WHERE clinician_id = $1 AND status = 'booked' AND period && $2",
+            a.clinician_id, Range(a.start, a.end),
+        )
+        for row in rows:
+            self._apply({"op": "take", "id": row["appointment_id"], **self._slot(row)})
+
+    async def get(self, appointment_id: str) -> Optional[Appointment]:
+        row = await self.pool.fetchrow(
+            f"SELECT {APPOINTMENT_COLUMNS} FROM appointments WHERE appointment_id = $1",
+            appointment_id,
+        )
+        return _appointment(row) if row else None
+
+    async def list(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                   patient_id: Optional[str] = None, day: Optional[date] = None,
+                   status: Optional[str] = None, limit: int = 100) -> List[Appointment]:
+        where, args = _filters(
+            facility_id=facility_id, clinician_id=clinician_id, patient_id=patient_id,
+            status=status, day=day,
+        )
+        rows = await self.pool.fetch(
+            f"SELECT {APPOINTMENT_COLUMNS} FROM appointments{where} "
+            f"ORDER BY lower(period), appointment_id LIMIT ${len(args) + 1}",
+            *args, limit,
+        )
+        return [_appointment(row) for row in rows]
+
+    async def cancel(self, appointment_id: str, updated_at: str) -> Optional[Appointment]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                row = await conn.fetchrow(
+                    f"UPDATE appointments SET status = 'cancelled', updated_at = $2 "
+                    "WHERE appointment_id = $1 AND status = 'booked' "
+                    f"RETURNING {APPOINTMENT_COLUMNS}",
+                    appointment_id, _to_timestamp(updated_at),
+                )
+                if row is None:
+                    return await self.get(appointment_id)
+                change = {"op": "release", "id": appointment_id, **self._slot(row)}
+                await self._notify(conn, change)
+        self._apply(change)
+        return _appointment(row)
@@ -0,0 +1,230 @@
+"""
+Appointment storage backends.
+
+The endpoints only talk to an AppointmentRepository. Every backend keeps an
+AvailabilityIndex of its sessions and booked slots in process, which is what
+availability and next-slot queries read. InMemoryAppointmentRepository is
+that index plus dicts (tests, demos, single-worker dev);
+PostgresAppointmentRepository (see postgres.py) is the production store, in
+which the database decides every booking and each worker's index follows it.
+The backend is picked from the environment by create_repository().
+"""
+
+from abc import ABC, abstractmethod
+from datetime import date, datetime, timezone
+from typing import Callable, Dict, Iterable, List, Optional
+import os
+
+from .availability import AvailabilityIndex, Slot, SlotUnavailable
+from .models import Appointment, Session
+
+# A slot another worker booked first is given up for the next one this many times
+BOOK_ATTEMPTS = 8
+
+
+class AppointmentRepository(ABC):
+    """Async storage interface used by the appointment endpoints"""
+
+    backend = "abstract"
+
+    def __init__(self, slot_minutes: int) -> None:
+        self.index = AvailabilityIndex(slot_minutes)
+        # The index holds nothing before this day (UTC)
+        self.today = date.min
+
+    async def connect(self) -> None:
+        """Open connections / create schema / load the index; called once at startup"""
+
+    async def close(self) -> None:
+        """Release connections; called once at shutdown"""
+
+    async def ping(self) -> None:
+        """Raise if the store is unreachable (readiness probe)"""
+
+    @abstractmethod
+    async def count(self) -> int:
+        """Booked appointments"""
+
+    async def estimated_count(self) -> int:
+        """count(), or a figure that needs no query where counting is one (/metrics)"""
+        return await self.count()
+
+    def prune(self, now: Optional[datetime] = None) -> bool:
+        """Forget availability before today once the day has changed (past
+        slots can no longer be booked); True if it had"""
+        today = (now or datetime.now(timezone.utc)).date()
+        if today <= self.today:
+            return False
+        self.today = today
+        self.index.prune(today)
+        return True
+
+    @abstractmethod
+    async def add_session(self, session: Session) -> None:
+        """Raises SlotUnavailable if the clinician has a session overlapping it"""
+
+    async def add_sessions(self, sessions: Iterable[Session]) -> int:
+        """Add the sessions whose id is new and that overlap none of their
+        clinician's (demo data: safe to repeat); returns how many were added"""
+        added = 0
+        for session in sessions:
+            if await self.get_session(session.session_id) is not None:
+                continue
+            try:
+                await self.add_session(session)
+            except SlotUnavailable:
+                continue
+            added += 1
+        return added
+
+    @abstractmethod
+    async def get_session(self, session_id: str) -> Optional[Session]: ...
+
+    @abstractmethod
+    async def sessions(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                       day: Optional[date] = None, limit: int = 100) -> List[Session]:
+        """Sessions by start time"""
+
+    @abstractmethod
+    async def delete_session(self, session_id: str) -> bool:
+        """False if there is no such session; SlotUnavailable while it has bookings"""
+
+    @abstractmethod
+    async def book(self, appointment: Appointment) -> None:
+        """Store the appointment if its slots are free in one of the
+        clinician's sessions there; SlotUnavailable (nothing stored) if not"""
+
+    async def book_first(self, facility_ids: Iterable[str], minutes: int, not_before: datetime,
+                         make: Callable[[Slot], Appointment], clinician_id: Optional[str] = None,
+                         horizon_days: int = 60) -> Optional[Appointment]:
+        """Book the earliest free slot (see AvailabilityIndex.first_free);
+        None if there is none within the horizon"""
+        facility_ids = list(facility_ids)
+        for _ in range(BOOK_ATTEMPTS):
+            slot = self.index.first_free(
+                facility_ids, minutes, not_before, clinician_id, horizon_days
+            )
+            if slot is None:
+                return None
+            appointment = make(slot)
+            try:
+                await self.book(appointment)
+                return appointment
+            except SlotUnavailable:
+                # Booked elsewhere since (book() has taken it out of the index)
+                continue
+        raise SlotUnavailable("every free slot found was booked first by another request; retry")
+
+    @abstractmethod
+    async def get(self, appointment_id: str) -> Optional[Appointment]: ...
+
+    @abstractmethod
+    async def list(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                   patient_id: Optional[str] = None, day: Optional[date] = None,
+                   status: Optional[str] = None, limit: int = 100) -> List[Appointment]:
+        """Appointments by start time"""
+
+    @abstractmethod
+    async def cancel(self, appointment_id: str, updated_at: str) -> Optional[Appointment]:
+        """Cancel a booked appointment and free its slots; returns it as it
+        now is (unchanged if it was cancelled already), None if unknown"""
+
+
+def _matches(record, day: Optional[date], **fields) -> bool:
+    if day is not None and record.start.date() != day:
+        return False
+    return all(value is None or getattr(record, name) == value for name, value in fields.items())
+
+
+class InMemoryAppointmentRepository(AppointmentRepository):
+    """Process-local store: each worker has its own sessions and bookings"""
+
+    backend = "memory"
+
+    def __init__(self, slot_minutes: int) -> None:
+        super().__init__(slot_minutes)
+        self._sessions: Dict[str, Session] = {}
+        self._appointments: Dict[str, Appointment] = {}
+        self._booked = 0
+
+    async def count(self) -> int:
+        return self._booked
+
+    async def add_session(self, session: Session) -> None:
+        self.prune()
+        self.index.open(session.facility_id, session.clinician_id, session.start, session.end)
+        self._sessions[session.session_id] = session
+
+    async def get_session(self, session_id: str) -> Optional[Session]:
+        return self._sessions.get(session_id)
+
+    async def sessions(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                       day: Optional[date] = None, limit: int = 100) -> List[Session]:
+        found = [
+            s for s in self._sessions.values()
+            if _matches(s, day, facility_id=facility_id, clinician_id=clinician_id)
+        ]
+        return sorted(found, key=lambda s: (s.start, s.session_id))[:limit]
+
+    async def delete_session(self, session_id: str) -> bool:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return False
+        self.index.close(session.facility_id, session.clinician_id, session.start, session.end)
+        del self._sessions[session_id]
+        return True
+
+    async def book(self, appointment: Appointment) -> None:
+        a = appointment
+        self.prune()
+        if not self.index.book(a.facility_id, a.clinician_id, a.start, a.end):
+            raise SlotUnavailable("the slot is not free")
+        self._appointments[a.appointment_id] = a
+        self._booked += 1
+
+    async def get(self, appointment_id: str) -> Optional[Appointment]:
+        return self._appointments.get(appointment_id)
+
+    async def list(self, facility_id: Optional[str] = None, clinician_id: Optional[str] = None,
+                   patient_id: Optional[str] = None, day: Optional[date] = None,
+                   status: Optional[str] = None, limit: int = 100) -> List[Appointment]:
+        found = [
+            a for a in self._appointments.values()
+            if _matches(a, day, facility_id=facility_id, clinician_id=clinician_id,
+                        patient_id=patient_id, status=status)
+        ]
+        return sorted(found, key=lambda a: (a.start, a.appointment_id))[:limit]
+
+    async def cancel(self, appointment_id: str, updated_at: str) -> Optional[Appointment]:
+        appointment = self._appointments.get(appointment_id)
+        if appointment is None or appointment.status == "cancelled":
+            return appointment
+        a = appointment.model_copy(update={"status": "cancelled", "updated_at": updated_at})
+        self.index.release(a.facility_id, a.clinician_id, a.start, a.end)
+        self._appointments[appointment_id] = a
+        self._booked -= 1
+        return a
+
+
+def create_repository(slot_minutes: int) -> AppointmentRepository:
+    """Pick the backend from APPOINTMENT_STORE (memory|postgres).
+
+    Defaults to Postgres whenever DATABASE_URL is set, as it is in
+    docker-compose, and to the in-memory store otherwise.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    backend = os.getenv("APPOINTMENT_STORE", "postgres" if database_url else "memory").lower()
+    if backend == "memory":
+        return InMemoryAppointmentRepository(slot_minutes)
+    if backend == "postgres":
+        if not database_url:
+            raise RuntimeError("APPOINTMENT_STORE=postgres requires DATABASE_URL")
+        from .postgres import PostgresAppointmentRepository
+
+        return PostgresAppointmentRepository(
+            database_url,
+            slot_minutes,
+            min_size=int(os.getenv("DB_POOL_MIN", "2")),
+            max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        )
+    raise RuntimeError(f"Unknown APPOINTMENT_STORE '{backend}' (expected memory or postgres)")
@@ -0,0 +1,61 @@
+from datetime import datetime, time, timedelta, timezone
+import os
+
+import pytest
+
+# Read when the app module is imported: in-memory store, no tokens, no demo sessions
+os.environ.update(AUTH_REQUIRED="false", APPOINTMENT_STORE="memory", APPOINTMENT_DEMO_DATA="false")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+from src import main  # noqa: E402
+from src.models import Session  # noqa: E402
+
+CREATED = "2025-03-01T00:00:00Z"
+
+
+def day_start(days: int = 0) -> datetime:
+    today = datetime.now(timezone.utc).date()
+    return datetime.combine(today + timedelta(days=days), time(), tzinfo=timezone.utc)
+
+
+@pytest.fixture
+def client():
+    with TestClient(main.app) as client:
+        yield client
+
+
+def add_session(client: TestClient, session_id: str, start: datetime, end: datetime) -> None:
+    session = Session(session_id=session_id, facility_id="F1", clinician_id="C1",
+                      start=start, end=end, created_at=CREATED)
+    # On the app's event loop, where the store lives
+    client.portal.call(client.app.state.appointments.add_session, session)
+
+
+def test_booking_a_start_in_the_past_is_rejected(client):
+    start = day_start(-1) + timedelta(hours=9)
+    response = client.post("/appointments", json={
+        "facility_id": "F1", "clinician_id": "C1", "patient_id": "PAT-1",
+        "start": start.isoformat(), "end": (start + timedelta(minutes=15)).isoformat(),
+    })
+    assert response.status_code == 422
+    assert response.json()["detail"] == "start is in the past"
+
+
+def test_next_appointment_is_never_in_the_past(client):
+    # Open all of today and tomorrow morning, then ask from midnight
+    add_session(client, "S1", day_start(), day_start() + timedelta(hours=23, minutes=45))
+    add_session(client, "S2", day_start(1) + timedelta(hours=8), day_start(1) + timedelta(hours=12))
+    earliest = datetime.now(timezone.utc)
+
+    slot = client.get("/slots/next", params={
+        "clinician_id": "C1", "not_before": day_start().isoformat(),
+    })
+    assert slot.status_code == 200
+    assert datetime.fromisoformat(slot.json()["start"].replace("Z", "+00:00")) >= earliest
+
+    booked = client.post("/appointments/next", json={
+        "clinician_id": "C1", "patient_id": "PAT-1", "not_before": day_start().isoformat(),
+    })
+    assert booked.status_code == 201
+    assert datetime.fromisoformat(booked.json()["start"].replace("Z", "+00:00")) >= earliest
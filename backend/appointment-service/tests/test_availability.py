@@ -0,0 +1,123 @@
+from datetime import date, datetime, timezone
+
+import pytest
+
+from src.availability import AvailabilityIndex, InvalidSlot, SlotUnavailable
+
+DAY = date(2025, 3, 3)
+
+
+def at(hour: int, minute: int = 0, day: date = DAY) -> datetime:
+    return datetime(day.year, day.month, day.day, hour, minute, tzinfo=timezone.utc)
+
+
+def times(slots):
+    return [(s.start.strftime("%H:%M"), s.end.strftime("%H:%M")) for s in slots]
+
+
+@pytest.fixture
+def index() -> AvailabilityIndex:
+    return AvailabilityIndex(15)
+
+
+def test_open_book_release_close(index):
+    index.open("F1", "C1", at(8), at(12))
+    assert index.is_free("F1", "C1", at(9), at(9, 45))
+    assert index.book("F1", "C1", at(9), at(9, 45))
+    assert not index.is_free("F1", "C1", at(9, 30), at(10))
+    assert not index.book("F1", "C1", at(9, 30), at(10))
+    # A session with bookings is only closed by force
+    with pytest.raises(SlotUnavailable):
+        index.close("F1", "C1", at(8), at(12))
+    index.release("F1", "C1", at(9), at(9, 45))
+    assert index.book("F1", "C1", at(9, 30), at(10))
+    index.release("F1", "C1", at(9, 30), at(10))
+    index.close("F1", "C1", at(8), at(12))
+    assert not index.is_free("F1", "C1", at(9), at(9, 15))
+    assert index.first_free(["F1"], 15, at(0)) is None
+
+
+def test_outside_sessions_and_overlaps(index):
+    index.open("F1", "C1", at(8), at(12))
+    assert not index.book("F1", "C1", at(11, 45), at(12, 15))
+    assert not index.book("F2", "C1", at(9), at(9, 15))
+    # One facility at a time
+    with pytest.raises(SlotUnavailable):
+        index.open("F2", "C1", at(11), at(13))
+    index.open("F2", "C1", at(12), at(13))
+
+
+def test_off_grid_and_midnight(index):
+    with pytest.raises(InvalidSlot):
+        index.open("F1", "C1", at(8, 5), at(9))
+    with pytest.raises(InvalidSlot):
+        index.open("F1", "C1", at(23), at(1, day=date(2025, 3, 4)))
+    with pytest.raises(InvalidSlot):
+        index.open("F1", "C1", at(9), at(9))
+    # A span may end at midnight itself
+    index.open("F1", "C1", at(23), at(0, day=date(2025, 3, 4)))
+    assert index.book("F1", "C1", at(23, 45), at(0, day=date(2025, 3, 4)))
+
+
+def test_runs_across_session_edges(index):
+    # Back-to-back sessions make one run; a gap breaks it
+    index.open("F1", "C1", at(8), at(9))
+    index.open("F1", "C1", at(9), at(10))
+    index.open("F1", "C1", at(10, 30), at(11))
+    assert times(index.free_in_day("F1", DAY, 60)) == [("08:00", "09:00"), ("08:15", "09:15"),
+                                                       ("08:30", "09:30"), ("08:45", "09:45"),
+                                                       ("09:00", "10:00")]
+    assert index.book("F1", "C1", at(8, 45), at(9, 15))
+    slot = index.first_free(["F1"], 30, at(8))
+    assert times([slot]) == [("08:00", "08:30")]
+    slot = index.first_free(["F1"], 45, at(8))
+    assert times([slot]) == [("08:00", "08:45")]
+    slot = index.first_free(["F1"], 45, at(8, 15))
+    assert times([slot]) == [("09:15", "10:00")]
+    assert index.first_free(["F1"], 60, at(8)) is None
+
+
+def test_first_free_rolls_over_midnight(index):
+    tomorrow = date(2025, 3, 4)
+    index.open("F1", "C1", at(23, 30), at(0, day=tomorrow))
+    index.open("F1", "C1", at(8, day=tomorrow), at(9, day=tomorrow))
+    # Past the last slot of the day: the search starts the next morning
+    assert index.first_free(["F1"], 15, at(23, 50)).start == at(8, day=tomorrow)
+    # On a slot boundary but a second late: that slot has begun
+    late = at(23, 30).replace(second=1)
+    assert index.first_free(["F1"], 15, late).start == at(23, 45)
+    assert index.first_free(["F1"], 15, at(23, 30)).start == at(23, 30)
+
+
+def test_first_free_ordering(index):
+    index.open("F2", "C3", at(9), at(10))
+    index.open("F1", "C2", at(9), at(10))
+    index.open("F1", "C1", at(9), at(10))
+    index.open("F3", "C4", at(8, day=date(2025, 3, 5)), at(9, day=date(2025, 3, 5)))
+    index.open("F3", "C5", at(8, 45), at(10))
+    # Earliest first, whatever the facility
+    slot = index.first_free(["F1", "F2", "F3"], 15, at(7))
+    assert (slot.facility_id, slot.clinician_id, slot.start) == ("F3", "C5", at(8, 45))
+    assert index.book("F3", "C5", at(8, 45), at(9))
+    # Ties: lowest facility id, then clinician id
+    slot = index.first_free(["F3", "F2", "F1"], 15, at(7))
+    assert (slot.facility_id, slot.clinician_id, slot.start) == ("F1", "C1", at(9))
+    assert index.first_free(["F2"], 15, at(7)).clinician_id == "C3"
+    assert index.first_free(["F1"], 15, at(7), clinician_id="C2").clinician_id == "C2"
+    # Later days only when nothing earlier fits
+    assert index.first_free(["F3"], 60, at(9, 15)).start == at(8, day=date(2025, 3, 5))
+    assert index.first_free(["F3"], 60, at(9, 15), horizon_days=1) is None
+
+
+def test_prune(index):
+    yesterday, tomorrow = date(2025, 3, 2), date(2025, 3, 4)
+    index.open("F1", "C1", at(8, day=yesterday), at(9, day=yesterday))
+    index.open("F2", "C2", at(8, day=yesterday), at(9, day=yesterday))
+    index.open("F1", "C1", at(8, day=tomorrow), at(9, day=tomorrow))
+    assert index.prune(DAY) == 2
+    assert index.stats() == {"facilities": 1, "clinicians": 1, "clinician_days": 1}
+    assert index.facilities_of("C2") == set()
+    assert index.first_free(["F1", "F2"], 15, at(0, day=yesterday)).start == at(8, day=tomorrow)
+    assert index.prune(DAY) == 0
+    # The pruned day can be opened afresh
+    index.open("F2", "C2", at(8, day=yesterday), at(9, day=yesterday))
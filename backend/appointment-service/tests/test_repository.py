@@ -0,0 +1,71 @@
+from datetime import date, datetime, time, timedelta, timezone
+import asyncio
+
+import pytest
+
+from src.availability import SlotUnavailable
+from src.models import Appointment, Session
+from src.repository import InMemoryAppointmentRepository
+
+# Booking prunes the days before today (UTC)
+DAY = datetime.now(timezone.utc).date() + timedelta(days=1)
+CREATED = "2025-03-01T00:00:00Z"
+
+
+def at(hour: int, minute: int = 0, day: date = DAY) -> datetime:
+    return datetime.combine(day, time(hour, minute), tzinfo=timezone.utc)
+
+
+def session(session_id: str, clinician_id: str, start: datetime, end: datetime,
+            facility_id: str = "F1") -> Session:
+    return Session(session_id=session_id, facility_id=facility_id, clinician_id=clinician_id,
+                   start=start, end=end, created_at=CREATED)
+
+
+def appointment(appointment_id: str, clinician_id: str, start: datetime, end: datetime,
+                facility_id: str = "F1") -> Appointment:
+    return Appointment(appointment_id=appointment_id, facility_id=facility_id,
+                       clinician_id=clinician_id, patient_id="PAT-1", start=start, end=end,
+                       status="booked", created_at=CREATED, updated_at=CREATED)
+
+
+def test_add_sessions_is_idempotent():
+    async def scenario():
+        repo = InMemoryAppointmentRepository(15)
+        sessions = [session("S1", "C1", at(8), at(12)), session("S2", "C2", at(8), at(12))]
+        assert await repo.add_sessions(sessions) == 2
+        assert await repo.add_sessions(sessions) == 0
+        # Another id overlapping an existing session is skipped too
+        assert await repo.add_sessions([session("S3", "C1", at(11), at(13))]) == 0
+        assert [s.session_id for s in await repo.sessions()] == ["S1", "S2"]
+
+    asyncio.run(scenario())
+
+
+def test_book_cancel_count():
+    async def scenario():
+        repo = InMemoryAppointmentRepository(15)
+        await repo.add_session(session("S1", "C1", at(8), at(12)))
+        await repo.book(appointment("A1", "C1", at(9), at(9, 30)))
+        with pytest.raises(SlotUnavailable):
+            await repo.book(appointment("A2", "C1", at(9, 15), at(9, 45)))
+        assert await repo.count() == await repo.estimated_count() == 1
+        await repo.cancel("A1", CREATED)
+        await repo.book(appointment("A2", "C1", at(9, 15), at(9, 45)))
+        assert await repo.count() == 1
+        with pytest.raises(SlotUnavailable):
+            await repo.delete_session("S1")
+
+    asyncio.run(scenario())
+
+
+def test_prune_on_day_change():
+    repo = InMemoryAppointmentRepository(15)
+    repo.index.open("F1", "C1", at(8), at(12))
+    later = DAY + timedelta(days=1)
+    repo.index.open("F1", "C1", at(8, day=later), at(12, day=later))
+    assert repo.prune(at(10))
+    assert not repo.prune(at(23))
+    assert repo.index.stats()["clinician_days"] == 2
+    assert repo.prune(at(0, day=later))
+    assert repo.index.stats()["clinician_days"] == 1
@@ -0,0 +1,134 @@
+"""
+RS256 signing keys for auth-service.
+
+Private keys are PEM files in JWT_KEYS_DIR. The most recently modified one
+signs new tokens; the others stay published in the JWKS until removed, so
+tokens signed before a rotation keep verifying. Without a key directory a
+throwaway key is generated (dev only) and kept in the temp directory, so all
+worker processes on the host sign and verify with the same key. A directory
+that is set but holds no key, or no directory in production, is an error:
+a throwaway key there would change with every container and void every
+token issued before.
+
+Each key's ``kid`` is its RFC 7638 thumbprint, so every replica that loads
+the same PEM advertises the same kid.
+"""
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import base64
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk
+
+logger = logging.getLogger(__name__)
+
+ALGORITHM = "RS256"
+
+DEV_KEY_PATH = Path(tempfile.gettempdir()) / f"danaya-jwt-dev-{os.getuid()}.pem"
+
+
+def _b64uint(value: int) -> str:
+    raw = value.to_bytes((value.bit_length() + 7) // 8, "big")
+    return base64.urlsafe_b64encode(raw).rstrip(b"=").decode()
+
+
+def _load_pem(pem: bytes) -> Any:
+    return serialization.load_pem_private_key(pem, password=None)
+
+
+def _dev_key() -> rsa.RSAPrivateKey:
+    """The host's throwaway key; the first worker to start creates it"""
+    try:
+        return _load_pem(DEV_KEY_PATH.read_bytes())
+    except FileNotFoundError:
+        pass
+    key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = key.private_bytes(
+        serialization.Encoding.PEM,
+        serialization.PrivateFormat.PKCS8,
+        serialization.NoEncryption(),
+    )
+    staging = DEV_KEY_PATH.with_name(f"{DEV_KEY_PATH.name}.{os.getpid()}")
+    with os.fdopen(os.open(staging, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600), "wb") as f:
+        f.write(pem)
+    try:
+        # link() is atomic and fails if the file exists: exactly one worker wins
+        os.link(staging, DEV_KEY_PATH)
+    except FileExistsError:
+        key = _load_pem(DEV_KEY_PATH.read_bytes())
+    finally:
+        staging.unlink()
+    return key
+
+
+class SigningKey:
+    def __init__(self, private_key: rsa.RSAPrivateKey) -> None:
+        numbers = private_key.public_key().public_numbers()
+        self.public_jwk: Dict[str, Any] = {
+            "kty": "RSA", "n": _b64uint(numbers.n), "e": _b64uint(numbers.e),
+        }
+        thumbprint = json.dumps(
+            {"e": self.public_jwk["e"], "kty": "RSA", "n": self.public_jwk["n"]},
+            separators=(",", ":"), sort_keys=True,
+        ).encode()
+        digest = hashlib.sha256(thumbprint).digest()
+        self.kid = base64.urlsafe_b64encode(digest).rstrip(b"=").decode()
+        self.public_jwk.update({"kid": self.kid, "alg": ALGORITHM, "use": "sig"})
+
+        pem = private_key.private_bytes(
+            serialization.Encoding.PEM,
+            serialization.PrivateFormat.PKCS8,
+            serialization.NoEncryption(),
+        )
+        # Parsing a PEM costs tens of milliseconds; build the jose keys once
+        self.signer = jwk.construct(pem, ALGORITHM)
+        self.verifier = jwk.construct(self.public_jwk, ALGORITHM)
+
+
+class SigningKeys:
+    """Active signing key plus every key still published for verification"""
+
+    def __init__(self, keys: List[SigningKey]) -> None:
+        if not keys:
+            raise ValueError("SigningKeys needs at least one key")
+        self.active = keys[0]
+        self._by_kid = {key.kid: key for key in keys}
+
+    @classmethod
+    def load(cls, directory: Optional[str], allow_dev_key: bool = True) -> "SigningKeys":
+        paths: List[Path] = []
+        if directory:
+            paths = sorted(
+                Path(directory).glob("*.pem"), key=lambda p: p.stat().st_mtime, reverse=True
+            )
+        keys = []
+        for path in paths:
+            private_key = _load_pem(path.read_bytes())
+            if not isinstance(private_key, rsa.RSAPrivateKey):
+                logger.warning(f"Skipping {path.name}: not an RSA private key")
+                continue
+            keys.append(SigningKey(private_key))
+        if not keys and directory:
+            raise RuntimeError(f"No RSA private key (*.pem) in JWT_KEYS_DIR={directory}")
+        if not keys and not allow_dev_key:
+            raise RuntimeError("JWT_KEYS_DIR is required outside development")
+        if not keys:
+            logger.warning(f"JWT_KEYS_DIR not set; using the dev key {DEV_KEY_PATH}")
+            keys.append(SigningKey(_dev_key()))
+        logger.info(f"Loaded {len(keys)} signing key(s), active kid {keys[0].kid}")
+        return cls(keys)
+
+    def get(self, kid: str) -> Optional[Any]:
+        """Verification key for kid (same interface as danaya_shared.jwks.KeySet)"""
+        key = self._by_kid.get(kid)
+        return key.verifier if key else None
+
+    def jwks(self) -> Dict[str, Any]:
+        return {"keys": [key.public_jwk for key in self._by_kid.values()]}
@@ -5,29 +5,124 @@ Copyright (c) 2025 Kader BONZI
 Licensed under the Apache License, Version 2.0
 """
 
-from fastapi import FastAPI, HTTPException, Depends, status
+from fastapi import FastAPI, HTTPException, Depends, Request, Response, status
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, EmailStr, Field
+from contextlib import asynccontextmanager
 from datetime import datetime, timedelta, timezone
 from typing import Optional
 from jose import jwt
-import hashlib
+from prometheus_client import Histogram
+import asyncio
 import os
 import logging
-import httpx
+import uuid
 
-SECRET_KEY = os.getenv("JWT_SECRET", "dev-secret-CHANGE-IN-PRODUCTION")
-ALGORITHM = "HS256"
+from danaya_shared import logs
+from danaya_shared.health import HealthChecks
+from danaya_shared.jwks import JWKSTokenVerifier
+from danaya_shared.logs import RequestContextMiddleware, setup_logging
+from danaya_shared.metrics import (
+    LATENCY_BUCKETS, LOG_RECORDS_DROPPED, MetricsMiddleware, MetricsPublisher, timer,
+)
+from danaya_shared.responses import JSONResponse, ModelResponse
+from danaya_shared.revocation import RedisRevocations, RevocationList
+from danaya_shared.tokens import claims_or_401, unauthorized
+
+from .keys import ALGORITHM, SigningKeys
+from .passwords import PasswordHasher, legacy_hash
+from .ratelimit import LoginLimiter, Rate, retry_after
+from .registry_client import RegistryClient
+from .users import UserStore
+
+JWT_KEYS_DIR = os.getenv("JWT_KEYS_DIR")
+ENVIRONMENT = os.getenv("ENVIRONMENT", "development")
 ACCESS_TOKEN_EXPIRE_MINUTES = 30
+REDIS_URL = os.getenv("REDIS_URL")
+
+# Login attempts: "<attempts>/<seconds>" token buckets
+LOGIN_RATE_EMAIL = Rate.parse(os.getenv("LOGIN_RATE_EMAIL", "5/300"))
+LOGIN_RATE_IP = Rate.parse(os.getenv("LOGIN_RATE_IP", "30/60"))
+# Proxies trusted to name the client (X-Real-IP); gunicorn reads the same
+# setting for X-Forwarded-For
+FORWARDED_ALLOW_IPS = {
+    ip.strip() for ip in os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1").split(",") if ip.strip()
+}
+
+REGISTRY_URL = os.getenv("REGISTRY_URL", "http://localhost:8003")
+REGISTRY_TIMEOUT = float(os.getenv("REGISTRY_TIMEOUT", "2.0"))
+HOSPITAL_CACHE_TTL = float(os.getenv("HOSPITAL_CACHE_TTL", "300"))
+# Seconds between copies of cache counters and sizes into /metrics
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
 
-logging.basicConfig(level=logging.INFO)
+setup_logging("auth-service")
 logger = logging.getLogger(__name__)
 
+PASSWORD_VERIFY = Histogram(
+    "auth_password_verify_seconds", "Password hash verification in authenticate_user",
+    ["result"], buckets=LATENCY_BUCKETS,
+)
+HOSPITAL_LOOKUP = Histogram(
+    "auth_hospital_lookup_seconds", "get_hospital_info, cache hits included",
+    buckets=LATENCY_BUCKETS,
+)
+REGISTRY_REQUEST = Histogram(
+    "auth_registry_request_seconds", "Requests to the registry by outcome",
+    ["outcome"], buckets=LATENCY_BUCKETS,
+)
+metrics = MetricsPublisher(METRICS_INTERVAL)
+health = HealthChecks.from_env("danaya-auth", "0.1.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    registry = RegistryClient(
+        REGISTRY_URL,
+        parse=hospital_from_registry,
+        timeout=REGISTRY_TIMEOUT,
+        ttl=HOSPITAL_CACHE_TTL,
+        observe=lambda outcome, seconds: REGISTRY_REQUEST.labels(outcome).observe(seconds),
+    )
+    app.state.registry = registry
+    app.state.users = UserStore(DEMO_USERS.values(), User.model_validate)
+    app.state.passwords = PasswordHasher.from_env()
+    app.state.login_limiter = LoginLimiter(REDIS_URL, LOGIN_RATE_EMAIL, LOGIN_RATE_IP)
+    await app.state.login_limiter.start()
+    await revocation_feed.start()
+    metrics.cache("hospitals", lambda: registry.hits, lambda: registry.misses,
+                  lambda: len(registry))
+    metrics.cache("tokens", lambda: token_verifier.hits, lambda: token_verifier.misses,
+                  lambda: len(token_verifier))
+    metrics.store("users", lambda: len(app.state.users))
+    metrics.count(LOG_RECORDS_DROPPED, logs.dropped)
+    await metrics.start()
+    # Logins keep working from cached hospitals and local buckets without these
+    health.add("registry", registry.ping, critical=False)
+    if REDIS_URL:
+        health.add("redis", app.state.login_limiter.ping, critical=False)
+    # Warm the hospital cache without holding up startup if the registry is down
+    prefetch = asyncio.create_task(registry.prefetch())
+    # Likewise the hash unknown emails are checked against
+    prepare = asyncio.create_task(app.state.passwords.prepare())
+    health.started()
+    try:
+        yield
+    finally:
+        health.stopped()
+        prefetch.cancel()
+        prepare.cancel()
+        await metrics.stop()
+        await revocation_feed.stop()
+        await app.state.login_limiter.stop()
+        await registry.close()
+        app.state.passwords.shutdown()
+
 app = FastAPI(
     title="DANAYA Auth Service",
     description="Zero-trust authentication. Danaya (Dioula) = Trust.",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=JSONResponse,
 )
 
 app.add_middleware(
@@ -36,15 +131,15 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
-
-def hash_password(password: str) -> str:
-    return hashlib.sha256(password.encode()).hexdigest()
+# Outermost: times every request, answers /metrics without a token
+app.add_middleware(MetricsMiddleware, publisher=metrics)
+# Around that: the request id, and the sampled request log
+app.add_middleware(RequestContextMiddleware)
 
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return hash_password(plain_password) == hashed_password
+oauth2_scheme = OAuth2PasswordBearer(tokenUrl="token")
 
 class User(BaseModel):
     user_id: str
@@ -81,8 +176,10 @@ class UserLogin(BaseModel):
     email: EmailStr
     password: str
 
-# Demo users - now with proper hospital IDs matching registry
-fake_users_db = {
+# Demo users - now with proper hospital IDs matching registry.
+# Seeded with legacy SHA-256 hashes; each is upgraded to bcrypt on first login.
+# Each worker copies these into its own UserStore at startup.
+DEMO_USERS = {
     "doctor@chu-ouaga.bf": {
         "user_id": "USR001",
         "email": "doctor@chu-ouaga.bf",
@@ -90,7 +187,7 @@ fake_users_db = {
         "role": "doctor",
         "hospital_id": "BF-CHU-YALG",  # CHU Yalgado
         "department": "Emergency",
-        "hashed_password": hash_password("Doctor123!"),
+        "hashed_password": legacy_hash("Doctor123!"),
         "is_active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     },
@@ -101,7 +198,7 @@ fake_users_db = {
         "role": "nurse",
         "hospital_id": "BF-CHU-YALG",  # CHU Yalgado
         "department": "Pediatrics",
-        "hashed_password": hash_password("Nurse123!"),
+        "hashed_password": legacy_hash("Nurse123!"),
         "is_active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     },
@@ -112,7 +209,7 @@ fake_users_db = {
         "role": "admin",
         "hospital_id": "BF-CHU-YALG",  # CHU Yalgado for now
         "department": "IT",
-        "hashed_password": hash_password("Admin123!"),
+        "hashed_password": legacy_hash("Admin123!"),
         "is_active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     },
@@ -123,45 +220,43 @@ fake_users_db = {
         "role": "doctor",
         "hospital_id": "BF-CHU-BOBO",  # CHU Bobo-Dioulasso
         "department": "Surgery",
-        "hashed_password": hash_password("Doctor123!"),
+        "hashed_password": legacy_hash("Doctor123!"),
         "is_active": True,
         "created_at": datetime.now(timezone.utc).isoformat()
     }
 }
 
+# Color mapping by type
+TYPE_COLORS = {
+    "CHU": "#0047AB",
+    "CHR": "#00A651",
+    "CMA": "#FDB813",
+    "CSPS": "#20B2AA"
+}
+
+def hospital_from_registry(data: dict) -> Hospital:
+    return Hospital(
+        id=data["id"],
+        name=data["name"],
+        short_code=data["short_code"],
+        type=data["type"],
+        level=data["level"],
+        region_name=data["region_name"],
+        city=data["city"],
+        logo_url=data["logo_url"],
+        logo_color=TYPE_COLORS.get(data["type"], "#0047AB")
+    )
+
 async def get_hospital_info(hospital_id: str) -> Optional[Hospital]:
-    """Fetch hospital information from registry service"""
-    try:
-        async with httpx.AsyncClient() as client:
-            response = await client.get(
-                f"http://localhost:8003/facilities/{hospital_id}",
-                timeout=5.0
-            )
-            if response.status_code == 200:
-                data = response.json()
-                
-                # Color mapping by type
-                type_colors = {
-                    "CHU": "#0047AB",
-                    "CHR": "#00A651",
-                    "CMA": "#FDB813",
-                    "CSPS": "#20B2AA"
-                }
-                
-                return Hospital(
-                    id=data["id"],
-                    name=data["name"],
-                    short_code=data["short_code"],
-                    type=data["type"],
-                    level=data["level"],
-                    region_name=data["region_name"],
-                    city=data["city"],
-                    logo_url=data["logo_url"],
-                    logo_color=type_colors.get(data["type"], "#0047AB")
-                )
-    except Exception as e:
-        logger.error(f"Failed to fetch hospital info for {hospital_id}: {e}")
-    return None
+    """Hospital information from the registry, served from the shared cache"""
+    elapsed = timer()
+    hospital = await app.state.registry.get(hospital_id)
+    HOSPITAL_LOOKUP.observe(elapsed())
+    return hospital
+
+# RS256 keys; the public halves are published at /.well-known/jwks.json so
+# other services verify tokens locally
+signing_keys = SigningKeys.load(JWT_KEYS_DIR, allow_dev_key=ENVIRONMENT != "production")
 
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
@@ -170,43 +265,71 @@ def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -
     else:
         expire = datetime.now(timezone.utc) + timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     
-    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc)})
-    return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
+    to_encode.update({"exp": expire, "iat": datetime.now(timezone.utc), "jti": uuid.uuid4().hex})
+    key = signing_keys.active
+    return jwt.encode(to_encode, key.signer, algorithm=ALGORITHM, headers={"kid": key.kid})
 
-def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
-    user_dict = fake_users_db.get(email)
+async def authenticate_user(email: str, password: str) -> Optional[UserInDB]:
+    users: UserStore[User] = app.state.users
+    hasher: PasswordHasher = app.state.passwords
+    user_dict = users.record(email)
     if not user_dict:
-        logger.warning(f"Login attempt for non-existent user: {email}")
+        await hasher.verify_unknown(password)
+        logger.warning(
+            "Login failed: unknown user", extra={"event": "auth.login_failed", "email": email}
+        )
         return None
-    if not verify_password(password, user_dict["hashed_password"]):
-        logger.warning(f"Failed login attempt for user: {email}")
+    elapsed = timer()
+    ok, new_hash = await hasher.verify(password, user_dict["hashed_password"])
+    PASSWORD_VERIFY.labels("ok" if ok else "rejected").observe(elapsed())
+    if not ok:
+        logger.warning(
+            "Login failed: wrong password", extra={"event": "auth.login_failed", "email": email}
+        )
         return None
-    logger.info(f"Successful authentication for user: {email}")
+    if new_hash:
+        users.set_password_hash(email, new_hash)
+        logger.info(
+            "Password hash upgraded",
+            extra={"event": "auth.rehash", "scheme": hasher.scheme, "email": email},
+        )
+    # A successful login clears earlier typos from the per-email bucket
+    await app.state.login_limiter.reset(email)
+    logger.info("Login succeeded", extra={"event": "auth.login", "email": email})
     return UserInDB(**user_dict)
 
-async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
-    credentials_exception = HTTPException(
-        status_code=status.HTTP_401_UNAUTHORIZED,
-        detail="Could not validate credentials",
-        headers={"WWW-Authenticate": "Bearer"},
-    )
-    try:
-        payload = jwt.decode(token, SECRET_KEY, algorithms=[ALGORITHM])
-        email: str = payload.get("sub")
-        if email is None:
-            raise credentials_exception
-    except jwt.ExpiredSignatureError:
+def client_ip(request: Request) -> Optional[str]:
+    # nginx sets X-Real-IP; from anyone else it is ignored (or any client
+    # could name its own bucket), and the socket peer is used instead
+    peer = request.client.host if request.client else None
+    if "*" in FORWARDED_ALLOW_IPS or peer in FORWARDED_ALLOW_IPS:
+        return request.headers.get("x-real-ip") or peer
+    return peer
+
+async def throttle_login(request: Request, email: str) -> None:
+    """Reject with 429 before any password hashing once a bucket is empty"""
+    wait = await app.state.login_limiter.check(email, client_ip(request))
+    if wait:
         raise HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail="Token has expired",
+            status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+            detail="Too many login attempts, try again later",
+            headers={"Retry-After": retry_after(wait)},
         )
-    except jwt.PyJWTError:
-        raise credentials_exception
-    
-    user_dict = fake_users_db.get(email)
-    if user_dict is None:
-        raise credentials_exception
-    return User(**user_dict)
+
+# Revoked token IDs, shared with every service through Redis
+revocations = RevocationList()
+revocation_feed = RedisRevocations(REDIS_URL, revocations)
+
+# Verified-token cache shared by every authenticated endpoint
+token_verifier = JWKSTokenVerifier(signing_keys, [ALGORITHM], revocations=revocations)
+
+async def get_current_user(token: str = Depends(oauth2_scheme)) -> User:
+    claims = claims_or_401(token_verifier, token)
+    email = claims.get("sub")
+    user = app.state.users.get(email) if email else None
+    if user is None:
+        raise unauthorized()
+    return user
 
 @app.get("/")
 async def root():
@@ -219,20 +342,30 @@ async def root():
         "docs": "/docs"
     }
 
+app.include_router(health.router())
+
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response):
+    ready, report = await health.ready()
+    response.headers["Cache-Control"] = "no-store"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {
-        "status": "healthy",
-        "service": "danaya-auth",
-        "version": "0.1.0",
-        "users_registered": len(fake_users_db)
+        **report,
+        "users_registered": len(app.state.users),
+        "login_attempts": app.state.login_limiter.counters,
     }
 
+@app.get("/.well-known/jwks.json")
+async def jwks(response: Response):
+    # Short max-age: verifiers also refetch on an unknown kid after a rotation
+    response.headers["Cache-Control"] = "public, max-age=300"
+    return signing_keys.jwks()
+
 @app.post("/token", response_model=Token)
-async def login(form_data: OAuth2PasswordRequestForm = Depends()):
-    logger.info(f"Login attempt for: {form_data.username}")
-    
-    user = authenticate_user(form_data.username, form_data.password)
+async def login(request: Request, form_data: OAuth2PasswordRequestForm = Depends()):
+    await throttle_login(request, form_data.username)
+    user = await authenticate_user(form_data.username, form_data.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -251,23 +384,23 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends()):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role},
+        # uid: the user id other services record (e.g. a clinician's appointments)
+        data={"sub": user.email, "role": user.role, "uid": user.user_id},
         expires_delta=access_token_expires
     )
     
-    logger.info(f"✅ Token issued for user: {user.email} at {hospital.name if hospital else user.hospital_id}")
-    
-    return Token(
+    return ModelResponse(Token(
         access_token=access_token,
         token_type="bearer",
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
         user=User(**user.dict()),
         hospital=hospital
-    )
+    ))
 
 @app.post("/login", response_model=Token)
-async def login_json(credentials: UserLogin):
-    user = authenticate_user(credentials.email, credentials.password)
+async def login_json(request: Request, credentials: UserLogin):
+    await throttle_login(request, credentials.email)
+    user = await authenticate_user(credentials.email, credentials.password)
     if not user:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
@@ -279,28 +412,37 @@ async def login_json(credentials: UserLogin):
     
     access_token_expires = timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "role": user.role},
+        data={"sub": user.email, "role": user.role, "uid": user.user_id},
         expires_delta=access_token_expires
     )
     
-    return Token(
+    return ModelResponse(Token(
         access_token=access_token,
         token_type="bearer",
         expires_in=ACCESS_TOKEN_EXPIRE_MINUTES * 60,
         user=User(**user.dict()),
         hospital=hospital
-    )
+    ))
+
+@app.post("/logout", status_code=status.HTTP_204_NO_CONTENT)
+async def logout(token: str = Depends(oauth2_scheme)):
+    claims = claims_or_401(token_verifier, token)
+    if claims.get("jti"):
+        await revocation_feed.revoke(claims["jti"], float(claims.get("exp", 0)))
+    token_verifier.forget(token)
+    return Response(status_code=status.HTTP_204_NO_CONTENT)
 
 @app.get("/users/me", response_model=User)
 async def read_users_me(current_user: User = Depends(get_current_user)):
-    return current_user
+    # A UserInDB: serialized as User, so the password hash stays out
+    return ModelResponse(current_user, model=User)
 
 if __name__ == "__main__":
     import uvicorn
     logger.info("=" * 70)
     logger.info("DANAYA Authentication Service Starting")
     logger.info("Danaya (Dioula) = Trust | Building trust through zero-trust")
-    logger.info(f"Registered users: {len(fake_users_db)}")
+    logger.info(f"Demo users: {len(DEMO_USERS)}")
     logger.info("Demo: doctor@chu-ouaga.bf / Doctor123!")
     logger.info("=" * 70)
     uvicorn.run(app, host="0.0.0.0", port=8001, log_level="info")
@@ -0,0 +1,160 @@
+"""
+Password hashing for auth-service.
+
+bcrypt (default) or argon2id, configured from the environment. Hashing is
+deliberately slow (~100-250 ms of CPU), so it never runs on the event loop:
+every hash / verify is sent to a bounded worker pool. bcrypt and argon2
+release the GIL while hashing, so the default thread pool already uses every
+core; PASSWORD_HASH_EXECUTOR=process is available for runtimes where that
+does not hold.
+
+Legacy unsalted SHA-256 hex digests are still accepted and are transparently
+re-hashed with the current scheme after a successful login.
+"""
+
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Optional, Tuple
+import asyncio
+import hashlib
+import hmac
+import os
+import re
+import secrets
+
+import bcrypt
+
+_LEGACY_SHA256 = re.compile(r"^[0-9a-f]{64}$")
+
+_argon2_hasher = None
+
+
+def _argon2():
+    """argon2-cffi PasswordHasher, created lazily (also inside pool workers)"""
+    global _argon2_hasher
+    if _argon2_hasher is None:
+        from argon2 import PasswordHasher
+
+        _argon2_hasher = PasswordHasher()
+    return _argon2_hasher
+
+
+# Module-level so they can be shipped to a process pool
+
+def _bcrypt_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode(), bcrypt.gensalt(rounds)).decode()
+
+
+def _bcrypt_check(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode(), hashed.encode())
+    except ValueError:
+        return False
+
+
+def _argon2_hash(password: str) -> str:
+    return _argon2().hash(password)
+
+
+def _argon2_check(password: str, hashed: str) -> bool:
+    from argon2.exceptions import InvalidHashError, VerificationError
+
+    try:
+        return _argon2().verify(hashed, password)
+    except (VerificationError, InvalidHashError):
+        return False
+
+
+def legacy_hash(password: str) -> str:
+    """Unsalted SHA-256 digest used before bcrypt; only kept for migration"""
+    return hashlib.sha256(password.encode()).hexdigest()
+
+
+class PasswordHasher:
+    """Async hash / verify with rehash-on-login, backed by a worker pool"""
+
+    def __init__(self, scheme: str = "bcrypt", bcrypt_rounds: int = 12,
+                 workers: Optional[int] = None, executor: str = "thread") -> None:
+        if scheme not in ("bcrypt", "argon2"):
+            raise ValueError(f"Unknown password scheme '{scheme}' (expected bcrypt or argon2)")
+        if scheme == "argon2":
+            _argon2()  # fail fast if argon2-cffi is missing
+        self.scheme = scheme
+        self.bcrypt_rounds = bcrypt_rounds
+        self.workers = workers or os.cpu_count() or 1
+        self._executor_kind = executor
+        self._executor: Optional[Executor] = None
+        # Bound queued work so a login burst waits here rather than piling up
+        self._slots = asyncio.Semaphore(self.workers * 4)
+        # A hash of nothing anyone knows, made with the current settings
+        self._dummy: Optional[str] = None
+
+    @classmethod
+    def from_env(cls) -> "PasswordHasher":
+        workers = os.getenv("PASSWORD_HASH_WORKERS")
+        return cls(
+            scheme=os.getenv("PASSWORD_SCHEME", "bcrypt").lower(),
+            bcrypt_rounds=int(os.getenv("BCRYPT_ROUNDS", "12")),
+            workers=int(workers) if workers else None,
+            executor=os.getenv("PASSWORD_HASH_EXECUTOR", "thread").lower(),
+        )
+
+    def _pool(self) -> Executor:
+        if self._executor is None:
+            if self._executor_kind == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers, thread_name_prefix="password-hash"
+                )
+        return self._executor
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def _run(self, fn, *args):
+        async with self._slots:
+            return await asyncio.get_running_loop().run_in_executor(self._pool(), fn, *args)
+
+    async def hash(self, password: str) -> str:
+        if self.scheme == "argon2":
+            return await self._run(_argon2_hash, password)
+        return await self._run(_bcrypt_hash, password, self.bcrypt_rounds)
+
+    def needs_rehash(self, hashed: str) -> bool:
+        if _LEGACY_SHA256.match(hashed):
+            return True
+        if self.scheme == "argon2":
+            return not hashed.startswith("$argon2") or _argon2().check_needs_rehash(hashed)
+        if not hashed.startswith("$2"):
+            return True
+        # "$2b$12$..." -> cost factor 12
+        return int(hashed.split("$")[2]) < self.bcrypt_rounds
+
+    async def verify(self, password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+        """(matches, replacement hash if the stored one should be upgraded)"""
+        if _LEGACY_SHA256.match(hashed):
+            ok = hmac.compare_digest(legacy_hash(password), hashed)
+        elif hashed.startswith("$argon2"):
+            ok = await self._run(_argon2_check, password, hashed)
+        elif hashed.startswith("$2"):
+            ok = await self._run(_bcrypt_check, password, hashed)
+        else:
+            ok = False
+        if ok and self.needs_rehash(hashed):
+            return True, await self.hash(password)
+        return ok, None
+
+    async def prepare(self) -> None:
+        """Make the throwaway hash verify_unknown() checks against"""
+        if self._dummy is None:
+            self._dummy = await self.hash(secrets.token_urlsafe(32))
+
+    async def verify_unknown(self, password: str) -> bool:
+        """Verify against a throwaway hash and fail: a login for an account
+        that does not exist takes as long as a wrong password, so the time
+        taken does not tell which emails have accounts"""
+        await self.prepare()
+        await self.verify(password, self._dummy)
+        return False
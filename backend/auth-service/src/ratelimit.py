@@ -0,0 +1,173 @@
+"""
+Login throttling for auth-service.
+
+Token buckets per email and per client IP, checked before any password hash
+work is done. Buckets live in Redis (each check is one atomic Lua call), so
+all workers and replicas share them.
+When Redis is unset or unreachable the limiter falls back to in-process
+buckets, which still bound each worker, and retries Redis after a pause.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+import logging
+import math
+import time
+
+logger = logging.getLogger(__name__)
+
+KEY_PREFIX = "danaya:login:"
+
+# KEYS[1]: bucket. ARGV: now, capacity, refill per second.
+# Takes a token and returns '0', or returns the seconds until one is available.
+TOKEN_BUCKET_LUA = """
+local now = tonumber(ARGV[1])
+local capacity = tonumber(ARGV[2])
+local rate = tonumber(ARGV[3])
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'ts')
+local tokens = tonumber(bucket[1]) or capacity
+local ts = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - ts) * rate)
+if tokens < 1 then
+    return tostring((1 - tokens) / rate)
+end
+tokens = tokens - 1
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'ts', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000))
+return '0'
+"""
+
+
+@dataclass(frozen=True)
+class Rate:
+    """``capacity`` attempts, refilled evenly over ``period`` seconds"""
+
+    capacity: int
+    period: float
+
+    @classmethod
+    def parse(cls, value: str) -> "Rate":
+        """'5/300' -> 5 attempts per 300 seconds"""
+        count, _, seconds = value.partition("/")
+        rate = cls(int(count), float(seconds or 60))
+        if rate.capacity < 1 or rate.period <= 0:
+            raise ValueError(f"Invalid rate '{value}' (expected attempts/seconds)")
+        return rate
+
+    @property
+    def per_second(self) -> float:
+        return self.capacity / self.period
+
+
+class LocalBuckets:
+    """In-process token buckets (bounded LRU), same semantics as the Lua script"""
+
+    def __init__(self, max_entries: int = 100_000) -> None:
+        self._buckets: "OrderedDict[str, Tuple[float, float]]" = OrderedDict()
+        self._max_entries = max_entries
+
+    def take(self, key: str, rate: Rate, now: float) -> float:
+        tokens, ts = self._buckets.get(key, (rate.capacity, now))
+        tokens = min(rate.capacity, tokens + max(0.0, now - ts) * rate.per_second)
+        if tokens < 1:
+            return (1 - tokens) / rate.per_second
+        self._buckets[key] = (tokens - 1, now)
+        self._buckets.move_to_end(key)
+        if len(self._buckets) > self._max_entries:
+            self._buckets.popitem(last=False)
+        return 0.0
+
+    def reset(self, key: str) -> None:
+        self._buckets.pop(key, None)
+
+
+class LoginLimiter:
+    def __init__(self, redis_url: Optional[str], per_email: Rate, per_ip: Rate,
+                 retry_seconds: float = 30.0) -> None:
+        self.per_email = per_email
+        self.per_ip = per_ip
+        self._url = redis_url
+        self._retry = retry_seconds
+        self._redis = None
+        self._script = None
+        self._redis_down_until = 0.0
+        self._local = LocalBuckets()
+        self.counters: Dict[str, int] = {
+            "admitted": 0,
+            "rejected_email": 0,
+            "rejected_ip": 0,
+            "local_fallback": 0,
+        }
+
+    async def start(self) -> None:
+        if not self._url:
+            logger.warning("REDIS_URL not set: login rate limits are per process")
+            return
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self._url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._redis.register_script(TOKEN_BUCKET_LUA)
+
+    async def stop(self) -> None:
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def ping(self) -> None:
+        """Raise if Redis is unreachable"""
+        if self._redis is not None:
+            await self._redis.ping()
+
+    @staticmethod
+    def _email_key(email: str) -> str:
+        return f"{KEY_PREFIX}email:{email.strip().lower()}"
+
+    @staticmethod
+    def _ip_key(ip: str) -> str:
+        return f"{KEY_PREFIX}ip:{ip}"
+
+    async def _take(self, key: str, rate: Rate) -> float:
+        now = time.time()
+        if self._script is not None and now >= self._redis_down_until:
+            try:
+                args = [now, rate.capacity, rate.per_second]
+                return float(await self._script(keys=[key], args=args))
+            except Exception as e:
+                self._redis_down_until = now + self._retry
+                logger.warning(
+                    f"Login limiter falling back to local buckets for {self._retry}s: {e}"
+                )
+        self.counters["local_fallback"] += 1
+        return self._local.take(key, rate, now)
+
+    async def check(self, email: str, ip: Optional[str]) -> float:
+        """0 if the attempt may go ahead, else seconds to wait before retrying.
+
+        The IP bucket is checked on its own first, so a blocked IP cannot
+        drain the email buckets it is spraying.
+        """
+        if ip:
+            wait = await self._take(self._ip_key(ip), self.per_ip)
+            if wait:
+                self.counters["rejected_ip"] += 1
+                return wait
+        wait = await self._take(self._email_key(email), self.per_email)
+        if wait:
+            self.counters["rejected_email"] += 1
+            return wait
+        self.counters["admitted"] += 1
+        return 0.0
+
+    async def reset(self, email: str) -> None:
+        """Refill an email's bucket after a successful login"""
+        key = self._email_key(email)
+        self._local.reset(key)
+        if self._redis is not None and time.time() >= self._redis_down_until:
+            try:
+                await self._redis.delete(key)
+            except Exception as e:
+                logger.warning(f"Could not reset login limit for {email}: {e}")
+
+
+def retry_after(wait: float) -> str:
+    return str(max(1, math.ceil(wait)))
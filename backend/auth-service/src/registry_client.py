@@ -0,0 +1,172 @@
+"""
+Registry client for auth-service.
+
+One pooled, keep-alive httpx client for the life of the app, with an
+in-process LRU cache in front of it:
+
+- fresh entries (younger than ``ttl``) are served from memory;
+- stale entries (younger than ``stale_ttl``) are served immediately while a
+  single background task refreshes them (stale-while-revalidate);
+- unknown facilities (404) are cached as misses for ``negative_ttl`` so a
+  bad hospital_id cannot hammer the registry;
+- ``prefetch()`` loads every facility at startup so logins normally never
+  wait on the registry at all;
+- refreshes are conditional: the registry's ETag is sent back in
+  ``If-None-Match``, and a 304 just renews the cached entry.
+
+``observe``, if given, is called with the outcome (ok, not_modified,
+not_found or error) and duration in seconds of every registry request.
+"""
+
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+import asyncio
+import logging
+import time
+
+import httpx
+
+from danaya_shared.logs import forward_request_id
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Marker stored for facilities the registry does not know
+_MISSING = object()
+
+
+class RegistryClient(Generic[T]):
+    def __init__(
+        self,
+        base_url: str,
+        parse: Callable[[Dict[str, Any]], T],
+        timeout: float = 2.0,
+        ttl: float = 300.0,
+        stale_ttl: float = 86400.0,
+        negative_ttl: float = 60.0,
+        error_ttl: float = 5.0,
+        max_entries: int = 4096,
+        observe: Optional[Callable[[str, float], None]] = None,
+    ) -> None:
+        self._parse = parse
+        self._observe = observe
+        self._ttl = ttl
+        self._stale_ttl = stale_ttl
+        self._negative_ttl = negative_ttl
+        self._error_ttl = error_ttl
+        self._max_entries = max_entries
+        self._client = httpx.AsyncClient(
+            base_url=base_url,
+            timeout=timeout,
+            limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+            event_hooks={"request": [forward_request_id]},
+        )
+        # key -> (value or _MISSING, stored_at, expires_after, etag)
+        self._cache: "OrderedDict[str, Tuple[Any, float, float, Optional[str]]]" = OrderedDict()
+        self._inflight: Dict[str, "asyncio.Task[Any]"] = {}
+        self.hits = 0
+        self.misses = 0
+        self.not_modified = 0
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    async def close(self) -> None:
+        for task in self._inflight.values():
+            task.cancel()
+        await self._client.aclose()
+
+    async def ping(self) -> None:
+        """Raise unless the registry answers its liveness check"""
+        response = await self._client.get("/health/live")
+        response.raise_for_status()
+
+    def _store(self, key: str, value: Any, ttl: float, etag: Optional[str] = None) -> None:
+        self._cache[key] = (value, time.monotonic(), ttl, etag)
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+
+    async def _fetch(self, facility_id: str) -> Any:
+        """Fetch one facility and cache the outcome; never raises"""
+        cached = self._cache.get(facility_id)
+        started = time.perf_counter()
+        outcome = "error"
+        try:
+            etag = cached[3] if cached is not None and cached[0] is not _MISSING else None
+            response = await self._client.get(
+                f"/facilities/{facility_id}",
+                headers={"If-None-Match": etag} if etag else None,
+            )
+            if response.status_code == 304 and etag:
+                outcome = "not_modified"
+                self.not_modified += 1
+                self._store(facility_id, cached[0], self._ttl, etag)
+                return cached[0]
+            if response.status_code == 404:
+                outcome = "not_found"
+                self._store(facility_id, _MISSING, self._negative_ttl)
+                return _MISSING
+            response.raise_for_status()
+            value = self._parse(response.json())
+            outcome = "ok"
+            self._store(facility_id, value, self._ttl, response.headers.get("etag"))
+            return value
+        except Exception as e:
+            logger.error(f"Failed to fetch hospital info for {facility_id}: {e}")
+            if cached is not None and cached[0] is not _MISSING:
+                # Keep serving the last good value; retry after error_ttl
+                self._store(facility_id, cached[0], self._error_ttl, cached[3])
+                return cached[0]
+            self._store(facility_id, _MISSING, self._error_ttl)
+            return _MISSING
+        finally:
+            self._inflight.pop(facility_id, None)
+            if self._observe is not None:
+                self._observe(outcome, time.perf_counter() - started)
+
+    def _refresh(self, facility_id: str) -> "asyncio.Task[Any]":
+        """Start (or join) the single in-flight fetch for a facility"""
+        task = self._inflight.get(facility_id)
+        if task is None:
+            task = asyncio.create_task(self._fetch(facility_id))
+            self._inflight[facility_id] = task
+        return task
+
+    async def get(self, facility_id: str) -> Optional[T]:
+        cached = self._cache.get(facility_id)
+        if cached is not None:
+            value, stored_at, ttl, _ = cached
+            age = time.monotonic() - stored_at
+            if age < ttl:
+                self.hits += 1
+                self._cache.move_to_end(facility_id)
+                return None if value is _MISSING else value
+            if value is not _MISSING and age < self._stale_ttl:
+                self.hits += 1
+                self._refresh(facility_id)
+                return value
+
+        self.misses += 1
+        value = await asyncio.shield(self._refresh(facility_id))
+        return None if value is _MISSING else value
+
+    async def prefetch(self) -> int:
+        """Warm the cache with every facility (by id and short_code)"""
+        try:
+            response = await self._client.get("/facilities")
+            response.raise_for_status()
+        except Exception as e:
+            logger.warning(f"Registry prefetch failed, hospitals will load on demand: {e}")
+            return 0
+        facilities = response.json()
+        # Whole-registry ETag: also valid for each /facilities/{id}
+        etag = response.headers.get("etag")
+        for data in facilities:
+            value = self._parse(data)
+            self._store(data["id"], value, self._ttl, etag)
+            if data.get("short_code"):
+                self._store(data["short_code"], value, self._ttl, etag)
+        logger.info(f"Prefetched {len(facilities)} hospitals from registry")
+        return len(facilities)
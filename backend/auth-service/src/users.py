@@ -0,0 +1,43 @@
+"""
+User records for auth-service.
+
+One store per worker process, created in the app lifespan (``app.state.users``)
+rather than at import time, so every worker starts from the same seed and
+owns its copy outright. Public ``User`` objects are built once per user and
+dropped whenever that user's record changes.
+
+The records themselves are the demo accounts; a hash upgrade on login only
+touches the worker that served it, which is harmless since the old and new
+hashes verify the same password.
+"""
+
+from typing import Any, Callable, Dict, Generic, Iterable, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class UserStore(Generic[T]):
+    def __init__(self, records: Iterable[Dict[str, Any]],
+                 build: Callable[[Dict[str, Any]], T]) -> None:
+        self._records: Dict[str, Dict[str, Any]] = {r["email"]: dict(r) for r in records}
+        self._build = build
+        self._users: Dict[str, T] = {}
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def record(self, email: str) -> Optional[Dict[str, Any]]:
+        return self._records.get(email)
+
+    def get(self, email: str) -> Optional[T]:
+        user = self._users.get(email)
+        if user is None:
+            record = self._records.get(email)
+            if record is None:
+                return None
+            user = self._users[email] = self._build(record)
+        return user
+
+    def set_password_hash(self, email: str, hashed_password: str) -> None:
+        self._records[email]["hashed_password"] = hashed_password
+        self._users.pop(email, None)
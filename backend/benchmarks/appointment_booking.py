@@ -0,0 +1,368 @@
+"""
+Appointment booking benchmark.
+
+Gives every facility of a synthetic national registry (default 2,000) a
+clinician with weekday sessions over the coming weeks, then measures:
+
+- the AvailabilityIndex alone: bookings per second, and the latency of
+  "next free slot" over every CMA of a region, over one facility and over
+  the whole country;
+- the service in-process (httpx ASGI transport): POST /appointments/next from
+  concurrent clients, the same slot searched and booked per request;
+- contention: N clients racing for one slot, which exactly one may get, and
+  N clients all booking "the next slot" in one small region, who must all
+  get different ones;
+- a sweep of every booking made, which fails the run if any two booked
+  appointments of a clinician overlap.
+
+With --database-url the contention rounds also run against Postgres, through
+several repositories at once standing in for workers, each with its own
+index (the database must allow CREATE EXTENSION btree_gist; the tables are
+created if missing and the run's rows deleted afterwards).
+
+    python backend/benchmarks/appointment_booking.py --facilities 2000 --output booking.json
+"""
+
+from datetime import date, datetime, time as clock, timedelta, timezone
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import random
+import statistics
+import sys
+import time
+
+from patient_search import percentile
+from suite import BACKEND, synthetic_registry
+
+# A weekday session from 08:00 to 16:00, for this many days from tomorrow
+DAYS = 28
+
+
+def facilities_of(document: Dict[str, Any]) -> List[Dict[str, Any]]:
+    return [
+        {**f, "region_id": r["region_id"], "region_name": r["name"]}
+        for r in document["regions"] for f in r["facilities"]
+    ]
+
+
+def schedule(facility_ids: List[str], first_day: date):
+    """(facility, clinician, start, end) of every synthetic session"""
+    for n, facility_id in enumerate(facility_ids):
+        for offset in range(DAYS):
+            day = first_day + timedelta(days=offset)
+            if day.weekday() < 5:
+                yield (facility_id, f"USR-{n:07d}",
+                       datetime.combine(day, clock(8), tzinfo=timezone.utc),
+                       datetime.combine(day, clock(16), tzinfo=timezone.utc))
+
+
+def latency(samples: List[float]) -> Dict[str, float]:
+    return {
+        "p50_us": round(statistics.median(samples), 1),
+        "p99_us": round(percentile(samples, 99), 1),
+    }
+
+
+def engine(facilities: List[Dict[str, Any]], first_day: date, bookings: int) -> Dict[str, Any]:
+    from src.availability import AvailabilityIndex
+
+    index = AvailabilityIndex()
+    started = time.perf_counter()
+    sessions = 0
+    for session in schedule([f["id"] for f in facilities], first_day):
+        index.open(*session)
+        sessions += 1
+    setup_s = time.perf_counter() - started
+
+    rng = random.Random(7)
+    regions: Dict[str, List[str]] = {}
+    for f in facilities:
+        if f["type"] == "CMA":
+            regions.setdefault(f["region_id"], []).append(f["id"])
+    region_cmas = list(regions.values())
+    every = [f["id"] for f in facilities]
+    not_before = datetime.combine(first_day, clock(), tzinfo=timezone.utc)
+
+    def timed(queries: int, search) -> Dict[str, float]:
+        samples = []
+        for _ in range(queries):
+            t0 = time.perf_counter()
+            search()
+            samples.append((time.perf_counter() - t0) * 1e6)
+        return latency(samples)
+
+    report = {
+        "sessions": sessions,
+        "setup_seconds": round(setup_s, 2),
+        "next_slot_facility": timed(
+            5_000, lambda: index.first_free([rng.choice(every)], 30, not_before)
+        ),
+        "next_slot_region_cma": timed(
+            2_000, lambda: index.first_free(rng.choice(region_cmas), 30, not_before)
+        ),
+        "next_slot_country": timed(50, lambda: index.first_free(every, 30, not_before)),
+    }
+
+    # Book the next 30 minutes at random CMA regions until done (what the
+    # endpoint does, minus HTTP)
+    booked = 0
+    started = time.perf_counter()
+    for _ in range(bookings):
+        slot = index.first_free(rng.choice(region_cmas), 30, not_before)
+        if slot is None or not index.book(*slot):
+            break
+        booked += 1
+    elapsed = time.perf_counter() - started
+    report["book_next"] = {"bookings": booked, "bookings_per_sec": round(booked / elapsed, 1)}
+
+    # Specific slots, as POST /appointments books them (taken ones refused)
+    slots = [
+        (f, f"USR-{n:07d}", datetime.combine(
+            first_day + timedelta(days=rng.randrange(DAYS)),
+            clock(8 + rng.randrange(8), 15 * rng.randrange(4)),
+            tzinfo=timezone.utc,
+        ))
+        for n, f in ((n, every[n]) for n in (rng.randrange(len(every)) for _ in range(bookings)))
+    ]
+    accepted = 0
+    started = time.perf_counter()
+    for facility_id, clinician_id, start in slots:
+        accepted += index.book(facility_id, clinician_id, start, start + timedelta(minutes=15))
+    elapsed = time.perf_counter() - started
+    report["book_slot"] = {
+        "attempts": len(slots), "accepted": accepted,
+        "attempts_per_sec": round(len(slots) / elapsed, 1),
+    }
+    return report
+
+
+async def api(facilities: List[Dict[str, Any]], first_day: date, args) -> Dict[str, Any]:
+    import httpx
+
+    from src import main
+
+    async with main.app.router.lifespan_context(main.app):
+        main.facilities.load(facilities)
+        repo = main.app.state.appointments
+        for session in schedule([f["id"] for f in facilities], first_day):
+            repo.index.open(*session)
+        regions = sorted({f["region_id"] for f in facilities if f["type"] == "CMA"})
+        not_before = datetime.combine(first_day, clock(), tzinfo=timezone.utc).isoformat()
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://appointment") as client:
+            made: List[Dict[str, Any]] = []
+            latencies: List[float] = []
+            counter = iter(range(args.requests))
+
+            async def user() -> None:
+                for n in counter:
+                    t0 = time.perf_counter()
+                    response = await client.post("/appointments/next", json={
+                        "patient_id": f"PAT-{n:010X}", "region": regions[n % len(regions)],
+                        "type": "CMA", "duration_minutes": 30, "not_before": not_before,
+                    })
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    if response.status_code == 201:
+                        made.append(response.json())
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user() for _ in range(args.concurrency)))
+            elapsed = time.perf_counter() - started
+            report = {
+                "book_next": {
+                    "requests": len(latencies),
+                    "booked": len(made),
+                    "bookings_per_sec": round(len(made) / elapsed, 1),
+                    "p50_ms": round(statistics.median(latencies), 3),
+                    "p99_ms": round(percentile(latencies, 99), 3),
+                },
+            }
+
+            # One slot, many clients: exactly one 201
+            slot = (await client.get("/slots/next", params={
+                "region": regions[0], "type": "CMA", "not_before": not_before})).json()
+            body = {k: slot[k] for k in ("facility_id", "clinician_id", "start", "end")}
+            responses = await asyncio.gather(*(
+                client.post("/appointments", json={**body, "patient_id": f"RACE-{i}"})
+                for i in range(args.racers)
+            ))
+            codes = [r.status_code for r in responses]
+            made += [r.json() for r in responses if r.status_code == 201]
+            report["same_slot"] = {"racers": args.racers, "booked": codes.count(201),
+                                   "conflicts": codes.count(409)}
+
+            # Many clients, "the next slot" in one region: all different
+            responses = await asyncio.gather(*(
+                client.post("/appointments/next", json={
+                    "patient_id": f"NEXT-{i}", "region": regions[-1], "type": "CMA",
+                    "not_before": not_before,
+                })
+                for i in range(args.racers)
+            ))
+            got = [r.json() for r in responses if r.status_code == 201]
+            made += got
+            report["next_slot_race"] = {
+                "racers": args.racers, "booked": len(got),
+                "distinct": len({(a["clinician_id"], a["start"]) for a in got}),
+            }
+    report["overlaps"] = overlaps(made)
+    return report
+
+
+def overlaps(appointments: List[Dict[str, Any]]) -> int:
+    """Pairs of booked appointments of one clinician that overlap"""
+    found = 0
+    by_clinician: Dict[str, List[tuple]] = {}
+    for a in appointments:
+        if a["status"] == "booked":
+            by_clinician.setdefault(a["clinician_id"], []).append((a["start"], a["end"]))
+    for periods in by_clinician.values():
+        periods.sort()
+        for (_, end), (start, _) in zip(periods, periods[1:]):
+            found += start < end
+    return found
+
+
+async def postgres(dsn: str, facilities: List[Dict[str, Any]], first_day: date,
+                   args) -> Dict[str, Any]:
+    """Workers (repositories with their own index) racing on one database"""
+    from src.availability import SlotUnavailable
+    from src.main import new_appointment
+    from src.models import Session, generate_session_id
+    from src.postgres import PostgresAppointmentRepository
+
+    workers = [
+        PostgresAppointmentRepository(dsn, 15, min_size=1, max_size=4)
+        for _ in range(args.workers)
+    ]
+    for worker in workers:
+        await worker.connect()
+    run = f"BENCH-{os.getpid()}"
+    facility_ids = [f["id"] for f in facilities if f["type"] == "CMA"][:5]
+    created_at = datetime.utcnow().isoformat() + "Z"
+    try:
+        for facility_id, clinician_id, start, end in schedule(facility_ids, first_day):
+            await workers[0].add_session(Session(
+                session_id=generate_session_id(), facility_id=facility_id,
+                clinician_id=f"{run}-{clinician_id}", start=start, end=end, created_at=created_at,
+            ))
+        await asyncio.sleep(0.5)  # the other workers' notifications
+        not_before = datetime.combine(first_day, clock(), tzinfo=timezone.utc)
+
+        slot = workers[0].index.first_free(facility_ids, 30, not_before)
+
+        async def one(i: int) -> bool:
+            try:
+                await workers[i % len(workers)].book(
+                    new_appointment(*slot, f"RACE-{i}", None))
+                return True
+            except SlotUnavailable:
+                return False
+
+        won = await asyncio.gather(*(one(i) for i in range(args.racers)))
+
+        async def next_one(i: int) -> Optional[Any]:
+            try:
+                return await workers[i % len(workers)].book_first(
+                    facility_ids, 30, not_before,
+                    lambda s: new_appointment(*s, f"NEXT-{i}", None),
+                )
+            except SlotUnavailable:
+                return None
+
+        started = time.perf_counter()
+        got = [a for a in await asyncio.gather(*(next_one(i) for i in range(args.racers))) if a]
+        elapsed = time.perf_counter() - started
+        # What the database holds (the bookings made above are among them)
+        booked = [
+            a.model_dump(mode="json")
+            for f in facility_ids
+            for a in await workers[0].list(facility_id=f, status="booked", limit=1000)
+            if a.clinician_id.startswith(run)
+        ]
+        return {
+            "workers": len(workers),
+            "same_slot": {"racers": args.racers, "booked": sum(won)},
+            "next_slot_race": {
+                "racers": args.racers, "booked": len(got),
+                "distinct": len({(a.clinician_id, a.start) for a in got}),
+                "bookings_per_sec": round(len(got) / elapsed, 1),
+            },
+            "overlaps": overlaps(booked),
+        }
+    finally:
+        async with workers[0].pool.acquire() as conn:
+            await conn.execute("DELETE FROM appointments WHERE clinician_id LIKE $1", f"{run}-%")
+            await conn.execute(
+                "DELETE FROM clinician_sessions WHERE clinician_id LIKE $1", f"{run}-%"
+            )
+        for worker in workers:
+            await worker.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--facilities", type=int, default=2_000)
+    parser.add_argument("--bookings", type=int, default=50_000, help="index-level bookings")
+    parser.add_argument("--requests", type=int, default=5_000,
+                        help="POST /appointments/next requests")
+    parser.add_argument("--concurrency", type=int, default=32, help="concurrent in-process clients")
+    parser.add_argument("--racers", type=int, default=200, help="clients per contention round")
+    parser.add_argument("--database-url", help="also race workers on this Postgres")
+    parser.add_argument("--workers", type=int, default=4, help="repositories racing on Postgres")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    os.environ.update(
+        AUTH_REQUIRED="false", APPOINTMENT_STORE="memory", REGISTRY_URL="http://127.0.0.1:9"
+    )
+    os.environ.pop("DATABASE_URL", None)
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "appointment-service")]
+    logging.disable(logging.CRITICAL)
+
+    facilities = facilities_of(synthetic_registry(args.facilities))
+    first_day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    report = {
+        "facilities": len(facilities),
+        "engine": engine(facilities, first_day, args.bookings),
+        "api": asyncio.run(api(facilities, first_day, args)),
+    }
+    if args.database_url:
+        report["postgres"] = asyncio.run(postgres(args.database_url, facilities, first_day, args))
+
+    e, a = report["engine"], report["api"]
+    print(f"{len(facilities):,} facilities, {e['sessions']:,} sessions "
+          f"(indexed in {e['setup_seconds']}s)")
+    for name in ("next_slot_facility", "next_slot_region_cma", "next_slot_country"):
+        print(f"  {name:<24} p50 {e[name]['p50_us']:>9.1f} us   p99 {e[name]['p99_us']:>9.1f} us")
+    print(f"  index book_next          {e['book_next']['bookings_per_sec']:>11,.0f} bookings/s")
+    print(f"  index book_slot          {e['book_slot']['attempts_per_sec']:>11,.0f} attempts/s"
+          f"   ({e['book_slot']['accepted']:,} of {e['book_slot']['attempts']:,} free)")
+    b = a["book_next"]
+    print(f"  API /appointments/next   {b['bookings_per_sec']:>11,.0f} bookings/s"
+          f"   p50 {b['p50_ms']:.2f} ms   p99 {b['p99_ms']:.2f} ms")
+    runs = [("in-process", a)]
+    if "postgres" in report:
+        runs.append(("postgres", report["postgres"]))
+    failed = False
+    for name, run in runs:
+        same, race = run["same_slot"], run["next_slot_race"]
+        print(f"  {name}: {same['racers']} racers for one slot -> {same['booked']} booked; "
+              f"{race['racers']} for the next slot -> "
+              f"{race['distinct']} distinct of {race['booked']}; "
+              f"{run['overlaps']} overlaps")
+        failed |= same["booked"] != 1 or race["distinct"] != race["booked"] or run["overlaps"] > 0
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    if failed:
+        print("DOUBLE BOOKING")
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Auth-service login load test.
+
+Drives POST /login in-process (httpx ASGI transport, no network) with many
+concurrent clients and reports logins/sec and latency percentiles for each
+PASSWORD_HASH_WORKERS setting, showing how hashing scales across cores now
+that it runs off the event loop.
+
+    python backend/benchmarks/auth_login.py --workers 1 2 4 --concurrency 32
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import os
+import statistics
+import sys
+import time
+
+AUTH_SERVICE = Path(__file__).resolve().parents[1] / "auth-service"
+
+DEMO_CREDENTIALS = [
+    ("doctor@chu-ouaga.bf", "Doctor123!"),
+    ("nurse@chu-ouaga.bf", "Nurse123!"),
+    ("admin@danaya.bf", "Admin123!"),
+    ("doctor@chu-bobo.bf", "Doctor123!"),
+]
+
+
+def load_auth_app():
+    sys.path.insert(0, str(AUTH_SERVICE))
+    from src.main import app
+
+    return app
+
+
+async def run(app, workers: int, concurrency: int, duration: float) -> dict:
+    import httpx
+
+    os.environ["PASSWORD_HASH_WORKERS"] = str(workers)
+    latencies = []
+    async with app.router.lifespan_context(app):
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+            # First login migrates the legacy demo hashes; keep it out of the numbers
+            for email, password in DEMO_CREDENTIALS:
+                await client.post("/login", json={"email": email, "password": password})
+
+            deadline = time.perf_counter() + duration
+
+            async def user(n: int) -> None:
+                email, password = DEMO_CREDENTIALS[n % len(DEMO_CREDENTIALS)]
+                while time.perf_counter() < deadline:
+                    t0 = time.perf_counter()
+                    response = await client.post(
+                        "/login", json={"email": email, "password": password}
+                    )
+                    latencies.append((time.perf_counter() - t0) * 1000)
+                    assert response.status_code == 200, response.text
+
+            started = time.perf_counter()
+            await asyncio.gather(*(user(n) for n in range(concurrency)))
+            elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "workers": workers,
+        "concurrency": concurrency,
+        "logins": len(latencies),
+        "logins_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 1),
+        "p99_ms": round(latencies[int(len(latencies) * 0.99) - 1], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--workers", type=int, nargs="+",
+                        default=sorted({1, 2, os.cpu_count() or 1}))
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per run")
+    parser.add_argument("--rounds", type=int, default=12, help="bcrypt cost factor")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    os.environ["BCRYPT_ROUNDS"] = str(args.rounds)
+    # Point at a closed port: hospital lookups fail fast and are negatively cached
+    os.environ.setdefault("REGISTRY_URL", "http://127.0.0.1:9")
+    app = load_auth_app()
+    logging.disable(logging.CRITICAL)
+
+    results = [asyncio.run(run(app, w, args.concurrency, args.duration)) for w in args.workers]
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"cpu_count={os.cpu_count()} bcrypt_rounds={args.rounds} concurrency={args.concurrency}")
+    for r in results:
+        print(f"  workers={r['workers']:<3} {r['logins_per_sec']:>8.1f} logins/s"
+              f"   p50 {r['p50_ms']:>7.1f} ms   p99 {r['p99_ms']:>7.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
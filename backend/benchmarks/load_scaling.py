@@ -0,0 +1,230 @@
+"""
+Multi-worker scaling benchmark.
+
+Starts auth-service, patient-service and the registry under gunicorn with the
+production settings (shared/gunicorn_conf.py) at 1, 2, 4 ... workers, drives
+each with keep-alive HTTP/1.1 load from several client processes and reports
+requests/sec per worker count, with the speed-up over the first (1 worker).
+
+The load generator runs on the same machine, so by default services get at
+most half of the cores and the clients the rest.
+
+    python backend/benchmarks/load_scaling.py --workers 1 2 4 --duration 10
+"""
+
+from pathlib import Path
+from typing import Dict, List, Tuple
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+
+BACKEND = Path(__file__).resolve().parents[1]
+GUNICORN_CONF = BACKEND / "shared" / "gunicorn_conf.py"
+
+# Read-heavy requests each service serves on its hot path
+SERVICES = {
+    "auth": {
+        "dir": "auth-service",
+        "app": "src.main:app",
+        "paths": ["/users/me"],
+        # Nothing listens here, so the login's hospital lookup fails fast
+        "env": {"REGISTRY_URL": "http://127.0.0.1:9"},
+    },
+    "patient": {
+        "dir": "patient-service",
+        "app": "src.main:app",
+        "paths": ["/patients?limit=20", "/patients?search=ouedraogo&limit=20", "/patients/P001"],
+        "env": {"AUTH_REQUIRED": "false", "PATIENT_STORE": "memory"},
+    },
+    "registry": {
+        "dir": "registry",
+        "app": "main:app",
+        "paths": [
+            "/facilities?type=CHR",
+            "/facilities/nearest?lat=12.37&lon=-1.52&k=5",
+            "/facilities/BF-CHU-YALG",
+        ],
+        "env": {},
+    },
+}
+LOGIN = {"email": "doctor@chu-ouaga.bf", "password": "Doctor123!"}
+
+
+def cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_service(name: str, workers: int, port: int) -> subprocess.Popen:
+    service = SERVICES[name]
+    env = dict(
+        os.environ,
+        PYTHONPATH=str(BACKEND / "shared"),
+        WEB_CONCURRENCY=str(workers),
+        LOG_LEVEL="warning",
+        **service["env"],
+    )
+    env.pop("DATABASE_URL", None)
+    env.pop("REDIS_URL", None)
+    process = subprocess.Popen(
+        [sys.executable, "-m", "gunicorn", "-c", str(GUNICORN_CONF),
+         "--bind", f"127.0.0.1:{port}", service["app"]],
+        cwd=BACKEND / service["dir"],
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        if process.poll() is not None:
+            raise RuntimeError(f"{name} exited with {process.returncode} (is gunicorn installed?)")
+        try:
+            urllib.request.urlopen(f"http://127.0.0.1:{port}/health/ready", timeout=1).read()
+            # Ready as soon as one worker is up; give the rest time to boot
+            time.sleep(1 + 0.25 * workers)
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"{name} did not become healthy")
+
+
+def stop_service(process: subprocess.Popen) -> None:
+    process.terminate()
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+        process.wait()
+
+
+def login_token(port: int) -> str:
+    request = urllib.request.Request(
+        f"http://127.0.0.1:{port}/login",
+        data=json.dumps(LOGIN).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    return json.load(urllib.request.urlopen(request, timeout=10))["access_token"]
+
+
+def raw_requests(paths: List[str], port: int, token: str = "") -> List[bytes]:
+    auth = f"Authorization: Bearer {token}\r\n" if token else ""
+    return [
+        (f"GET {path} HTTP/1.1\r\nHost: 127.0.0.1:{port}\r\n"
+         f"{auth}Connection: keep-alive\r\n\r\n").encode()
+        for path in paths
+    ]
+
+
+async def _connection(port: int, requests: List[bytes], deadline: float, counts: List[int]) -> None:
+    reader, writer = await asyncio.open_connection("127.0.0.1", port)
+    i = 0
+    try:
+        while time.perf_counter() < deadline:
+            writer.write(requests[i % len(requests)])
+            i += 1
+            status = int((await reader.readline()).split()[1])
+            length = 0
+            while (line := await reader.readline()) not in (b"\r\n", b""):
+                name, _, value = line.partition(b":")
+                if name.strip().lower() == b"content-length":
+                    length = int(value)
+            await reader.readexactly(length)
+            counts[0 if status < 400 else 1] += 1
+    finally:
+        writer.close()
+
+
+def _client(args: Tuple[int, List[bytes], int, float]) -> List[int]:
+    port, requests, connections, duration = args
+    counts = [0, 0]  # ok, errors
+
+    async def run() -> None:
+        deadline = time.perf_counter() + duration
+        await asyncio.gather(
+            *(_connection(port, requests, deadline, counts) for _ in range(connections))
+        )
+
+    asyncio.run(run())
+    return counts
+
+
+def drive(pool, port: int, requests: List[bytes], clients: int, connections: int,
+          duration: float) -> Tuple[float, int]:
+    """Requests/sec (successful) and error count over ``duration`` seconds"""
+    per_client = max(1, connections // clients)
+    started = time.perf_counter()
+    results = pool.map(_client, [(port, requests, per_client, duration)] * clients)
+    elapsed = time.perf_counter() - started
+    ok = sum(r[0] for r in results)
+    return ok / elapsed, sum(r[1] for r in results)
+
+
+def measure(name: str, workers: int, pool, clients: int, connections: int,
+            duration: float) -> Dict:
+    port = free_port()
+    process = start_service(name, workers, port)
+    try:
+        token = login_token(port) if name == "auth" else ""
+        requests = raw_requests(SERVICES[name]["paths"], port, token)
+        drive(pool, port, requests, clients, connections, 1.0)  # warm-up
+        rate, errors = drive(pool, port, requests, clients, connections, duration)
+    finally:
+        stop_service(process)
+    return {"service": name, "workers": workers, "requests_per_sec": round(rate), "errors": errors}
+
+
+def main() -> None:
+    cpus = cpu_count()
+    default_workers = [1]
+    while default_workers[-1] * 2 <= max(1, cpus // 2):
+        default_workers.append(default_workers[-1] * 2)
+
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--services", nargs="+", choices=list(SERVICES), default=list(SERVICES))
+    parser.add_argument("--workers", nargs="+", type=int, default=default_workers)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds per measurement")
+    parser.add_argument("--connections", type=int, default=64,
+                        help="concurrent keep-alive connections")
+    parser.add_argument("--clients", type=int, default=max(1, cpus - max(default_workers)),
+                        help="load generator processes")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    results = []
+    with multiprocessing.Pool(args.clients) as pool:
+        for name in args.services:
+            baseline = None
+            for workers in args.workers:
+                result = measure(name, workers, pool, args.clients, args.connections, args.duration)
+                baseline = baseline or result["requests_per_sec"]
+                result["speedup"] = (
+                    round(result["requests_per_sec"] / baseline, 2) if baseline else None
+                )
+                results.append(result)
+                if not args.json:
+                    rate = result["requests_per_sec"]
+                    print(f"  {name:<10} {workers:>3} worker(s) {rate:>10,} req/s"
+                          f"  x{result['speedup']}  ({result['errors']} errors)")
+
+    if args.json:
+        print(json.dumps({"cpus": cpus, "clients": args.clients, "results": results}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,143 @@
+"""
+Memory footprint of the in-memory patient and facility stores.
+
+Measures, with tracemalloc, what each store keeps per 100,000 records:
+
+- patients: a dict of Pydantic Patient models (the store's old layout)
+  against the column-wise PatientTable, plus the in-memory repository as a
+  whole (table, search, keyset and linkage indexes), and what reading one
+  patient back out of the table costs;
+- facilities: the registry's facility dicts as it used to keep them (a copy
+  of every facility with the region fields spread in, reachable under both
+  its id and its short_code, next to the index) against the FacilityIndex
+  and SpatialIndex it now keeps alone.
+
+Synthetic records as in suite.py.
+
+    python backend/benchmarks/memory_footprint.py --patients 100000 --output memory.json
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import gc
+import json
+import logging
+import random
+import sys
+import time
+import tracemalloc
+
+from suite import BACKEND, synthetic_patients, synthetic_registry
+
+PER = 100_000
+
+
+def measured(build: Callable[[], Any]) -> Tuple[Any, int]:
+    """What build() returns and the bytes still allocated for it"""
+    gc.collect()
+    before = tracemalloc.get_traced_memory()[0]
+    built = build()
+    gc.collect()
+    return built, tracemalloc.get_traced_memory()[0] - before
+
+
+def per_100k(used: int, count: int) -> float:
+    """MB per 100,000 records"""
+    return round(used / count * PER / 1e6, 1)
+
+
+def patients(count: int) -> Dict[str, Any]:
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "patient-service")]
+    from src.compact import PatientTable
+    from src.models import Patient
+    from src.repository import InMemoryPatientRepository
+
+    fields = list(synthetic_patients(count))
+    models, as_models = measured(lambda: {f["patient_id"]: Patient(**f) for f in fields})
+    table, as_table = measured(lambda: PatientTable(models.values()))
+    _, repository = measured(lambda: InMemoryPatientRepository(models.values()))
+
+    assert all(table[pid] == patient for pid, patient in list(models.items())[:1000])
+    ids = random.Random(7).sample(list(models), min(count, 10_000))
+    tracemalloc.stop()
+    started = time.perf_counter()
+    for pid in ids:
+        table.get(pid)
+    get_us = (time.perf_counter() - started) / len(ids) * 1e6
+    tracemalloc.start()
+    return {
+        "records": count,
+        "models_mb_per_100k": per_100k(as_models, count),
+        "table_mb_per_100k": per_100k(as_table, count),
+        "reduction": round(as_models / as_table, 1),
+        "repository_mb_per_100k": per_100k(repository, count),
+        "table": table.stats(),
+        "materialize_us": round(get_us, 1),
+    }
+
+
+def facilities(count: int) -> Dict[str, Any]:
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "registry")]
+    from pydantic import TypeAdapter
+
+    from facility_index import FacilityIndex
+    from main import Facility
+    from spatial import SpatialIndex
+
+    data = synthetic_registry(count)
+    adapter = TypeAdapter(List[Facility])
+
+    def dicts() -> Dict[str, Dict[str, Any]]:
+        by_key: Dict[str, Dict[str, Any]] = {}
+        for region in data["regions"]:
+            for facility in region["facilities"]:
+                entry = {**facility, "region_id": region["region_id"],
+                         "region_name": region["name"]}
+                by_key[entry["id"]] = by_key[entry["short_code"]] = entry
+        return by_key
+
+    by_key, as_dicts = measured(dicts)
+    unique = list({id(entry): entry for entry in by_key.values()}.values())
+    models = adapter.validate_python(unique)
+    _, as_index = measured(lambda: (
+        FacilityIndex(models), SpatialIndex([(m.latitude, m.longitude) for m in models])
+    ))
+    return {
+        "records": count,
+        "before_mb_per_100k": per_100k(as_dicts + as_index, count),
+        "after_mb_per_100k": per_100k(as_index, count),
+        "dicts_mb_per_100k": per_100k(as_dicts, count),
+        "reduction": round((as_dicts + as_index) / as_index, 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--patients", type=int, default=PER)
+    parser.add_argument("--facilities", type=int, default=20_000)
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    args = parser.parse_args()
+
+    logging.disable(logging.CRITICAL)
+    tracemalloc.start()
+    report = {"patients": patients(args.patients), "facilities": facilities(args.facilities)}
+    tracemalloc.stop()
+
+    p, f = report["patients"], report["facilities"]
+    print(f"Patients ({p['records']:,}), MB per 100k")
+    print(f"  Pydantic models in a dict   {p['models_mb_per_100k']:>7.1f}")
+    print(f"  PatientTable                {p['table_mb_per_100k']:>7.1f}"
+          f"   x{p['reduction']} smaller")
+    print(f"  whole repository (indexes)  {p['repository_mb_per_100k']:>7.1f}")
+    print(f"  reading one patient         {p['materialize_us']:>7.1f} us")
+    print(f"Facilities ({f['records']:,}), MB per 100k")
+    print(f"  dicts + indexes (before)    {f['before_mb_per_100k']:>7.1f}")
+    print(f"  indexes only                {f['after_mb_per_100k']:>7.1f}"
+          f"   x{f['reduction']} smaller")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Bulk import benchmark.
+
+Generates a synthetic CSV register (with a share of duplicate national IDs
+and invalid rows), streams it through the patient-service importer into the
+in-memory store (or Postgres with --dsn), and compares throughput with
+posting the same patients one at a time to ``POST /patients``.
+
+    python backend/benchmarks/patient_import.py --rows 1000000
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import csv
+import io
+import json
+import logging
+import random
+import sys
+import time
+
+from patient_search import FIRST_NAMES, LAST_NAMES
+
+BACKEND = Path(__file__).resolve().parents[1]
+COLUMNS = ["national_id", "first_name", "last_name", "sex", "date_of_birth",
+           "phone", "address", "region_id", "hospital_id"]
+REGIONS = ["Centre", "Hauts-Bassins", "Nord", "Est", "Sahel", "Boucle du Mouhoun"]
+
+
+def synthetic_csv(rows: int, seed: int = 42, chunk_rows: int = 1_000):
+    """CSV in byte chunks: ~1% duplicate national IDs, ~0.5% rows missing last_name"""
+    rng = random.Random(seed)
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(COLUMNS)
+    for i in range(rows):
+        nid = i if rng.random() > 0.01 else rng.randrange(max(1, i))
+        writer.writerow([
+            f"BF{2000 + nid % 26}{nid:09d}",
+            rng.choice(FIRST_NAMES),
+            rng.choice(LAST_NAMES) if rng.random() > 0.005 else "",
+            rng.choice("MF"),
+            f"{rng.randrange(1940, 2024)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}",
+            f"+226 7{rng.randrange(10)} {rng.randrange(100):02d} "
+            f"{rng.randrange(100):02d} {rng.randrange(100):02d}",
+            f"Secteur {rng.randrange(1, 55)}, Ouagadougou",
+            rng.choice(REGIONS),
+            "BF-CHU-YALG",
+        ])
+        if i % chunk_rows == chunk_rows - 1:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode()
+
+
+async def stream(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+async def make_repository(dsn):
+    from src.repository import InMemoryPatientRepository
+
+    if not dsn:
+        return InMemoryPatientRepository()
+    from src.postgres import PostgresPatientRepository
+
+    repo = PostgresPatientRepository(dsn)
+    await repo.connect()
+    await repo.pool.execute("TRUNCATE patients")
+    return repo
+
+
+async def bulk_rate(chunks, batch_size: int, dsn):
+    from src.importer import import_patients
+
+    repo = await make_repository(dsn)
+    report = await import_patients(repo, stream(chunks), "csv", batch_size)
+    await repo.close()
+    return report
+
+
+async def single_rate(chunks) -> float:
+    """Baseline: one POST /patients per row, in-process (no network), as a
+    migration script using the existing API would do"""
+    import contextlib
+    import os
+
+    import httpx
+
+    os.environ["AUTH_REQUIRED"] = "false"
+    from src.main import app
+
+    rows = list(csv.DictReader(b"".join(chunks).decode().splitlines()))
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://patients") as client:
+        async with app.router.lifespan_context(app):
+            started = time.perf_counter()
+            with contextlib.redirect_stdout(io.StringIO()):
+                for row in rows:
+                    await client.post("/patients", json={k: v for k, v in row.items() if v})
+            return round(len(rows) / (time.perf_counter() - started))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--batch-size", type=int, default=5_000)
+    parser.add_argument("--baseline-rows", type=int, default=5_000,
+                        help="rows for the one-request-per-row baseline")
+    parser.add_argument("--dsn", help="Postgres DSN (default: in-memory store)")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND / "shared"))
+    sys.path.insert(0, str(BACKEND / "patient-service"))
+    logging.disable(logging.CRITICAL)
+
+    # Generated up front so only the import itself is timed
+    chunks = list(synthetic_csv(args.rows))
+    report = asyncio.run(bulk_rate(chunks, args.batch_size, args.dsn))
+    results = {
+        "rows": report.received,
+        "imported": report.imported,
+        "duplicates": report.duplicates,
+        "failed": report.failed,
+        "seconds": round(report.seconds, 2),
+        "bulk_rows_per_sec": report.rows_per_second,
+        "single_rows_per_sec": asyncio.run(
+            single_rate(list(synthetic_csv(args.baseline_rows)))
+        ),
+    }
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, value in results.items():
+        print(f"  {name:<20} {value:>12,}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,141 @@
+"""
+Record linkage benchmark.
+
+Builds a synthetic register in which a share of people were registered
+twice (at another facility, with spelling variants, swapped day/month,
+swapped name order or a missing phone), runs the batch linkage scan over
+the in-memory store and reports time, pairs compared (against the n^2/2 of
+an exhaustive comparison) and recall / precision on the planted duplicates
+(precision over all links, and over the links scored as a "match").
+
+    python backend/benchmarks/patient_linkage.py --patients 100000
+"""
+
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import random
+import sys
+import time
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+SYLLABLES = ["ou", "e", "dra", "o", "go", "sa", "wa", "do", "zon", "ka", "bo", "re", "tra",
+             "ko", "ne", "ya", "me", "ni", "kie", "tap", "so", "ba", "ri", "kou", "li", "ti",
+             "en", "be", "san", "gui", "ro", "da", "zan", "na", "ma", "di"]
+FIRST_NAMES = ["Awa", "Salif", "Mariam", "Ibrahim", "Aminata", "Boureima", "Fatou", "Moussa",
+               "Adama", "Rasmané", "Issouf", "Haoua", "Alizèta", "Souleymane", "Kadiatou",
+               "Oumarou", "Saïdou", "Noélie", "Hamidou", "Rokia", "Abdoulaye", "Bintou",
+               "Aïcha", "Yacouba", "Safiatou", "Lassané", "Pélagie", "Ousmane", "Djénéba",
+               "Tiga", "Rasmata", "Brahima", "Zénabo", "Inoussa", "Awa-Marie", "Karim"]
+# Spelling variants a second registration might use
+VARIANTS = [("ou", "w"), ("é", "e"), ("dj", "j"), ("y", "i"), ("ss", "s"), ("c", "k")]
+
+
+def make_person(rng: random.Random, i: int) -> dict:
+    last = "".join(rng.choice(SYLLABLES) for _ in range(rng.randint(2, 4))).capitalize()
+    return {
+        "patient_id": f"PAT-{i:010X}",
+        "first_name": rng.choice(FIRST_NAMES),
+        "last_name": last,
+        "sex": rng.choice("MF"),
+        "date_of_birth": (
+            f"{rng.randrange(1940, 2024)}-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}"
+        ),
+        "phone": (
+            f"+226 7{rng.randrange(10)} {rng.randrange(100):02d} "
+            f"{rng.randrange(100):02d} {rng.randrange(100):02d}"
+        ) if rng.random() < 0.6 else None,
+        "national_id": None,
+        "created_at": "2025-01-01T00:00:00Z",
+        "updated_at": "2025-01-01T00:00:00Z",
+    }
+
+
+def re_registration(rng: random.Random, person: dict, i: int) -> dict:
+    copy = dict(person, patient_id=f"PAT-{i:010X}")
+    for pattern, replacement in rng.sample(VARIANTS, 2):
+        copy["last_name"] = copy["last_name"].replace(pattern, replacement)
+    kind = rng.random()
+    if kind < 0.2:
+        y, m, d = copy["date_of_birth"].split("-")
+        copy["date_of_birth"] = f"{y}-{d}-{m}" if int(d) <= 12 else copy["date_of_birth"]
+    elif kind < 0.35:
+        copy["first_name"], copy["last_name"] = copy["last_name"], copy["first_name"]
+    elif kind < 0.6:
+        copy["phone"] = None
+    return copy
+
+
+def synthetic_register(count: int, duplicate_rate: float, seed: int = 42):
+    rng = random.Random(seed)
+    people, planted = [], set()
+    for i in range(count):
+        if people and rng.random() < duplicate_rate:
+            original = rng.choice(people)
+            people.append(re_registration(rng, original, i))
+            planted.add(tuple(sorted((original["patient_id"], people[-1]["patient_id"]))))
+        else:
+            people.append(make_person(rng, i))
+    return people, planted
+
+
+async def run(patients: int, duplicate_rate: float, max_block: int) -> dict:
+    from src.link_patients import scan
+    from src.linkage import MATCH
+    from src.models import Patient
+    from src.repository import InMemoryPatientRepository
+
+    people, planted = synthetic_register(patients, duplicate_rate)
+    repo = InMemoryPatientRepository(Patient(**p) for p in people)
+
+    started = time.perf_counter()
+    stats = await scan(repo, max_block)
+    elapsed = time.perf_counter() - started
+
+    found, matches = set(), set()
+    for p in people:
+        for other, score in (await repo.matches(p["patient_id"])).items():
+            pair = tuple(sorted((p["patient_id"], other)))
+            found.add(pair)
+            if score >= MATCH:
+                matches.add(pair)
+    return {
+        "patients": patients,
+        "planted_duplicates": len(planted),
+        "links_found": len(found),
+        "recall": round(len(found & planted) / len(planted), 3) if planted else None,
+        "precision": round(len(found & planted) / len(found), 3) if found else None,
+        "match_precision": round(len(matches & planted) / len(matches), 3) if matches else None,
+        "pairs_compared": stats["pairs_compared"],
+        "exhaustive_pairs": patients * (patients - 1) // 2,
+        "scan_seconds": round(elapsed, 2),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--patients", type=int, default=100_000)
+    parser.add_argument("--duplicate-rate", type=float, default=0.05)
+    parser.add_argument("--max-block", type=int, default=500)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND / "patient-service"))
+    logging.disable(logging.CRITICAL)
+    results = asyncio.run(run(args.patients, args.duplicate_rate, args.max_block))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, value in results.items():
+        if isinstance(value, int):
+            print(f"  {name:<20} {value:>16,}")
+        else:
+            print(f"  {name:<20} {value:>16}")
+
+
+if __name__ == "__main__":
+    main()
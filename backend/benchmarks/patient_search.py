@@ -0,0 +1,130 @@
+"""
+Patient search benchmark.
+
+Builds a synthetic national register, indexes it with the patient-service
+PatientSearchIndex and reports query latency percentiles for a staff-portal
+keystroke mix (short prefixes, full names, substrings, national IDs).
+
+    python backend/benchmarks/patient_search.py --patients 1000000
+"""
+
+from pathlib import Path
+from types import SimpleNamespace
+import argparse
+import importlib.util
+import json
+import random
+import statistics
+import time
+
+SEARCH_MODULE = Path(__file__).resolve().parents[1] / "patient-service" / "src" / "search.py"
+
+FIRST_NAMES = [
+    "Awa", "Salif", "Mariam", "Ibrahim", "Aminata", "Boureima", "Fatou", "Moussa",
+    "Adama", "Rasmané", "Issouf", "Haoua", "Alizèta", "Souleymane", "Kadiatou",
+    "Oumarou", "Saïdou", "Noélie", "Hamidou", "Rokia", "Abdoulaye", "Bintou",
+]
+LAST_NAMES = [
+    "Ouédraogo", "Sawadogo", "Zongo", "Traoré", "Koné", "Kaboré", "Diallo",
+    "Compaoré", "Ilboudo", "Nikiéma", "Zoungrana", "Tapsoba", "Kiemtoré",
+    "Yaméogo", "Bonkoungou", "Sanou", "Barry", "Sana", "Coulibaly", "Dabiré",
+]
+
+
+def load_search_module():
+    spec = importlib.util.spec_from_file_location("patient_search", SEARCH_MODULE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_patients(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    # Widen the vocabulary the way a real register does (compound / rare names)
+    suffixes = [""] * 8 + [f"-{rng.choice(LAST_NAMES)}" for _ in range(4)] + [
+        f"{rng.randrange(100)}" for _ in range(2)
+    ]
+    for i in range(count):
+        yield SimpleNamespace(
+            patient_id=f"PAT-{i:010X}",
+            first_name=rng.choice(FIRST_NAMES),
+            last_name=rng.choice(LAST_NAMES) + rng.choice(suffixes),
+            national_id=f"BF{2000 + i % 26}{i:09d}" if rng.random() < 0.8 else None,
+        )
+
+
+def query_mix(count: int, patients: int, seed: int = 7):
+    rng = random.Random(seed)
+    queries = []
+    for _ in range(count):
+        kind = rng.random()
+        name = rng.choice(LAST_NAMES + FIRST_NAMES)
+        if kind < 0.4:
+            queries.append(name[:rng.randint(1, 5)])
+        elif kind < 0.6:
+            queries.append(f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}")
+        elif kind < 0.8:
+            start = rng.randint(1, max(1, len(name) - 3))
+            queries.append(name[start:start + 3])
+        else:
+            i = rng.randrange(patients)
+            queries.append(f"BF{2000 + i % 26}{i:09d}"[:rng.randint(6, 15)])
+    return queries
+
+
+def percentile(samples, pct):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * pct / 100))]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--patients", type=int, default=1_000_000)
+    parser.add_argument("--queries", type=int, default=5_000)
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    search = load_search_module()
+    index = search.PatientSearchIndex()
+
+    started = time.perf_counter()
+    index.add_many(synthetic_patients(args.patients))
+    build_s = time.perf_counter() - started
+
+    latencies = []
+    for query in query_mix(args.queries, args.patients):
+        t0 = time.perf_counter()
+        index.search(query, limit=args.limit)
+        latencies.append((time.perf_counter() - t0) * 1000)
+
+    updates = []
+    for patient in synthetic_patients(1_000, seed=99):
+        patient.patient_id = f"PAT-UPD{patient.patient_id[4:]}"
+        t0 = time.perf_counter()
+        index.add(patient)
+        updates.append((time.perf_counter() - t0) * 1000)
+
+    results = {
+        "patients": args.patients,
+        "queries": args.queries,
+        "build_seconds": round(build_s, 2),
+        "query_ms": {
+            "p50": round(statistics.median(latencies), 3),
+            "p95": round(percentile(latencies, 95), 3),
+            "p99": round(percentile(latencies, 99), 3),
+            "max": round(max(latencies), 3),
+        },
+        "insert_ms_p99": round(percentile(updates, 99), 3),
+    }
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"Indexed {args.patients:,} patients in {build_s:.1f}s")
+    for name, value in results["query_ms"].items():
+        print(f"  query {name}: {value:.3f} ms")
+    print(f"  insert p99: {results['insert_ms_p99']:.3f} ms")
+
+
+if __name__ == "__main__":
+    main()
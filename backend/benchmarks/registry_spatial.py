@@ -0,0 +1,120 @@
+"""
+Registry spatial index benchmark.
+
+Generates a synthetic national facility set (default 2,000: every CSPS plus
+CMA/CHR/CHU) inside Burkina Faso's bounding box and compares k-nearest /
+radius queries on the registry SpatialIndex with a linear haversine scan.
+
+    python backend/benchmarks/registry_spatial.py --facilities 2000
+"""
+
+from math import asin, cos, radians, sin, sqrt
+from pathlib import Path
+import argparse
+import importlib.util
+import json
+import random
+import statistics
+import time
+
+SPATIAL_MODULE = Path(__file__).resolve().parents[1] / "registry" / "spatial.py"
+
+# Rough national bounding box
+LAT_RANGE = (9.4, 15.1)
+LON_RANGE = (-5.5, 2.4)
+TYPE_MIX = [("CSPS", 0.9), ("CMA", 0.06), ("CHR", 0.03), ("CHU", 0.01)]
+
+
+def load_spatial_module():
+    spec = importlib.util.spec_from_file_location("registry_spatial", SPATIAL_MODULE)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+def synthetic_facilities(count: int, seed: int = 42):
+    rng = random.Random(seed)
+    facilities = []
+    for i in range(count):
+        roll, ftype = rng.random(), "CSPS"
+        for name, share in TYPE_MIX:
+            if roll < share:
+                ftype = name
+                break
+            roll -= share
+        facilities.append({
+            "id": f"BF-{ftype}-{i:05d}",
+            "type": ftype,
+            "latitude": rng.uniform(*LAT_RANGE),
+            "longitude": rng.uniform(*LON_RANGE),
+            "surgery": ftype != "CSPS" and rng.random() < 0.8,
+        })
+    return facilities
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    dlat, dlon = radians(lat2 - lat1), radians(lon2 - lon1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlon / 2) ** 2
+    return 2 * 6371.0088 * asin(sqrt(a))
+
+
+def timed(fn, queries):
+    samples = []
+    for query in queries:
+        t0 = time.perf_counter()
+        fn(*query)
+        samples.append((time.perf_counter() - t0) * 1_000_000)
+    samples.sort()
+    return {
+        "p50_us": round(statistics.median(samples), 1),
+        "p99_us": round(samples[int(len(samples) * 0.99) - 1], 1),
+    }
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--facilities", type=int, default=2_000)
+    parser.add_argument("--queries", type=int, default=2_000)
+    parser.add_argument("--k", type=int, default=5)
+    parser.add_argument("--radius-km", type=float, default=50.0)
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    spatial = load_spatial_module()
+    facilities = synthetic_facilities(args.facilities)
+    started = time.perf_counter()
+    index = spatial.SpatialIndex([(f["latitude"], f["longitude"]) for f in facilities])
+    build_ms = (time.perf_counter() - started) * 1000
+
+    rng = random.Random(7)
+    queries = [(rng.uniform(*LAT_RANGE), rng.uniform(*LON_RANGE)) for _ in range(args.queries)]
+    referral = {pos for pos, f in enumerate(facilities)
+                if f["type"] in ("CHR", "CHU") and f["surgery"]}
+
+    def linear_nearest(lat, lon):
+        return sorted(
+            (haversine_km(lat, lon, f["latitude"], f["longitude"]), pos)
+            for pos, f in enumerate(facilities)
+        )[:args.k]
+
+    results = {
+        "facilities": args.facilities,
+        "build_ms": round(build_ms, 2),
+        "nearest": timed(lambda lat, lon: index.nearest(lat, lon, args.k), queries),
+        "nearest_referral": timed(
+            lambda lat, lon: index.nearest(lat, lon, args.k, allowed=referral), queries
+        ),
+        "within": timed(lambda lat, lon: index.within(lat, lon, args.radius_km), queries),
+        "linear_nearest": timed(linear_nearest, queries[:200]),
+    }
+    if args.json:
+        print(json.dumps(results))
+        return
+    print(f"Indexed {args.facilities:,} facilities in {build_ms:.1f} ms")
+    for name in ("nearest", "nearest_referral", "within", "linear_nearest"):
+        r = results[name]
+        print(f"  {name:<17} p50 {r['p50_us']:>9.1f} us   p99 {r['p99_us']:>9.1f} us")
+
+
+if __name__ == "__main__":
+    main()
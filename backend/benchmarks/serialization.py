@@ -0,0 +1,230 @@
+"""
+Response serialization cost per endpoint, before and after the fast path.
+
+"before" is what FastAPI does with an endpoint's return value when it is not
+a Response: validate it against the route's response_model, encode it to
+JSON-able values, then json.dumps it (Starlette's JSONResponse). "after" is
+what the endpoint now returns: a ModelResponse (pydantic-core straight to
+bytes, no validation), orjson for plain dicts, or, in the registry, bytes
+joined from facilities serialized when the snapshot was loaded. Both bodies
+are checked to hold the same JSON.
+
+Only serialization is timed, on payloads of the size each endpoint returns;
+each service runs in a fresh interpreter, like suite.py.
+
+    python backend/benchmarks/serialization.py --output serialization.json
+"""
+
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Tuple
+import argparse
+import json
+import logging
+import os
+import subprocess
+import sys
+import time
+
+from suite import BACKEND, synthetic_patients, synthetic_registry, synthetic_users
+
+SERVICES = ("patient", "registry", "auth")
+# (name, before, after); each returns the response body
+Case = Tuple[str, Callable[[], bytes], Callable[[], bytes]]
+
+
+def route_of(app, path: str, method: str = "GET"):
+    for route in app.routes:
+        if getattr(route, "path", None) == path and method in getattr(route, "methods", ()):
+            return route
+    raise LookupError(f"{method} {path}")
+
+
+def fastapi_body(route, content: Any) -> bytes:
+    """The body FastAPI builds from a non-Response return value of route"""
+    from fastapi.routing import serialize_response
+    from starlette.responses import JSONResponse
+
+    # With is_coroutine it never suspends: run it to completion in place
+    # rather than paying for an event loop per call
+    step = serialize_response(field=route.response_field, response_content=content)
+    try:
+        step.send(None)
+    except StopIteration as done:
+        return JSONResponse(done.value).body
+    raise RuntimeError("serialize_response suspended")
+
+
+def timed(fn: Callable[[], bytes], min_seconds: float) -> float:
+    """Microseconds per call"""
+    fn()
+    calls, started = 0, time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_seconds:
+            return elapsed / calls * 1e6
+
+
+def patient_cases() -> List[Case]:
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "patient-service")]
+    from danaya_shared.responses import ModelResponse, dumps
+    from src import fhir
+    from src.main import app
+    from src.models import DuplicateCandidate, Patient
+    from src.repository import Change
+
+    patients = [Patient(**fields) for fields in synthetic_patients(1_000)]
+    duplicates = [
+        DuplicateCandidate(patient=p, score=8.5, status="possible") for p in patients[:10]
+    ]
+    changes = [Change(seq, p.patient_id, p) for seq, p in enumerate(patients[:500], 1)]
+    listing = route_of(app, "/patients")
+    single = route_of(app, "/patients/{patient_id}")
+
+    def sync_rows() -> Dict[str, Any]:
+        fields = list(Patient.model_fields)
+        rows = [[c.seq, *(getattr(c.patient, f) for f in fields)] for c in changes]
+        return {"since": 0, "watermark": 500, "more": False, "fields": fields,
+                "rows": rows, "deleted": []}
+
+    rows = sync_rows()
+    entries = fhir.history_entries("https://danaya.bf/fhir", changes)
+    duplicates_route = route_of(app, "/patients/{patient_id}/duplicates")
+    return [
+        ("get_patient", lambda: fastapi_body(single, patients[0]),
+         lambda: ModelResponse(patients[0]).body),
+        ("list_patients_100", lambda: fastapi_body(listing, patients[:100]),
+         lambda: ModelResponse(patients[:100]).body),
+        ("list_patients_1000", lambda: fastapi_body(listing, patients),
+         lambda: ModelResponse(patients).body),
+        ("duplicates_10", lambda: fastapi_body(duplicates_route, duplicates),
+         lambda: ModelResponse(duplicates).body),
+        ("sync_pull_500", lambda: json.dumps(rows, separators=(",", ":")).encode(),
+         lambda: dumps(rows)),
+        ("fhir_entries_500",
+         lambda: json.dumps(entries, ensure_ascii=False, separators=(",", ":")).encode(),
+         lambda: dumps(entries)),
+    ]
+
+
+def registry_cases() -> List[Case]:
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "registry")]
+    from pydantic import TypeAdapter
+
+    from main import Facility, app
+    from snapshot import RegistrySnapshot
+
+    adapter = TypeAdapter(List[Facility])
+    snapshot = RegistrySnapshot(synthetic_registry(5_000), adapter)
+    index = snapshot.index
+    results = snapshot.spatial.nearest(12.37, -1.52, 20)
+    within = snapshot.spatial.within(12.37, -1.52, 100)
+    chr_positions = index.positions(index.filter_key(type="CHR"))
+    nearest_route = route_of(app, "/facilities/nearest")
+    within_route = route_of(app, "/facilities/within")
+
+    # The index keeps no facility dicts: rebuild them for the "before" side
+    facilities = json.loads(index.filter_json())
+
+    def nearby(found):
+        return [{"distance_km": round(km, 2), "facility": facilities[pos]} for pos, km in found]
+
+    def filtered_before(positions):
+        return adapter.dump_json(adapter.validate_python([facilities[pos] for pos in positions]))
+
+    first = facilities[0]
+    facility_route = route_of(app, "/facilities/{facility_id}")
+    return [
+        ("get_facility", lambda: fastapi_body(facility_route, first),
+         lambda: index.facility_json(first["id"])),
+        ("facilities_chr", lambda: filtered_before(chr_positions),
+         lambda: index.filter_json(type="CHR")),
+        ("facilities_all_5000", lambda: filtered_before(range(len(index))),
+         lambda: index.filter_json()),
+        ("nearest_20", lambda: fastapi_body(nearest_route, nearby(results)),
+         lambda: index.nearby_json(results)),
+        (f"within_100km_{len(within)}", lambda: fastapi_body(within_route, nearby(within)),
+         lambda: index.nearby_json(within)),
+    ]
+
+
+def auth_cases() -> List[Case]:
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "auth-service")]
+    from danaya_shared.responses import JSONResponse, ModelResponse
+    from fastapi.encoders import jsonable_encoder
+    from src.main import Token, User, UserInDB, app
+
+    user = UserInDB(**next(synthetic_users(1, "$2b$12$" + "x" * 53, ["BF-CHU-YALG"])))
+    token = Token(access_token="x" * 600, token_type="bearer", expires_in=1800,
+                  user=User(**user.model_dump()))
+    check = {"status": "ok", "critical": False, "latency_ms": 0.42}
+    health = {"status": "ok", "service": "danaya-auth",
+              "checks": {name: check for name in ("registry", "redis")},
+              "login_attempts": {"allowed": 1200, "throttled": 3}}
+    return [
+        ("users_me", lambda: fastapi_body(route_of(app, "/users/me"), user),
+         lambda: ModelResponse(user, model=User).body),
+        ("login", lambda: fastapi_body(route_of(app, "/login", "POST"), token),
+         lambda: ModelResponse(token).body),
+        # Plain dicts still go through FastAPI; only the encoder changed
+        ("health", lambda: fastapi_body(route_of(app, "/health"), health),
+         lambda: JSONResponse(jsonable_encoder(health)).body),
+    ]
+
+
+CASES = {"patient": patient_cases, "registry": registry_cases, "auth": auth_cases}
+
+
+def run(service: str, min_seconds: float) -> List[Dict[str, Any]]:
+    results = []
+    for name, before, after in CASES[service]():
+        old, new = before(), after()
+        if json.loads(old) != json.loads(new):
+            raise AssertionError(f"{service}/{name}: the bodies differ")
+        before_us, after_us = timed(before, min_seconds), timed(after, min_seconds)
+        results.append({
+            "endpoint": name,
+            "bytes": len(new),
+            "before_us": round(before_us, 1),
+            "after_us": round(after_us, 1),
+            "speedup": round(before_us / after_us, 1),
+        })
+    return results
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--services", nargs="+", choices=SERVICES, default=list(SERVICES))
+    parser.add_argument("--seconds", type=float, default=0.5, help="minimum timing per variant")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        logging.disable(logging.CRITICAL)
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        stdout.write(json.dumps(run(args.child, args.seconds)) + "\n")
+        return
+
+    report = {}
+    for service in args.services:
+        completed = subprocess.run(
+            [sys.executable, __file__, "--child", service, "--seconds", str(args.seconds)],
+            capture_output=True, text=True, cwd=BACKEND,
+        )
+        if completed.returncode != 0:
+            tail = completed.stderr.strip().splitlines()[-5:]
+            print(f"{service}: failed\n  " + "\n  ".join(tail))
+            continue
+        report[service] = json.loads(completed.stdout.strip().splitlines()[-1])
+        print(service)
+        for r in report[service]:
+            print(f"  {r['endpoint']:<22} {r['bytes']:>9,} B   before {r['before_us']:>9.1f} us"
+                  f"   after {r['after_us']:>8.1f} us   x{r['speedup']}")
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
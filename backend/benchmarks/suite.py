@@ -0,0 +1,521 @@
+"""
+Endpoint benchmark suite.
+
+Runs auth-service, patient-service, the registry and appointment-service
+in-process (httpx ASGI transport, no network) against synthetic users,
+patients and facilities at each requested scale, and measures throughput and
+latency percentiles of every hot endpoint: login, token verification
+(/users/me), patient CRUD, search, listing and sync, the registry filters
+and spatial queries, and appointment slot search and booking.
+
+Each service and scale runs in a fresh interpreter, so the two ``src``
+packages never meet and one run's memory never skews the next. Results are
+written as JSON together with the commit they were measured on; pass an
+earlier file as --baseline to list regressions (exit status 1 if any).
+
+    python backend/benchmarks/suite.py --scales 1000 100000 1000000 --output bench.json
+    python backend/benchmarks/suite.py --scales 1000 --baseline bench.json
+"""
+
+from datetime import date, datetime, timedelta, timezone
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+import argparse
+import asyncio
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from patient_import import REGIONS
+from patient_search import FIRST_NAMES, LAST_NAMES, percentile, query_mix
+from registry_spatial import LAT_RANGE, LON_RANGE, TYPE_MIX
+
+BACKEND = Path(__file__).resolve().parents[1]
+SERVICES = ("auth", "patient", "registry", "appointment")
+PASSWORD = "Bench123!"
+# Builds (method, path, json body[, headers]) for request number n
+Request = Callable[[int], tuple]
+
+
+def synthetic_users(count: int, hashed_password: str, hospital_ids: List[str], seed: int = 42):
+    rng = random.Random(seed)
+    created_at = datetime.now(timezone.utc).isoformat()
+    roles = ["doctor"] * 5 + ["nurse"] * 4 + ["admin"]
+    for i in range(count):
+        yield {
+            "user_id": f"USR-{i:07d}",
+            "email": f"user{i}@danaya.bf",
+            "full_name": f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+            "role": rng.choice(roles),
+            "hospital_id": rng.choice(hospital_ids),
+            "department": rng.choice(["Emergency", "Pediatrics", "Surgery", "Maternity"]),
+            "hashed_password": hashed_password,
+            "is_active": True,
+            "created_at": created_at,
+        }
+
+
+def synthetic_patients(count: int, seed: int = 42):
+    """Patient field dicts for a national register of count patients"""
+    rng = random.Random(seed)
+    epoch = date(1940, 1, 1)
+    for i in range(count):
+        stamp = f"2024-{rng.randrange(1, 13):02d}-{rng.randrange(1, 29):02d}T10:00:00Z"
+        yield {
+            "patient_id": f"PAT-{i:010X}",
+            "national_id": f"BF{2000 + i % 26}{i:09d}" if rng.random() < 0.8 else None,
+            "first_name": rng.choice(FIRST_NAMES),
+            "last_name": rng.choice(LAST_NAMES),
+            "sex": rng.choice("MF"),
+            "date_of_birth": (epoch + timedelta(days=rng.randrange(30_000))).isoformat(),
+            "phone": f"+226 7{rng.randrange(10)} {rng.randrange(100):02d} {rng.randrange(100):02d} "
+                     f"{rng.randrange(100):02d}",
+            "address": f"Secteur {rng.randrange(1, 60)}",
+            "region_id": rng.choice(REGIONS),
+            "hospital_id": f"BF-CSPS-{rng.randrange(2_000):05d}",
+            "created_at": stamp,
+            "updated_at": stamp,
+        }
+
+
+def synthetic_registry(count: int, seed: int = 42) -> Dict[str, Any]:
+    """A hospitals_bf.json document with count facilities over 13 regions"""
+    rng = random.Random(seed)
+    regions = [
+        {"region_id": f"BF-REG-{r + 1:02d}", "name": f"Region {r + 1}", "facilities": []}
+        for r in range(13)
+    ]
+    levels = {"CSPS": "primary", "CMA": "secondary", "CHR": "secondary", "CHU": "tertiary"}
+    for i in range(count):
+        roll, ftype = rng.random(), "CSPS"
+        for name, share in TYPE_MIX:
+            if roll < share:
+                ftype = name
+                break
+            roll -= share
+        hospital = ftype != "CSPS"
+        rng.choice(regions)["facilities"].append({
+            "id": f"BF-{ftype}-{i:07d}",
+            "short_code": f"{ftype}_{i:07d}",
+            "name": f"{ftype} {rng.choice(LAST_NAMES)} {i}",
+            "type": ftype,
+            "level": levels[ftype],
+            "ownership": rng.choice(["public", "public", "private", "confessional"]),
+            "district": f"District {rng.randrange(70)}",
+            "city": f"Commune {rng.randrange(350)}",
+            "latitude": round(rng.uniform(*LAT_RANGE), 5),
+            "longitude": round(rng.uniform(*LON_RANGE), 5),
+            "logo_url": "/assets/hospitals/default.png",
+            "capabilities": {
+                "emergency": hospital or rng.random() < 0.2,
+                "surgery": hospital and rng.random() < 0.8,
+                "maternity": rng.random() < 0.7,
+                "laboratory": hospital or rng.random() < 0.3,
+                "imaging": ["xray", "ct"] if ftype in ("CHR", "CHU") else [],
+            },
+            "status": "active",
+        })
+    return {"country": "BF", "version": f"bench-{count}", "regions": regions}
+
+
+async def measure(client, name: str, request: Request, duration: float, concurrency: int,
+                  max_requests: Optional[int] = None) -> Dict[str, Any]:
+    """Drive request(0), request(1) ... from concurrency clients for duration seconds"""
+    latencies: List[float] = []
+    errors = 0
+    counter = iter(range(max_requests if max_requests is not None else sys.maxsize))
+
+    async def user(deadline: float, limit: int = sys.maxsize) -> None:
+        nonlocal errors
+        while time.perf_counter() < deadline and len(latencies) < limit:
+            n = next(counter, None)
+            if n is None:
+                return
+            method, path, body, *headers = request(n)
+            t0 = time.perf_counter()
+            response = await client.request(
+                method, path, json=body, headers=headers[0] if headers else None
+            )
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code >= 400:
+                errors += 1
+
+    # Warm caches and lazily built state, outside the numbers; an endpoint that
+    # can only be called max_requests times keeps most of them for the run
+    warm_limit = max_requests // 10 if max_requests is not None else sys.maxsize
+    warm_deadline = time.perf_counter() + min(0.5, duration / 4)
+    await asyncio.gather(*(user(warm_deadline, warm_limit) for _ in range(concurrency)))
+    latencies.clear()
+    errors = 0
+
+    started = time.perf_counter()
+    await asyncio.gather(*(user(started + duration) for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    if not latencies:
+        return {"endpoint": name, "requests": 0, "errors": errors}
+    return {
+        "endpoint": name,
+        "requests": len(latencies),
+        "errors": errors,
+        "requests_per_sec": round(len(latencies) / elapsed, 1),
+        "p50_ms": round(statistics.median(latencies), 3),
+        "p90_ms": round(percentile(latencies, 90), 3),
+        "p99_ms": round(percentile(latencies, 99), 3),
+        "max_ms": round(max(latencies), 3),
+    }
+
+
+async def bench_auth(scale: int, args) -> Dict[str, Any]:
+    # Distinct synthetic users keep the per-email limiter out of the way; the
+    # registry is unreachable, so hospital lookups fail fast and are cached
+    os.environ.update(
+        BCRYPT_ROUNDS=str(args.bcrypt_rounds),
+        LOGIN_RATE_EMAIL="1000000/1",
+        LOGIN_RATE_IP="1000000/1",
+        REGISTRY_URL="http://127.0.0.1:9",
+    )
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "auth-service")]
+    import httpx
+
+    from src.main import User, app, create_access_token
+    from src.passwords import _bcrypt_hash
+    from src.users import UserStore
+
+    started = time.perf_counter()
+    records = list(synthetic_users(scale, _bcrypt_hash(PASSWORD, args.bcrypt_rounds),
+                                   ["BF-CHU-YALG", "BF-CHU-BOBO", "BF-CHR-DED"]))
+    rng = random.Random(7)
+    sample = [records[rng.randrange(scale)]["email"] for _ in range(1_000)]
+
+    async with app.router.lifespan_context(app):
+        app.state.users = UserStore(records, User.model_validate)
+        setup_s = time.perf_counter() - started
+        headers = [
+            {"Authorization": f"Bearer {create_access_token({'sub': email, 'role': 'doctor'})}"}
+            for email in sample
+        ]
+        warm, cold = headers[:100], headers[100:]
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+            endpoints = [
+                ("login", lambda n: (
+                    "POST", "/login", {"email": sample[n % len(sample)], "password": PASSWORD}
+                ), None),
+                ("verify_token_warm", lambda n: (
+                    "GET", "/users/me", None, warm[n % len(warm)]), None),
+                # Every token new to the verifier (full RS256 check), while they last
+                ("verify_token_cold", lambda n: ("GET", "/users/me", None, cold[n]), len(cold)),
+            ]
+            results = [
+                await measure(client, name, request, args.duration, args.concurrency, max_requests)
+                for name, request, max_requests in endpoints
+            ]
+    return {"setup_seconds": round(setup_s, 2), "results": results}
+
+
+async def bench_patient(scale: int, args) -> Dict[str, Any]:
+    os.environ.update(AUTH_REQUIRED="false", PATIENT_STORE="memory")
+    os.environ.pop("DATABASE_URL", None)
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "patient-service")]
+    import httpx
+
+    from src.main import app
+    from src.models import Patient
+    from src.pagination import encode_cursor
+    from src.repository import InMemoryPatientRepository
+
+    started = time.perf_counter()
+    repo = InMemoryPatientRepository(Patient(**fields) for fields in synthetic_patients(scale))
+    setup_s = time.perf_counter() - started
+
+    rng = random.Random(7)
+    half = max(1, scale // 2)
+    # Reads and updates use the first half; deletes consume the second
+    ids = [f"PAT-{rng.randrange(half):010X}" for _ in range(10_000)]
+    queries = query_mix(2_000, scale)
+    new_patient = {"first_name": "Awa", "last_name": "Zongo", "sex": "F", "region_id": "Centre"}
+
+    async with app.router.lifespan_context(app):
+        app.state.patients = repo
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://patient") as client:
+            endpoints = [
+                ("get", lambda n: ("GET", f"/patients/{ids[n % len(ids)]}", None), None),
+                ("list_cursor", lambda n: (
+                    "GET", f"/patients?limit=20&cursor={encode_cursor(ids[n % len(ids)])}", None
+                ), None),
+                ("search", lambda n: (
+                    "GET", f"/patients?search={queries[n % len(queries)]}&limit=20", None), None),
+                ("create", lambda n: (
+                    "POST", "/patients", {**new_patient, "national_id": f"BENCH{n:09d}"}), None),
+                ("update", lambda n: (
+                    "PUT", f"/patients/{ids[n % len(ids)]}", {"phone": f"+226 {n:08d}"}), None),
+                ("sync_pull", lambda n: (
+                    "GET", f"/sync/patients?since={rng.randrange(scale)}&limit=500", None), None),
+                ("fhir_read", lambda n: ("GET", f"/fhir/Patient/{ids[n % len(ids)]}", None), None),
+                ("fhir_search", lambda n: (
+                    "GET", f"/fhir/Patient?_count=100&_cursor={encode_cursor(ids[n % len(ids)])}",
+                    None), None),
+                ("fhir_history", lambda n: (
+                    "GET", f"/fhir/Patient/_history?_cursor={rng.randrange(scale)}&_count=500",
+                    None), None),
+                ("delete", lambda n: (
+                    "DELETE", f"/patients/PAT-{half + n:010X}", None), scale - half),
+            ]
+            results = [
+                await measure(client, name, request, args.duration, args.concurrency, max_requests)
+                for name, request, max_requests in endpoints
+            ]
+    return {"setup_seconds": round(setup_s, 2), "results": results}
+
+
+async def bench_registry(scale: int, args) -> Dict[str, Any]:
+    workdir = Path(tempfile.mkdtemp(prefix="danaya-bench-"))
+    registry_file = workdir / "registry.json"
+    document = synthetic_registry(scale)
+    registry_file.write_text(json.dumps(document), encoding="utf-8")
+    os.environ.update(REGISTRY_FILE=str(registry_file), REGISTRY_WATCH_INTERVAL="0")
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "registry")]
+    import httpx
+
+    from main import app
+
+    rng = random.Random(7)
+    region_ids = [r["region_id"] for r in document["regions"]]
+    ids = [f["id"] for r in document["regions"] for f in r["facilities"]]
+    ids = [rng.choice(ids) for _ in range(10_000)]
+    points = [
+        (round(rng.uniform(*LAT_RANGE), 4), round(rng.uniform(*LON_RANGE), 4))
+        for _ in range(10_000)
+    ]
+    del document
+
+    started = time.perf_counter()
+    async with app.router.lifespan_context(app):
+        setup_s = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://registry") as client:
+            endpoints = [
+                ("get", lambda n: ("GET", f"/facilities/{ids[n % len(ids)]}", None)),
+                # Few distinct URLs: served from the response cache after the first
+                ("filter_type_region", lambda n: (
+                    "GET", f"/facilities?type={('CHR', 'CHU')[n % 2]}&region={region_ids[n % 13]}",
+                    None)),
+                ("filter_capability", lambda n: (
+                    "GET", "/facilities?type=CHU&capability=surgery&capability=ct", None)),
+                # A new origin each time: nothing cached
+                ("nearest", lambda n: (
+                    "GET", "/facilities/nearest?lat={}&lon={}&k=5".format(*points[n % len(points)]),
+                    None)),
+                ("nearest_referral", lambda n: (
+                    "GET", "/facilities/nearest?lat={}&lon={}&k=3&type=CHR&type=CHU"
+                    "&capability=surgery".format(*points[n % len(points)]), None)),
+                ("within_25km", lambda n: (
+                    "GET", "/facilities/within?lat={}&lon={}&radius_km=25&type=CMA".format(
+                        *points[n % len(points)]), None)),
+            ]
+            results = [
+                await measure(client, name, request, args.duration, args.concurrency)
+                for name, request in endpoints
+            ]
+    registry_file.unlink()
+    workdir.rmdir()
+    return {"setup_seconds": round(setup_s, 2), "results": results}
+
+
+async def bench_appointment(scale: int, args) -> Dict[str, Any]:
+    os.environ.update(
+        AUTH_REQUIRED="false", APPOINTMENT_STORE="memory", REGISTRY_URL="http://127.0.0.1:9"
+    )
+    os.environ.pop("DATABASE_URL", None)
+    sys.path[:0] = [str(BACKEND / "shared"), str(BACKEND / "appointment-service")]
+    import httpx
+
+    from appointment_booking import facilities_of, schedule
+    from src.main import app, facilities
+
+    rng = random.Random(7)
+    loaded = facilities_of(synthetic_registry(scale))
+    ids = [f["id"] for f in loaded]
+    regions = sorted({f["region_id"] for f in loaded if f["type"] == "CMA"})
+    first_day = datetime.now(timezone.utc).date() + timedelta(days=1)
+    not_before = f"{first_day}T00:00:00Z"
+    # Slots the book endpoint tries, mostly free at first (taken ones: 409)
+    slots = []
+    for _ in range(10_000):
+        n = rng.randrange(len(ids))
+        start = datetime.combine(first_day + timedelta(days=rng.randrange(28)),
+                                 datetime.min.time(), tzinfo=timezone.utc)
+        start += timedelta(hours=8 + rng.randrange(8), minutes=15 * rng.randrange(4))
+        slots.append({
+            "facility_id": ids[n], "clinician_id": f"USR-{n:07d}",
+            "start": start.isoformat(), "end": (start + timedelta(minutes=15)).isoformat(),
+        })
+
+    async with app.router.lifespan_context(app):
+        started = time.perf_counter()
+        facilities.load(loaded)
+        index = app.state.appointments.index
+        for session in schedule(ids, first_day):
+            index.open(*session)
+        setup_s = time.perf_counter() - started
+        transport = httpx.ASGITransport(app=app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://appointment") as client:
+            endpoints = [
+                ("availability", lambda n: (
+                    "GET", f"/facilities/{ids[n % len(ids)]}/availability"
+                    f"?date={first_day}&duration_minutes=30",
+                    None)),
+                ("next_slot_region", lambda n: (
+                    "GET", f"/slots/next?region={regions[n % len(regions)]}"
+                    f"&type=CMA&not_before={not_before}",
+                    None)),
+                ("book", lambda n: (
+                    "POST", "/appointments",
+                    {**slots[n % len(slots)], "patient_id": f"PAT-{n:010X}"})),
+                ("book_next_region", lambda n: ("POST", "/appointments/next", {
+                    "patient_id": f"PAT-{n:010X}", "region": regions[n % len(regions)],
+                    "type": "CMA", "duration_minutes": 30, "not_before": not_before,
+                })),
+            ]
+            results = [
+                await measure(client, name, request, args.duration, args.concurrency)
+                for name, request in endpoints
+            ]
+    return {"setup_seconds": round(setup_s, 2), "results": results}
+
+
+BENCHES = {
+    "auth": bench_auth, "patient": bench_patient, "registry": bench_registry,
+    "appointment": bench_appointment,
+}
+
+
+def run_child(service: str, scale: int, args) -> Dict[str, Any]:
+    """Run one service at one scale in a fresh interpreter"""
+    command = [
+        sys.executable, __file__, "--child", f"{service}:{scale}",
+        "--duration", str(args.duration), "--concurrency", str(args.concurrency),
+        "--bcrypt-rounds", str(args.bcrypt_rounds),
+    ]
+    completed = subprocess.run(command, capture_output=True, text=True, cwd=BACKEND)
+    if completed.returncode != 0:
+        tail = completed.stderr.strip().splitlines()[-5:]
+        error = "\n".join(tail) or f"exit {completed.returncode}"
+        return {"service": service, "scale": scale, "error": error}
+    result = json.loads(completed.stdout.strip().splitlines()[-1])
+    return {"service": service, "scale": scale, **result}
+
+
+def git_commit() -> Optional[str]:
+    try:
+        commit = subprocess.run(["git", "rev-parse", "HEAD"], capture_output=True, text=True,
+                                cwd=BACKEND, check=True).stdout.strip()
+        dirty = subprocess.run(["git", "status", "--porcelain", "--untracked-files=no"],
+                               capture_output=True, text=True, cwd=BACKEND).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return f"{commit}-dirty" if dirty else commit
+
+
+def flatten(report: Dict[str, Any]) -> Dict[tuple, Dict[str, Any]]:
+    return {
+        (run["service"], run["scale"], result["endpoint"]): result
+        for run in report["runs"] for result in run.get("results", [])
+    }
+
+
+def regressions(report: Dict[str, Any], baseline: Dict[str, Any], threshold: float) -> List[str]:
+    """Endpoints whose throughput fell or p99 rose by more than threshold %"""
+    found = []
+    before = flatten(baseline)
+    for key, result in flatten(report).items():
+        old = before.get(key)
+        if not old or not old.get("requests") or not result.get("requests"):
+            continue
+        rps = (result["requests_per_sec"] / old["requests_per_sec"] - 1) * 100
+        p99 = (result["p99_ms"] / old["p99_ms"] - 1) * 100 if old["p99_ms"] else 0.0
+        if rps < -threshold or p99 > threshold:
+            found.append(f"{'/'.join(map(str, key))}: {rps:+.1f}% req/s, {p99:+.1f}% p99")
+    return found
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--services", nargs="+", choices=SERVICES, default=list(SERVICES))
+    parser.add_argument("--scales", nargs="+", type=int, default=[1_000, 100_000],
+                        help="users / patients / facilities generated per run")
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds per endpoint")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent in-process clients")
+    parser.add_argument("--bcrypt-rounds", type=int, default=12,
+                        help="bcrypt cost of the synthetic users")
+    parser.add_argument("--output", type=Path, help="write the JSON report here")
+    parser.add_argument("--baseline", type=Path, help="earlier report to compare with")
+    parser.add_argument("--threshold", type=float, default=15.0,
+                        help="regression threshold, percent")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        service, _, scale = args.child.partition(":")
+        logging.disable(logging.CRITICAL)
+        # Silence the services' print() progress lines; stdout carries the result
+        stdout, sys.stdout = sys.stdout, open(os.devnull, "w")
+        result = asyncio.run(BENCHES[service](int(scale), args))
+        stdout.write(json.dumps(result) + "\n")
+        return
+
+    report = {
+        "commit": git_commit(),
+        "started_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "settings": {"duration": args.duration, "concurrency": args.concurrency,
+                     "bcrypt_rounds": args.bcrypt_rounds},
+        "runs": [],
+    }
+    for scale in args.scales:
+        for service in args.services:
+            run = run_child(service, scale, args)
+            report["runs"].append(run)
+            if args.json:
+                continue
+            if "error" in run:
+                print(f"{service} @ {scale:,}: failed\n  {run['error']}")
+                continue
+            print(f"{service} @ {scale:,} (setup {run['setup_seconds']}s)")
+            for r in run["results"]:
+                if not r["requests"]:
+                    print(f"  {r['endpoint']:<20} no requests completed")
+                    continue
+                print(f"  {r['endpoint']:<20} {r['requests_per_sec']:>9,.1f} req/s"
+                      f"   p50 {r['p50_ms']:>8.2f} ms   p99 {r['p99_ms']:>8.2f} ms"
+                      f"   ({r['errors']} errors)")
+
+    if args.output:
+        args.output.write_text(json.dumps(report, indent=2) + "\n", encoding="utf-8")
+    found = []
+    if args.baseline:
+        baseline = json.loads(args.baseline.read_text(encoding="utf-8"))
+        found = regressions(report, baseline, args.threshold)
+        report["regressions"] = found
+    if args.json:
+        print(json.dumps(report))
+    elif args.baseline:
+        print(f"{len(found)} regression(s) over {args.threshold}% against {args.baseline}")
+        for line in found:
+            print(f"  {line}")
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
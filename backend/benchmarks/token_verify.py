@@ -0,0 +1,89 @@
+"""
+Token verification microbenchmark.
+
+Compares full RS256 ``jwt.decode`` verification with the shared
+JWKSTokenVerifier (cold: every token new, warm: tokens seen before) and
+measures the auth-service ``/users/me`` path end to end in-process.
+
+    python backend/benchmarks/token_verify.py --tokens 1000 --rounds 20
+"""
+
+from datetime import datetime, timedelta, timezone
+from pathlib import Path
+import argparse
+import asyncio
+import json
+import logging
+import sys
+import time
+
+BACKEND = Path(__file__).resolve().parents[1]
+
+
+def rate(fn, items, rounds: int = 1) -> float:
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for item in items:
+            fn(item)
+    return round(len(items) * rounds / (time.perf_counter() - started))
+
+
+async def users_me_rate(requests: int) -> float:
+    import httpx
+
+    from src.main import app, create_access_token
+
+    token = create_access_token({"sub": "doctor@chu-ouaga.bf", "role": "doctor"})
+    headers = {"Authorization": f"Bearer {token}"}
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://auth") as client:
+        started = time.perf_counter()
+        for _ in range(requests):
+            response = await client.get("/users/me", headers=headers)
+            assert response.status_code == 200, response.text
+        return round(requests / (time.perf_counter() - started))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--tokens", type=int, default=1_000)
+    parser.add_argument("--rounds", type=int, default=20, help="warm passes over the tokens")
+    parser.add_argument("--requests", type=int, default=2_000, help="/users/me calls")
+    parser.add_argument("--json", action="store_true", help="print machine-readable results")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BACKEND / "shared"))
+    sys.path.insert(0, str(BACKEND / "auth-service"))
+    logging.disable(logging.CRITICAL)
+    from jose import jwt
+    from danaya_shared.jwks import JWKSTokenVerifier
+    from src.keys import ALGORITHM, SigningKeys
+
+    keys = SigningKeys.load(None)
+    key = keys.active
+    expires = datetime.now(timezone.utc) + timedelta(minutes=30)
+    tokens = [
+        jwt.encode({"sub": f"user{i}@danaya.bf", "role": "doctor", "exp": expires},
+                   key.signer, algorithm=ALGORITHM, headers={"kid": key.kid})
+        for i in range(args.tokens)
+    ]
+    verifier = JWKSTokenVerifier(keys, max_entries=args.tokens)
+
+    results = {
+        "jwt_decode_per_sec": rate(
+            lambda t: jwt.decode(t, key.verifier, algorithms=[ALGORITHM]), tokens
+        ),
+        "verifier_cold_per_sec": rate(verifier.verify, tokens),
+        "verifier_warm_per_sec": rate(verifier.verify, tokens, args.rounds),
+    }
+    results["users_me_per_sec"] = asyncio.run(users_me_rate(args.requests))
+
+    if args.json:
+        print(json.dumps(results))
+        return
+    for name, value in results.items():
+        print(f"  {name:<22} {value:>10,}")
+
+
+if __name__ == "__main__":
+    main()
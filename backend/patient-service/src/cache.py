@@ -0,0 +1,318 @@
+"""
+Read-through, write-invalidate cache for patient records.
+
+CachedPatientRepository wraps the real store and serves ``get()`` (and so
+``GET /patients/{id}``, duplicate lists, ...) from two levels:
+
+- L1: a small LRU of Patient objects in each worker, kept ``l1_ttl`` seconds;
+- L2: Redis, shared by every worker and node, one JSON value per patient
+  with a ``ttl``.
+
+Every write goes to the store first. Once it has committed, the patient is
+dropped from this worker's L1 and from Redis, and its id is published so the
+other workers drop it from their L1 too.
+
+A reader that missed must not put back a copy it read before an invalidation:
+each invalidation bumps a per-patient stamp in Redis, and the copy is stored
+only if the stamp is still the one the reader saw before going to the store
+(compared and set in one script). L1 follows the same rule with a per-worker
+invalidation counter.
+
+Without a working connection to Redis (and its invalidation feed) every read
+goes straight to the store: an L1 that cannot hear about other workers' writes
+could serve stale charts. Invalidations that could not be sent are retried
+once Redis is back.
+
+Read-modify-write paths use ``get_latest()``, which always reads the store.
+"""
+
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+import asyncio
+import logging
+import time
+
+from .linkage import MAX_BLOCK
+from .models import Patient
+from .repository import Change, PatientRepository, Version
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "danaya:patients:invalidate"
+KEY_PREFIX = "danaya:patient:"
+STAMP_PREFIX = "danaya:patient-stamp:"
+# Past this many unsent invalidations, every cached patient is dropped instead
+MAX_PENDING = 10_000
+
+# KEYS: value, stamp; ARGV: stamp seen before reading the store, value, ttl
+STORE_IF_UNCHANGED_LUA = """
+if (redis.call('GET', KEYS[2]) or '') == ARGV[1] then
+  redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+  return 1
+end
+return 0
+"""
+
+
+class CachedPatientRepository(PatientRepository):
+    def __init__(self, store: PatientRepository, redis_url: str, ttl: int = 300,
+                 l1_size: int = 1024, l1_ttl: float = 30.0, retry_seconds: float = 5.0) -> None:
+        self.store = store
+        self.backend = store.backend
+        self._url = redis_url
+        self._ttl = ttl
+        self._l1_size = l1_size
+        self._l1_ttl = l1_ttl
+        self._retry = retry_seconds
+        # patient_id -> (patient, expires at)
+        self._l1: "OrderedDict[str, Tuple[Patient, float]]" = OrderedDict()
+        # Bumped by every invalidation this worker sends or hears
+        self._generation = 0
+        self._redis = None
+        self._feed = None
+        self._script = None
+        self._task: Optional["asyncio.Task[None]"] = None
+        self._subscribed = False
+        self._redis_down_until = 0.0
+        self._pending: Set[str] = set()
+        self._pending_overflow = False
+        self.l1_hits = 0
+        self.l1_misses = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._l1)
+
+    async def connect(self) -> None:
+        await self.store.connect()
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self._url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        self._script = self._redis.register_script(STORE_IF_UNCHANGED_LUA)
+        # The feed blocks reading between messages, so it gets no read timeout
+        self._feed = redis.from_url(self._url, socket_connect_timeout=0.5)
+        self._task = asyncio.create_task(self._listen())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+        for client in (self._redis, self._feed):
+            if client is not None:
+                await client.aclose()
+        await self.store.close()
+
+    async def ping(self) -> None:
+        await self.store.ping()
+
+    # --- cache ------------------------------------------------------------
+
+    def _usable(self) -> bool:
+        return self._subscribed and time.monotonic() >= self._redis_down_until
+
+    def _redis_failed(self, e: Exception) -> None:
+        if time.monotonic() >= self._redis_down_until:
+            logger.warning(f"Patient cache bypassed for {self._retry}s, Redis unavailable: {e}")
+        self._redis_down_until = time.monotonic() + self._retry
+        self._forget_all()
+
+    def _forget_all(self) -> None:
+        self._generation += 1
+        self._l1.clear()
+
+    def _remember(self, patient: Patient) -> None:
+        self._l1[patient.patient_id] = (patient, time.monotonic() + self._l1_ttl)
+        self._l1.move_to_end(patient.patient_id)
+        while len(self._l1) > self._l1_size:
+            self._l1.popitem(last=False)
+
+    async def _read_through(self, patient_id: str) -> Optional[Patient]:
+        key, stamp_key = KEY_PREFIX + patient_id, STAMP_PREFIX + patient_id
+        try:
+            cached, stamp = await self._redis.mget(key, stamp_key)
+        except Exception as e:
+            self._redis_failed(e)
+            return await self.store.get(patient_id)
+        if cached is not None:
+            self.hits += 1
+            return Patient.model_validate_json(cached)
+        self.misses += 1
+        patient = await self.store.get(patient_id)
+        if patient is not None:
+            try:
+                await self._script(
+                    keys=[key, stamp_key], args=[stamp or b"", patient.model_dump_json(), self._ttl]
+                )
+            except Exception as e:
+                self._redis_failed(e)
+        return patient
+
+    async def get(self, patient_id: str) -> Optional[Patient]:
+        if not self._usable():
+            return await self.store.get(patient_id)
+        if self._pending or self._pending_overflow:
+            await self._flush_pending()
+            if not self._usable():
+                return await self.store.get(patient_id)
+        entry = self._l1.get(patient_id)
+        if entry is not None and entry[1] > time.monotonic():
+            self.l1_hits += 1
+            self._l1.move_to_end(patient_id)
+            return entry[0]
+        self.l1_misses += 1
+        generation = self._generation
+        patient = await self._read_through(patient_id)
+        if patient is not None and generation == self._generation:
+            self._remember(patient)
+        return patient
+
+    async def get_latest(self, patient_id: str) -> Optional[Patient]:
+        return await self.store.get(patient_id)
+
+    def _defer(self, patient_ids: List[str]) -> None:
+        if self._pending_overflow or len(self._pending) + len(patient_ids) > MAX_PENDING:
+            self._pending_overflow = True
+            self._pending.clear()
+        else:
+            self._pending.update(patient_ids)
+
+    async def _invalidate(self, patient_ids: Iterable[str]) -> None:
+        patient_ids = list(patient_ids)
+        self._generation += 1
+        for patient_id in patient_ids:
+            self._l1.pop(patient_id, None)
+        if self._redis is None or not patient_ids:
+            return
+        if time.monotonic() < self._redis_down_until:
+            # Don't make every write wait for a timeout while Redis is down
+            self._defer(patient_ids)
+            return
+        try:
+            async with self._redis.pipeline(transaction=True) as pipe:
+                for patient_id in patient_ids:
+                    pipe.incr(STAMP_PREFIX + patient_id)
+                    pipe.expire(STAMP_PREFIX + patient_id, self._ttl)
+                    pipe.delete(KEY_PREFIX + patient_id)
+                    pipe.publish(CHANNEL, patient_id)
+                await pipe.execute()
+        except Exception as e:
+            self._redis_failed(e)
+            self._defer(patient_ids)
+
+    async def _flush_pending(self) -> None:
+        """Send the invalidations deferred while Redis was down"""
+        try:
+            if self._pending_overflow:
+                async for key in self._redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000):
+                    await self._redis.delete(key)
+                self._pending_overflow = False
+        except Exception as e:
+            self._redis_failed(e)
+            return
+        pending, self._pending = list(self._pending), set()
+        await self._invalidate(pending)
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self._feed.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    # Whatever was announced while we were not listening is lost
+                    self._forget_all()
+                    await self._flush_pending()
+                    self._subscribed = True
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        self._generation += 1
+                        self._l1.pop(message["data"].decode(), None)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self._subscribed = False
+                self._redis_down_until = time.monotonic() + self._retry
+                self._forget_all()
+                logger.warning(
+                    f"Patient cache invalidation feed unavailable, retrying in {self._retry}s: {e}"
+                )
+                await asyncio.sleep(self._retry)
+
+    # --- writes: store first, then invalidate -------------------------------
+
+    # Adds only insert patients that are not stored (nothing cached to drop)
+    async def add(self, patient: Patient) -> None:
+        await self.store.add(patient)
+
+    async def add_many(self, patients: Iterable[Patient]) -> None:
+        await self.store.add_many(patients)
+
+    async def add_new(self, patients: Sequence[Patient]) -> Set[str]:
+        return await self.store.add_new(patients)
+
+    async def replace(self, patient: Patient) -> None:
+        await self.store.replace(patient)
+        await self._invalidate([patient.patient_id])
+
+    async def replace_if(self, patient: Patient, seq: int) -> bool:
+        replaced = await self.store.replace_if(patient, seq)
+        if replaced:
+            await self._invalidate([patient.patient_id])
+        return replaced
+
+    async def delete(self, patient_id: str) -> bool:
+        deleted = await self.store.delete(patient_id)
+        if deleted:
+            await self._invalidate([patient_id])
+        return deleted
+
+    async def delete_if(self, patient_id: str, seq: int) -> bool:
+        deleted = await self.store.delete_if(patient_id, seq)
+        if deleted:
+            await self._invalidate([patient_id])
+        return deleted
+
+    # --- everything else goes to the store ----------------------------------
+
+    async def count(self) -> int:
+        return await self.store.count()
+
+    async def estimated_count(self) -> int:
+        return await self.store.estimated_count()
+
+    async def page(self, limit: int, skip: int = 0, after: Optional[str] = None) -> List[Patient]:
+        return await self.store.page(limit, skip, after)
+
+    async def search(self, query: str, skip: int = 0, limit: int = 100) -> List[Patient]:
+        return await self.store.search(query, skip, limit)
+
+    async def changes(self, since: int, limit: int) -> Tuple[List[Change], int]:
+        return await self.store.changes(since, limit)
+
+    async def versions(self, patient_ids: Sequence[str]) -> Dict[str, Version]:
+        return await self.store.versions(patient_ids)
+
+    async def candidates(self, patient: Patient, max_block: int = MAX_BLOCK) -> List[Patient]:
+        return await self.store.candidates(patient, max_block)
+
+    def blocks(self, max_block: int = MAX_BLOCK) -> AsyncIterator[List[Patient]]:
+        return self.store.blocks(max_block)
+
+    async def matches(self, patient_id: str) -> Dict[str, float]:
+        return await self.store.matches(patient_id)
+
+    async def set_matches(self, patient_id: str, matches: Dict[str, float]) -> None:
+        await self.store.set_matches(patient_id, matches)
+
+    async def clear_matches(self) -> None:
+        await self.store.clear_matches()
+
+    async def rebuild_block_keys(self) -> None:
+        await self.store.rebuild_block_keys()
+
+    def chunks(self, size: int, region_id: Optional[str] = None,
+               hospital_id: Optional[str] = None) -> AsyncIterator[List[Patient]]:
+        return self.store.chunks(size, region_id, hospital_id)
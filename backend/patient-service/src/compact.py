@@ -0,0 +1,237 @@
+"""
+Compact in-memory storage of patient records.
+
+A Pydantic Patient costs over a kilobyte: the object, its field dict, its
+fields-set and a string per field, timestamps included. PatientTable keeps
+the same records as columns instead, one slot per patient in each:
+
+- names, sex, address, region and hospital ids repeat across a register, so
+  they are pooled: each distinct string is stored once and a column holds
+  4-byte codes;
+- timestamps are microseconds since the epoch and birth dates day numbers,
+  in typed arrays (8 and 4 bytes); a value that would not format back to the
+  exact string it came from is kept as given;
+- national ids and phone numbers, mostly unique, are plain string columns.
+
+Rows freed by deletes are reused. A Patient is materialized only when a
+record is read, i.e. at the response boundary; the table holds no models.
+Every value in it came from a validated Patient and comes back out unchanged,
+so materializing restores the model's state (as unpickling does) rather than
+validating it again.
+The pools only grow: a string no longer used stays until the table is
+rebuilt (a restart), which a register's slowly changing vocabulary allows.
+"""
+
+from array import array
+from datetime import date, datetime, timedelta
+from functools import lru_cache
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from .models import Patient
+
+_EPOCH = datetime(1970, 1, 1)
+_EPOCH_DAY = _EPOCH.toordinal()
+_MICROSECOND = timedelta(microseconds=1)
+_DAY_MICROS = 86_400_000_000
+_TWO_DIGITS = [f"{i:02d}" for i in range(100)]
+# Sentinels in the numeric columns: no value, or a value kept as a string
+_NONE_TS, _ODD_TS = -2 ** 63, -2 ** 63 + 1
+_NONE_DAY, _ODD_DAY = 0, -1
+
+POOLED = ("first_name", "last_name", "sex", "address", "region_id", "hospital_id")
+PLAIN = ("national_id", "phone")
+TIMESTAMPS = ("created_at", "updated_at")
+# Model field order, which serialization follows
+FIELDS = tuple(Patient.model_fields)
+
+
+class StringPool:
+    """Each distinct string once; code 0 is None"""
+
+    def __init__(self) -> None:
+        self._codes: Dict[str, int] = {}
+        self.strings: List[Optional[str]] = [None]
+
+    def __len__(self) -> int:
+        return len(self.strings) - 1
+
+    def code(self, value: Optional[str]) -> int:
+        if value is None:
+            return 0
+        code = self._codes.get(value)
+        if code is None:
+            code = self._codes[value] = len(self.strings)
+            self.strings.append(value)
+        return code
+
+
+@lru_cache(maxsize=65536)
+def _iso_day(day: int) -> str:
+    return date.fromordinal(day).isoformat()
+
+
+def _format_timestamp(micros: int) -> str:
+    """As datetime.isoformat() + 'Z', in half the time (reads format two
+    per patient)"""
+    days, micros = divmod(micros, _DAY_MICROS)
+    seconds, fraction = divmod(micros, 1_000_000)
+    text = (f"{_iso_day(_EPOCH_DAY + days)}T{_TWO_DIGITS[seconds // 3600]}:"
+            f"{_TWO_DIGITS[seconds // 60 % 60]}:{_TWO_DIGITS[seconds % 60]}")
+    return f"{text}.{fraction:06d}Z" if fraction else text + "Z"
+
+
+def _encode_timestamp(value: Optional[str]) -> int:
+    """Microseconds for '2024-12-01T10:00:00Z' / '...:00.123456Z' (what the
+    service writes), _ODD_TS for anything that would not round-trip"""
+    if value is None:
+        return _NONE_TS
+    try:
+        micros = (datetime.fromisoformat(value.removesuffix("Z")) - _EPOCH) // _MICROSECOND
+    except (TypeError, ValueError):
+        return _ODD_TS
+    return micros if _format_timestamp(micros) == value else _ODD_TS
+
+
+def _encode_day(value: Optional[str]) -> int:
+    if value is None:
+        return _NONE_DAY
+    try:
+        day = date.fromisoformat(value)
+    except ValueError:
+        return _ODD_DAY
+    return day.toordinal() if day.isoformat() == value else _ODD_DAY
+
+
+class PatientTable:
+    """patient_id -> Patient, stored column-wise (a dict-like subset)"""
+
+    def __init__(self, patients: Iterable[Patient] = ()) -> None:
+        self._rows: Dict[str, int] = {}
+        self._ids: List[Optional[str]] = []
+        self._free: List[int] = []
+        self._pools = {name: StringPool() for name in POOLED}
+        self._pooled = {name: array("I") for name in POOLED}
+        self._pooled_columns = [
+            (name, self._pooled[name], self._pools[name].strings) for name in POOLED
+        ]
+        self._plain: Dict[str, List[Optional[str]]] = {name: [] for name in PLAIN}
+        self._timestamps = {name: array("q") for name in TIMESTAMPS}
+        self._birth_days = array("i")
+        # (row, field) -> value, for values the numeric columns cannot hold exactly
+        self._odd: Dict[Tuple[int, str], str] = {}
+        for patient in patients:
+            self[patient.patient_id] = patient
+
+    def __len__(self) -> int:
+        return len(self._rows)
+
+    def __contains__(self, patient_id: object) -> bool:
+        return patient_id in self._rows
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._rows)
+
+    def __getitem__(self, patient_id: str) -> Patient:
+        return self._materialize(self._rows[patient_id])
+
+    def get(self, patient_id: str) -> Optional[Patient]:
+        row = self._rows.get(patient_id)
+        return None if row is None else self._materialize(row)
+
+    def values(self) -> Iterator[Patient]:
+        for row in list(self._rows.values()):
+            yield self._materialize(row)
+
+    def __setitem__(self, patient_id: str, patient: Patient) -> None:
+        row = self._rows.get(patient_id)
+        if row is None:
+            row = self._free.pop() if self._free else self._append_row()
+            self._rows[patient_id] = row
+            self._ids[row] = patient_id
+        for name in POOLED:
+            self._pooled[name][row] = self._pools[name].code(getattr(patient, name))
+        for name in PLAIN:
+            self._plain[name][row] = getattr(patient, name)
+        for name in TIMESTAMPS:
+            self._timestamps[name][row] = self._encode(
+                row, name, getattr(patient, name), _encode_timestamp, _ODD_TS
+            )
+        self._birth_days[row] = self._encode(
+            row, "date_of_birth", patient.date_of_birth, _encode_day, _ODD_DAY
+        )
+
+    def pop(self, patient_id: str, default: Optional[Patient] = None) -> Optional[Patient]:
+        row = self._rows.pop(patient_id, None)
+        if row is None:
+            return default
+        patient = self._materialize(row)
+        self._ids[row] = None
+        for name in PLAIN:
+            self._plain[name][row] = None
+        for name in (*TIMESTAMPS, "date_of_birth"):
+            self._odd.pop((row, name), None)
+        self._free.append(row)
+        return patient
+
+    def _append_row(self) -> int:
+        self._ids.append(None)
+        for column in self._pooled.values():
+            column.append(0)
+        for column in self._plain.values():
+            column.append(None)
+        for column in self._timestamps.values():
+            column.append(_NONE_TS)
+        self._birth_days.append(_NONE_DAY)
+        return len(self._ids) - 1
+
+    def _encode(self, row: int, name: str, value: Optional[str],
+                encode: Callable[[Optional[str]], int], odd: int) -> int:
+        encoded = encode(value)
+        if encoded == odd:
+            self._odd[(row, name)] = value
+        else:
+            self._odd.pop((row, name), None)
+        return encoded
+
+    def _timestamp(self, row: int, name: str) -> Optional[str]:
+        micros = self._timestamps[name][row]
+        if micros == _NONE_TS:
+            return None
+        if micros == _ODD_TS:
+            return self._odd[(row, name)]
+        return _format_timestamp(micros)
+
+    def _birth_date(self, row: int) -> Optional[str]:
+        day = self._birth_days[row]
+        if day == _NONE_DAY:
+            return None
+        if day == _ODD_DAY:
+            return self._odd[(row, "date_of_birth")]
+        return _iso_day(day)
+
+    def _materialize(self, row: int) -> Patient:
+        fields = dict.fromkeys(FIELDS)
+        for name, codes, strings in self._pooled_columns:
+            fields[name] = strings[codes[row]]
+        for name, column in self._plain.items():
+            fields[name] = column[row]
+        for name in TIMESTAMPS:
+            fields[name] = self._timestamp(row, name)
+        fields["date_of_birth"] = self._birth_date(row)
+        fields["patient_id"] = self._ids[row]
+        patient = Patient.__new__(Patient)
+        patient.__setstate__({
+            "__dict__": fields,
+            "__pydantic_fields_set__": set(FIELDS),
+            "__pydantic_extra__": None,
+            "__pydantic_private__": None,
+        })
+        return patient
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "rows": len(self._rows),
+            "free_rows": len(self._free),
+            "pooled_strings": sum(len(pool) for pool in self._pools.values()),
+            "odd_values": len(self._odd),
+        }
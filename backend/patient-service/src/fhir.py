@@ -0,0 +1,274 @@
+"""
+FHIR R4 view of the patient store (https://hl7.org/fhir/R4/patient.html).
+
+Read-only: a Patient by id, search, and history (of one patient, or of the
+whole store for systems that keep a copy in step). Resources are built
+straight from Patient attributes into plain dicts and JSON-encoded a chunk at
+a time; no per-resource model is validated on the way out. Bundles are
+streamed: the entries go out as each chunk is read from the store and the
+paging links come last (JSON does not order object keys), so a bundle of
+thousands of patients never sits in memory whole. Encoding is orjson's
+(see danaya_shared.responses).
+
+Paging follows the next link. Plain listings and store history page by
+keyset (``_cursor``), so deep pages cost the same as the first; a name or
+identifier search pages by ``_offset`` over the ranked results.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, AsyncIterator, Callable, Dict, Iterable, List, Mapping, Optional, Tuple
+from urllib.parse import urlencode
+
+from danaya_shared.responses import dumps
+
+from .models import Patient
+from .repository import Change, Version
+from .search import fold
+
+FHIR_JSON = "application/fhir+json"
+
+NATIONAL_ID_SYSTEM = "https://danaya.bf/fhir/sid/national-id"
+PATIENT_ID_SYSTEM = "https://danaya.bf/fhir/sid/patient-id"
+REGION_EXTENSION = "https://danaya.bf/fhir/StructureDefinition/region"
+
+GENDERS = {"M": "male", "F": "female", "O": "other"}
+
+DEFAULT_COUNT = 50
+MAX_COUNT = 5000
+
+# Search parameters applied to each patient (the text ones also pick the
+# candidates from the search index)
+NAME_PARAMS = (
+    ("name", ("first_name", "last_name")), ("family", ("last_name",)), ("given", ("first_name",)),
+)
+SEARCH_PARAMS = (
+    "_id", "identifier", "name", "family", "given", "gender", "birthdate", "organization",
+)
+
+
+class FhirError(Exception):
+    """Answered as an OperationOutcome"""
+
+    def __init__(self, status_code: int, code: str, diagnostics: str) -> None:
+        super().__init__(diagnostics)
+        self.status_code = status_code
+        self.code = code
+        self.diagnostics = diagnostics
+
+
+def operation_outcome(code: str, diagnostics: str) -> Dict[str, Any]:
+    return {
+        "resourceType": "OperationOutcome",
+        "issue": [{"severity": "error", "code": code, "diagnostics": diagnostics}],
+    }
+
+
+def _now() -> str:
+    return datetime.now(timezone.utc).isoformat(timespec="seconds").replace("+00:00", "Z")
+
+
+def patient_resource(p: Patient, seq: Optional[int] = None) -> Dict[str, Any]:
+    """A FHIR Patient for p; seq becomes meta.versionId"""
+    meta: Dict[str, Any] = {"lastUpdated": p.updated_at}
+    if seq is not None:
+        meta["versionId"] = str(seq)
+    resource: Dict[str, Any] = {"resourceType": "Patient", "id": p.patient_id, "meta": meta}
+    identifiers = [{"use": "usual", "system": PATIENT_ID_SYSTEM, "value": p.patient_id}]
+    if p.national_id:
+        identifiers.append(
+            {"use": "official", "system": NATIONAL_ID_SYSTEM, "value": p.national_id}
+        )
+    resource["identifier"] = identifiers
+    resource["name"] = [{"use": "official", "family": p.last_name, "given": [p.first_name]}]
+    if p.phone:
+        resource["telecom"] = [{"system": "phone", "value": p.phone}]
+    resource["gender"] = GENDERS.get((p.sex or "").upper(), "unknown")
+    if p.date_of_birth:
+        resource["birthDate"] = p.date_of_birth
+    if p.address:
+        resource["address"] = [{"text": p.address}]
+    if p.region_id:
+        resource["extension"] = [{"url": REGION_EXTENSION, "valueString": p.region_id}]
+    if p.hospital_id:
+        resource["managingOrganization"] = {"reference": f"Organization/{p.hospital_id}"}
+    return resource
+
+
+# --- search -------------------------------------------------------------------
+
+def count_param(params: Mapping[str, str]) -> int:
+    try:
+        count = int(params.get("_count", DEFAULT_COUNT))
+    except ValueError:
+        raise FhirError(400, "invalid", "_count must be an integer")
+    if not 1 <= count <= MAX_COUNT:
+        raise FhirError(400, "invalid", f"_count must be between 1 and {MAX_COUNT}")
+    return count
+
+
+def int_param(params: Mapping[str, str], name: str) -> int:
+    try:
+        value = int(params.get(name, 0))
+    except ValueError:
+        raise FhirError(400, "invalid", f"{name} must be an integer")
+    if value < 0:
+        raise FhirError(400, "invalid", f"{name} must not be negative")
+    return value
+
+
+def _identifier(token: str) -> Tuple[Optional[str], str]:
+    """'system|value' or 'value'"""
+    system, sep, value = token.partition("|")
+    return (system or None, value) if sep else (None, token)
+
+
+def search_text(params: Mapping[str, str]) -> Optional[str]:
+    """What to ask the search index for, if the search names a patient"""
+    if "identifier" in params:
+        system, value = _identifier(params["identifier"])
+        if system != PATIENT_ID_SYSTEM:
+            return value
+    for name in ("name", "family", "given"):
+        if params.get(name):
+            return params[name]
+    return None
+
+
+def _name_test(fields: Tuple[str, ...], value: str) -> Callable[[Patient], bool]:
+    """Every word of the (folded) value starts one of the names, or a word of
+    one: 'aminata ouedraogo' matches given 'Aminata', family 'Ouédraogo'"""
+    words = value.split()
+
+    def test(p: Patient) -> bool:
+        names = [fold(getattr(p, name)) for name in fields]
+        parts = names + [part for name in names for part in name.split()]
+        return all(any(part.startswith(word) for part in parts) for word in words)
+
+    return test
+
+
+def matcher(params: Mapping[str, str]) -> Callable[[Patient], bool]:
+    """Predicate for the search parameters (strings match by prefix, case
+    and accents ignored, as FHIR string search does)"""
+    tests: List[Callable[[Patient], bool]] = []
+    if "_id" in params:
+        ids = set(params["_id"].split(","))
+        tests.append(lambda p: p.patient_id in ids)
+    if "identifier" in params:
+        system, value = _identifier(params["identifier"])
+        if system == PATIENT_ID_SYSTEM:
+            tests.append(lambda p: p.patient_id == value)
+        elif system in (None, NATIONAL_ID_SYSTEM):
+            tests.append(lambda p: p.national_id == value)
+        else:
+            tests.append(lambda p: False)
+    for param, fields in NAME_PARAMS:
+        if param in params:
+            tests.append(_name_test(fields, fold(params[param])))
+    if "gender" in params:
+        gender = params["gender"]
+        tests.append(lambda p: GENDERS.get((p.sex or "").upper(), "unknown") == gender)
+    if "birthdate" in params:
+        # Equality at the precision given: 1985, 1985-03 or 1985-03-14
+        birthdate = params["birthdate"].removeprefix("eq")
+        tests.append(lambda p: bool(p.date_of_birth) and p.date_of_birth.startswith(birthdate))
+    if "organization" in params:
+        organization = params["organization"].removeprefix("Organization/")
+        tests.append(lambda p: p.hospital_id == organization)
+    return lambda p: all(test(p) for test in tests)
+
+
+def page_link(base_url: str, path: str, params: Mapping[str, str], **paging: Any) -> str:
+    query = {k: v for k, v in params.items() if k in SEARCH_PARAMS or k == "_count"}
+    query.update({k: v for k, v in paging.items() if v is not None})
+    return f"{base_url}/{path}" + (f"?{urlencode(query)}" if query else "")
+
+
+# --- bundles --------------------------------------------------------------------
+
+def search_entries(base_url: str, patients: Iterable[Patient],
+                   versions: Mapping[str, Version]) -> List[Dict[str, Any]]:
+    entries = []
+    for p in patients:
+        version = versions.get(p.patient_id)
+        entries.append({
+            "fullUrl": f"{base_url}/Patient/{p.patient_id}",
+            "resource": patient_resource(p, version.seq if version else None),
+            "search": {"mode": "match"},
+        })
+    return entries
+
+
+def history_entries(base_url: str, changes: Iterable[Change]) -> List[Dict[str, Any]]:
+    entries = []
+    for change in changes:
+        url = f"Patient/{change.patient_id}"
+        if change.patient is None:
+            entries.append({
+                "fullUrl": f"{base_url}/{url}",
+                "request": {"method": "DELETE", "url": url},
+                "response": {"status": "204", "etag": f'W/"{change.seq}"'},
+            })
+        else:
+            entries.append({
+                "fullUrl": f"{base_url}/{url}",
+                "resource": patient_resource(change.patient, change.seq),
+                "request": {"method": "PUT", "url": url},
+                "response": {"status": "200", "etag": f'W/"{change.seq}"',
+                             "lastModified": change.patient.updated_at},
+            })
+    return entries
+
+
+async def stream_bundle(
+    bundle_type: str,
+    pages: AsyncIterator[List[Dict[str, Any]]],
+    links: Callable[[], List[Dict[str, str]]],
+    total: Optional[int] = None,
+) -> AsyncIterator[bytes]:
+    """A Bundle as JSON chunks: one per page of entries, then the links
+    (called once every page has been produced, so they may depend on where
+    the pages ended)"""
+    head: Dict[str, Any] = {"resourceType": "Bundle", "type": bundle_type, "timestamp": _now()}
+    if total is not None:
+        head["total"] = total
+    yield dumps(head)[:-1]
+    # FHIR JSON has no empty arrays: "entry" is only opened once there is one
+    opened = False
+    async for entries in pages:
+        if not entries:
+            continue
+        yield (b"," if opened else b',"entry":[') + dumps(entries)[1:-1]
+        opened = True
+    yield (b"]," if opened else b",") + dumps({"link": links()})[1:]
+
+
+CAPABILITY_STATEMENT: Dict[str, Any] = {
+    "resourceType": "CapabilityStatement",
+    "status": "active",
+    "date": "2025-01-01",
+    "kind": "instance",
+    "software": {"name": "DANAYA Patient Service"},
+    "fhirVersion": "4.0.1",
+    "format": ["json"],
+    "rest": [{
+        "mode": "server",
+        "resource": [{
+            "type": "Patient",
+            "interaction": [
+                {"code": "read"}, {"code": "search-type"},
+                {"code": "history-instance"}, {"code": "history-type"},
+            ],
+            "searchParam": [
+                {"name": "_id", "type": "token"},
+                {"name": "identifier", "type": "token"},
+                {"name": "name", "type": "string"},
+                {"name": "family", "type": "string"},
+                {"name": "given", "type": "string"},
+                {"name": "gender", "type": "token"},
+                {"name": "birthdate", "type": "date"},
+                {"name": "organization", "type": "reference"},
+            ],
+        }],
+    }],
+}
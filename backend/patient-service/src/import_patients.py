@@ -0,0 +1,103 @@
+"""
+Bulk-import a CSV / NDJSON patient register.
+
+Writes straight to the configured store (DATABASE_URL / PATIENT_STORE), or
+streams the file to a running patient-service with --url:
+
+    python -m src.import_patients chu_yalgado.csv
+    python -m src.import_patients export.ndjson --url http://localhost:8002 --token $TOKEN
+"""
+
+from pathlib import Path
+from typing import AsyncIterator, Dict, Optional
+import argparse
+import asyncio
+import json
+import logging
+import sys
+
+from .importer import DEFAULT_BATCH_SIZE, FORMATS, ImportFormatError, import_patients
+from .repository import create_repository
+
+CHUNK_SIZE = 1 << 16
+SUFFIXES = {".csv": "csv", ".ndjson": "ndjson", ".jsonl": "ndjson"}
+
+
+async def read_chunks(path: Path) -> AsyncIterator[bytes]:
+    with path.open("rb") as f:
+        while chunk := f.read(CHUNK_SIZE):
+            yield chunk
+
+
+async def import_direct(path: Path, fmt: str, batch_size: int, encoding: str) -> Dict:
+    repo = create_repository()
+    if repo.backend == "memory":
+        print("PATIENT_STORE=memory: rows are validated but not persisted", file=sys.stderr)
+    await repo.connect()
+    try:
+        report = await import_patients(repo, read_chunks(path), fmt, batch_size, encoding)
+    finally:
+        await repo.close()
+    return report.as_dict()
+
+
+async def import_remote(path: Path, fmt: str, batch_size: int, encoding: str,
+                        url: str, token: Optional[str]) -> Dict:
+    import httpx
+
+    headers = {"Authorization": f"Bearer {token}"} if token else {}
+    async with httpx.AsyncClient(base_url=url, timeout=None) as client:
+        response = await client.post(
+            "/patients/import",
+            params={"format": fmt, "batch_size": batch_size, "encoding": encoding},
+            content=read_chunks(path),
+            headers=headers,
+        )
+    if response.status_code != 200:
+        sys.exit(f"Import failed ({response.status_code}): {response.text}")
+    return response.json()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("path", type=Path)
+    parser.add_argument("--format", choices=FORMATS, help="default: from the file suffix")
+    parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+    parser.add_argument("--encoding", default="utf-8", help="e.g. cp1252 for old Excel exports")
+    parser.add_argument(
+        "--url", help="patient-service base URL (default: write to the store directly)"
+    )
+    parser.add_argument("--token", help="bearer token for --url")
+    parser.add_argument("--errors", type=Path, help="write row errors here as NDJSON")
+    args = parser.parse_args()
+
+    fmt = args.format or SUFFIXES.get(args.path.suffix.lower())
+    if fmt is None:
+        parser.error(f"cannot tell the format of {args.path.name}; pass --format")
+
+    logging.basicConfig(level=logging.INFO)
+    try:
+        if args.url:
+            report = asyncio.run(import_remote(
+                args.path, fmt, args.batch_size, args.encoding, args.url, args.token
+            ))
+        else:
+            report = asyncio.run(import_direct(args.path, fmt, args.batch_size, args.encoding))
+    except ImportFormatError as exc:
+        sys.exit(str(exc))
+
+    errors = report.pop("errors")
+    if args.errors:
+        with args.errors.open("w") as f:
+            for error in errors:
+                f.write(json.dumps(error) + "\n")
+    else:
+        for error in errors[:20]:
+            print(f"  row {error['row']}: {error['error']}", file=sys.stderr)
+        if len(errors) > 20:
+            print(f"  ... {len(errors) - 20} more (use --errors FILE)", file=sys.stderr)
+    print(json.dumps(report))
+
+
+if __name__ == "__main__":
+    main()
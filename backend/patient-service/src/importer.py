@@ -0,0 +1,266 @@
+"""
+Bulk patient import.
+
+Streams CSV or NDJSON, parses and validates it in batches, skips rows whose
+national_id is already stored (or appears earlier in the upload), and writes
+each batch in its own transaction through PatientRepository.add_new. Memory
+is bounded by the batch size however large the upload is, and a failed row
+never sinks its batch: it is reported with its row number instead.
+
+CSV needs a header row naming PatientCreate fields (case-insensitive; other
+columns are ignored). A ``patient_id`` column, if present, is kept, so
+re-running the same file is a no-op. Row numbers count data records from 1
+(CSV header and blank lines excluded).
+"""
+
+from dataclasses import asdict, dataclass, field
+from datetime import datetime
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List, Optional, Set, Tuple
+import asyncio
+import codecs
+import csv
+import json
+import logging
+import time
+
+from pydantic import TypeAdapter, ValidationError
+
+from .models import Patient, PatientCreate, generate_patient_id
+from .repository import PatientRepository
+
+logger = logging.getLogger(__name__)
+
+FORMATS = ("csv", "ndjson")
+CONTENT_TYPES = {
+    "text/csv": "csv",
+    "application/csv": "csv",
+    "application/x-ndjson": "ndjson",
+    "application/ndjson": "ndjson",
+    "application/jsonl": "ndjson",
+}
+FIELDS = frozenset(PatientCreate.model_fields) | {"patient_id"}
+
+DEFAULT_BATCH_SIZE = 5_000
+MAX_REPORTED_ERRORS = 1_000
+
+_patient_list = TypeAdapter(List[Patient])
+
+
+class ImportFormatError(ValueError):
+    """The upload cannot be read at all (bad format, missing CSV header)"""
+
+
+@dataclass
+class RowError:
+    row: int
+    error: str
+
+
+@dataclass
+class ImportReport:
+    received: int = 0
+    imported: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: List[RowError] = field(default_factory=list)
+    errors_truncated: bool = False
+    seconds: float = 0.0
+
+    @property
+    def rows_per_second(self) -> float:
+        return round(self.received / self.seconds) if self.seconds else 0.0
+
+    def reject(self, row: int, error: str) -> None:
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append(RowError(row, error))
+        else:
+            self.errors_truncated = True
+
+    def as_dict(self) -> Dict[str, Any]:
+        data = asdict(self)
+        data["seconds"] = round(self.seconds, 3)
+        data["rows_per_second"] = self.rows_per_second
+        return data
+
+
+def detect_format(content_type: Optional[str]) -> Optional[str]:
+    if not content_type:
+        return None
+    return CONTENT_TYPES.get(content_type.split(";")[0].strip().lower())
+
+
+async def _record_batches(
+    chunks: AsyncIterable[bytes], fmt: str, batch_size: int, encoding: str
+) -> AsyncIterator[List[str]]:
+    """Lines grouped into batches of complete records.
+
+    A CSV record ends on a line that leaves an even number of quotes open, so
+    quoted fields may span lines; blank lines outside quotes are dropped.
+    """
+    decoder = codecs.getincrementaldecoder(encoding)(errors="replace")
+    pending = ""
+    batch: List[str] = []
+    records = 0
+    in_quotes = False
+    first = True
+
+    def feed(lines: List[str]) -> None:
+        nonlocal records, in_quotes
+        for line in lines:
+            if not in_quotes and not line.strip():
+                continue
+            if fmt == "csv":
+                # Keep the newline: it is data inside a quoted field
+                batch.append(line + "\n")
+                if line.count('"') % 2:
+                    in_quotes = not in_quotes
+            else:
+                batch.append(line)
+            if not in_quotes:
+                records += 1
+
+    async for chunk in chunks:
+        text = pending + decoder.decode(chunk)
+        if first and text:
+            text = text.lstrip("\ufeff")
+            first = False
+        lines = text.split("\n")
+        pending = lines.pop()
+        feed(lines)
+        if records >= batch_size and not in_quotes:
+            yield batch
+            batch, records = [], 0
+    pending += decoder.decode(b"", final=True)
+    if pending:
+        feed([pending])
+    if batch:
+        yield batch
+
+
+Rows = List[Tuple[int, Dict[str, Any]]]
+
+
+def _csv_rows(lines: List[str], header: List[str], first_row: int,
+              report: ImportReport) -> Tuple[Rows, int]:
+    """(row number, field dict) per parsed record, and the number of records"""
+    rows = []
+    row = first_row
+    for values in csv.reader(lines):
+        if len(values) != len(header):
+            report.reject(row, f"expected {len(header)} columns, got {len(values)}")
+        else:
+            rows.append((row, {
+                name: value.strip() for name, value in zip(header, values)
+                if name in FIELDS and value.strip()
+            }))
+        row += 1
+    return rows, row - first_row
+
+
+def _ndjson_rows(lines: List[str], first_row: int, report: ImportReport) -> Tuple[Rows, int]:
+    rows = []
+    for row, line in enumerate(lines, first_row):
+        try:
+            data = json.loads(line)
+        except ValueError as exc:
+            report.reject(row, f"invalid JSON: {exc}")
+            continue
+        if not isinstance(data, dict):
+            report.reject(row, "expected a JSON object")
+            continue
+        rows.append((row, {k: v for k, v in data.items() if k in FIELDS and v not in ("", None)}))
+    return rows, len(lines)
+
+
+def _validate(rows: Rows, now: str,
+              report: ImportReport) -> List[Tuple[int, Patient]]:
+    """Validate a whole batch at once; re-validate without the bad rows if any"""
+    for _, data in rows:
+        data.setdefault("patient_id", generate_patient_id())
+        data["created_at"] = data["updated_at"] = now
+        national_id = data.get("national_id")
+        if isinstance(national_id, str):
+            data["national_id"] = national_id.strip().upper()
+    try:
+        patients = _patient_list.validate_python([data for _, data in rows])
+    except ValidationError as exc:
+        problems: Dict[int, str] = {}
+        for error in exc.errors():
+            index, *loc = error["loc"]
+            problems.setdefault(index, f"{'.'.join(map(str, loc))}: {error['msg']}")
+        for index, message in problems.items():
+            report.reject(rows[index][0], message)
+        rows = [r for index, r in enumerate(rows) if index not in problems]
+        patients = _patient_list.validate_python([data for _, data in rows])
+    return [(row, patient) for (row, _), patient in zip(rows, patients)]
+
+
+async def import_patients(
+    repo: PatientRepository,
+    chunks: AsyncIterable[bytes],
+    fmt: str,
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    encoding: str = "utf-8",
+) -> ImportReport:
+    if fmt not in FORMATS:
+        raise ImportFormatError(f"Unknown import format '{fmt}' (expected csv or ndjson)")
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise ImportFormatError(f"Unknown encoding '{encoding}'")
+
+    report = ImportReport()
+    started = time.perf_counter()
+    header: Optional[List[str]] = None
+    next_row = 1
+
+    async for lines in _record_batches(chunks, fmt, batch_size, encoding):
+        if fmt == "csv":
+            if header is None:
+                header = [name.strip().lower() for name in next(csv.reader(lines[:1]))]
+                lines = lines[1:]
+                if not FIELDS.intersection(header):
+                    raise ImportFormatError("CSV header names no patient fields")
+            rows, received = _csv_rows(lines, header, next_row, report)
+        else:
+            rows, received = _ndjson_rows(lines, next_row, report)
+        next_row += received
+        report.received += received
+
+        now = datetime.utcnow().isoformat() + "Z"
+        batch: List[Tuple[int, Patient]] = []
+        # The first row with a given national_id or patient_id wins
+        seen_national_ids: Set[str] = set()
+        seen_patient_ids: Set[str] = set()
+        for row, patient in _validate(rows, now, report):
+            if patient.national_id and patient.national_id in seen_national_ids:
+                report.duplicates += 1
+                report.reject(row, f"duplicate national_id {patient.national_id} in upload")
+                continue
+            if patient.patient_id in seen_patient_ids:
+                report.duplicates += 1
+                report.reject(row, f"duplicate patient_id {patient.patient_id} in upload")
+                continue
+            if patient.national_id:
+                seen_national_ids.add(patient.national_id)
+            seen_patient_ids.add(patient.patient_id)
+            batch.append((row, patient))
+
+        inserted = await repo.add_new([patient for _, patient in batch])
+        report.imported += len(inserted)
+        for row, patient in batch:
+            if patient.patient_id not in inserted:
+                report.duplicates += 1
+                report.reject(row, f"already stored: {patient.national_id or patient.patient_id}")
+        # Let other requests run between batches
+        await asyncio.sleep(0)
+
+    report.failed = report.received - report.imported - report.duplicates
+    report.errors.sort(key=lambda e: e.row)
+    report.seconds = time.perf_counter() - started
+    logger.info(
+        f"Imported {report.imported}/{report.received} patients "
+        f"({report.duplicates} duplicates, {report.failed} failed) "
+        f"in {report.seconds:.1f}s, {report.rows_per_second:.0f} rows/s"
+    )
+    return report
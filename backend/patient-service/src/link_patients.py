@@ -0,0 +1,83 @@
+"""
+Batch duplicate detection over the whole patient store.
+
+Scores every pair of patients that share a blocking key (see linkage.py)
+and stores the links in place of those stored before (patients whose
+duplicates were fixed since lose them). Work is the sum of squared block sizes, with blocks
+capped at MAX_BLOCK, so it grows with the registry instead of with its
+square. Run it after a bulk import or after changing the scoring rules:
+
+    python -m src.link_patients
+    python -m src.link_patients --rebuild-keys   # after changing blocking_keys()
+"""
+
+from typing import Dict, Set, Tuple
+import argparse
+import asyncio
+import json
+import logging
+import time
+
+from .linkage import MATCH, MAX_BLOCK, block_pairs
+from .repository import PatientRepository, create_repository
+
+logger = logging.getLogger(__name__)
+
+
+async def scan(repo: PatientRepository, max_block: int = MAX_BLOCK) -> Dict[str, float]:
+    started = time.perf_counter()
+    links: Dict[str, Dict[str, float]] = {}
+    scored: Set[Tuple[str, str]] = set()
+    blocks = compared = 0
+
+    async for block in repo.blocks(max_block):
+        blocks += 1
+        compared += len(block) * (len(block) - 1) // 2
+        # Linked pairs usually share several keys; score each pair once
+        for a, b, score in block_pairs(block, skip=scored):
+            scored.add((a, b))
+            links.setdefault(a, {})[b] = score
+            links.setdefault(b, {})[a] = score
+        await asyncio.sleep(0)
+
+    await repo.clear_matches()
+    for patient_id, matches in links.items():
+        await repo.set_matches(patient_id, matches)
+
+    stats = {
+        "blocks": blocks,
+        "pairs_compared": compared,
+        "links": len(scored),
+        "matches": sum(1 for a, b in scored if links[a][b] >= MATCH),
+        "patients_linked": len(links),
+        "seconds": round(time.perf_counter() - started, 2),
+    }
+    logger.info(f"Linkage scan: {stats}")
+    return stats
+
+
+async def run(rebuild_keys: bool, max_block: int) -> Dict[str, float]:
+    repo = create_repository()
+    await repo.connect()
+    try:
+        if rebuild_keys:
+            await repo.rebuild_block_keys()
+        return await scan(repo, max_block)
+    finally:
+        await repo.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--max-block", type=int, default=MAX_BLOCK,
+                        help="skip blocking keys shared by more patients than this")
+    parser.add_argument("--rebuild-keys", action="store_true",
+                        help="recompute every blocking key first")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    print(json.dumps(asyncio.run(run(args.rebuild_keys, args.max_block))))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,205 @@
+"""
+Patient record linkage (duplicate detection).
+
+Comparing every new patient with every stored one is quadratic, so records
+are first *blocked*: each patient gets a few keys (phonetic name pair,
+phonetic last name + date of birth, date of birth + phonetic first name,
+phone number, national ID) and only patients sharing a key are compared.
+Blocks larger than MAX_BLOCK are ignored (a key that common says nothing),
+which bounds the work per patient however large the registry grows.
+
+Candidate pairs are scored field by field with agreement / disagreement
+weights in the style of Fellegi-Sunter: names by Jaro-Winkler similarity
+(either name order), date of birth allowing a day/month swap, then sex,
+phone and national ID. The summed weight is classified as a match or a
+possible match for review.
+"""
+
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Container, Dict, Iterable, List, Optional, Tuple
+import re
+
+from .search import fold
+
+MAX_BLOCK = 500
+
+MATCH = 12.0
+POSSIBLE = 7.0
+
+_NON_LETTERS = re.compile(r"[^a-z]+")
+_NON_DIGITS = re.compile(r"\D+")
+
+# Spelling variants common in Burkinabè names written with French
+# orthography ("Ouédraogo" / "Wedraogo", "Sawadogo" / "Savadogo", "Djibo" /
+# "Jibo", "Coulibaly" / "Kulibali"), applied in order
+_OU_GLIDE = re.compile(r"^ou|ou(?=[aeio])")
+_PHONETIC_RULES = [
+    ("ou", "u"), ("v", "w"), ("tch", "c"), ("ch", "c"), ("sh", "c"), ("dj", "j"), ("dz", "z"),
+    ("ph", "f"), ("qu", "k"), ("ck", "k"), ("gu", "g"), ("ce", "se"), ("ci", "si"),
+    ("c", "k"), ("q", "k"), ("x", "ks"), ("y", "i"), ("z", "s"), ("h", ""),
+]
+_VOWELS = re.compile(r"[aeiou]")
+_REPEATS = re.compile(r"(.)\1+")
+
+
+@lru_cache(maxsize=65536)
+def phonetic(name: Optional[str]) -> str:
+    """Consonant skeleton after normalising spelling variants: 'Ouédraogo' -> 'wdrg'"""
+    if not name:
+        return ""
+    text = _OU_GLIDE.sub("w", _NON_LETTERS.sub("", fold(name)))
+    for pattern, replacement in _PHONETIC_RULES:
+        text = text.replace(pattern, replacement)
+    text = _REPEATS.sub(r"\1", text)
+    if not text:
+        return ""
+    return text[0] + _VOWELS.sub("", text[1:])
+
+
+def normalize_phone(phone: Optional[str]) -> str:
+    """Last 8 digits (Burkina numbers without the +226 / 00226 prefix)"""
+    digits = _NON_DIGITS.sub("", phone or "")
+    return digits[-8:] if len(digits) >= 8 else ""
+
+
+def blocking_keys(patient) -> Tuple[str, ...]:
+    first, last = phonetic(patient.first_name), phonetic(patient.last_name)
+    dob = patient.date_of_birth or ""
+    keys = []
+    if first and last:
+        # Order-independent, so swapped first / last names still meet
+        keys.append(f"n:{min(first, last)}:{max(first, last)}")
+    if dob and last:
+        keys.append(f"b:{last}:{dob}")
+    if dob and first:
+        keys.append(f"d:{dob}:{first}")
+    phone = normalize_phone(patient.phone)
+    if phone:
+        keys.append(f"p:{phone}")
+    if patient.national_id:
+        keys.append(f"i:{patient.national_id.strip().upper()}")
+    return tuple(keys)
+
+
+def jaro_winkler(a: str, b: str) -> float:
+    if a == b:
+        return 1.0 if a else 0.0
+    if not a or not b:
+        return 0.0
+    window = max(len(a), len(b)) // 2 - 1
+    matched_b = [False] * len(b)
+    a_matches = []
+    for i, ch in enumerate(a):
+        for j in range(max(0, i - window), min(len(b), i + window + 1)):
+            if not matched_b[j] and b[j] == ch:
+                matched_b[j] = True
+                a_matches.append(ch)
+                break
+    m = len(a_matches)
+    if not m:
+        return 0.0
+    b_matches = [ch for ch, hit in zip(b, matched_b) if hit]
+    transpositions = sum(x != y for x, y in zip(a_matches, b_matches)) / 2
+    jaro = (m / len(a) + m / len(b) + (m - transpositions) / m) / 3
+    prefix = 0
+    for x, y in zip(a[:4], b[:4]):
+        if x != y:
+            break
+        prefix += 1
+    return jaro + prefix * 0.1 * (1 - jaro)
+
+
+@lru_cache(maxsize=262144)
+def name_agreement(a: str, b: str) -> float:
+    """1 (same name), 0.5 (close) or 0 (different); names repeat, so cached"""
+    if phonetic(a) == phonetic(b):
+        return 1.0
+    similarity = jaro_winkler(fold(a), fold(b))
+    if similarity >= 0.94:
+        return 1.0
+    if similarity >= 0.88:
+        return 0.5
+    return 0.0
+
+
+def _name_weight(a: Optional[str], b: Optional[str], agree: float, disagree: float) -> float:
+    if not a or not b:
+        return 0.0
+    agreement = name_agreement(a, b)
+    return agree * agreement if agreement else disagree
+
+
+def _dob_weight(a: Optional[str], b: Optional[str]) -> float:
+    if not a or not b:
+        return 0.0
+    if a == b:
+        return 5.5
+    ya, _, ra = a.partition("-")
+    yb, _, rb = b.partition("-")
+    if ya == yb and ra.split("-")[::-1] == rb.split("-"):
+        return 2.5  # day and month swapped at entry
+    if ya == yb:
+        return 0.5
+    return -4.0
+
+
+@dataclass(frozen=True)
+class MatchScore:
+    score: float
+    status: str  # "match" | "possible" | "distinct"
+
+
+def score_pair(a, b) -> MatchScore:
+    score = (_name_weight(a.last_name, b.last_name, 4.5, -3.5)
+             + _name_weight(a.first_name, b.first_name, 4.0, -3.0))
+    if score < 8.5:
+        swapped = (_name_weight(a.last_name, b.first_name, 4.5, -3.5)
+                   + _name_weight(a.first_name, b.last_name, 4.0, -3.0))
+        score = max(score, swapped)
+    score += _dob_weight(a.date_of_birth, b.date_of_birth)
+
+    if a.sex and b.sex:
+        score += 0.5 if a.sex.upper() == b.sex.upper() else -4.0
+    phone_a, phone_b = normalize_phone(a.phone), normalize_phone(b.phone)
+    if phone_a and phone_b:
+        score += 5.0 if phone_a == phone_b else -0.5
+    if a.national_id and b.national_id:
+        same = a.national_id.strip().upper() == b.national_id.strip().upper()
+        score += 12.0 if same else -12.0
+
+    if score >= MATCH:
+        status = "match"
+    elif score >= POSSIBLE:
+        status = "possible"
+    else:
+        status = "distinct"
+    return MatchScore(round(score, 2), status)
+
+
+def find_matches(patient, candidates: Iterable) -> Dict[str, float]:
+    """patient_id -> score for the candidates scoring at least POSSIBLE"""
+    matches = {}
+    for other in candidates:
+        if other.patient_id == patient.patient_id:
+            continue
+        result = score_pair(patient, other)
+        if result.status != "distinct":
+            matches[other.patient_id] = result.score
+    return matches
+
+
+def block_pairs(block: List,
+                skip: Container[Tuple[str, str]] = ()) -> Iterable[Tuple[str, str, float]]:
+    """(patient_id, patient_id, score) for every linked pair within one block.
+
+    The block must be ordered by patient_id; pairs in ``skip`` (already
+    scored in another block) are not scored again.
+    """
+    for i, a in enumerate(block):
+        for b in block[i + 1:]:
+            if (a.patient_id, b.patient_id) in skip:
+                continue
+            result = score_pair(a, b)
+            if result.status != "distinct":
+                yield a.patient_id, b.patient_id, result.score
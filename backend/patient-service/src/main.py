@@ -1,63 +1,152 @@
-from fastapi import FastAPI, HTTPException, status
+from fastapi import Depends, FastAPI, HTTPException, Query, Request, Response, status
+from fastapi.encoders import jsonable_encoder
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel, Field
-from typing import Optional, List
+from fastapi.responses import StreamingResponse
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Optional, List
 from datetime import datetime
-from uuid import uuid4
+import asyncio
+import gzip
+import logging
+import os
+
+from pydantic import ValidationError
+
+from danaya_shared import logs
+from danaya_shared.health import HealthChecks
+from danaya_shared.jwks import JWKSTokenVerifier, KeySet
+from danaya_shared.logs import RequestContextMiddleware, setup_logging
+from danaya_shared.metrics import LOG_RECORDS_DROPPED, MetricsMiddleware, MetricsPublisher
+from danaya_shared.middleware import TokenAuthMiddleware
+from danaya_shared.responses import JSONResponse, ModelResponse, dumps
+from danaya_shared.revocation import RedisRevocations, RevocationList
+
+from .cache import CachedPatientRepository
+from .fhir import FHIR_JSON, FhirError
+from .importer import DEFAULT_BATCH_SIZE, FORMATS, ImportFormatError, detect_format, import_patients
+from .linkage import MATCH, find_matches
+from .models import (
+    DuplicateCandidate, Patient, PatientCreate, PatientUpdate, SyncPush, SyncResult,
+    generate_patient_id,
+)
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+from .repository import Change, PatientRepository, create_repository
+from . import fhir, sync
+
+EXPORT_CHUNK_SIZE = 500
+# Sync deltas smaller than this are sent uncompressed
+SYNC_GZIP_MIN_SIZE = 1024
+
+setup_logging("patient-service")
+logger = logging.getLogger(__name__)
+
+# Tokens are verified locally against auth-service's published keys
+AUTH_REQUIRED = os.getenv("AUTH_REQUIRED", "true").lower() not in ("0", "false", "no")
+AUTH_JWKS_URL = os.getenv("AUTH_JWKS_URL", "http://localhost:8001/.well-known/jwks.json")
+REDIS_URL = os.getenv("REDIS_URL")
+# Read-through cache of patients in Redis (with REDIS_URL and a shared store)
+PATIENT_CACHE = os.getenv("PATIENT_CACHE", "on").lower() not in ("0", "off", "false", "no")
+PATIENT_CACHE_TTL = int(os.getenv("PATIENT_CACHE_TTL", "300"))
+PATIENT_CACHE_L1_SIZE = int(os.getenv("PATIENT_CACHE_L1_SIZE", "1024"))
+PATIENT_CACHE_L1_TTL = float(os.getenv("PATIENT_CACHE_L1_TTL", "30"))
+# Public base of the FHIR API as clients reach it (through nginx); by default
+# taken from the request
+FHIR_BASE_URL = os.getenv("FHIR_BASE_URL", "").rstrip("/")
+# Seconds between copies of cache counters and sizes into /metrics
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
+
+signing_keys = KeySet(AUTH_JWKS_URL)
+revocations = RevocationList()
+revocation_feed = RedisRevocations(REDIS_URL, revocations)
+token_verifier = JWKSTokenVerifier(signing_keys, revocations=revocations)
+metrics = MetricsPublisher(METRICS_INTERVAL)
+health = HealthChecks.from_env("danaya-patient-service", "0.1.0")
+
+async def check_signing_keys() -> dict:
+    # Keys missing since startup (auth-service was down) are fetched again here
+    if not len(signing_keys):
+        await signing_keys.refresh(force=True)
+    if not len(signing_keys):
+        raise RuntimeError(f"No token signing keys from {AUTH_JWKS_URL}")
+    return {"keys": len(signing_keys)}
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    repository = create_repository()
+    if repository.backend == "memory" and int(os.getenv("WEB_CONCURRENCY", "1")) > 1:
+        logger.warning(
+            "PATIENT_STORE=memory with several workers: each worker keeps its own patients"
+        )
+    # Not over the memory store: workers would share cached patients they don't share
+    if PATIENT_CACHE and REDIS_URL and repository.backend != "memory":
+        repository = CachedPatientRepository(
+            repository, REDIS_URL, ttl=PATIENT_CACHE_TTL,
+            l1_size=PATIENT_CACHE_L1_SIZE, l1_ttl=PATIENT_CACHE_L1_TTL,
+        )
+    await repository.connect()
+    if await repository.count() == 0:
+        await repository.add_many(demo_patients.values())
+    app.state.patients = repository
+    if AUTH_REQUIRED:
+        await signing_keys.start()
+        await revocation_feed.start()
+    metrics.cache("tokens", lambda: token_verifier.hits, lambda: token_verifier.misses,
+                  lambda: len(token_verifier))
+    metrics.store("patients", repository.estimated_count)
+    if isinstance(repository, CachedPatientRepository):
+        metrics.cache("patients_l1", lambda: repository.l1_hits, lambda: repository.l1_misses,
+                      lambda: len(repository))
+        metrics.cache("patients_redis", lambda: repository.hits, lambda: repository.misses)
+    metrics.count(LOG_RECORDS_DROPPED, logs.dropped)
+    await metrics.start()
+    health.add("patients", repository.ping)
+    if AUTH_REQUIRED:
+        # Without keys no token can be verified
+        health.add("signing_keys", check_signing_keys)
+    if REDIS_URL:
+        health.add("redis", revocation_feed.ping, critical=False)
+    health.started()
+    try:
+        yield
+    finally:
+        health.stopped()
+        await metrics.stop()
+        await signing_keys.stop()
+        await revocation_feed.stop()
+        await repository.close()
 
 app = FastAPI(
     title="DANAYA Patient Service",
     description="Core EHR patient management microservice.",
     version="0.1.0",
+    lifespan=lifespan,
+    default_response_class=JSONResponse,
 )
 
-# Add CORS
+app.add_middleware(
+    TokenAuthMiddleware,
+    verifier=token_verifier,
+    keys=signing_keys,
+    enabled=AUTH_REQUIRED,
+)
+
+# Add CORS (added last so it wraps auth and preflights never need a token)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["http://localhost:3000", "http://localhost:8001"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-Possible-Duplicates", "X-Request-ID"],
 )
 
-class PatientBase(BaseModel):
-    national_id: Optional[str] = Field(
-        default=None,
-        description="National health ID (NHID) or CNIB/Passport"
-    )
-    first_name: str = Field(..., min_length=1, max_length=100)
-    last_name: str = Field(..., min_length=1, max_length=100)
-    sex: Optional[str] = Field(default=None, description="M, F, or O")
-    date_of_birth: Optional[str] = Field(
-        default=None,
-        description="YYYY-MM-DD"
-    )
-    phone: Optional[str] = None
-    address: Optional[str] = None
-    region_id: Optional[str] = None
-    hospital_id: Optional[str] = None
-
-class PatientCreate(PatientBase):
-    pass
-
-class PatientUpdate(BaseModel):
-    national_id: Optional[str] = None
-    first_name: Optional[str] = None
-    last_name: Optional[str] = None
-    sex: Optional[str] = None
-    date_of_birth: Optional[str] = None
-    phone: Optional[str] = None
-    address: Optional[str] = None
-    region_id: Optional[str] = None
-    hospital_id: Optional[str] = None
-
-class Patient(PatientBase):
-    patient_id: str
-    created_at: str
-    updated_at: str
-
-# Initialize with demo data
-patients_db: dict[str, Patient] = {
+# Outermost: times every request, answers /metrics without a token
+app.add_middleware(MetricsMiddleware, publisher=metrics)
+# Around that: the request id, and the sampled request log
+app.add_middleware(RequestContextMiddleware)
+
+# Demo data, loaded into an empty store at startup
+demo_patients: dict[str, Patient] = {
     "P001": Patient(
         patient_id="P001",
         national_id="BF2025ABC12345",
@@ -172,46 +261,139 @@ patients_db: dict[str, Patient] = {
     )
 }
 
-def generate_patient_id() -> str:
-    return f"PAT-{uuid4().hex[:10].upper()}"
+def get_repository(request: Request) -> PatientRepository:
+    return request.app.state.patients
+
+async def link_patient(repo: PatientRepository, patient: Patient,
+                       response: Optional[Response] = None) -> None:
+    """Score the patient against its blocking candidates and store the links"""
+    matches = find_matches(patient, await repo.candidates(patient))
+    await repo.set_matches(patient.patient_id, matches)
+    if matches and response is not None:
+        ranked = sorted(matches, key=matches.get, reverse=True)
+        response.headers["X-Possible-Duplicates"] = ",".join(ranked[:10])
 
 @app.get("/")
-async def root():
+async def root(repo: PatientRepository = Depends(get_repository)):
     return {
         "service": "danaya-patient-service",
         "version": "0.1.0",
-        "total_patients": len(patients_db),
+        "total_patients": await repo.count(),
         "docs": "/docs",
     }
 
+app.include_router(health.router())
+
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response, repo: PatientRepository = Depends(get_repository)):
+    # No count(*) here: polling must stay cheap (an estimate is in /metrics)
+    ready, report = await health.ready()
+    response.headers["Cache-Control"] = "no-store"
+    if not ready:
+        response.status_code = status.HTTP_503_SERVICE_UNAVAILABLE
     return {
-        "status": "healthy",
-        "service": "danaya-patient-service",
-        "patients": len(patients_db),
+        **report,
+        "store": repo.backend,
         "timestamp": datetime.utcnow().isoformat() + "Z",
     }
 
 @app.get("/patients", response_model=List[Patient])
-async def list_patients(skip: int = 0, limit: int = 100, search: Optional[str] = None):
-    """List patients with optional search"""
-    patients = list(patients_db.values())
-    
-    # Search filter
+async def list_patients(
+    response: Response,
+    skip: int = Query(0, ge=0),
+    limit: int = Query(100, ge=1, le=1000),
+    search: Optional[str] = None,
+    cursor: Optional[str] = Query(
+        default=None,
+        description="Opaque cursor from a previous page's X-Next-Cursor header",
+    ),
+    repo: PatientRepository = Depends(get_repository),
+):
+    """List patients ordered by patient_id, with optional ranked search.
+
+    Without ``search``, pass the ``X-Next-Cursor`` header of one page as
+    ``cursor`` to get the next one; this is cheaper than ``skip`` on deep pages.
+    """
+    # Patients come out of the store validated: ModelResponse skips FastAPI's
+    # second validation and encoding pass (the same below)
     if search:
-        search_lower = search.lower()
-        patients = [
-            p for p in patients
-            if search_lower in p.first_name.lower()
-            or search_lower in p.last_name.lower()
-            or search_lower in (p.national_id or "").lower()
-        ]
-    
-    return patients[skip:skip + limit]
+        return ModelResponse(await repo.search(search, skip=skip, limit=limit))
+
+    if cursor is not None:
+        try:
+            after = decode_cursor(cursor)
+        except InvalidCursor as exc:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+        patients = await repo.page(limit + 1, after=after)
+    else:
+        patients = await repo.page(limit + 1, skip=skip)
+
+    if len(patients) > limit:
+        patients = patients[:limit]
+        response.headers["X-Next-Cursor"] = encode_cursor(patients[-1].patient_id)
+    return ModelResponse(patients, headers=response.headers)
+
+async def _export_lines(
+    repo: PatientRepository, region_id: Optional[str], hospital_id: Optional[str]
+) -> AsyncIterator[bytes]:
+    """Yield NDJSON chunks, walking the keyset so memory stays flat"""
+    async for batch in repo.chunks(EXPORT_CHUNK_SIZE, region_id, hospital_id):
+        if batch:
+            yield ("\n".join(p.model_dump_json() for p in batch) + "\n").encode()
+        # Let other requests run between chunks
+        await asyncio.sleep(0)
+
+@app.get("/patients/export")
+async def export_patients(
+    region_id: Optional[str] = None,
+    hospital_id: Optional[str] = None,
+    repo: PatientRepository = Depends(get_repository),
+):
+    """Stream patients as newline-delimited JSON (one Patient per line)"""
+    return StreamingResponse(
+        _export_lines(repo, region_id, hospital_id),
+        media_type="application/x-ndjson",
+    )
+
+@app.post("/patients/import")
+async def import_patient_file(
+    request: Request,
+    format: Optional[str] = Query(
+        default=None,
+        description=f"One of {', '.join(FORMATS)}; defaults from Content-Type",
+    ),
+    batch_size: int = Query(DEFAULT_BATCH_SIZE, ge=100, le=50_000),
+    encoding: str = "utf-8",
+    repo: PatientRepository = Depends(get_repository),
+):
+    """Bulk-import a CSV or NDJSON upload (streamed, never held in memory).
+
+    Rows whose national_id is already stored are skipped. Returns counts,
+    throughput and per-row errors.
+    """
+    fmt = format or detect_format(request.headers.get("content-type"))
+    if fmt is None:
+        raise HTTPException(
+            status_code=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE,
+            detail="Send text/csv or application/x-ndjson, or pass ?format=",
+        )
+    try:
+        report = await import_patients(repo, request.stream(), fmt, batch_size, encoding)
+    except ImportFormatError as exc:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(exc))
+    logger.info(
+        "Patients imported",
+        extra={"event": "patient.import", "imported": report.imported,
+               "rows_per_second": report.rows_per_second},
+    )
+    return report.as_dict()
 
 @app.post("/patients", response_model=Patient, status_code=status.HTTP_201_CREATED)
-async def create_patient(payload: PatientCreate):
+async def create_patient(
+    payload: PatientCreate,
+    response: Response,
+    repo: PatientRepository = Depends(get_repository),
+):
     now = datetime.utcnow().isoformat() + "Z"
     patient_id = generate_patient_id()
     patient = Patient(
@@ -220,53 +402,275 @@ async def create_patient(payload: PatientCreate):
         updated_at=now,
         **payload.model_dump(),
     )
-    patients_db[patient_id] = patient
-    print(f"✅ Created patient: {patient_id} - {patient.first_name} {patient.last_name}")
-    return patient
+    await repo.add(patient)
+    await link_patient(repo, patient, response)
+    logger.info("Patient created", extra={"event": "patient.create", "patient_id": patient_id})
+    return ModelResponse(patient, status_code=status.HTTP_201_CREATED, headers=response.headers)
 
 @app.get("/patients/{patient_id}", response_model=Patient)
-async def get_patient(patient_id: str):
-    patient = patients_db.get(patient_id)
+async def get_patient(patient_id: str, repo: PatientRepository = Depends(get_repository)):
+    patient = await repo.get(patient_id)
     if not patient:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Patient '{patient_id}' not found",
         )
-    return patient
+    return ModelResponse(patient)
+
+@app.get("/patients/{patient_id}/duplicates", response_model=List[DuplicateCandidate])
+async def get_patient_duplicates(
+    patient_id: str, repo: PatientRepository = Depends(get_repository)
+):
+    """Likely duplicates of a patient, best match first"""
+    if not await repo.get(patient_id):
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=f"Patient '{patient_id}' not found",
+        )
+    matches = await repo.matches(patient_id)
+    candidates = []
+    for other_id, score in sorted(matches.items(), key=lambda item: item[1], reverse=True):
+        other = await repo.get(other_id)
+        if other is not None:
+            candidates.append(DuplicateCandidate(
+                patient=other, score=score, status="match" if score >= MATCH else "possible",
+            ))
+    return ModelResponse(candidates)
 
 @app.put("/patients/{patient_id}", response_model=Patient)
-async def update_patient(patient_id: str, payload: PatientUpdate):
-    stored = patients_db.get(patient_id)
+async def update_patient(
+    patient_id: str,
+    payload: PatientUpdate,
+    response: Response,
+    repo: PatientRepository = Depends(get_repository),
+):
+    stored = await repo.get_latest(patient_id)
     if not stored:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Patient '{patient_id}' not found",
         )
-    update_data = payload.model_dump(exclude_unset=True)
-    updated_dict = stored.model_dump()
-    updated_dict.update(update_data)
-    updated_dict["updated_at"] = datetime.utcnow().isoformat() + "Z"
-    updated_patient = Patient(**updated_dict)
-    patients_db[patient_id] = updated_patient
-    print(f"✅ Updated patient: {patient_id}")
-    return updated_patient
+    # Validated once, as a whole: PatientUpdate alone allows e.g. an empty name
+    try:
+        updated_patient = Patient.model_validate({
+            **stored.model_dump(),
+            **payload.model_dump(exclude_unset=True),
+            "updated_at": datetime.utcnow().isoformat() + "Z",
+        })
+    except ValidationError as exc:
+        # The same body as FastAPI's own 422 for an invalid request
+        raise HTTPException(
+            status_code=status.HTTP_422_UNPROCESSABLE_ENTITY,
+            detail=jsonable_encoder(exc.errors(include_url=False)),
+        )
+    await repo.replace(updated_patient)
+    await link_patient(repo, updated_patient, response)
+    logger.info("Patient updated", extra={"event": "patient.update", "patient_id": patient_id})
+    return ModelResponse(updated_patient, headers=response.headers)
 
 @app.delete("/patients/{patient_id}", status_code=status.HTTP_204_NO_CONTENT)
-async def delete_patient(patient_id: str):
-    if patient_id not in patients_db:
+async def delete_patient(patient_id: str, repo: PatientRepository = Depends(get_repository)):
+    if not await repo.delete(patient_id):
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Patient '{patient_id}' not found",
         )
-    del patients_db[patient_id]
-    print(f"⚠️  Deleted patient: {patient_id}")
+    logger.info("Patient deleted", extra={"event": "patient.delete", "patient_id": patient_id})
     return None
 
+@app.get("/sync/patients")
+async def pull_changes(
+    request: Request,
+    since: int = Query(0, ge=0, description="Watermark from the previous pull (0: full sync)"),
+    limit: int = Query(500, ge=1, le=5000),
+    repo: PatientRepository = Depends(get_repository),
+):
+    """Patients changed since a watermark, as compact rows (see sync.py).
+
+    Gzipped when the client accepts it.
+    """
+    body = dumps(await sync.pull(repo, since, limit))
+    headers = {"Vary": "Accept-Encoding", "Cache-Control": "no-store"}
+    if len(body) >= SYNC_GZIP_MIN_SIZE and "gzip" in request.headers.get("accept-encoding", ""):
+        body = gzip.compress(body, compresslevel=6)
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
+@app.post("/sync/patients", response_model=SyncResult)
+async def push_changes(payload: SyncPush, repo: PatientRepository = Depends(get_repository)):
+    """Apply a batch of offline changes; stale ones come back as conflicts"""
+    result, written = await sync.push(repo, payload.changes)
+    for patient in written:
+        await link_patient(repo, patient)
+    logger.info(
+        "Sync batch applied",
+        extra={"event": "patient.sync", "applied": len(result.applied),
+               "conflicts": len(result.conflicts)},
+    )
+    return ModelResponse(result)
+
+# --- FHIR R4 (read-only; see fhir.py) --------------------------------------------
+
+def fhir_base(request: Request) -> str:
+    return FHIR_BASE_URL or str(request.base_url).rstrip("/") + "/fhir"
+
+def fhir_response(body: dict, status_code: int = 200, headers: Optional[dict] = None) -> Response:
+    return Response(dumps(body), status_code=status_code, media_type=FHIR_JSON, headers=headers)
+
+@app.exception_handler(FhirError)
+async def fhir_error(request: Request, exc: FhirError):
+    return fhir_response(fhir.operation_outcome(exc.code, exc.diagnostics), exc.status_code)
+
+@app.get("/fhir/metadata")
+async def fhir_metadata():
+    return fhir_response(fhir.CAPABILITY_STATEMENT)
+
+@app.get("/fhir/Patient")
+async def fhir_search_patients(request: Request, repo: PatientRepository = Depends(get_repository)):
+    """Search, as a streamed searchset Bundle.
+
+    With a name or identifier the candidates come from the search index and
+    pages follow ``_offset``; otherwise the store is walked in id order from
+    ``_cursor``, a chunk at a time, until ``_count`` patients have matched.
+    """
+    params = request.query_params
+    # Everything that can be a 400 is checked before the response starts
+    count = fhir.count_param(params)
+    offset = fhir.int_param(params, "_offset")
+    try:
+        after = decode_cursor(params["_cursor"]) if "_cursor" in params else None
+    except InvalidCursor as exc:
+        raise FhirError(400, "invalid", str(exc))
+    base = fhir_base(request)
+    keep = fhir.matcher(params)
+    text = fhir.search_text(params)
+    paging: dict = {}
+
+    async def entries(patients: List[Patient]) -> list:
+        versions = await repo.versions([p.patient_id for p in patients])
+        return fhir.search_entries(base, patients, versions)
+
+    async def by_id() -> AsyncIterator[list]:
+        ids = list(dict.fromkeys(params["_id"].split(",")))[:count]
+        found = [await repo.get(patient_id) for patient_id in ids]
+        yield await entries([p for p in found if p is not None and keep(p)])
+
+    async def by_text() -> AsyncIterator[list]:
+        found = await repo.search(text, skip=offset, limit=count)
+        if len(found) == count:
+            paging["_offset"] = offset + count
+        yield await entries([p for p in found if keep(p)])
+
+    async def walk(after: Optional[str]) -> AsyncIterator[list]:
+        # Unfiltered, one chunk of _count is the page
+        filtered = any(name in params for name in fhir.SEARCH_PARAMS)
+        size = EXPORT_CHUNK_SIZE if filtered else min(count, EXPORT_CHUNK_SIZE)
+        matched = 0
+        while matched < count:
+            batch = await repo.page(size, after=after)
+            hits = []
+            for patient in batch:
+                after = patient.patient_id
+                if keep(patient):
+                    hits.append(patient)
+                    matched += 1
+                    if matched == count:
+                        break
+            if hits:
+                yield await entries(hits)
+            if matched < count and len(batch) < size:
+                return
+        paging["_cursor"] = encode_cursor(after)
+
+    def links() -> list:
+        found = [{"relation": "self", "url": str(request.url)}]
+        if paging:
+            found.append({"relation": "next", "url": fhir.page_link(
+                base, "Patient", params, **paging)})
+        return found
+
+    if "_id" in params:
+        pages = by_id()
+    elif text:
+        pages = by_text()
+    else:
+        pages = walk(after)
+    return StreamingResponse(fhir.stream_bundle("searchset", pages, links), media_type=FHIR_JSON)
+
+@app.get("/fhir/Patient/_history")
+async def fhir_patients_history(
+    request: Request, repo: PatientRepository = Depends(get_repository)
+):
+    """Changes to any patient in change order (oldest first, unlike FHIR's
+    default, so that ``_cursor`` can follow them), each patient at its latest
+    version or deletion.
+
+    A system keeping a copy stores the last next link and follows it later
+    for what changed since, like ``/sync/patients``.
+    """
+    params = request.query_params
+    if "_since" in params or "_at" in params:
+        raise FhirError(
+            400, "not-supported",
+            "Use the next link of a previous _history page instead of _since",
+        )
+    count = fhir.count_param(params)
+    since = fhir.int_param(params, "_cursor")
+    base = fhir_base(request)
+    changes, head = await repo.changes(since, count)
+    more = len(changes) == count and changes[-1].seq < head
+
+    async def pages() -> AsyncIterator[list]:
+        for start in range(0, len(changes), EXPORT_CHUNK_SIZE):
+            yield fhir.history_entries(base, changes[start:start + EXPORT_CHUNK_SIZE])
+            await asyncio.sleep(0)
+
+    def links() -> list:
+        found = [{"relation": "self", "url": str(request.url)}]
+        if more:
+            found.append({"relation": "next", "url": fhir.page_link(
+                base, "Patient/_history", params, _cursor=changes[-1].seq)})
+        return found
+
+    return StreamingResponse(fhir.stream_bundle("history", pages(), links), media_type=FHIR_JSON)
+
+@app.get("/fhir/Patient/{patient_id}")
+async def fhir_read_patient(patient_id: str, repo: PatientRepository = Depends(get_repository)):
+    version = (await repo.versions([patient_id])).get(patient_id)
+    patient = await repo.get(patient_id) if version is not None and not version.deleted else None
+    if patient is None:
+        if version is not None and version.deleted:
+            raise FhirError(410, "deleted", f"Patient '{patient_id}' was deleted")
+        raise FhirError(404, "not-found", f"Patient '{patient_id}' not found")
+    return fhir_response(
+        fhir.patient_resource(patient, version.seq),
+        headers={"ETag": f'W/"{version.seq}"'},
+    )
+
+@app.get("/fhir/Patient/{patient_id}/_history")
+async def fhir_patient_history(patient_id: str, request: Request,
+                               repo: PatientRepository = Depends(get_repository)):
+    """Only the latest version of a patient is kept: the history is that
+    version, or the deletion"""
+    version = (await repo.versions([patient_id])).get(patient_id)
+    if version is None:
+        raise FhirError(404, "not-found", f"Patient '{patient_id}' not found")
+    patient = None if version.deleted else await repo.get(patient_id)
+    return fhir_response({
+        "resourceType": "Bundle",
+        "type": "history",
+        "total": 1,
+        "link": [{"relation": "self", "url": str(request.url)}],
+        "entry": fhir.history_entries(
+            fhir_base(request), [Change(version.seq, patient_id, patient)]
+        ),
+    })
+
 if __name__ == "__main__":
     import uvicorn
-    print("=" * 70)
-    print("🏥 DANAYA Patient Service Starting")
-    print(f"👥 Demo patients loaded: {len(patients_db)}")
-    print("📡 Running on http://localhost:8002")
-    print("=" * 70)
+    logger.info("=" * 70)
+    logger.info("🏥 DANAYA Patient Service Starting")
+    logger.info(f"👥 Demo patients available: {len(demo_patients)}")
+    logger.info("📡 Running on http://localhost:8002")
+    logger.info("=" * 70)
     uvicorn.run(app, host="0.0.0.0", port=8002, log_level="info")
@@ -0,0 +1,99 @@
+"""Patient API models shared by the endpoints and storage backends"""
+
+from pydantic import BaseModel, Field, field_validator
+from typing import Dict, List, Literal, Optional
+from uuid import uuid4
+
+
+def generate_patient_id() -> str:
+    return f"PAT-{uuid4().hex[:10].upper()}"
+
+
+class PatientBase(BaseModel):
+    national_id: Optional[str] = Field(
+        default=None,
+        description="National health ID (NHID) or CNIB/Passport"
+    )
+    first_name: str = Field(..., min_length=1, max_length=100)
+    last_name: str = Field(..., min_length=1, max_length=100)
+    sex: Optional[str] = Field(default=None, description="M, F, or O")
+    date_of_birth: Optional[str] = Field(
+        default=None,
+        description="YYYY-MM-DD"
+    )
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    region_id: Optional[str] = None
+    hospital_id: Optional[str] = None
+
+
+class PatientCreate(PatientBase):
+    pass
+
+
+class PatientUpdate(BaseModel):
+    national_id: Optional[str] = None
+    first_name: Optional[str] = None
+    last_name: Optional[str] = None
+    sex: Optional[str] = None
+    date_of_birth: Optional[str] = None
+    phone: Optional[str] = None
+    address: Optional[str] = None
+    region_id: Optional[str] = None
+    hospital_id: Optional[str] = None
+
+
+class Patient(PatientBase):
+    patient_id: str
+    created_at: str
+    updated_at: str
+
+
+class DuplicateCandidate(BaseModel):
+    patient: Patient
+    score: float = Field(..., description="Summed field agreement weight")
+    status: str = Field(..., description="match or possible")
+
+
+class SyncChange(BaseModel):
+    op: Literal["upsert", "delete"]
+    patient_id: str = Field(..., min_length=1, max_length=64)
+    base_seq: Optional[int] = Field(
+        default=None,
+        ge=0,
+        description="seq of the patient the change was made on; null for a patient created offline",
+    )
+    patient: Optional[PatientUpdate] = Field(
+        default=None,
+        description="Fields to set (upsert); all PatientCreate fields when creating",
+    )
+
+
+class SyncPush(BaseModel):
+    changes: List[SyncChange] = Field(..., max_length=1000)
+
+    @field_validator("changes")
+    @classmethod
+    def one_change_per_patient(cls, changes: List[SyncChange]) -> List[SyncChange]:
+        seen = set()
+        for change in changes:
+            if change.patient_id in seen:
+                raise ValueError(f"more than one change for patient '{change.patient_id}'")
+            seen.add(change.patient_id)
+        return changes
+
+
+class SyncConflict(BaseModel):
+    patient_id: str
+    reason: str = Field(
+        ..., description="exists, modified, deleted, missing, national_id or invalid"
+    )
+    server_seq: Optional[int] = None
+    server: Optional[Patient] = Field(default=None, description="Current server copy, if any")
+
+
+class SyncResult(BaseModel):
+    applied: Dict[str, Optional[int]] = Field(
+        ..., description="patient_id -> its new seq (null if it no longer exists)"
+    )
+    conflicts: List[SyncConflict]
@@ -0,0 +1,526 @@
+"""
+Postgres patient store (asyncpg).
+
+One connection pool per worker process. asyncpg prepares every statement on
+first use and keeps it in a per-connection cache, so the fixed SQL below is
+parsed and planned once per connection rather than once per request. Bulk
+writes go through COPY into a staging table.
+
+Every write stamps the row with the next value of patient_change_seq (a
+deleted patient leaves a row in patient_tombstones), which is what the sync
+endpoints page through. Writers hold a shared advisory lock from before they
+draw a seq until they commit; changes() briefly takes it exclusively to read
+a head below which every seq is committed, so a delta can never skip a write
+that commits late.
+"""
+
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, Iterable, List, Optional, Sequence, Set, Tuple
+
+import asyncpg
+
+from .linkage import MAX_BLOCK, blocking_keys
+from .models import Patient
+from .repository import Change, PatientRepository, Version
+from .search import PatientSearchIndex, tokenize
+
+FIELDS = (
+    "patient_id", "national_id", "first_name", "last_name", "sex", "date_of_birth",
+    "phone", "address", "region_id", "hospital_id", "created_at", "updated_at",
+)
+COLUMNS = ", ".join(FIELDS)
+
+SCHEMA = """
+CREATE EXTENSION IF NOT EXISTS pg_trgm;
+
+CREATE TABLE IF NOT EXISTS patients (
+    patient_id    text PRIMARY KEY,
+    national_id   text,
+    first_name    text NOT NULL,
+    last_name     text NOT NULL,
+    sex           text,
+    date_of_birth text,
+    phone         text,
+    address       text,
+    region_id     text,
+    hospital_id   text,
+    created_at    timestamptz NOT NULL,
+    updated_at    timestamptz NOT NULL,
+    search_key    text NOT NULL
+);
+
+CREATE INDEX IF NOT EXISTS patients_national_id_idx ON patients (national_id);
+CREATE INDEX IF NOT EXISTS patients_names_idx ON patients (last_name, first_name);
+CREATE INDEX IF NOT EXISTS patients_location_idx ON patients (region_id, hospital_id);
+CREATE INDEX IF NOT EXISTS patients_search_key_trgm_idx
+    ON patients USING gin (search_key gin_trgm_ops);
+
+-- Record linkage: blocking keys and the likely duplicates found (both directions)
+CREATE TABLE IF NOT EXISTS patient_block_keys (
+    block_key  text NOT NULL,
+    patient_id text NOT NULL REFERENCES patients ON DELETE CASCADE,
+    PRIMARY KEY (block_key, patient_id)
+);
+CREATE INDEX IF NOT EXISTS patient_block_keys_patient_idx ON patient_block_keys (patient_id);
+
+CREATE TABLE IF NOT EXISTS patient_matches (
+    patient_id text NOT NULL REFERENCES patients ON DELETE CASCADE,
+    match_id   text NOT NULL REFERENCES patients ON DELETE CASCADE,
+    score      real NOT NULL,
+    PRIMARY KEY (patient_id, match_id)
+);
+-- set_matches() also deletes by match_id
+CREATE INDEX IF NOT EXISTS patient_matches_match_id_idx ON patient_matches (match_id);
+
+-- Offline sync: change sequence numbers and tombstones of deleted patients
+CREATE SEQUENCE IF NOT EXISTS patient_change_seq;
+ALTER TABLE patients
+    ADD COLUMN IF NOT EXISTS seq bigint NOT NULL DEFAULT nextval('patient_change_seq');
+CREATE INDEX IF NOT EXISTS patients_seq_idx ON patients (seq);
+
+CREATE TABLE IF NOT EXISTS patient_tombstones (
+    patient_id text PRIMARY KEY,
+    seq        bigint NOT NULL DEFAULT nextval('patient_change_seq'),
+    deleted_at timestamptz NOT NULL DEFAULT now()
+);
+CREATE INDEX IF NOT EXISTS patient_tombstones_seq_idx ON patient_tombstones (seq);
+"""
+
+# Serialises schema creation when several workers start at once
+SCHEMA_LOCK_ID = 0x44414E59
+# Serialises import batches so two imports cannot both insert a national_id
+IMPORT_LOCK_ID = 0x44414E5A
+# Held shared by every write transaction, exclusively to read the sync head
+SYNC_LOCK_ID = 0x44414E5B
+
+# {where}: one "p.search_key LIKE $n" per term, from $4 on (see search_sql()),
+# which the trigram index can answer; LIKE ALL over a subquery it cannot
+SEARCH_SQL = f"""
+SELECT {COLUMNS} FROM patients AS p
+WHERE {{where}}
+ORDER BY (
+    SELECT sum(CASE
+        WHEN p.search_key LIKE '% ' || t || ' %' THEN 3
+        WHEN p.search_key LIKE '% ' || t || '%' THEN 2
+        ELSE 1 END)
+    FROM unnest($1::text[]) AS t
+) DESC, p.patient_id
+OFFSET $2 LIMIT $3
+"""
+
+UPDATE_SQL = """
+UPDATE patients SET
+    national_id = $2, first_name = $3, last_name = $4, sex = $5, date_of_birth = $6,
+    phone = $7, address = $8, region_id = $9, hospital_id = $10,
+    created_at = $11, updated_at = $12, search_key = $13,
+    seq = nextval('patient_change_seq')
+WHERE patient_id = $1
+"""
+
+# Same, only if nobody changed the patient since the client last saw it
+UPDATE_IF_SQL = UPDATE_SQL.rstrip() + " AND seq = $14\n"
+
+TOMBSTONE_SQL = """
+INSERT INTO patient_tombstones (patient_id) VALUES ($1)
+ON CONFLICT (patient_id) DO UPDATE
+SET seq = nextval('patient_change_seq'), deleted_at = now()
+"""
+
+CHANGED_SQL = f"""
+SELECT {COLUMNS}, seq FROM patients
+WHERE seq > $1 AND seq <= $2
+ORDER BY seq
+LIMIT $3
+"""
+
+DELETED_SQL = """
+SELECT patient_id, seq FROM patient_tombstones
+WHERE seq > $1 AND seq <= $2
+ORDER BY seq
+LIMIT $3
+"""
+
+VERSIONS_SQL = """
+SELECT patient_id, seq, false AS deleted FROM patients WHERE patient_id = ANY($1::text[])
+UNION ALL
+SELECT patient_id, seq, true FROM patient_tombstones WHERE patient_id = ANY($1::text[])
+"""
+
+IMPORT_SQL = """
+INSERT INTO patients SELECT s.* FROM patients_stage AS s
+WHERE s.national_id IS NULL
+   OR NOT EXISTS (SELECT 1 FROM patients AS p WHERE p.national_id = s.national_id)
+ON CONFLICT (patient_id) DO NOTHING
+RETURNING patient_id
+"""
+
+INSERT_KEYS_SQL = """
+INSERT INTO patient_block_keys (block_key, patient_id)
+SELECT * FROM unnest($1::text[], $2::text[])
+ON CONFLICT DO NOTHING
+"""
+
+CANDIDATES_SQL = f"""
+WITH blocks AS (
+    SELECT block_key FROM patient_block_keys
+    WHERE block_key = ANY($1::text[])
+    GROUP BY block_key HAVING count(*) <= $3
+)
+SELECT {COLUMNS} FROM patients
+WHERE patient_id IN (
+    SELECT k.patient_id FROM patient_block_keys AS k JOIN blocks USING (block_key)
+    WHERE k.patient_id <> $2
+)
+ORDER BY patient_id
+"""
+
+BLOCKS_SQL = """
+SELECT array_agg(patient_id ORDER BY patient_id) AS members
+FROM patient_block_keys
+GROUP BY block_key
+HAVING count(*) BETWEEN 2 AND $1
+"""
+
+EXPORT_SQL = f"""
+SELECT {COLUMNS} FROM patients
+WHERE patient_id > $1
+  AND ($2::text IS NULL OR region_id = $2)
+  AND ($3::text IS NULL OR hospital_id = $3)
+ORDER BY patient_id
+LIMIT $4
+"""
+
+
+def search_sql(terms: int) -> str:
+    return SEARCH_SQL.format(
+        where=" AND ".join(f"p.search_key LIKE ${n}" for n in range(4, 4 + terms))
+    )
+
+
+def search_key(patient: Patient) -> str:
+    """Space-delimited folded tokens, so ' tok' / ' tok ' mark prefix / exact hits"""
+    names, national_id = PatientSearchIndex.tokens_for(patient)
+    tokens = names + ((national_id,) if national_id else ())
+    return f" {' '.join(tokens)} "
+
+
+def _to_timestamp(value: str) -> datetime:
+    return datetime.fromisoformat(value.replace("Z", "+00:00"))
+
+
+def _to_iso(value: datetime) -> str:
+    return value.astimezone(timezone.utc).isoformat().replace("+00:00", "Z")
+
+
+def _record(patient: Patient) -> tuple:
+    return (
+        patient.patient_id, patient.national_id, patient.first_name, patient.last_name,
+        patient.sex, patient.date_of_birth, patient.phone, patient.address,
+        patient.region_id, patient.hospital_id,
+        _to_timestamp(patient.created_at), _to_timestamp(patient.updated_at),
+        search_key(patient),
+    )
+
+
+def _key_arrays(patients: Iterable[Patient]) -> tuple:
+    """(block keys, patient ids) as parallel arrays for INSERT_KEYS_SQL"""
+    keys, ids = [], []
+    for patient in patients:
+        for key in blocking_keys(patient):
+            keys.append(key)
+            ids.append(patient.patient_id)
+    return keys, ids
+
+
+async def _write_lock(conn: asyncpg.Connection) -> None:
+    """Taken first in every write transaction, before it draws a seq"""
+    await conn.execute("SELECT pg_advisory_xact_lock_shared($1)", SYNC_LOCK_ID)
+
+
+def _patient(row: asyncpg.Record) -> Patient:
+    data = dict(row)
+    data.pop("seq", None)
+    data["created_at"] = _to_iso(data["created_at"])
+    data["updated_at"] = _to_iso(data["updated_at"])
+    return Patient(**data)
+
+
+class PostgresPatientRepository(PatientRepository):
+    """Shared store for multi-worker / multi-node deployments"""
+
+    backend = "postgres"
+
+    def __init__(self, dsn: str, min_size: int = 2, max_size: int = 10) -> None:
+        self._dsn = dsn
+        self._min_size = min_size
+        self._max_size = max_size
+        self._pool: Optional[asyncpg.Pool] = None
+
+    @property
+    def pool(self) -> asyncpg.Pool:
+        if self._pool is None:
+            raise RuntimeError("PostgresPatientRepository.connect() has not been awaited")
+        return self._pool
+
+    async def connect(self) -> None:
+        self._pool = await asyncpg.create_pool(
+            self._dsn,
+            min_size=self._min_size,
+            max_size=self._max_size,
+            command_timeout=10,
+        )
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SCHEMA_LOCK_ID)
+                await conn.execute(SCHEMA)
+
+    async def close(self) -> None:
+        if self._pool is not None:
+            await self._pool.close()
+            self._pool = None
+
+    async def ping(self) -> None:
+        await self.pool.fetchval("SELECT 1")
+
+    async def count(self) -> int:
+        return await self.pool.fetchval("SELECT count(*) FROM patients")
+
+    async def estimated_count(self) -> int:
+        # The planner's row count, kept by autovacuum/ANALYZE: a catalog read,
+        # not a scan of the table. -1 until the table is first analyzed
+        estimate = await self.pool.fetchval(
+            "SELECT reltuples::bigint FROM pg_class WHERE oid = 'patients'::regclass"
+        )
+        return max(estimate, 0)
+
+    async def get(self, patient_id: str) -> Optional[Patient]:
+        row = await self.pool.fetchrow(
+            f"SELECT {COLUMNS} FROM patients WHERE patient_id = $1", patient_id
+        )
+        return _patient(row) if row else None
+
+    async def page(self, limit: int, skip: int = 0, after: Optional[str] = None) -> List[Patient]:
+        if after is not None:
+            rows = await self.pool.fetch(
+                f"SELECT {COLUMNS} FROM patients WHERE patient_id > $1 "
+                "ORDER BY patient_id LIMIT $2",
+                after, limit,
+            )
+        else:
+            rows = await self.pool.fetch(
+                f"SELECT {COLUMNS} FROM patients ORDER BY patient_id OFFSET $1 LIMIT $2",
+                skip, limit,
+            )
+        return [_patient(row) for row in rows]
+
+    async def search(self, query: str, skip: int = 0, limit: int = 100) -> List[Patient]:
+        # Tokens are [0-9a-z] only, so they are safe inside LIKE patterns
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms:
+            return []
+        rows = await self.pool.fetch(
+            search_sql(len(terms)), terms, skip, limit, *(f"%{t}%" for t in terms)
+        )
+        return [_patient(row) for row in rows]
+
+    async def add(self, patient: Patient) -> None:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_lock(conn)
+                await conn.execute(
+                    f"INSERT INTO patients ({COLUMNS}, search_key) "
+                    "VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13)",
+                    *_record(patient),
+                )
+                await conn.execute(
+                    "DELETE FROM patient_tombstones WHERE patient_id = $1", patient.patient_id
+                )
+                await conn.execute(INSERT_KEYS_SQL, *_key_arrays([patient]))
+
+    @staticmethod
+    async def _stage(conn: asyncpg.Connection, records: List[tuple]) -> None:
+        """COPY records into a temp table dropped at the end of the transaction"""
+        await conn.execute(
+            "CREATE TEMP TABLE patients_stage "
+            "(LIKE patients INCLUDING DEFAULTS) ON COMMIT DROP"
+        )
+        await conn.copy_records_to_table(
+            "patients_stage", records=records, columns=[*FIELDS, "search_key"]
+        )
+
+    async def add_many(self, patients: Iterable[Patient]) -> None:
+        """COPY into a staging table, then insert, skipping IDs that already exist"""
+        patients = list(patients)
+        if not patients:
+            return
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_lock(conn)
+                await self._stage(conn, [_record(p) for p in patients])
+                rows = await conn.fetch(
+                    "INSERT INTO patients SELECT * FROM patients_stage "
+                    "ON CONFLICT (patient_id) DO NOTHING RETURNING patient_id"
+                )
+                inserted = {row["patient_id"] for row in rows}
+                await self._untombstone(conn, inserted)
+                await conn.execute(
+                    INSERT_KEYS_SQL, *_key_arrays(p for p in patients if p.patient_id in inserted)
+                )
+
+    async def add_new(self, patients: Sequence[Patient]) -> Set[str]:
+        records = [_record(p) for p in patients]
+        if not records:
+            return set()
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", IMPORT_LOCK_ID)
+                await _write_lock(conn)
+                await self._stage(conn, records)
+                rows = await conn.fetch(IMPORT_SQL)
+                inserted = {row["patient_id"] for row in rows}
+                await self._untombstone(conn, inserted)
+                await conn.execute(
+                    INSERT_KEYS_SQL, *_key_arrays(p for p in patients if p.patient_id in inserted)
+                )
+        return inserted
+
+    @staticmethod
+    async def _untombstone(conn: asyncpg.Connection, patient_ids: Set[str]) -> None:
+        """A re-created patient is no longer deleted"""
+        if patient_ids:
+            await conn.execute(
+                "DELETE FROM patient_tombstones WHERE patient_id = ANY($1::text[])",
+                list(patient_ids),
+            )
+
+    async def _update(self, patient: Patient, seq: Optional[int] = None) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_lock(conn)
+                if seq is None:
+                    result = await conn.execute(UPDATE_SQL, *_record(patient))
+                else:
+                    result = await conn.execute(UPDATE_IF_SQL, *_record(patient), seq)
+                if result != "UPDATE 1":
+                    return False
+                await conn.execute(
+                    "DELETE FROM patient_block_keys WHERE patient_id = $1", patient.patient_id
+                )
+                await conn.execute(INSERT_KEYS_SQL, *_key_arrays([patient]))
+        return True
+
+    async def replace(self, patient: Patient) -> None:
+        await self._update(patient)
+
+    async def _delete(self, patient_id: str, seq: Optional[int] = None) -> bool:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await _write_lock(conn)
+                if seq is None:
+                    result = await conn.execute(
+                        "DELETE FROM patients WHERE patient_id = $1", patient_id
+                    )
+                else:
+                    result = await conn.execute(
+                        "DELETE FROM patients WHERE patient_id = $1 AND seq = $2", patient_id, seq
+                    )
+                if result != "DELETE 1":
+                    return False
+                await conn.execute(TOMBSTONE_SQL, patient_id)
+        return True
+
+    async def delete(self, patient_id: str) -> bool:
+        return await self._delete(patient_id)
+
+    async def changes(self, since: int, limit: int) -> Tuple[List[Change], int]:
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                # Waits out every write in flight; none can start meanwhile
+                await conn.execute("SELECT pg_advisory_xact_lock($1)", SYNC_LOCK_ID)
+                row = await conn.fetchrow("SELECT last_value, is_called FROM patient_change_seq")
+            head = row["last_value"] if row["is_called"] else 0
+            if since >= head:
+                return [], head
+            changed = await conn.fetch(CHANGED_SQL, since, head, limit)
+            deleted = await conn.fetch(DELETED_SQL, since, head, limit)
+        found = [Change(row["seq"], row["patient_id"], _patient(row)) for row in changed]
+        found += [Change(row["seq"], row["patient_id"], None) for row in deleted]
+        found.sort(key=lambda change: change.seq)
+        return found[:limit], head
+
+    async def versions(self, patient_ids: Sequence[str]) -> Dict[str, Version]:
+        if not patient_ids:
+            return {}
+        rows = await self.pool.fetch(VERSIONS_SQL, list(patient_ids))
+        return {row["patient_id"]: Version(row["seq"], row["deleted"]) for row in rows}
+
+    async def replace_if(self, patient: Patient, seq: int) -> bool:
+        return await self._update(patient, seq)
+
+    async def delete_if(self, patient_id: str, seq: int) -> bool:
+        return await self._delete(patient_id, seq)
+
+    async def candidates(self, patient: Patient, max_block: int = MAX_BLOCK) -> List[Patient]:
+        keys = list(blocking_keys(patient))
+        if not keys:
+            return []
+        rows = await self.pool.fetch(CANDIDATES_SQL, keys, patient.patient_id, max_block)
+        return [_patient(row) for row in rows]
+
+    async def blocks(self, max_block: int = MAX_BLOCK) -> AsyncIterator[List[Patient]]:
+        # A server-side cursor keeps the block list out of memory
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                async for row in conn.cursor(BLOCKS_SQL, max_block, prefetch=200):
+                    rows = await self.pool.fetch(
+                        f"SELECT {COLUMNS} FROM patients WHERE patient_id = ANY($1::text[]) "
+                        "ORDER BY patient_id",
+                        row["members"],
+                    )
+                    yield [_patient(r) for r in rows]
+
+    async def matches(self, patient_id: str) -> Dict[str, float]:
+        rows = await self.pool.fetch(
+            "SELECT match_id, score FROM patient_matches WHERE patient_id = $1", patient_id
+        )
+        return {row["match_id"]: row["score"] for row in rows}
+
+    async def set_matches(self, patient_id: str, matches: Dict[str, float]) -> None:
+        others = list(matches)
+        scores = [matches[other] for other in others]
+        async with self.pool.acquire() as conn:
+            async with conn.transaction():
+                await conn.execute(
+                    "DELETE FROM patient_matches WHERE patient_id = $1 OR match_id = $1", patient_id
+                )
+                await conn.execute(
+                    "INSERT INTO patient_matches (patient_id, match_id, score) "
+                    "SELECT $1, m, s FROM unnest($2::text[], $3::real[]) AS t(m, s) "
+                    "UNION ALL "
+                    "SELECT m, $1, s FROM unnest($2::text[], $3::real[]) AS t(m, s) "
+                    "ON CONFLICT DO NOTHING",
+                    patient_id, others, scores,
+                )
+
+    async def clear_matches(self) -> None:
+        await self.pool.execute("DELETE FROM patient_matches")
+
+    async def rebuild_block_keys(self) -> None:
+        await self.pool.execute("TRUNCATE patient_block_keys")
+        async for batch in self.chunks(5_000):
+            await self.pool.execute(INSERT_KEYS_SQL, *_key_arrays(batch))
+
+    async def chunks(
+        self,
+        size: int,
+        region_id: Optional[str] = None,
+        hospital_id: Optional[str] = None,
+    ) -> AsyncIterator[List[Patient]]:
+        # Filters run in SQL so only matching rows cross the wire
+        after = ""
+        while True:
+            rows = await self.pool.fetch(EXPORT_SQL, after, region_id, hospital_id, size)
+            if not rows:
+                return
+            after = rows[-1]["patient_id"]
+            yield [_patient(row) for row in rows]
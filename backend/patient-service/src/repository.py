@@ -0,0 +1,373 @@
+"""
+Patient storage backends.
+
+The endpoints only talk to a PatientRepository. InMemoryPatientRepository
+keeps everything in process (tests, demos, single-worker dev) and
+PostgresPatientRepository (see postgres.py) is the production store shared by
+every worker and node. The backend is picked from the environment by
+create_repository().
+"""
+
+from abc import ABC, abstractmethod
+from bisect import bisect_right
+from operator import itemgetter
+from typing import (
+    AsyncIterator, Collection, Dict, Iterable, List, NamedTuple, Optional, Sequence, Set, Tuple,
+    Union,
+)
+import logging
+import os
+
+from .compact import PatientTable
+from .linkage import MAX_BLOCK, blocking_keys
+from .models import Patient
+from .pagination import KeysetIndex
+from .search import PatientSearchIndex
+
+logger = logging.getLogger(__name__)
+
+
+class Change(NamedTuple):
+    """A patient's latest change: its sequence number and current state"""
+    seq: int
+    patient_id: str
+    patient: Optional[Patient]  # None: deleted (tombstone)
+
+
+class Version(NamedTuple):
+    seq: int
+    deleted: bool
+
+
+class PatientRepository(ABC):
+    """Async storage interface used by the patient endpoints"""
+
+    backend = "abstract"
+
+    async def connect(self) -> None:
+        """Open connections / create schema; called once at startup"""
+
+    async def close(self) -> None:
+        """Release connections; called once at shutdown"""
+
+    async def ping(self) -> None:
+        """Raise if the store is unreachable (readiness probe)"""
+
+    @abstractmethod
+    async def count(self) -> int: ...
+
+    async def estimated_count(self) -> int:
+        """count(), or an estimate where counting is a table scan (/metrics)"""
+        return await self.count()
+
+    @abstractmethod
+    async def get(self, patient_id: str) -> Optional[Patient]: ...
+
+    async def get_latest(self, patient_id: str) -> Optional[Patient]:
+        """get(), never from a cache: for read-modify-write"""
+        return await self.get(patient_id)
+
+    @abstractmethod
+    async def page(self, limit: int, skip: int = 0, after: Optional[str] = None) -> List[Patient]:
+        """Patients ordered by patient_id, after a cursor key or from an offset"""
+
+    @abstractmethod
+    async def search(self, query: str, skip: int = 0, limit: int = 100) -> List[Patient]:
+        """Ranked name / national ID search"""
+
+    @abstractmethod
+    async def add(self, patient: Patient) -> None: ...
+
+    @abstractmethod
+    async def add_many(self, patients: Iterable[Patient]) -> None: ...
+
+    @abstractmethod
+    async def add_new(self, patients: Sequence[Patient]) -> Set[str]:
+        """Insert, in one transaction, the patients whose national_id (and
+        patient_id) is not stored yet; returns the patient_ids inserted"""
+
+    @abstractmethod
+    async def replace(self, patient: Patient) -> None: ...
+
+    @abstractmethod
+    async def delete(self, patient_id: str) -> bool:
+        """Delete a patient, leaving a tombstone; False if it did not exist"""
+
+    # Every write gives the patient a new change sequence number (seq), from
+    # one counter for the whole store, so "everything after seq N" is a
+    # complete delta for a client that has synced up to N.
+
+    @abstractmethod
+    async def changes(self, since: int, limit: int) -> Tuple[List[Change], int]:
+        """Up to limit latest changes with seq > since, in seq order, and the
+        store's current seq (no change at or below it can still appear)"""
+
+    @abstractmethod
+    async def versions(self, patient_ids: Sequence[str]) -> Dict[str, Version]:
+        """Current seq of each known (stored or deleted) patient"""
+
+    @abstractmethod
+    async def replace_if(self, patient: Patient, seq: int) -> bool:
+        """Replace the patient only if its seq is still seq"""
+
+    @abstractmethod
+    async def delete_if(self, patient_id: str, seq: int) -> bool:
+        """Delete the patient only if its seq is still seq"""
+
+    @abstractmethod
+    async def candidates(self, patient: Patient, max_block: int = MAX_BLOCK) -> List[Patient]:
+        """Other patients sharing a blocking key with patient (blocks over
+        max_block patients are skipped)"""
+
+    @abstractmethod
+    def blocks(self, max_block: int = MAX_BLOCK) -> AsyncIterator[List[Patient]]:
+        """Every block of 2..max_block patients, for the batch linkage job"""
+
+    @abstractmethod
+    async def matches(self, patient_id: str) -> Dict[str, float]:
+        """Stored likely duplicates of a patient: patient_id -> score"""
+
+    @abstractmethod
+    async def set_matches(self, patient_id: str, matches: Dict[str, float]) -> None:
+        """Replace a patient's likely duplicates (links are symmetric)"""
+
+    @abstractmethod
+    async def clear_matches(self) -> None:
+        """Forget every stored link (before the batch job stores them afresh)"""
+
+    async def rebuild_block_keys(self) -> None:
+        """Recompute every blocking key (after the key rules change)"""
+
+    async def chunks(
+        self,
+        size: int,
+        region_id: Optional[str] = None,
+        hospital_id: Optional[str] = None,
+    ) -> AsyncIterator[List[Patient]]:
+        """Walk the whole store by keyset in chunks of at most size patients"""
+        after: Optional[str] = None
+        while True:
+            batch = await self.page(size, after=after)
+            if not batch:
+                return
+            after = batch[-1].patient_id
+            yield [
+                p for p in batch
+                if (not region_id or p.region_id == region_id)
+                and (not hospital_id or p.hospital_id == hospital_id)
+            ]
+
+
+class InMemoryPatientRepository(PatientRepository):
+    """Process-local store: a compact patient table (see compact.py) plus the
+    search and keyset indexes"""
+
+    backend = "memory"
+
+    def __init__(self, patients: Iterable[Patient] = ()) -> None:
+        # The last of each patient_id wins, as when the table was a dict
+        initial = list({p.patient_id: p for p in patients}.values())
+        self._patients = PatientTable(initial)
+        # Change log: every (seq, patient_id) in seq order, superseded entries
+        # included (skipped on read, dropped by compaction), and the latest
+        # seq of every patient, tombstones included
+        self._seq = 0
+        self._history: List[Tuple[int, str]] = []
+        self._latest: Dict[str, int] = {}
+        for patient_id in self._patients:
+            self._bump(patient_id)
+        self._national_ids: Dict[str, str] = {
+            p.national_id: p.patient_id for p in initial if p.national_id
+        }
+        self._keys = KeysetIndex(self._patients)
+        # Blocking key -> its patients; most keys (birth date + name, phone,
+        # national id) have one, kept as the bare id rather than a set
+        self._blocks: Dict[str, Union[str, Set[str]]] = {}
+        self._matches: Dict[str, Dict[str, float]] = {}
+        for patient in initial:
+            self._block(patient)
+        self._index = PatientSearchIndex()
+        self._index.add_many(initial)
+
+    async def count(self) -> int:
+        return len(self._patients)
+
+    async def get(self, patient_id: str) -> Optional[Patient]:
+        return self._patients.get(patient_id)
+
+    async def page(self, limit: int, skip: int = 0, after: Optional[str] = None) -> List[Patient]:
+        if after is not None:
+            patient_ids = self._keys.after(after, limit)
+        else:
+            patient_ids = self._keys.slice(skip, limit)
+        return [self._patients[pid] for pid in patient_ids]
+
+    async def search(self, query: str, skip: int = 0, limit: int = 100) -> List[Patient]:
+        return [self._patients[pid] for pid in self._index.search(query, skip=skip, limit=limit)]
+
+    def _members(self, key: str) -> Collection[str]:
+        members = self._blocks.get(key, ())
+        return (members,) if isinstance(members, str) else members
+
+    def _block(self, patient: Patient) -> None:
+        patient_id = patient.patient_id
+        for key in blocking_keys(patient):
+            members = self._blocks.get(key)
+            if members is None:
+                self._blocks[key] = patient_id
+            elif isinstance(members, str):
+                if members != patient_id:
+                    self._blocks[key] = {members, patient_id}
+            else:
+                members.add(patient_id)
+
+    def _unblock(self, patient: Patient) -> None:
+        """Undo _block(patient) for the stored version of a patient"""
+        patient_id = patient.patient_id
+        for key in blocking_keys(patient):
+            members = self._blocks.get(key)
+            if members is None:
+                continue
+            if isinstance(members, str):
+                if members == patient_id:
+                    del self._blocks[key]
+                continue
+            members.discard(patient_id)
+            if len(members) == 1:
+                self._blocks[key] = members.pop()
+
+    def _bump(self, patient_id: str) -> None:
+        self._seq += 1
+        self._latest[patient_id] = self._seq
+        self._history.append((self._seq, patient_id))
+        if len(self._history) > 2 * len(self._latest) + 1024:
+            self._history = [(seq, pid) for seq, pid in self._history if self._latest[pid] == seq]
+
+    def _store(self, patient: Patient) -> None:
+        self._bump(patient.patient_id)
+        previous = self._patients.get(patient.patient_id)
+        if previous is not None:
+            self._unblock(previous)
+            if previous.national_id:
+                self._national_ids.pop(previous.national_id, None)
+        self._patients[patient.patient_id] = patient
+        if patient.national_id:
+            self._national_ids[patient.national_id] = patient.patient_id
+        self._block(patient)
+
+    async def add(self, patient: Patient) -> None:
+        self._store(patient)
+        self._keys.add(patient.patient_id)
+        self._index.add(patient)
+
+    async def add_many(self, patients: Iterable[Patient]) -> None:
+        patients = list(patients)
+        for patient in patients:
+            self._store(patient)
+        self._keys.add_many(p.patient_id for p in patients)
+        self._index.add_many(patients)
+
+    async def add_new(self, patients: Sequence[Patient]) -> Set[str]:
+        new = [
+            p for p in patients
+            if p.patient_id not in self._patients
+            and not (p.national_id and p.national_id in self._national_ids)
+        ]
+        await self.add_many(new)
+        return {p.patient_id for p in new}
+
+    async def replace(self, patient: Patient) -> None:
+        self._store(patient)
+        self._index.add(patient)
+
+    async def delete(self, patient_id: str) -> bool:
+        patient = self._patients.pop(patient_id, None)
+        if patient is None:
+            return False
+        if patient.national_id and self._national_ids.get(patient.national_id) == patient_id:
+            del self._national_ids[patient.national_id]
+        self._unblock(patient)
+        await self.set_matches(patient_id, {})
+        self._keys.remove(patient_id)
+        self._index.remove(patient_id)
+        self._bump(patient_id)
+        return True
+
+    async def changes(self, since: int, limit: int) -> Tuple[List[Change], int]:
+        history = self._history
+        found = []
+        for i in range(bisect_right(history, since, key=itemgetter(0)), len(history)):
+            seq, patient_id = history[i]
+            if self._latest[patient_id] == seq:
+                found.append(Change(seq, patient_id, self._patients.get(patient_id)))
+                if len(found) == limit:
+                    break
+        return found, self._seq
+
+    async def versions(self, patient_ids: Sequence[str]) -> Dict[str, Version]:
+        return {
+            pid: Version(self._latest[pid], pid not in self._patients)
+            for pid in patient_ids if pid in self._latest
+        }
+
+    async def replace_if(self, patient: Patient, seq: int) -> bool:
+        if patient.patient_id not in self._patients or self._latest[patient.patient_id] != seq:
+            return False
+        await self.replace(patient)
+        return True
+
+    async def delete_if(self, patient_id: str, seq: int) -> bool:
+        if patient_id not in self._patients or self._latest[patient_id] != seq:
+            return False
+        return await self.delete(patient_id)
+
+    async def candidates(self, patient: Patient, max_block: int = MAX_BLOCK) -> List[Patient]:
+        found: Set[str] = set()
+        for key in blocking_keys(patient):
+            members = self._members(key)
+            if len(members) <= max_block:
+                found.update(members)
+        found.discard(patient.patient_id)
+        return [self._patients[pid] for pid in sorted(found)]
+
+    async def blocks(self, max_block: int = MAX_BLOCK) -> AsyncIterator[List[Patient]]:
+        for members in list(self._blocks.values()):
+            if not isinstance(members, str) and 2 <= len(members) <= max_block:
+                yield [self._patients[pid] for pid in sorted(members) if pid in self._patients]
+
+    async def matches(self, patient_id: str) -> Dict[str, float]:
+        return dict(self._matches.get(patient_id, {}))
+
+    async def set_matches(self, patient_id: str, matches: Dict[str, float]) -> None:
+        for other in self._matches.pop(patient_id, {}):
+            self._matches.get(other, {}).pop(patient_id, None)
+        if matches:
+            self._matches[patient_id] = dict(matches)
+            for other, score in matches.items():
+                self._matches.setdefault(other, {})[patient_id] = score
+
+    async def clear_matches(self) -> None:
+        self._matches.clear()
+
+
+def create_repository() -> PatientRepository:
+    """Pick the backend from PATIENT_STORE (memory|postgres).
+
+    Defaults to Postgres whenever DATABASE_URL is set, as it is in
+    docker-compose, and to the in-memory store otherwise.
+    """
+    database_url = os.getenv("DATABASE_URL")
+    backend = os.getenv("PATIENT_STORE", "postgres" if database_url else "memory").lower()
+    if backend == "memory":
+        return InMemoryPatientRepository()
+    if backend == "postgres":
+        if not database_url:
+            raise RuntimeError("PATIENT_STORE=postgres requires DATABASE_URL")
+        from .postgres import PostgresPatientRepository
+
+        return PostgresPatientRepository(
+            database_url,
+            min_size=int(os.getenv("DB_POOL_MIN", "2")),
+            max_size=int(os.getenv("DB_POOL_MAX", "10")),
+        )
+    raise RuntimeError(f"Unknown PATIENT_STORE '{backend}' (expected memory or postgres)")
@@ -0,0 +1,278 @@
+"""
+In-memory patient search index.
+
+Names and national IDs are folded (case + accents, so "Ouédraogo" matches
+"ouedraogo") and split into tokens. Each token keeps a posting list of
+document numbers in insertion order; sorted vocabularies answer prefix
+queries with a bisect, and a trigram index over the *name vocabulary* (not
+the patients) answers substring queries. National IDs are unique per
+patient, so they are matched by prefix only and kept out of the trigram
+index. Query cost therefore depends on the number of distinct names and on
+the size of the page requested, not on the number of patients.
+"""
+
+from bisect import bisect_left, insort
+from functools import lru_cache
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Tuple
+import heapq
+import re
+import unicodedata
+
+NGRAM = 3
+
+# Match tiers, higher is better
+EXACT = 3
+PREFIX = 2
+SUBSTRING = 1
+
+_SPLIT = re.compile(r"[^0-9a-z]+")
+
+
+@lru_cache(maxsize=65536)
+def fold(text: str) -> str:
+    """Lowercase and strip accents: 'Ouédraogo' -> 'ouedraogo'"""
+    decomposed = unicodedata.normalize("NFKD", text)
+    return "".join(c for c in decomposed if not unicodedata.combining(c)).casefold()
+
+
+def tokenize(text: Optional[str]) -> List[str]:
+    if not text:
+        return []
+    return [t for t in _SPLIT.split(fold(text)) if t]
+
+
+def _grams(token: str) -> Set[str]:
+    return {token[i:i + NGRAM] for i in range(len(token) - NGRAM + 1)}
+
+
+class PatientSearchIndex:
+    """Incrementally maintained token index over first/last name and national ID"""
+
+    def __init__(self) -> None:
+        self._next_doc = 0
+        self._doc_by_id: Dict[str, int] = {}
+        self._id_by_doc: Dict[int, str] = {}
+        self._tokens_by_doc: Dict[int, Tuple[Tuple[str, ...], Optional[str]]] = {}
+        self._postings: Dict[str, List[int]] = {}
+        self._vocab: List[str] = []
+        self._id_vocab: List[str] = []
+        self._grams: Dict[str, Set[str]] = {}
+        self._bulk = False
+
+    def __len__(self) -> int:
+        return len(self._doc_by_id)
+
+    def __contains__(self, patient_id: str) -> bool:
+        return patient_id in self._doc_by_id
+
+    @staticmethod
+    def tokens_for(patient) -> Tuple[Tuple[str, ...], Optional[str]]:
+        """(name tokens, national ID token) for a patient"""
+        names = tuple(dict.fromkeys(tokenize(patient.first_name) + tokenize(patient.last_name)))
+        # National IDs are matched as a single token so "bf2025abc" is a prefix hit
+        national_id = "".join(tokenize(patient.national_id)) or None
+        return names, national_id
+
+    # ------------------------------------------------------------------
+    # Maintenance
+    # ------------------------------------------------------------------
+
+    def add(self, patient) -> None:
+        """Index a patient, replacing any previous entry with the same ID"""
+        doc = self._doc_by_id.get(patient.patient_id)
+        if doc is None:
+            doc = self._next_doc
+            self._next_doc += 1
+            self._doc_by_id[patient.patient_id] = doc
+            self._id_by_doc[doc] = patient.patient_id
+        else:
+            self._unlink(doc)
+
+        names, national_id = self.tokens_for(patient)
+        self._tokens_by_doc[doc] = (names, national_id)
+        for token in names:
+            if self._post(token, doc):
+                self._add_vocab(self._vocab, token)
+                for gram in _grams(token):
+                    self._grams.setdefault(gram, set()).add(token)
+        if national_id and self._post(national_id, doc):
+            self._add_vocab(self._id_vocab, national_id)
+
+    def add_many(self, patients: Iterable) -> None:
+        """Index many patients, sorting the vocabularies once at the end"""
+        self._bulk = True
+        try:
+            for patient in patients:
+                self.add(patient)
+        finally:
+            self._bulk = False
+            self._vocab.sort()
+            self._id_vocab.sort()
+
+    def remove(self, patient_id: str) -> None:
+        doc = self._doc_by_id.pop(patient_id, None)
+        if doc is None:
+            return
+        self._unlink(doc)
+        del self._id_by_doc[doc]
+        del self._tokens_by_doc[doc]
+
+    def _post(self, token: str, doc: int) -> bool:
+        """Add doc to token's posting list; True if the token is new"""
+        posting = self._postings.get(token)
+        if posting is None:
+            self._postings[token] = [doc]
+            return True
+        if posting[-1] < doc:
+            posting.append(doc)
+        else:
+            insort(posting, doc)
+        return False
+
+    def _add_vocab(self, vocab: List[str], token: str) -> None:
+        if self._bulk:
+            vocab.append(token)
+        else:
+            insort(vocab, token)
+
+    def _drop_vocab(self, vocab: List[str], token: str) -> None:
+        if self._bulk:
+            vocab.remove(token)
+        else:
+            del vocab[bisect_left(vocab, token)]
+
+    def _unpost(self, token: str, doc: int) -> bool:
+        """Remove doc from token's posting list; True if the token is now unused"""
+        posting = self._postings[token]
+        i = bisect_left(posting, doc)
+        if i < len(posting) and posting[i] == doc:
+            del posting[i]
+        if posting:
+            return False
+        del self._postings[token]
+        return True
+
+    def _unlink(self, doc: int) -> None:
+        names, national_id = self._tokens_by_doc.get(doc, ((), None))
+        for token in names:
+            if self._unpost(token, doc):
+                self._drop_vocab(self._vocab, token)
+                for gram in _grams(token):
+                    owners = self._grams[gram]
+                    owners.discard(token)
+                    if not owners:
+                        del self._grams[gram]
+        if national_id and self._unpost(national_id, doc):
+            self._drop_vocab(self._id_vocab, national_id)
+
+    # ------------------------------------------------------------------
+    # Queries
+    # ------------------------------------------------------------------
+
+    @staticmethod
+    def _range(vocab: List[str], term: str) -> Iterator[str]:
+        i = bisect_left(vocab, term)
+        while i < len(vocab) and vocab[i].startswith(term):
+            yield vocab[i]
+            i += 1
+
+    def _prefixed(self, term: str) -> Iterator[str]:
+        """Name and national ID tokens starting with term, in sorted order"""
+        return heapq.merge(self._range(self._vocab, term), self._range(self._id_vocab, term))
+
+    def _containing(self, term: str) -> List[str]:
+        """Name tokens containing term but not starting with it"""
+        if len(term) < NGRAM:
+            # Too short for trigrams; the name vocabulary is small enough to scan
+            candidates: Iterable[str] = self._vocab
+        else:
+            gram_sets = sorted(
+                (self._grams.get(g, set()) for g in _grams(term)), key=len
+            )
+            candidates = set.intersection(*gram_sets) if gram_sets[0] else ()
+        return sorted(t for t in candidates if term in t and not t.startswith(term))
+
+    def _tiers(self, term: str) -> Iterator[Tuple[int, str]]:
+        """(tier, token) pairs matching term, best tier first"""
+        for token in self._prefixed(term):
+            yield (EXACT if token == term else PREFIX), token
+        for token in self._containing(term):
+            yield SUBSTRING, token
+
+    def _exact_all(self, terms: List[str], wanted: int) -> List[int]:
+        """First docs (by doc number) that match every term exactly"""
+        postings = [self._postings.get(term) for term in terms]
+        if not all(postings):
+            return []
+        postings.sort(key=len)
+        found: List[int] = []
+        for doc in postings[0]:
+            for posting in postings[1:]:
+                i = bisect_left(posting, doc)
+                if i == len(posting) or posting[i] != doc:
+                    break
+            else:
+                found.append(doc)
+                if len(found) >= wanted:
+                    break
+        return found
+
+    def search(self, query: str, skip: int = 0, limit: int = 100) -> List[str]:
+        """Return ranked patient IDs matching every term of query"""
+        terms = list(dict.fromkeys(tokenize(query)))
+        if not terms or limit <= 0:
+            return []
+        wanted = skip + limit
+
+        if len(terms) == 1:
+            # Single term: walk tiers in rank order and stop once the page is full
+            seen: Set[int] = set()
+            ranked: List[int] = []
+            for _, token in self._tiers(terms[0]):
+                for doc in self._postings[token]:
+                    if doc not in seen:
+                        seen.add(doc)
+                        ranked.append(doc)
+                        if len(ranked) >= wanted:
+                            break
+                if len(ranked) >= wanted:
+                    break
+            return [self._id_by_doc[doc] for doc in ranked[skip:wanted]]
+
+        # Several terms: docs matching every term exactly share the top score
+        # and are ranked by doc number, so a full page of them needs no scoring.
+        exact = self._exact_all(terms, wanted)
+        if len(exact) >= wanted:
+            return [self._id_by_doc[doc] for doc in exact[skip:wanted]]
+
+        # Otherwise every term must match; rank by summed tier.
+        # Start from the most selective term and narrow with the others.
+        matches = [[(tier, self._postings[token]) for tier, token in self._tiers(term)]
+                   for term in terms]
+        matches.sort(key=lambda m: sum(len(posting) for _, posting in m))
+
+        scores: Dict[int, int] = {}
+        for tier, posting in matches[0]:
+            for doc in posting:
+                scores.setdefault(doc, tier)
+
+        for term_matches in matches[1:]:
+            narrowed: Dict[int, int] = {}
+            for tier, posting in term_matches:
+                if len(posting) > 8 * len(scores):
+                    # Probe the (sorted) posting rather than walking all of it
+                    for doc, score in scores.items():
+                        if doc not in narrowed:
+                            i = bisect_left(posting, doc)
+                            if i < len(posting) and posting[i] == doc:
+                                narrowed[doc] = score + tier
+                else:
+                    for doc in posting:
+                        if doc not in narrowed and doc in scores:
+                            narrowed[doc] = scores[doc] + tier
+            scores = narrowed
+            if not scores:
+                return []
+
+        top = heapq.nsmallest(wanted, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [self._id_by_doc[doc] for doc, _ in top[skip:]]
@@ -0,0 +1,168 @@
+"""
+Offline-first delta sync for sites with intermittent connectivity (CSPS).
+
+Every write gives a patient the store's next change sequence number (seq).
+A site keeps one watermark, the highest seq it has pulled, and asks only for
+what changed after it:
+
+    GET /sync/patients?since=<watermark>
+
+The delta holds each changed patient once, in its latest state, as a row of
+values under a single ``fields`` header (field names are not repeated per
+patient), plus the ids deleted since the watermark. A first sync (since=0)
+gets no deletions. When ``more`` is true the client pulls again from the
+returned watermark.
+
+Writes made offline are pushed in batches, each change carrying the seq of
+the version it was made on (``base_seq``, null for a patient created
+offline). A change is applied only if the patient is still at that seq;
+otherwise it comes back as a conflict with the server copy for the site to
+resolve and re-push. Replaying a batch is safe: a change whose result is
+already stored, or a delete of a patient already gone, counts as applied.
+"""
+
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import ValidationError
+
+from .models import Patient, SyncChange, SyncConflict, SyncResult
+from .repository import PatientRepository
+
+# Row layout of a pull: seq, then the Patient, id first
+PATIENT_FIELDS = ("patient_id", *(name for name in Patient.model_fields if name != "patient_id"))
+FIELDS = ("seq", *PATIENT_FIELDS)
+# Changes the client did not make; they never cause a conflict on their own
+SERVER_FIELDS = ("patient_id", "created_at", "updated_at")
+
+
+async def pull(repo: PatientRepository, since: int, limit: int) -> Dict[str, Any]:
+    """Patients changed after since, as compact rows, and the next watermark"""
+    changes, head = await repo.changes(since, limit)
+    more = len(changes) == limit and changes[-1].seq < head
+    rows: List[List[Any]] = []
+    deleted: List[str] = []
+    for change in changes:
+        if change.patient is not None:
+            patient = change.patient
+            rows.append([change.seq, *(getattr(patient, name) for name in PATIENT_FIELDS)])
+        elif since:
+            deleted.append(change.patient_id)
+    return {
+        "since": since,
+        "watermark": changes[-1].seq if more else max(head, since),
+        "more": more,
+        "fields": FIELDS,
+        "rows": rows,
+        "deleted": deleted,
+    }
+
+
+def _same(a: Patient, b: Patient) -> bool:
+    return all(
+        getattr(a, name) == getattr(b, name) for name in PATIENT_FIELDS if name not in SERVER_FIELDS
+    )
+
+
+# _create and _update return (conflict reason or None, patient): the patient
+# written when applied, the server copy on a conflict
+Outcome = Tuple[Optional[str], Optional[Patient]]
+
+
+async def _create(repo: PatientRepository, change: SyncChange, now: str) -> Outcome:
+    try:
+        patient = Patient(
+            patient_id=change.patient_id,
+            created_at=now,
+            updated_at=now,
+            **(change.patient.model_dump(exclude_unset=True) if change.patient else {}),
+        )
+    except ValidationError:
+        return "invalid", None
+    version = (await repo.versions([change.patient_id])).get(change.patient_id)
+    if version is not None and version.deleted:
+        return "deleted", None
+    if await repo.add_new([patient]):
+        return None, patient
+    stored = await repo.get(change.patient_id)
+    if stored is not None:
+        # A retried create is not a conflict
+        return (None, None) if _same(stored, patient) else ("exists", stored)
+    # Another patient already has this national_id
+    return "national_id", None
+
+
+async def _update(repo: PatientRepository, change: SyncChange, now: str) -> Outcome:
+    stored = await repo.get_latest(change.patient_id)
+    if stored is None:
+        versions = await repo.versions([change.patient_id])
+        return ("deleted" if change.patient_id in versions else "missing"), None
+    fields = stored.model_dump()
+    fields.update(change.patient.model_dump(exclude_unset=True) if change.patient else {})
+    fields["updated_at"] = now
+    try:
+        patient = Patient(**fields)
+    except ValidationError:
+        return "invalid", stored
+    if _same(stored, patient):
+        return None, None
+    if await repo.replace_if(patient, change.base_seq):
+        return None, patient
+    return "modified", await repo.get(change.patient_id)
+
+
+async def _delete(repo: PatientRepository, change: SyncChange) -> Optional[str]:
+    if change.base_seq is None:
+        deleted = await repo.delete(change.patient_id)
+    else:
+        deleted = await repo.delete_if(change.patient_id, change.base_seq)
+    if deleted or await repo.get(change.patient_id) is None:
+        return None
+    return "modified"
+
+
+async def push(repo: PatientRepository,
+               changes: List[SyncChange]) -> Tuple[SyncResult, List[Patient]]:
+    """Apply a batch of offline changes; returns the result and the patients
+    written, for duplicate linking"""
+    now = datetime.utcnow().isoformat() + "Z"
+    applied: List[str] = []
+    written: List[Patient] = []
+    failed: List[Tuple[str, str, Optional[Patient]]] = []
+    for change in changes:
+        patient: Optional[Patient] = None
+        if change.op == "delete":
+            reason = await _delete(repo, change)
+            if reason:
+                patient = await repo.get(change.patient_id)
+        elif change.base_seq is None:
+            reason, patient = await _create(repo, change, now)
+        else:
+            reason, patient = await _update(repo, change, now)
+        if reason is None:
+            applied.append(change.patient_id)
+            if patient is not None:
+                written.append(patient)
+        else:
+            failed.append((change.patient_id, reason, patient))
+
+    # One lookup for every new seq the client needs as its next base_seq
+    versions = await repo.versions([change.patient_id for change in changes])
+
+    def seq(patient_id: str) -> Optional[int]:
+        version = versions.get(patient_id)
+        return version.seq if version and not version.deleted else None
+
+    result = SyncResult(
+        applied={patient_id: seq(patient_id) for patient_id in applied},
+        conflicts=[
+            SyncConflict(
+                patient_id=patient_id,
+                reason=reason,
+                server_seq=versions[patient_id].seq if patient_id in versions else None,
+                server=server,
+            )
+            for patient_id, reason, server in failed
+        ],
+    )
+    return result, written
@@ -0,0 +1,142 @@
+import asyncio
+import time
+from typing import List, Optional
+
+import fakeredis
+import pytest
+import redis.asyncio
+
+from src.cache import KEY_PREFIX, CachedPatientRepository
+from src.models import Patient
+from src.repository import InMemoryPatientRepository
+
+CREATED = "2025-03-01T00:00:00Z"
+
+
+def patient(first_name: str, patient_id: str = "PAT-1") -> Patient:
+    return Patient(patient_id=patient_id, first_name=first_name, last_name="Ouedraogo",
+                   date_of_birth="1990-01-01", created_at=CREATED, updated_at=CREATED)
+
+
+class GatedStore(InMemoryPatientRepository):
+    """A store whose get() can be held after it has read, like a slow query"""
+
+    def __init__(self, *patients: Patient) -> None:
+        super().__init__(patients)
+        self.gate: Optional[asyncio.Event] = None
+        self.reading = asyncio.Event()
+
+    async def get(self, patient_id: str) -> Optional[Patient]:
+        found = await super().get(patient_id)
+        gate = self.gate
+        if gate is not None:
+            self.reading.set()
+            await gate.wait()
+        return found
+
+
+@pytest.fixture
+def server(monkeypatch):
+    """One fake Redis server; every client the caches open talks to it"""
+    server = fakeredis.FakeServer()
+    monkeypatch.setattr(
+        redis.asyncio, "from_url", lambda url, **kwargs: fakeredis.FakeAsyncRedis(server=server)
+    )
+    return server
+
+
+async def eventually(condition, timeout: float = 2.0) -> None:
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline, "condition not met in time"
+        await asyncio.sleep(0.01)
+
+
+async def workers(store: InMemoryPatientRepository,
+                  count: int = 2) -> List[CachedPatientRepository]:
+    """Caches over one store, as in that many workers, once all are listening"""
+    caches = [CachedPatientRepository(store, "redis://fake", retry_seconds=0.05)
+              for _ in range(count)]
+    for cache in caches:
+        await cache.connect()
+    await eventually(lambda: all(cache._usable() for cache in caches))
+    return caches
+
+
+async def close(caches: List[CachedPatientRepository]) -> None:
+    for cache in caches:
+        await cache.close()
+
+
+def test_read_racing_an_invalidation_stores_no_stale_copy(server):
+    async def scenario():
+        store = GatedStore(patient("Aminata"))
+        caches = reader, writer = await workers(store)
+        try:
+            gate = store.gate = asyncio.Event()
+            read = asyncio.create_task(reader.get("PAT-1"))
+            # The reader has the old copy in hand when the write commits
+            await store.reading.wait()
+            store.gate = None
+            await writer.replace(patient("Awa"))
+            await eventually(lambda: reader._generation > 0)
+            gate.set()
+            assert (await read).first_name == "Aminata"
+            # Neither Redis nor the reader's L1 kept it
+            assert await reader._redis.get(KEY_PREFIX + "PAT-1") is None
+            assert "PAT-1" not in reader._l1
+            assert (await reader.get("PAT-1")).first_name == "Awa"
+            assert (await writer.get("PAT-1")).first_name == "Awa"
+        finally:
+            await close(caches)
+
+    asyncio.run(scenario())
+
+
+def test_write_evicts_other_workers_l1(server):
+    async def scenario():
+        store = InMemoryPatientRepository([patient("Aminata")])
+        caches = first, second = await workers(store)
+        try:
+            assert (await first.get("PAT-1")).first_name == "Aminata"
+            assert "PAT-1" in first._l1
+            await second.replace(patient("Awa"))
+            await eventually(lambda: "PAT-1" not in first._l1)
+            assert (await first.get("PAT-1")).first_name == "Awa"
+
+            await first.get("PAT-1")
+            assert await second.delete("PAT-1")
+            await eventually(lambda: "PAT-1" not in first._l1)
+            assert await first.get("PAT-1") is None
+        finally:
+            await close(caches)
+
+    asyncio.run(scenario())
+
+
+def test_invalidations_sent_while_redis_was_down_arrive_after_recovery(server):
+    async def scenario():
+        store = InMemoryPatientRepository([patient("Aminata"), patient("Issa", "PAT-2")])
+        caches = reader, writer = await workers(store)
+        try:
+            await reader.get("PAT-1")
+            assert await writer._redis.get(KEY_PREFIX + "PAT-1") is not None
+
+            server.connected = False
+            await writer.replace(patient("Awa"))
+            assert writer._pending == {"PAT-1"}
+
+            server.connected = True
+            await asyncio.sleep(0.06)  # past the writer's retry_seconds
+            # The writer's next read sends what it owes first
+            await eventually(lambda: writer._usable())
+            await writer.get("PAT-2")
+            assert not writer._pending
+            await eventually(lambda: "PAT-1" not in reader._l1)
+            assert await reader._redis.get(KEY_PREFIX + "PAT-1") is None
+            await eventually(lambda: reader._usable())
+            assert (await reader.get("PAT-1")).first_name == "Awa"
+        finally:
+            await close(caches)
+
+    asyncio.run(scenario())
@@ -0,0 +1,154 @@
+"""
+Secondary indexes over registry facilities.
+
+Built once when the registry is loaded. Every filterable attribute (region,
+type, level, capability flags, imaging modalities) maps to a frozenset of
+facility positions, so a combined filter is a set intersection. Each facility
+is also serialized once, from its validated model, so a response body is
+those bytes joined: nothing is validated or encoded per request.
+
+The index keeps no facility dicts or models: besides those bytes it holds
+only the columns requests read (ids, coordinates, the searchable text, each
+type's level), so a registry costs little more than its JSON.
+"""
+
+from array import array
+from math import isnan, nan
+from typing import Any, Dict, FrozenSet, Iterable, List, Optional, Sequence, Tuple
+import sys
+
+from pydantic import BaseModel
+
+FilterKey = Tuple[Optional[str], Optional[str], Optional[str], Tuple[str, ...]]
+
+
+def capability_keys(capabilities: Dict[str, Any]) -> List[str]:
+    """Flags that are true, plus 'imaging' and one key per imaging modality"""
+    keys = []
+    for name, value in capabilities.items():
+        if isinstance(value, list):
+            if value:
+                keys.append(name.lower())
+                keys.extend(str(item).lower() for item in value)
+        elif value:
+            keys.append(name.lower())
+    return keys
+
+
+class FacilityIndex:
+    """Facilities with set-based filters and their pre-serialized JSON"""
+
+    def __init__(self, models: Sequence[BaseModel]) -> None:
+        # models are the facilities validated as the API's Facility, in order
+        self._json: List[bytes] = [model.model_dump_json().encode() for model in models]
+        self.ids: List[str] = [model.id for model in models]
+        # id or short_code -> position
+        self._position: Dict[str, int] = {}
+        # NaN where a facility has no coordinates
+        self._latitude = array("d")
+        self._longitude = array("d")
+        # Lowercased name, city and district, for /search; cities and
+        # districts repeat, so each distinct one is stored once
+        self._text: List[Tuple[str, str, str]] = []
+        # Level of the first facility of each type, for /types
+        self.type_levels: Dict[str, str] = {}
+
+        region: Dict[str, set] = {}
+        ftype: Dict[str, set] = {}
+        level: Dict[str, set] = {}
+        capability: Dict[str, set] = {}
+        for pos, facility in enumerate(models):
+            self._position[facility.id] = pos
+            self._position[facility.short_code] = pos
+            located = facility.latitude is not None and facility.longitude is not None
+            self._latitude.append(facility.latitude if located else nan)
+            self._longitude.append(facility.longitude if located else nan)
+            self._text.append((
+                facility.name.lower(),
+                sys.intern(facility.city.lower()),
+                sys.intern(facility.district.lower()),
+            ))
+            if facility.type:
+                self.type_levels.setdefault(facility.type, facility.level)
+
+            region.setdefault(facility.region_name.lower(), set()).add(pos)
+            region.setdefault(facility.region_id.lower(), set()).add(pos)
+            ftype.setdefault(facility.type.upper(), set()).add(pos)
+            level.setdefault(facility.level.lower(), set()).add(pos)
+            for key in capability_keys(facility.capabilities or {}):
+                capability.setdefault(key, set()).add(pos)
+
+        self._region = {k: frozenset(v) for k, v in region.items()}
+        self._type = {k: frozenset(v) for k, v in ftype.items()}
+        self._level = {k: frozenset(v) for k, v in level.items()}
+        self._capability = {k: frozenset(v) for k, v in capability.items()}
+
+    def __len__(self) -> int:
+        return len(self.ids)
+
+    def position(self, id_or_short_code: str) -> Optional[int]:
+        return self._position.get(id_or_short_code)
+
+    def coordinates(self, pos: int) -> Optional[Tuple[float, float]]:
+        latitude, longitude = self._latitude[pos], self._longitude[pos]
+        return None if isnan(latitude) else (latitude, longitude)
+
+    @staticmethod
+    def filter_key(region: Optional[str] = None, type: Optional[str] = None,
+                   level: Optional[str] = None, capabilities: Iterable[str] = ()) -> FilterKey:
+        return (
+            region.lower() if region else None,
+            type.upper() if type else None,
+            level.lower() if level else None,
+            tuple(sorted({c.lower() for c in capabilities})),
+        )
+
+    def positions(self, key: FilterKey) -> List[int]:
+        region, ftype, level, capabilities = key
+        empty: FrozenSet[int] = frozenset()
+        sets = []
+        if region:
+            sets.append(self._region.get(region, empty))
+        if ftype:
+            sets.append(self._type.get(ftype, empty))
+        if level:
+            sets.append(self._level.get(level, empty))
+        sets.extend(self._capability.get(c, empty) for c in capabilities)
+        if not sets:
+            return list(range(len(self.ids)))
+        sets.sort(key=len)
+        return sorted(sets[0].intersection(*sets[1:]))
+
+    def filter_json(self, region: Optional[str] = None, type: Optional[str] = None,
+                    level: Optional[str] = None, capabilities: Iterable[str] = ()) -> bytes:
+        """JSON list of the facilities matching a filter combination"""
+        key = self.filter_key(region, type, level, capabilities)
+        return b"[" + b",".join([self._json[pos] for pos in self.positions(key)]) + b"]"
+
+    def facility_json(self, facility_id: str) -> bytes:
+        return self._json[self._position[facility_id]]
+
+    def search(self, text: str) -> List[int]:
+        """Positions of the facilities whose name, city or district contains text"""
+        text = text.lower()
+        return [
+            pos for pos, fields in enumerate(self._text) if any(text in field for field in fields)
+        ]
+
+    def search_json(self, text: str) -> bytes:
+        found = self.search(text)
+        results = b",".join([self._json[pos] for pos in found])
+        return b'{"results":[%s],"count":%d}' % (results, len(found))
+
+    def nearby_json(self, results: Iterable[Tuple[int, float]], exclude_id: Optional[str] = None,
+                    k: Optional[int] = None) -> bytes:
+        """JSON list of {distance_km, facility} for (position, km) results"""
+        items = []
+        for pos, km in results:
+            if self.ids[pos] == exclude_id:
+                continue
+            distance = str(round(km, 2)).encode()
+            items.append(b'{"distance_km":%s,"facility":%s}' % (distance, self._json[pos]))
+            if len(items) == k:
+                break
+        return b"[" + b",".join(items) + b"]"
@@ -0,0 +1,168 @@
+"""
+Cached, pre-compressed registry responses.
+
+Every GET response of the registry is a pure function of the snapshot and
+the query parameters its endpoint reads, so the first 200 for a URL is kept
+(per snapshot, LRU, bounded in entries and bytes) and later requests for it
+are answered from memory without filtering or serializing again. Parameters
+the endpoint does not read are left out of the key: ``?x=1``, ``?x=2``...
+share one entry. Each body is compressed the first time a client asks for
+that encoding, and only then, so a one-off URL costs a single compression at
+most. A reload starts with an empty cache because the cache lives in the
+snapshot.
+
+Each encoding has its own strong ETag: the snapshot's, with ``-gzip`` /
+``-br`` appended, as the bytes differ.
+"""
+
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Collection, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode
+import gzip
+
+try:
+    import brotli
+except ImportError:  # gzip only
+    brotli = None
+
+# Not worth compressing below this
+MIN_COMPRESS_SIZE = 256
+# Brotli's best quality costs ~2 ms even on a small body: worth it for the
+# large lists many clients fetch, not for one-off answers (a nearest query),
+# which get a fast quality about as compact as gzip's best
+BROTLI_BEST_MIN_SIZE = 32 * 1024
+
+ENCODINGS = ("br", "gzip") if brotli is not None else ("gzip",)
+
+Headers = List[Tuple[bytes, bytes]]
+
+
+def cache_key(path: str, query_string: bytes, names: Optional[Collection[str]] = None) -> str:
+    """URL with its query parameters sorted, so ?a=1&b=2 and ?b=2&a=1 share an
+    entry, keeping only those in ``names`` (the ones the endpoint reads) if given"""
+    if not query_string:
+        return path
+    params = sorted(
+        (name, value)
+        for name, value in parse_qsl(query_string.decode("latin-1"), keep_blank_values=True)
+        if names is None or name in names
+    )
+    return f"{path}?{urlencode(params)}" if params else path
+
+
+def accepted_encoding(accept_encoding: str) -> str:
+    """Best encoding we hold that the client accepts ('identity' if none)"""
+    accepted = set()
+    for part in accept_encoding.lower().split(","):
+        coding, *params = part.split(";")
+        q = 1.0
+        for param in params:
+            name, _, value = param.strip().partition("=")
+            if name == "q":
+                try:
+                    q = float(value)
+                except ValueError:
+                    q = 0.0
+        if q > 0:
+            accepted.add(coding.strip())
+    for coding in ENCODINGS:
+        if coding in accepted or "*" in accepted:
+            return coding
+    return "identity"
+
+
+def variant_etag(etag: str, encoding: str) -> str:
+    return etag if encoding == "identity" else f'{etag[:-1]}-{encoding}"'
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Does If-None-Match name this snapshot's ETag, in any encoding?"""
+    if if_none_match.strip() == "*":
+        return True
+    base = etag[:-1]
+    for tag in if_none_match.split(","):
+        # Weak comparison, as If-None-Match requires
+        tag = tag.strip().removeprefix("W/")
+        if tag == etag or (tag.startswith(base) and tag[len(base):-1] in ("-gzip", "-br")):
+            return True
+    return False
+
+
+def compress(body: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        quality = 11 if len(body) >= BROTLI_BEST_MIN_SIZE else 5
+        return brotli.compress(body, quality=quality)
+    return gzip.compress(body, compresslevel=9, mtime=0)
+
+
+@dataclass(frozen=True)
+class CachedResponse:
+    media_type: bytes
+    identity: bytes
+    route: Any = None  # the route that produced it, for request metrics
+    # Compressed bodies, made on first request for each encoding
+    encoded: Dict[str, bytes] = field(default_factory=dict)
+
+    @property
+    def size(self) -> int:
+        """Bytes it may come to hold: the body, and as much again for its
+        compressed encodings (JSON compresses to a fraction of its size)"""
+        if len(self.identity) < MIN_COMPRESS_SIZE:
+            return len(self.identity)
+        return 2 * len(self.identity)
+
+    def compresses(self, encoding: str) -> bool:
+        """Would body(encoding) have to compress first?"""
+        return (encoding != "identity" and encoding not in self.encoded
+                and len(self.identity) >= MIN_COMPRESS_SIZE)
+
+    def body(self, encoding: str) -> Tuple[str, bytes]:
+        if encoding == "identity" or len(self.identity) < MIN_COMPRESS_SIZE:
+            return "identity", self.identity
+        body = self.encoded.get(encoding)
+        if body is None:
+            body = self.encoded[encoding] = compress(self.identity, encoding)
+        return encoding, body
+
+
+class ResponseCache:
+    """LRU of responses, bounded in entries and in bytes (see CachedResponse.size)"""
+
+    def __init__(self, max_entries: int = 512, max_bytes: int = 32 << 20) -> None:
+        self._entries: "OrderedDict[str, CachedResponse]" = OrderedDict()
+        self._max_entries = max_entries
+        self._max_bytes = max_bytes
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[CachedResponse]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: str, entry: CachedResponse) -> None:
+        previous = self._entries.get(key)
+        if previous is not None:
+            self._bytes -= previous.size
+        self._bytes += entry.size
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        # The newest entry stays even if it alone is over the byte budget
+        while len(self._entries) > 1 and (
+            len(self._entries) > self._max_entries or self._bytes > self._max_bytes
+        ):
+            _, evicted = self._entries.popitem(last=False)
+            self._bytes -= evicted.size
+
+    def stats(self) -> Dict[str, int]:
+        return {"entries": len(self._entries), "bytes": self._bytes,
+                "hits": self.hits, "misses": self.misses}
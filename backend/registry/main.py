@@ -7,46 +7,43 @@ Copyright (c) 2025 Kader BONZI
 Licensed under the Apache License, Version 2.0
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import Body, Depends, FastAPI, Header, HTTPException, Query, Request, Response
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from pydantic import BaseModel, TypeAdapter, ValidationError
+from contextlib import asynccontextmanager
+from pathlib import Path
 from typing import Optional, List, Dict, Any
-import json
 import logging
+import os
+import secrets
 
-logging.basicConfig(level=logging.INFO)
+from danaya_shared import logs
+from danaya_shared.health import HealthChecks
+from danaya_shared.logs import RequestContextMiddleware, setup_logging
+from danaya_shared.metrics import LOG_RECORDS_DROPPED, MetricsMiddleware, MetricsPublisher
+from danaya_shared.responses import JSONResponse
+from facility_index import FacilityIndex
+from snapshot import InvalidRegistry, RegistrySnapshot, RegistryStore, SnapshotMiddleware
+
+setup_logging("registry")
 logger = logging.getLogger(__name__)
 
-app = FastAPI(
-    title="DANAYA Hospital Registry",
-    description="Central registry of healthcare facilities in Burkina Faso",
-    version="1.0.0",
-)
+REGISTRY_FILE = Path(os.getenv("REGISTRY_FILE", Path(__file__).parent / "hospitals_bf.json"))
+# Seconds between checks of REGISTRY_FILE for changes (0: only reload on request)
+REGISTRY_WATCH_INTERVAL = float(os.getenv("REGISTRY_WATCH_INTERVAL", "5"))
+# Bearer token for /admin endpoints; unset disables them
+REGISTRY_ADMIN_TOKEN = os.getenv("REGISTRY_ADMIN_TOKEN")
+# Seconds browsers and proxies may reuse a response without revalidating;
+# afterwards a conditional request costs a 304 while the data is unchanged
+REGISTRY_CACHE_MAX_AGE = int(os.getenv("REGISTRY_CACHE_MAX_AGE", "300"))
+# Bounds on each snapshot's response cache: entries, and megabytes of bodies
+REGISTRY_RESPONSE_CACHE_ENTRIES = int(os.getenv("REGISTRY_RESPONSE_CACHE_ENTRIES", "512"))
+REGISTRY_RESPONSE_CACHE_MB = int(os.getenv("REGISTRY_RESPONSE_CACHE_MB", "32"))
+# Seconds between copies of cache counters and sizes into /metrics
+METRICS_INTERVAL = float(os.getenv("METRICS_INTERVAL", "15"))
 
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=["*"],
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Load registry
-with open("hospitals_bf.json", "r", encoding="utf-8") as f:
-    registry_data = json.load(f)
-
-# Create facility lookup
-facilities_db = {}
-for region in registry_data.get("regions", []):
-    for facility in region.get("facilities", []):
-        facilities_db[facility["id"]] = {
-            **facility,
-            "region_id": region["region_id"],
-            "region_name": region["name"]
-        }
-        # Also index by short_code for easier lookup
-        if "short_code" in facility:
-            facilities_db[facility["short_code"]] = facilities_db[facility["id"]]
+metrics = MetricsPublisher(METRICS_INTERVAL)
+health = HealthChecks.from_env("danaya-registry", "1.0.0")
 
 class Facility(BaseModel):
     id: str
@@ -58,127 +55,291 @@ class Facility(BaseModel):
     district: str
     city: str
     address: Optional[str] = None
+    latitude: Optional[float] = None
+    longitude: Optional[float] = None
     logo_url: str
     region_id: str
     region_name: str
     capabilities: Dict[str, Any]
     status: str
 
+def check_registry_file(registry: RegistryStore) -> dict:
+    if registry.reload_error:
+        raise RuntimeError(f"{registry.path} not loaded: {registry.reload_error}")
+    return None
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Every request works on one immutable snapshot: facilities by id and
+    # short_code, region/type/level/capability indexes with cached response
+    # bodies, and the spatial index. Reloads swap in a new one.
+    registry = RegistryStore(
+        REGISTRY_FILE, TypeAdapter(List[Facility]), REGISTRY_WATCH_INTERVAL,
+        cache_entries=REGISTRY_RESPONSE_CACHE_ENTRIES,
+        cache_bytes=REGISTRY_RESPONSE_CACHE_MB << 20,
+    )
+    app.state.registry = registry
+    registry.start()
+    logger.info(f"Registry {registry.current.version}: {len(registry.current.index)} facilities")
+    # Each snapshot has its own response cache; a reload starts the counts again
+    metrics.cache(
+        "registry_responses",
+        lambda: registry.current.responses.hits,
+        lambda: registry.current.responses.misses,
+        lambda: len(registry.current.responses),
+    )
+    metrics.store("facilities", lambda: len(registry.current.index))
+    metrics.count(LOG_RECORDS_DROPPED, logs.dropped)
+    await metrics.start()
+    health.add("registry_data", lambda: {
+        "version": registry.current.version,
+        "facilities": len(registry.current.index),
+    })
+    # A bad edit of the file keeps the previous version serving: degraded
+    health.add("registry_file", lambda: check_registry_file(registry), critical=False)
+    health.started()
+    try:
+        yield
+    finally:
+        health.stopped()
+        await metrics.stop()
+        await registry.stop()
+
+app = FastAPI(
+    title="DANAYA Hospital Registry",
+    description="Central registry of healthcare facilities in Burkina Faso",
+    version="1.0.0",
+    lifespan=lifespan,
+    default_response_class=JSONResponse,
+)
+
+app.add_middleware(
+    SnapshotMiddleware,
+    cache_control=f"public, max-age={REGISTRY_CACHE_MAX_AGE}, stale-while-revalidate=86400",
+)
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=["*"],
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+    expose_headers=["ETag", "X-Registry-Version", "X-Request-ID"],
+)
+
+# Outermost: times every request, cached responses included
+app.add_middleware(MetricsMiddleware, publisher=metrics)
+# Around that: the request id, and the sampled request log
+app.add_middleware(RequestContextMiddleware)
+
+async def current_snapshot(request: Request) -> RegistrySnapshot:
+    """The snapshot this request was pinned to by SnapshotMiddleware"""
+    return request.state.snapshot
+
+def require_admin(authorization: Optional[str] = Header(None)) -> None:
+    if not REGISTRY_ADMIN_TOKEN:
+        raise HTTPException(
+            status_code=403, detail="Registry admin is disabled (REGISTRY_ADMIN_TOKEN unset)"
+        )
+    scheme, _, token = (authorization or "").partition(" ")
+    valid = secrets.compare_digest(token.encode(), REGISTRY_ADMIN_TOKEN.encode())
+    if scheme.lower() != "bearer" or not valid:
+        raise HTTPException(status_code=401, detail="Invalid admin token",
+                            headers={"WWW-Authenticate": "Bearer"})
+
+class NearbyFacility(BaseModel):
+    distance_km: float
+    facility: Facility
+
 @app.get("/")
-async def root():
+async def root(snapshot: RegistrySnapshot = Depends(current_snapshot)):
     return {
         "service": "DANAYA Hospital Registry",
         "version": "1.0.0",
-        "country": registry_data.get("country"),
-        "total_regions": len(registry_data.get("regions", [])),
-        "total_facilities": len(facilities_db) // 2,  # Divided by 2 because we index by both id and short_code
+        "country": snapshot.country,
+        "registry_version": snapshot.version,
+        "total_regions": len(snapshot.regions),
+        "total_facilities": len(snapshot.index),
         "docs": "/docs"
     }
 
+app.include_router(health.router())
+
 @app.get("/health")
-async def health_check():
+async def health_check(response: Response, snapshot: RegistrySnapshot = Depends(current_snapshot)):
+    ready, report = await health.ready()
+    response.headers["Cache-Control"] = "no-store"
+    if not ready:
+        response.status_code = 503
     return {
-        "status": "healthy",
-        "service": "danaya-registry",
-        "facilities": len(facilities_db) // 2
+        **report,
+        "facilities": len(snapshot.index),
+        "registry": snapshot.info(),
     }
 
 @app.get("/facilities", response_model=List[Facility])
 async def list_facilities(
     region: Optional[str] = None,
     type: Optional[str] = None,
-    level: Optional[str] = None
+    level: Optional[str] = None,
+    capability: List[str] = Query(
+        default=[],
+        description="Required capabilities, e.g. surgery, emergency, imaging, ct, mri",
+    ),
+    snapshot: RegistrySnapshot = Depends(current_snapshot),
 ):
-    """List all facilities with optional filters"""
-    # Get unique facilities (remove duplicates from short_code indexing)
-    seen_ids = set()
-    facilities = []
-    
-    for facility in facilities_db.values():
-        if facility["id"] in seen_ids:
-            continue
-        seen_ids.add(facility["id"])
-        
-        # Apply filters
-        if region and facility.get("region_name", "").lower() != region.lower():
-            continue
-        if type and facility.get("type", "").upper() != type.upper():
-            continue
-        if level and facility.get("level", "").lower() != level.lower():
-            continue
-        
-        facilities.append(facility)
-    
-    return facilities
+    """List all facilities with optional filters (all filters must match)"""
+    body = snapshot.index.filter_json(region, type, level, capability)
+    return Response(content=body, media_type="application/json")
+
+def _origin(snapshot: RegistrySnapshot, lat: Optional[float], lon: Optional[float],
+            from_facility: Optional[str]) -> tuple:
+    """(lat, lon, origin facility id or None) from coordinates or a facility"""
+    if from_facility:
+        pos = snapshot.index.position(from_facility)
+        if pos is None:
+            raise HTTPException(status_code=404, detail=f"Facility '{from_facility}' not found")
+        coordinates = snapshot.index.coordinates(pos)
+        if coordinates is None:
+            raise HTTPException(
+                status_code=422,
+                detail=f"Facility '{from_facility}' has no coordinates",
+            )
+        return (*coordinates, snapshot.index.ids[pos])
+    if lat is None or lon is None:
+        raise HTTPException(status_code=400, detail="Provide lat and lon, or from_facility")
+    return lat, lon, None
+
+def _allowed(snapshot: RegistrySnapshot, types: List[str], level: Optional[str],
+             capability: List[str]) -> Optional[set]:
+    """Facility positions passing the filters (any of types), or None if unfiltered"""
+    if not (types or level or capability):
+        return None
+    allowed = set()
+    for ftype in types or [None]:
+        key = FacilityIndex.filter_key(type=ftype, level=level, capabilities=capability)
+        allowed.update(snapshot.index.positions(key))
+    return allowed
+
+def _nearby(snapshot: RegistrySnapshot, results: List[tuple], exclude_id: Optional[str],
+            k: Optional[int] = None) -> Response:
+    # Built from the facilities' pre-serialized JSON (see FacilityIndex)
+    body = snapshot.index.nearby_json(results, exclude_id, k)
+    return Response(content=body, media_type="application/json")
+
+@app.get("/facilities/nearest", response_model=List[NearbyFacility])
+async def nearest_facilities(
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    from_facility: Optional[str] = Query(None, description="Origin facility id or short_code"),
+    k: int = Query(5, ge=1, le=100),
+    max_km: Optional[float] = Query(None, gt=0),
+    type: List[str] = Query(default=[], description="Any of these types, e.g. CHR and CHU"),
+    level: Optional[str] = None,
+    capability: List[str] = Query(default=[], description="Required capabilities"),
+    snapshot: RegistrySnapshot = Depends(current_snapshot),
+):
+    """k nearest facilities matching the filters, e.g. the closest CHR/CHU with
+    surgery and CT for a referral from a CSPS (from_facility=BF-CSPS-DOR-01)"""
+    lat, lon, origin_id = _origin(snapshot, lat, lon, from_facility)
+    # Ask for one extra in case the origin itself matches the filters
+    results = snapshot.spatial.nearest(
+        lat, lon, k + 1, allowed=_allowed(snapshot, type, level, capability), max_km=max_km
+    )
+    return _nearby(snapshot, results, origin_id, k)
+
+@app.get("/facilities/within", response_model=List[NearbyFacility])
+async def facilities_within(
+    radius_km: float = Query(..., gt=0, le=2000),
+    lat: Optional[float] = Query(None, ge=-90, le=90),
+    lon: Optional[float] = Query(None, ge=-180, le=180),
+    from_facility: Optional[str] = Query(None, description="Origin facility id or short_code"),
+    type: List[str] = Query(default=[], description="Any of these types"),
+    level: Optional[str] = None,
+    capability: List[str] = Query(default=[], description="Required capabilities"),
+    snapshot: RegistrySnapshot = Depends(current_snapshot),
+):
+    """All facilities within radius_km matching the filters, nearest first"""
+    lat, lon, origin_id = _origin(snapshot, lat, lon, from_facility)
+    results = snapshot.spatial.within(
+        lat, lon, radius_km, allowed=_allowed(snapshot, type, level, capability)
+    )
+    return _nearby(snapshot, results, origin_id)
 
 @app.get("/facilities/{facility_id}", response_model=Facility)
-async def get_facility(facility_id: str):
+async def get_facility(facility_id: str, snapshot: RegistrySnapshot = Depends(current_snapshot)):
     """Get facility by ID or short_code"""
-    facility = facilities_db.get(facility_id)
-    if not facility:
+    if snapshot.index.position(facility_id) is None:
         raise HTTPException(
             status_code=404,
             detail=f"Facility '{facility_id}' not found"
         )
-    return facility
+    body = snapshot.index.facility_json(facility_id)
+    return Response(content=body, media_type="application/json")
 
 @app.get("/regions")
-async def list_regions():
+async def list_regions(snapshot: RegistrySnapshot = Depends(current_snapshot)):
     """Get all regions"""
-    regions = [
-        {
-            "region_id": r["region_id"],
-            "name": r["name"],
-            "facility_count": len(r.get("facilities", []))
-        }
-        for r in registry_data.get("regions", [])
-    ]
-    return {"regions": regions, "total": len(regions)}
+    return {"regions": snapshot.regions, "total": len(snapshot.regions)}
 
 @app.get("/types")
-async def list_types():
+async def list_types(snapshot: RegistrySnapshot = Depends(current_snapshot)):
     """Get all facility types"""
     types = {}
-    for facility in facilities_db.values():
-        ftype = facility.get("type")
-        if ftype and ftype not in types:
-            types[ftype] = {
-                "name": ftype,
-                "level": facility.get("level"),
-                "description": {
-                    "CHU": "Centre Hospitalier Universitaire (University Hospital)",
-                    "CHR": "Centre Hospitalier Régional (Regional Hospital)",
-                    "CMA": "Centre Médical avec Antenne chirurgicale (Medical Center with Surgery)",
-                    "CSPS": "Centre de Santé et de Promotion Sociale (Health Center)"
-                }.get(ftype, ftype)
-            }
+    for ftype, level in snapshot.index.type_levels.items():
+        types[ftype] = {
+            "name": ftype,
+            "level": level,
+            "description": {
+                "CHU": "Centre Hospitalier Universitaire (University Hospital)",
+                "CHR": "Centre Hospitalier Régional (Regional Hospital)",
+                "CMA": "Centre Médical avec Antenne chirurgicale (Medical Center with Surgery)",
+                "CSPS": "Centre de Santé et de Promotion Sociale (Health Center)"
+            }.get(ftype, ftype)
+        }
     return types
 
 @app.get("/search")
-async def search_facilities(q: str):
+async def search_facilities(q: str, snapshot: RegistrySnapshot = Depends(current_snapshot)):
     """Search facilities by name, city, or district"""
-    query_lower = q.lower()
-    seen_ids = set()
-    results = []
-    
-    for facility in facilities_db.values():
-        if facility["id"] in seen_ids:
-            continue
-        
-        if (query_lower in facility.get("name", "").lower() or
-            query_lower in facility.get("city", "").lower() or
-            query_lower in facility.get("district", "").lower()):
-            seen_ids.add(facility["id"])
-            results.append(facility)
-    
-    return {"results": results, "count": len(results)}
+    body = snapshot.index.search_json(q)
+    return Response(content=body, media_type="application/json")
+
+@app.get("/admin/registry", dependencies=[Depends(require_admin)])
+async def registry_info(snapshot: RegistrySnapshot = Depends(current_snapshot)):
+    """Version, ETag and load time of the registry this worker serves"""
+    return {**snapshot.info(), "source": str(REGISTRY_FILE)}
+
+@app.post("/admin/reload", dependencies=[Depends(require_admin)])
+async def reload_registry(request: Request):
+    """Re-read REGISTRY_FILE (other workers pick the change up on their own)"""
+    registry: RegistryStore = request.app.state.registry
+    try:
+        changed = await registry.reload()
+    except (OSError, ValueError) as exc:
+        raise HTTPException(status_code=422, detail=f"Reload failed, still serving "
+                                                    f"{registry.current.version}: {exc}")
+    return {**registry.current.info(), "changed": changed}
+
+@app.put("/admin/registry", dependencies=[Depends(require_admin)])
+async def replace_registry(request: Request, data: Dict[str, Any] = Body(...)):
+    """Replace the whole registry document (same shape as hospitals_bf.json).
+
+    It is validated and indexed off the event loop, written to REGISTRY_FILE
+    and swapped in; requests already running finish on the previous version.
+    """
+    registry: RegistryStore = request.app.state.registry
+    try:
+        changed = await registry.replace(data)
+    except (InvalidRegistry, ValidationError) as exc:
+        raise HTTPException(status_code=422, detail=str(exc))
+    return {**registry.current.info(), "changed": changed}
 
 if __name__ == "__main__":
     import uvicorn
     logger.info("=" * 70)
     logger.info("🏥 DANAYA Hospital Registry Starting")
-    logger.info(f"📊 Regions loaded: {len(registry_data.get('regions', []))}")
-    logger.info(f"🏥 Facilities loaded: {len(facilities_db) // 2}")
+    logger.info(f"📄 Registry file: {REGISTRY_FILE}")
     logger.info("📡 Running on http://localhost:8003")
     logger.info("=" * 70)
     uvicorn.run(app, host="0.0.0.0", port=8003, log_level="info")
@@ -0,0 +1,314 @@
+"""
+Versioned, immutable registry snapshots.
+
+A snapshot is one version of hospitals_bf.json together with everything
+derived from it: the facility and spatial indexes (with the id/short_code
+lookup) and the region list. Nothing in a snapshot changes after it is built,
+so a request that picked one up sees a consistent registry for its whole life.
+The document itself is not kept; see FacilityIndex for what is.
+
+Reloading (from the file, or a document pushed to the admin endpoint) builds
+a complete new snapshot in a worker thread and then swaps it in with a single
+assignment; requests in flight finish on the old one. Every worker also
+watches the file, so a push to one worker reaches the others.
+
+Each snapshot has a strong ETag (the dataset version plus a hash of the
+canonical document), sent on every response with the version. GETs are
+answered from the snapshot's response cache (see http_cache.py) after the
+first request for each URL (counting only the query parameters its endpoint
+reads), and ``If-None-Match`` for the current ETag is answered 304 only for a
+URL that is known to exist: one in the cache, or one the app has just
+answered 200. Anything else (a 404, say) goes through.
+"""
+
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, List, Optional, Set, Tuple
+import asyncio
+import hashlib
+import json
+import logging
+import os
+import re
+
+from fastapi.dependencies.utils import get_flat_dependant
+from pydantic import TypeAdapter
+from starlette.routing import Match
+
+from facility_index import FacilityIndex
+from http_cache import (
+    CachedResponse, ResponseCache, accepted_encoding, cache_key, etag_matches, variant_etag,
+)
+from spatial import SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+
+class InvalidRegistry(ValueError):
+    pass
+
+
+_NOT_ETAG_SAFE = re.compile(r"[^A-Za-z0-9._-]")
+
+
+def _etag(version: str, data: Dict[str, Any]) -> str:
+    """Dataset version plus a content hash: a document edited without bumping
+    its version still gets a new ETag"""
+    canonical = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    digest = hashlib.sha256(canonical.encode()).hexdigest()[:12]
+    return f'"{_NOT_ETAG_SAFE.sub("", version)}-{digest}"'
+
+
+class RegistrySnapshot:
+    def __init__(self, data: Dict[str, Any], adapter: TypeAdapter, cache_entries: int = 512,
+                 cache_bytes: int = 32 << 20) -> None:
+        regions = data.get("regions")
+        if not isinstance(regions, list):
+            raise InvalidRegistry("'regions' must be a list")
+
+        # Ids and short_codes share one lookup, so neither may repeat an id
+        keys: Set[str] = set()
+        unique: List[Dict[str, Any]] = []
+        for region in regions:
+            try:
+                region_id, region_name = region["region_id"], region["name"]
+                facilities = region.get("facilities", [])
+                for facility in facilities:
+                    entry = {**facility, "region_id": region_id, "region_name": region_name}
+                    if entry["id"] in keys:
+                        raise InvalidRegistry(f"Duplicate facility id '{entry['id']}'")
+                    unique.append(entry)
+                    keys.add(entry["id"])
+                    if "short_code" in entry:
+                        keys.add(entry["short_code"])
+            except (KeyError, TypeError, AttributeError) as exc:
+                raise InvalidRegistry(f"Malformed region or facility: {exc!r}")
+        # Reject a bad document before it can replace a good one
+        models = adapter.validate_python(unique)
+
+        self.country: Optional[str] = data.get("country")
+        self.version: str = str(data.get("version") or "unversioned")
+        self.etag = _etag(self.version, data)
+        self.loaded_at = datetime.now(timezone.utc).isoformat()
+        # The indexes keep what requests read; the dicts and models go now
+        self.index = FacilityIndex(models)
+        # From the models: their coordinates are floats (or None) by now
+        self.spatial = SpatialIndex([(m.latitude, m.longitude) for m in models])
+        self.regions = [
+            {
+                "region_id": r["region_id"],
+                "name": r["name"],
+                "facility_count": len(r.get("facilities", [])),
+            }
+            for r in regions
+        ]
+        # Responses served from this snapshot, with their compressed encodings
+        self.responses = ResponseCache(cache_entries, cache_bytes)
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "version": self.version,
+            "etag": self.etag,
+            "loaded_at": self.loaded_at,
+            "facilities": len(self.index),
+            "response_cache": self.responses.stats(),
+        }
+
+
+class RegistryStore:
+    """Holds the current snapshot; reloads are serialized and swapped atomically"""
+
+    def __init__(self, path: Path, adapter: TypeAdapter, watch_interval: float = 5.0,
+                 cache_entries: int = 512, cache_bytes: int = 32 << 20) -> None:
+        self.path = path
+        self._adapter = adapter
+        self._watch_interval = watch_interval
+        self._cache_limits = (cache_entries, cache_bytes)
+        self._lock = asyncio.Lock()
+        self._stat: Optional[Tuple[int, int]] = None
+        self._watcher: Optional["asyncio.Task[None]"] = None
+        # Why the file on disk is not the version being served, if it is not
+        self.reload_error: Optional[str] = None
+        self.current = self._read_file()
+
+    def _file_stat(self) -> Optional[Tuple[int, int]]:
+        try:
+            st = self.path.stat()
+        except FileNotFoundError:
+            return None
+        return st.st_mtime_ns, st.st_size
+
+    def _read_file(self) -> RegistrySnapshot:
+        stat = self._file_stat()
+        with self.path.open("r", encoding="utf-8") as f:
+            snapshot = RegistrySnapshot(json.load(f), self._adapter, *self._cache_limits)
+        self._stat = stat
+        return snapshot
+
+    def _write_file(self, data: Dict[str, Any]) -> None:
+        # Write beside the target and rename, so readers never see half a file
+        staging = self.path.with_name(f".{self.path.name}.{os.getpid()}")
+        with staging.open("w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False, indent=2)
+        os.replace(staging, self.path)
+        self._stat = self._file_stat()
+
+    def _swap(self, snapshot: RegistrySnapshot, source: str) -> bool:
+        if snapshot.etag == self.current.etag:
+            return False
+        previous, self.current = self.current, snapshot
+        logger.info(
+            f"Registry {previous.version} {previous.etag} -> {snapshot.version} {snapshot.etag} "
+            f"({len(snapshot.index)} facilities, from {source})"
+        )
+        return True
+
+    async def reload(self) -> bool:
+        """Re-read the file; True if the registry changed"""
+        async with self._lock:
+            snapshot = await asyncio.to_thread(self._read_file)
+            self.reload_error = None
+            return self._swap(snapshot, str(self.path))
+
+    async def replace(self, data: Dict[str, Any]) -> bool:
+        """Validate and install a pushed document, persisting it to the file"""
+        async with self._lock:
+            snapshot = await asyncio.to_thread(
+                RegistrySnapshot, data, self._adapter, *self._cache_limits
+            )
+            if snapshot.etag == self.current.etag:
+                return False
+            await asyncio.to_thread(self._write_file, data)
+            return self._swap(snapshot, "admin push")
+
+    async def _watch(self) -> None:
+        while True:
+            await asyncio.sleep(self._watch_interval)
+            if self._file_stat() in (self._stat, None):
+                continue
+            try:
+                await self.reload()
+            except Exception as e:
+                # Keep serving the current snapshot; retry when the file changes again
+                self._stat = self._file_stat()
+                self.reload_error = str(e)
+                logger.error(f"Registry reload from {self.path} failed: {e}")
+
+    def start(self) -> None:
+        if self._watch_interval > 0 and self._watcher is None:
+            self._watcher = asyncio.create_task(self._watch())
+
+    async def stop(self) -> None:
+        if self._watcher is not None:
+            self._watcher.cancel()
+            self._watcher = None
+
+
+class SnapshotMiddleware:
+    """Pin each request to the current snapshot (``request.state.snapshot``,
+    read from ``app.state.registry``) and serve GETs through its response
+    cache, so bodies, ETag and X-Registry-Version always describe one version
+    """
+
+    def __init__(self, app, cache_control: str = "public, max-age=300",
+                 skip_prefixes: Tuple[str, ...] = (
+                     "/admin", "/health", "/docs", "/openapi.json", "/redoc",
+                 )) -> None:
+        self.app = app
+        self._cache_control = cache_control.encode()
+        self._skip_prefixes = skip_prefixes
+        # id(route) -> names of the query parameters its endpoint reads
+        self._route_params: Dict[int, Optional[FrozenSet[str]]] = {}
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        snapshot: RegistrySnapshot = scope["app"].state.registry.current
+        scope.setdefault("state", {})["snapshot"] = snapshot
+        if scope["method"] != "GET" or scope["path"].startswith(self._skip_prefixes):
+            await self.app(scope, receive, send)
+            return
+
+        if_none_match = accept_encoding = ""
+        for name, value in scope["headers"]:
+            if name == b"if-none-match":
+                if_none_match = value.decode("latin-1")
+            elif name == b"accept-encoding":
+                accept_encoding = value.decode("latin-1")
+        encoding = accepted_encoding(accept_encoding)
+
+        key = cache_key(scope["path"], scope["query_string"], self._query_params(scope))
+        entry = snapshot.responses.get(key)
+        if entry is not None:
+            # Answered without routing; tell the metrics which route this is
+            scope["route"] = entry.route
+
+        if entry is None:
+            start, body = await self._capture(scope, receive)
+            if start["status"] != 200:
+                # Errors are not cached; pass them through untouched
+                await send(start)
+                await send({"type": "http.response.body", "body": body})
+                return
+            media_type = dict(start.get("headers", [])).get(b"content-type", b"application/json")
+            entry = CachedResponse(media_type, body, scope.get("route"))
+            snapshot.responses.put(key, entry)
+
+        # Only for a response known to be a 200 of this snapshot
+        if if_none_match and etag_matches(if_none_match, snapshot.etag):
+            await send({"type": "http.response.start", "status": 304,
+                        "headers": self._headers(snapshot, encoding)})
+            await send({"type": "http.response.body", "body": b""})
+            return
+
+        if entry.compresses(encoding) and len(entry.identity) > 1 << 18:
+            # First request in this encoding for a large body: compress off the loop
+            encoding, body = await asyncio.to_thread(entry.body, encoding)
+        else:
+            encoding, body = entry.body(encoding)
+        headers = self._headers(snapshot, encoding) + [
+            (b"content-type", entry.media_type),
+            (b"content-length", str(len(body)).encode()),
+        ]
+        if encoding != "identity":
+            headers.append((b"content-encoding", encoding.encode()))
+        await send({"type": "http.response.start", "status": 200, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+    def _query_params(self, scope) -> Optional[FrozenSet[str]]:
+        """Query parameters the endpoint for this request reads (None: not known,
+        keep them all); the rest cannot change the response"""
+        for route in scope["app"].router.routes:
+            match, _ = route.matches(scope)
+            if match == Match.FULL:
+                break
+        else:
+            return None
+        if id(route) not in self._route_params:
+            dependant = getattr(route, "dependant", None)
+            self._route_params[id(route)] = None if dependant is None else frozenset(
+                param.alias for param in get_flat_dependant(dependant).query_params
+            )
+        return self._route_params[id(route)]
+
+    def _headers(self, snapshot: RegistrySnapshot, encoding: str) -> List[Tuple[bytes, bytes]]:
+        return [
+            (b"etag", variant_etag(snapshot.etag, encoding).encode()),
+            (b"x-registry-version", snapshot.version.encode()),
+            (b"cache-control", self._cache_control),
+            (b"vary", b"Accept-Encoding"),
+        ]
+
+    async def _capture(self, scope, receive) -> Tuple[Dict[str, Any], bytes]:
+        start: Dict[str, Any] = {}
+        chunks: List[bytes] = []
+
+        async def capture(message) -> None:
+            if message["type"] == "http.response.start":
+                start.update(message)
+            elif message["type"] == "http.response.body":
+                chunks.append(message.get("body", b""))
+
+        await self.app(scope, receive, capture)
+        return start, b"".join(chunks)
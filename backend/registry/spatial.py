@@ -0,0 +1,149 @@
+"""
+Spatial index over registry facilities.
+
+Coordinates are projected onto the unit sphere, where straight-line (chord)
+distance grows monotonically with great-circle distance, so an ordinary 3-D
+k-d tree answers k-nearest and radius queries exactly. Distances returned
+to callers are great-circle kilometres.
+"""
+
+from math import asin, cos, pi, radians, sin, sqrt
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+import heapq
+
+EARTH_RADIUS_KM = 6371.0088
+
+# Below this many candidates a linear scan beats walking the tree
+BRUTE_FORCE_LIMIT = 64
+
+Point = Tuple[float, float, float]
+
+
+def to_point(latitude: float, longitude: float) -> Point:
+    lat, lon = radians(latitude), radians(longitude)
+    return (cos(lat) * cos(lon), cos(lat) * sin(lon), sin(lat))
+
+
+def chord_to_km(chord_sq: float) -> float:
+    return 2 * EARTH_RADIUS_KM * asin(min(1.0, sqrt(chord_sq) / 2))
+
+
+def km_to_chord_sq(km: float) -> float:
+    return (2 * sin(min(km / EARTH_RADIUS_KM, pi) / 2)) ** 2
+
+
+def _dist_sq(a: Point, b: Point) -> float:
+    return (a[0] - b[0]) ** 2 + (a[1] - b[1]) ** 2 + (a[2] - b[2]) ** 2
+
+
+class _Node:
+    __slots__ = ("pos", "point", "axis", "left", "right")
+
+    def __init__(self, pos: int, point: Point, axis: int,
+                 left: Optional["_Node"], right: Optional["_Node"]) -> None:
+        self.pos = pos
+        self.point = point
+        self.axis = axis
+        self.left = left
+        self.right = right
+
+
+class SpatialIndex:
+    """k-d tree over facility positions that have latitude/longitude"""
+
+    def __init__(self, coordinates: Sequence[Tuple[Optional[float], Optional[float]]]) -> None:
+        # (latitude, longitude) of each facility, by position, as validated floats
+        self._points: Dict[int, Point] = {
+            pos: to_point(latitude, longitude)
+            for pos, (latitude, longitude) in enumerate(coordinates)
+            if latitude is not None and longitude is not None
+        }
+        self._root = self._build(list(self._points.items()), 0)
+
+    def __len__(self) -> int:
+        return len(self._points)
+
+    def _build(self, items: List[Tuple[int, Point]], depth: int) -> Optional[_Node]:
+        if not items:
+            return None
+        axis = depth % 3
+        items.sort(key=lambda item: item[1][axis])
+        mid = len(items) // 2
+        pos, point = items[mid]
+        return _Node(
+            pos, point, axis,
+            self._build(items[:mid], depth + 1),
+            self._build(items[mid + 1:], depth + 1),
+        )
+
+    def nearest(self, latitude: float, longitude: float, k: int = 5,
+                allowed: Optional[Iterable[int]] = None,
+                max_km: Optional[float] = None) -> List[Tuple[int, float]]:
+        """Up to k (position, km) pairs closest to the point, nearest first.
+
+        ``allowed`` restricts results to those facility positions (e.g. the
+        output of a capability filter).
+        """
+        target = to_point(latitude, longitude)
+        limit = km_to_chord_sq(max_km) if max_km is not None else float("inf")
+
+        if allowed is not None:
+            allowed = set(allowed)
+            if len(allowed) <= BRUTE_FORCE_LIMIT:
+                scored = [
+                    (_dist_sq(target, self._points[pos]), pos)
+                    for pos in allowed if pos in self._points
+                ]
+                best = heapq.nsmallest(k, (s for s in scored if s[0] <= limit))
+                return [(pos, chord_to_km(d)) for d, pos in best]
+        accept: Callable[[int], bool] = (
+            allowed.__contains__ if allowed is not None else (lambda pos: True)
+        )
+
+        # Max-heap of the k best so far, as (-dist_sq, pos)
+        heap: List[Tuple[float, int]] = []
+
+        def visit(node: Optional[_Node]) -> None:
+            if node is None:
+                return
+            d = _dist_sq(target, node.point)
+            if d <= limit and accept(node.pos):
+                if len(heap) < k:
+                    heapq.heappush(heap, (-d, node.pos))
+                elif d < -heap[0][0]:
+                    heapq.heapreplace(heap, (-d, node.pos))
+            diff = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            visit(near)
+            bound = -heap[0][0] if len(heap) == k else limit
+            if diff * diff <= bound:
+                visit(far)
+
+        if k > 0:
+            visit(self._root)
+        return [(pos, chord_to_km(-d)) for d, pos in sorted(heap, reverse=True)]
+
+    def within(self, latitude: float, longitude: float, radius_km: float,
+               allowed: Optional[Iterable[int]] = None) -> List[Tuple[int, float]]:
+        """All (position, km) pairs within radius_km, nearest first"""
+        target = to_point(latitude, longitude)
+        limit = km_to_chord_sq(radius_km)
+        allowed = set(allowed) if allowed is not None else None
+        found: List[Tuple[float, int]] = []
+
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if node is None:
+                continue
+            d = _dist_sq(target, node.point)
+            if d <= limit and (allowed is None or node.pos in allowed):
+                found.append((d, node.pos))
+            diff = target[node.axis] - node.point[node.axis]
+            near, far = (node.left, node.right) if diff < 0 else (node.right, node.left)
+            stack.append(near)
+            if diff * diff <= limit:
+                stack.append(far)
+
+        found.sort()
+        return [(pos, chord_to_km(d)) for d, pos in found]
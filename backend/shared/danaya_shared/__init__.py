@@ -0,0 +1,7 @@
+"""
+Code shared by the DANAYA backend services.
+
+Services import it as ``danaya_shared``; the Dockerfiles copy ``backend/shared``
+into the image and put it on PYTHONPATH (for local runs:
+``PYTHONPATH=../shared``).
+"""
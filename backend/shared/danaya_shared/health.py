@@ -0,0 +1,146 @@
+"""
+Liveness and readiness checks for the DANAYA services.
+
+``/health/live`` answers as long as the worker's event loop does; it checks
+nothing else, so a restart is only triggered by a wedged process.
+
+``/health/ready`` runs every registered dependency probe (a database, Redis,
+another service) concurrently, each with a timeout, and reports per
+dependency its status and latency, plus the process's startup time. It
+answers 503 until startup has finished and while a critical dependency is
+failing; a failing non-critical one makes the service ``degraded`` but still
+ready. Results are cached for ``ttl`` seconds and concurrent callers share
+one round of probes, so Docker, nginx and monitoring can poll as often as
+they like at the cost of one probe per dependency per ``ttl``.
+"""
+
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple, Union
+import asyncio
+import inspect
+import os
+import time
+
+from fastapi import APIRouter, Response
+
+# A probe raises if the dependency is unusable; it may return details to report
+Probe = Callable[[], Union[Optional[Dict[str, Any]], Awaitable[Optional[Dict[str, Any]]]]]
+
+
+def _iso(timestamp: float) -> str:
+    return datetime.fromtimestamp(timestamp, timezone.utc).isoformat(timespec="seconds")
+
+
+class HealthChecks:
+    def __init__(self, service: str, version: str, ttl: float = 5.0, timeout: float = 1.0) -> None:
+        self.service = service
+        self.version = version
+        self._ttl = ttl
+        self._timeout = timeout
+        self._probes: List[Tuple[str, Probe, bool]] = []
+        # Measured from when the app module was imported
+        self._created = time.monotonic()
+        self.started_at: Optional[float] = None
+        self.startup_seconds: Optional[float] = None
+        self._report: Optional[Dict[str, Any]] = None
+        self._checked_at = 0.0
+        self._running: Optional["asyncio.Task[None]"] = None
+        self._stopped = False
+
+    @classmethod
+    def from_env(cls, service: str, version: str) -> "HealthChecks":
+        return cls(
+            service,
+            version,
+            ttl=float(os.getenv("HEALTH_CHECK_TTL", "5")),
+            timeout=float(os.getenv("HEALTH_PROBE_TIMEOUT", "1")),
+        )
+
+    def add(self, name: str, probe: Probe, critical: bool = True) -> None:
+        self._probes.append((name, probe, critical))
+
+    def started(self) -> None:
+        """Call at the end of startup; the service is not ready before"""
+        self.started_at = time.time()
+        self.startup_seconds = round(time.monotonic() - self._created, 3)
+
+    def stopped(self) -> None:
+        """Call at shutdown; drops the probes (they use closed clients)"""
+        self._probes.clear()
+        self._report = None
+        self.started_at = None
+        self._stopped = True
+
+    def live(self) -> Dict[str, Any]:
+        return {
+            "status": "ok",
+            "service": self.service,
+            "uptime_seconds": round(time.monotonic() - self._created, 1),
+        }
+
+    async def _probe(self, name: str, probe: Probe, critical: bool) -> Tuple[str, Dict[str, Any]]:
+        started = time.perf_counter()
+        result: Dict[str, Any] = {"status": "ok", "critical": critical}
+        try:
+            detail = probe()
+            if inspect.isawaitable(detail):
+                detail = await asyncio.wait_for(detail, self._timeout)
+            result.update(detail or {})
+        except asyncio.TimeoutError:
+            result.update(status="fail", error=f"timed out after {self._timeout}s")
+        except Exception as e:
+            result.update(status="fail", error=str(e) or type(e).__name__)
+        result["latency_ms"] = round((time.perf_counter() - started) * 1000, 2)
+        return name, result
+
+    async def _check(self) -> None:
+        results = dict(await asyncio.gather(*(self._probe(*probe) for probe in self._probes)))
+        failed = [result for result in results.values() if result["status"] != "ok"]
+        if any(result["critical"] for result in failed):
+            status = "fail"
+        else:
+            status = "degraded" if failed else "ok"
+        self._checked_at = time.monotonic()
+        self._report = {"status": status, "checked_at": _iso(time.time()), "checks": results}
+
+    async def ready(self) -> Tuple[bool, Dict[str, Any]]:
+        """(ready, report); probes run at most once per ttl"""
+        report: Dict[str, Any] = {
+            "service": self.service,
+            "version": self.version,
+            "uptime_seconds": round(time.monotonic() - self._created, 1),
+        }
+        if self.started_at is None:
+            return False, {"status": "stopping" if self._stopped else "starting", **report}
+
+        if self._report is None or time.monotonic() - self._checked_at >= self._ttl:
+            if self._running is None:
+                self._running = asyncio.create_task(self._check())
+                self._running.add_done_callback(lambda _: setattr(self, "_running", None))
+            # Shielded: a caller that gives up does not cancel the round for the others
+            await asyncio.shield(self._running)
+        report.update(
+            started_at=_iso(self.started_at),
+            startup_seconds=self.startup_seconds,
+            **self._report,
+        )
+        return report["status"] != "fail", report
+
+    def router(self) -> APIRouter:
+        """``GET /health/live`` and ``GET /health/ready``"""
+        router = APIRouter(tags=["health"])
+
+        @router.get("/health/live")
+        async def liveness(response: Response):
+            response.headers["Cache-Control"] = "no-store"
+            return self.live()
+
+        @router.get("/health/ready")
+        async def readiness(response: Response):
+            ready, report = await self.ready()
+            response.headers["Cache-Control"] = "no-store"
+            if not ready:
+                response.status_code = 503
+            return report
+
+        return router
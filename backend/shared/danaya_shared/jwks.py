@@ -0,0 +1,111 @@
+"""
+Local verification of auth-service tokens against its published JWKS.
+
+auth-service signs with RS256 and publishes the public keys at
+``/.well-known/jwks.json``. KeySet caches them (refreshed in the background
+and, rate-limited, whenever a token names an unknown ``kid`` after a key
+rotation), so services verify tokens without calling auth-service.
+"""
+
+from typing import Any, Dict, Iterable, Optional
+import asyncio
+import logging
+import time
+
+import httpx
+from jose import jwk, jwt
+from jose.exceptions import JWTError
+
+from .logs import forward_request_id
+from .revocation import RevocationList
+from .tokens import InvalidToken, TokenVerifier, UnknownKey
+
+logger = logging.getLogger(__name__)
+
+
+class KeySet:
+    """Cached public keys by kid, loaded from a JWKS URL"""
+
+    def __init__(self, url: str, refresh_interval: float = 300.0,
+                 min_refresh_gap: float = 10.0, timeout: float = 2.0) -> None:
+        self.url = url
+        self._refresh_interval = refresh_interval
+        self._min_gap = min_refresh_gap
+        self._timeout = timeout
+        self._keys: Dict[str, Any] = {}
+        self._fetched_at = 0.0
+        self._lock = asyncio.Lock()
+        self._client: Optional[httpx.AsyncClient] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def get(self, kid: str) -> Optional[Any]:
+        return self._keys.get(kid)
+
+    def load(self, jwks: Dict[str, Any]) -> None:
+        keys = {}
+        for data in jwks.get("keys", []):
+            if data.get("kid") and data.get("kty") == "RSA":
+                keys[data["kid"]] = jwk.construct(data, data.get("alg", "RS256"))
+        self._keys = keys
+        self._fetched_at = time.monotonic()
+
+    async def refresh(self, force: bool = False) -> bool:
+        """Re-fetch the JWKS; at most once per min_refresh_gap. True if fetched"""
+        async with self._lock:
+            age = time.monotonic() - self._fetched_at
+            if age < self._min_gap or (not force and age < self._refresh_interval):
+                return False
+            # Failed attempts count too: while auth-service is down, or for a
+            # token with a kid nobody published, requests do not queue up
+            # behind one fetch after another
+            self._fetched_at = time.monotonic()
+            if self._client is None:
+                self._client = httpx.AsyncClient(
+                    timeout=self._timeout, event_hooks={"request": [forward_request_id]}
+                )
+            try:
+                response = await self._client.get(self.url)
+                response.raise_for_status()
+                self.load(response.json())
+                return True
+            except Exception as e:
+                logger.warning(f"Could not refresh signing keys from {self.url}: {e}")
+                return False
+
+    async def start(self) -> None:
+        await self.refresh(force=True)
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self._refresh_interval)
+            await self.refresh()
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+        if self._client is not None:
+            await self._client.aclose()
+
+
+class JWKSTokenVerifier(TokenVerifier):
+    """TokenVerifier that picks the verification key by the token's kid"""
+
+    def __init__(self, keys, algorithms: Iterable[str] = ("RS256",),
+                 revocations: Optional[RevocationList] = None, **kwargs) -> None:
+        super().__init__(None, algorithms, revocations=revocations, **kwargs)
+        # Anything with get(kid) -> key: a KeySet, or auth-service's own SigningKeys
+        self.keys = keys
+
+    def key_for(self, token: str) -> Any:
+        try:
+            kid = jwt.get_unverified_header(token).get("kid")
+        except JWTError as exc:
+            raise InvalidToken("Could not validate credentials") from exc
+        key = self.keys.get(kid) if kid else None
+        if key is None:
+            raise UnknownKey(f"Unknown signing key '{kid}'")
+        return key
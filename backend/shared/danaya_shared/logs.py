@@ -0,0 +1,276 @@
+"""
+Structured, non-blocking logging for the DANAYA services.
+
+``setup_logging(service)`` points the root logger at a bounded in-memory
+queue. A QueueHandler on the event loop only copies the record into the
+queue; a background thread formats it as one JSON object per line and writes
+it to stdout, so a slow log driver never stalls a request. When the queue is
+full the record is dropped and counted (``dropped()``) rather than waiting.
+
+Records carry fields as ``extra``:
+
+    logger.info("Patient created", extra={"event": "patient.create", "patient_id": pid})
+
+``event`` names a kind of record. High-volume events can be sampled with
+LOG_SAMPLE (``event=rate`` pairs, e.g. ``http.request=0.01,auth.login=0.1``);
+warnings and errors are always kept, and a sampled record shows its
+``sample_rate``.
+
+Every request gets a correlation id: the incoming ``X-Request-ID`` (nginx
+sets one) or a new one. It is added to every record logged while serving the
+request, echoed in the response and forwarded on outgoing httpx calls that
+use ``forward_request_id``.
+
+PII never reaches the output: fields named in PII_FIELDS are masked (emails
+keep their first letter and domain) and email addresses are masked in
+messages and other strings.
+"""
+
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any, Dict, Optional
+import atexit
+import copy
+import json
+import logging
+import os
+import queue
+import random
+import re
+import sys
+import time
+import uuid
+
+REQUEST_ID: ContextVar[Optional[str]] = ContextVar("request_id", default=None)
+
+PII_FIELDS = frozenset({
+    "email", "username", "password", "first_name", "last_name", "date_of_birth",
+    "phone", "address", "national_id",
+})
+EMAIL_FIELDS = frozenset({"email", "username"})
+EMAIL = re.compile(
+    r"\b([A-Za-z0-9._%+-])[A-Za-z0-9._%+-]*@([A-Za-z0-9-]+(?:\.[A-Za-z0-9-]+)*\.[A-Za-z]{2,})\b"
+)
+
+DEFAULT_SAMPLE = "http.request=0.01"
+# Libraries that log every request they make at INFO
+QUIET_LOGGERS = ("httpx", "httpcore")
+# Not worth an access log record
+UNLOGGED_PATHS = ("/health", "/health/live", "/health/ready", "/metrics")
+
+# Accepted as a correlation id as is; anything else is replaced
+_REQUEST_ID = re.compile(r"[A-Za-z0-9._:-]{1,128}")
+# Attributes every LogRecord has; the rest came in through ``extra``
+_RECORD_FIELDS = (
+    frozenset(logging.makeLogRecord({}).__dict__) | {"message", "request_id", "sample_rate"}
+)
+
+logger = logging.getLogger(__name__)
+
+_listener: Optional[QueueListener] = None
+_handler: Optional["_LogQueueHandler"] = None
+
+
+def mask_email(text: str) -> str:
+    return EMAIL.sub(r"\1***@\2", text)
+
+
+def redact(value: Any, key: Optional[str] = None) -> Any:
+    """value with PII masked, recursing into dicts and lists"""
+    if key in PII_FIELDS and value is not None:
+        if key in EMAIL_FIELDS and isinstance(value, str) and "@" in value:
+            return mask_email(value)
+        return "[redacted]"
+    if isinstance(value, str):
+        return mask_email(value) if "@" in value else value
+    if isinstance(value, dict):
+        return {k: redact(v, k) for k, v in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [redact(v, key) for v in value]
+    return value
+
+
+def parse_rates(spec: str) -> Dict[str, float]:
+    """``event=rate,...`` -> {event: rate}"""
+    rates = {}
+    for item in spec.split(","):
+        event, sep, rate = item.strip().partition("=")
+        if not sep:
+            if event:
+                raise ValueError(f"Invalid LOG_SAMPLE entry {item!r}; expected event=rate")
+            continue
+        rates[event.strip()] = min(1.0, max(0.0, float(rate)))
+    return rates
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per record, PII masked"""
+
+    def __init__(self, service: str) -> None:
+        super().__init__()
+        self.service = service
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry: Dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(
+                timespec="milliseconds"
+            ),
+            "level": record.levelname.lower(),
+            "service": self.service,
+            "logger": record.name,
+            "msg": mask_email(record.getMessage()),
+        }
+        request_id = getattr(record, "request_id", None)
+        if request_id:
+            entry["request_id"] = request_id
+        for key, value in record.__dict__.items():
+            if key not in _RECORD_FIELDS:
+                entry[key] = redact(value, key)
+        rate = getattr(record, "sample_rate", None)
+        if rate is not None:
+            entry["sample_rate"] = rate
+        if record.exc_info:
+            record.exc_text = record.exc_text or self.formatException(record.exc_info)
+        if record.exc_text:
+            entry["exc"] = mask_email(record.exc_text)
+        return json.dumps(entry, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+class Sampler(logging.Filter):
+    """Keep a rates[event] share of the records of each sampled event"""
+
+    def __init__(self, rates: Dict[str, float]) -> None:
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "event", None))
+        if rate is None or rate >= 1.0:
+            return True
+        if random.random() >= rate:
+            return False
+        record.sample_rate = rate
+        return True
+
+
+class _LogQueueHandler(QueueHandler):
+    """Enqueue without blocking; the formatting is left to the listener thread"""
+
+    def __init__(self, log_queue: "queue.Queue[logging.LogRecord]") -> None:
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Resolve what depends on this thread and this moment: the message
+        # arguments (they may change later), the traceback and the request id
+        record = copy.copy(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        record.request_id = REQUEST_ID.get()
+        return record
+
+    def enqueue(self, record: logging.LogRecord) -> None:
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+def setup_logging(service: str) -> None:
+    """Send this process's logs through the JSON queue (once per process)"""
+    global _listener, _handler
+    if _listener is not None:
+        return
+    output = logging.StreamHandler(sys.stdout)
+    output.setFormatter(JsonFormatter(service))
+    log_queue: "queue.Queue[logging.LogRecord]" = queue.Queue(
+        int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+    )
+    _handler = _LogQueueHandler(log_queue)
+    _handler.addFilter(Sampler(parse_rates(os.getenv("LOG_SAMPLE", DEFAULT_SAMPLE))))
+
+    # Skip what the JSON lines never show (see "Optimization" in the logging
+    # docs): the caller's file and line is a stack walk per record
+    logging._srcfile = None
+    logging.logThreads = False
+    logging.logProcesses = False
+    logging.logMultiprocessing = False
+
+    root = logging.getLogger()
+    root.handlers[:] = [_handler]
+    root.setLevel(os.getenv("LOG_LEVEL", "info").upper())
+    for name in QUIET_LOGGERS:
+        logging.getLogger(name).setLevel(logging.WARNING)
+
+    _listener = QueueListener(log_queue, output)
+    _listener.start()
+    # Flushes what is still queued
+    atexit.register(_listener.stop)
+
+
+def dropped() -> int:
+    """Records dropped because the queue was full"""
+    return _handler.dropped if _handler is not None else 0
+
+
+async def forward_request_id(request) -> None:
+    """httpx request hook: pass the current request id on"""
+    request_id = REQUEST_ID.get()
+    if request_id and "x-request-id" not in request.headers:
+        request.headers["X-Request-ID"] = request_id
+
+
+class RequestContextMiddleware:
+    """Set the request id for the request and log it as an ``http.request``
+    event; add it last (outermost)"""
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        request_id = None
+        for name, value in scope["headers"]:
+            if name == b"x-request-id":
+                request_id = value.decode("latin-1")
+                break
+        if request_id is None or not _REQUEST_ID.fullmatch(request_id):
+            request_id = uuid.uuid4().hex
+        header = (b"x-request-id", request_id.encode())
+        status = 500
+
+        async def send_with_id(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                message = {**message, "headers": [*message.get("headers", ()), header]}
+            await send(message)
+
+        token = REQUEST_ID.set(request_id)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            if scope["path"] not in UNLOGGED_PATHS:
+                route = scope.get("route")
+                logger.log(
+                    logging.WARNING if status >= 500 else logging.INFO,
+                    "%s %s %s", scope["method"], scope["path"], status,
+                    extra={
+                        "event": "http.request",
+                        "method": scope["method"],
+                        "route": getattr(route, "path", None),
+                        "status": status,
+                        "duration_ms": round((time.perf_counter() - started) * 1000, 2),
+                    },
+                )
+            REQUEST_ID.reset(token)
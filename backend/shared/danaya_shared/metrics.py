@@ -0,0 +1,224 @@
+"""
+Prometheus metrics for the DANAYA services.
+
+MetricsMiddleware times every request into a per-route latency histogram
+(labelled with the route template, e.g. ``/patients/{patient_id}``, so label
+cardinality stays bounded), tracks requests in progress and answers
+``GET /metrics`` itself, ahead of authentication.
+
+Hot paths do not touch Prometheus for cache lookups: caches keep their own
+plain ``hits`` / ``misses`` integers and a MetricsPublisher copies them (as
+counter increments) and store sizes (as gauges) into the metrics every
+``interval`` seconds and on every scrape.
+
+Under gunicorn each worker is a separate process; with
+PROMETHEUS_MULTIPROC_DIR set (shared/gunicorn_conf.py does this) workers
+write their samples to files there and a scrape of any worker reports the
+sum over all of them.
+"""
+
+from typing import Any, Awaitable, Callable, List, Optional, Tuple, Union
+import asyncio
+import inspect
+import logging
+import os
+import time
+
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Gauge,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+logger = logging.getLogger(__name__)
+
+# Seconds; from cached lookups (sub-millisecond) to slow password hashes
+LATENCY_BUCKETS = (
+    0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0,
+)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds",
+    "Request latency by route template",
+    ["method", "route", "status"],
+    buckets=LATENCY_BUCKETS,
+)
+IN_PROGRESS = Gauge(
+    "http_requests_in_progress",
+    "Requests being served",
+    multiprocess_mode="livesum",
+)
+CACHE_REQUESTS = Counter(
+    "cache_requests_total",
+    "Cache lookups by cache and result (hit or miss)",
+    ["cache", "result"],
+)
+CACHE_ENTRIES = Gauge(
+    "cache_entries",
+    "Entries held by a cache, summed over workers",
+    ["cache"],
+    multiprocess_mode="livesum",
+)
+LOG_RECORDS_DROPPED = Counter(
+    "log_records_dropped_total",
+    "Log records dropped because the log queue was full",
+)
+STORE_RECORDS = Gauge(
+    "store_records",
+    "Records in a store (users, patients, facilities)",
+    ["store"],
+    multiprocess_mode="livemax",
+)
+
+# Paths that are not worth a histogram series of their own
+UNTIMED_PATHS = ("/metrics",)
+
+Source = Callable[[], Union[float, Awaitable[float]]]
+
+
+def timer() -> Callable[[], float]:
+    """Start a clock; calling the result gives the seconds elapsed"""
+    started = time.perf_counter()
+    return lambda: time.perf_counter() - started
+
+
+class MetricsPublisher:
+    """Copies in-process counters and sizes into Prometheus metrics"""
+
+    def __init__(self, interval: float = 15.0) -> None:
+        self._interval = interval
+        self._counters: List[List[Any]] = []  # [counter, source, last published]
+        self._gauges: List[Tuple[Gauge, Source]] = []
+        self._task: Optional["asyncio.Task[None]"] = None
+
+    def count(self, counter: Counter, source: Source) -> None:
+        """Publish source(), a running total, as increments of counter"""
+        self._counters.append([counter, source, 0.0])
+
+    def cache(self, name: str, hits: Callable[[], int], misses: Callable[[], int],
+              entries: Optional[Callable[[], int]] = None) -> None:
+        self.count(CACHE_REQUESTS.labels(name, "hit"), hits)
+        self.count(CACHE_REQUESTS.labels(name, "miss"), misses)
+        if entries is not None:
+            self.gauge(CACHE_ENTRIES.labels(name), entries)
+
+    def gauge(self, gauge: Gauge, source: Source) -> None:
+        self._gauges.append((gauge, source))
+
+    def store(self, name: str, source: Source) -> None:
+        self.gauge(STORE_RECORDS.labels(name), source)
+
+    def clear(self) -> None:
+        self._counters.clear()
+        self._gauges.clear()
+
+    @staticmethod
+    async def _read(source: Source) -> float:
+        value = source()
+        if inspect.isawaitable(value):
+            value = await value
+        return float(value)
+
+    async def publish(self) -> None:
+        for entry in self._counters:
+            counter, source, last = entry
+            try:
+                total = await self._read(source)
+            except Exception as e:
+                logger.warning(f"Metrics source failed: {e}")
+                continue
+            # A replaced object (e.g. a reloaded cache) starts again from 0
+            if total > last:
+                counter.inc(total - last)
+            entry[2] = total
+        for gauge, source in self._gauges:
+            try:
+                gauge.set(await self._read(source))
+            except Exception as e:
+                logger.warning(f"Metrics source failed: {e}")
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self._interval)
+            await self.publish()
+
+    async def start(self) -> None:
+        if self._interval > 0 and self._task is None:
+            await self.publish()
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.clear()
+
+
+def render() -> bytes:
+    """Exposition text for every worker (multiprocess) or this process"""
+    if os.getenv("PROMETHEUS_MULTIPROC_DIR"):
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        return generate_latest(registry)
+    return generate_latest(REGISTRY)
+
+
+class MetricsMiddleware:
+    """Time requests and serve ``GET /metrics``; add it last (outermost)"""
+
+    def __init__(self, app, publisher: Optional[MetricsPublisher] = None,
+                 path: str = "/metrics") -> None:
+        self.app = app
+        self.publisher = publisher
+        self.path = path
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if scope["path"] == self.path and scope["method"] == "GET":
+            await self._serve(send)
+            return
+        if scope["path"] in UNTIMED_PATHS:
+            await self.app(scope, receive, send)
+            return
+
+        status = 500
+
+        async def send_status(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        IN_PROGRESS.inc()
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_status)
+        finally:
+            elapsed = time.perf_counter() - started
+            IN_PROGRESS.dec()
+            # The router leaves the matched route in the scope
+            route = scope.get("route")
+            template = getattr(route, "path", None) or "<unmatched>"
+            REQUEST_LATENCY.labels(scope["method"], template, str(status)).observe(elapsed)
+
+    async def _serve(self, send) -> None:
+        if self.publisher is not None:
+            await self.publisher.publish()
+        body = await asyncio.to_thread(render)
+        await send({
+            "type": "http.response.start",
+            "status": 200,
+            "headers": [
+                (b"content-type", CONTENT_TYPE_LATEST.encode()),
+                (b"content-length", str(len(body)).encode()),
+                (b"cache-control", b"no-store"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,78 @@
+"""
+ASGI middleware that authenticates every request with a local token check.
+
+Verified claims are put on ``request.state.claims``. Requests signed with a
+key the service has not seen yet trigger one (rate-limited) JWKS refresh
+before being rejected, so key rotation needs no restart.
+"""
+
+from typing import Iterable, Optional
+import json
+
+from .jwks import KeySet
+from .tokens import ExpiredToken, RevokedToken, TokenError, TokenVerifier, UnknownKey
+
+PUBLIC_PATHS = (
+    "/", "/health", "/health/live", "/health/ready",
+    "/docs", "/docs/oauth2-redirect", "/redoc", "/openapi.json",
+)
+
+
+class TokenAuthMiddleware:
+    def __init__(self, app, verifier: TokenVerifier, keys: Optional[KeySet] = None,
+                 public_paths: Iterable[str] = PUBLIC_PATHS, enabled: bool = True) -> None:
+        self.app = app
+        self.verifier = verifier
+        self.keys = keys
+        self.public_paths = frozenset(public_paths)
+        self.enabled = enabled
+
+    async def __call__(self, scope, receive, send):
+        if (
+            not self.enabled
+            or scope["type"] != "http"
+            or scope["method"] == "OPTIONS"
+            or scope["path"] in self.public_paths
+        ):
+            return await self.app(scope, receive, send)
+
+        token = None
+        for name, value in scope["headers"]:
+            if name == b"authorization":
+                scheme, _, credentials = value.decode("latin-1").partition(" ")
+                if scheme.lower() == "bearer" and credentials:
+                    token = credentials
+                break
+        if token is None:
+            return await self._reject(send, "Not authenticated")
+
+        try:
+            try:
+                claims = self.verifier.verify(token)
+            except UnknownKey:
+                if self.keys is None or not await self.keys.refresh(force=True):
+                    raise
+                claims = self.verifier.verify(token)
+        except ExpiredToken:
+            return await self._reject(send, "Token has expired")
+        except RevokedToken:
+            return await self._reject(send, "Token has been revoked")
+        except TokenError:
+            return await self._reject(send, "Could not validate credentials")
+
+        scope.setdefault("state", {})["claims"] = claims
+        return await self.app(scope, receive, send)
+
+    @staticmethod
+    async def _reject(send, detail: str) -> None:
+        body = json.dumps({"detail": detail}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 401,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"www-authenticate", b"Bearer"),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
@@ -0,0 +1,73 @@
+"""
+Fast JSON responses for the DANAYA services.
+
+FastAPI validates whatever an endpoint returns against its ``response_model``
+and then encodes it again (``jsonable_encoder``, then the stdlib json
+module), even when it is a model the service has just built or read from its
+own store. Returning a Response skips all of that; the route's
+``response_model`` still documents the schema.
+
+- ``dumps()``: JSON bytes with orjson (the stdlib json module without it);
+- ``JSONResponse``: rendered with ``dumps()``, the apps' default response class;
+- ``ModelResponse``: validated Pydantic models (one, or a list of one model)
+  serialized by pydantic-core straight to bytes, without validating them
+  again.
+
+Nothing checks a ModelResponse on the way out, so only hand it models that
+were validated when they were built. It serializes them as ``model`` (their
+own class by default): pass the response_model when the object may carry
+more, e.g. ``ModelResponse(user_in_db, model=User)`` leaves out the password
+hash.
+"""
+
+from functools import lru_cache
+from typing import Any, List, Mapping, Optional, Type
+import json
+
+from pydantic import BaseModel, TypeAdapter
+from starlette.background import BackgroundTask
+from starlette.responses import JSONResponse as StarletteJSONResponse, Response
+
+try:
+    import orjson
+except ImportError:  # stdlib json
+    orjson = None
+
+
+def dumps(content: Any) -> bytes:
+    """Compact JSON, UTF-8"""
+    if orjson is not None:
+        return orjson.dumps(content, option=orjson.OPT_NON_STR_KEYS)
+    return json.dumps(content, ensure_ascii=False, separators=(",", ":")).encode()
+
+
+class JSONResponse(StarletteJSONResponse):
+    def render(self, content: Any) -> bytes:
+        return dumps(content)
+
+
+@lru_cache(maxsize=None)
+def _adapter(annotation: Any) -> TypeAdapter:
+    return TypeAdapter(annotation)
+
+
+class ModelResponse(Response):
+    media_type = "application/json"
+
+    def __init__(
+        self,
+        content: Any,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+        model: Optional[Type[BaseModel]] = None,
+        background: Optional[BackgroundTask] = None,
+    ) -> None:
+        self.model = model
+        super().__init__(content, status_code, headers, background=background)
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, BaseModel):
+            return _adapter(self.model or type(content)).dump_json(content)
+        if not content:
+            return b"[]"
+        return _adapter(List[self.model or type(content[0])]).dump_json(content)
@@ -0,0 +1,128 @@
+"""
+Token revocation list.
+
+auth-service records a revoked token's ``jti`` in Redis (a key that expires
+with the token) and publishes it on a channel. Every service keeps an
+in-process RevocationList fed by that channel, so checking revocation is a
+dict lookup and never a network call. If Redis is unreachable, services keep
+what they already have and reconnect in the background. Expired entries are
+purged every minute, so the list holds only tokens that could still be used.
+"""
+
+from typing import Dict, List, Optional
+import asyncio
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+CHANNEL = "danaya:revocations"
+KEY_PREFIX = "danaya:revoked:"
+
+
+class RevocationList:
+    """jti -> expiry; entries disappear once the token would have expired anyway"""
+
+    def __init__(self) -> None:
+        self._revoked: Dict[str, float] = {}
+
+    def __len__(self) -> int:
+        return len(self._revoked)
+
+    def __contains__(self, jti: object) -> bool:
+        if not jti:
+            return False
+        expires_at = self._revoked.get(jti)  # type: ignore[arg-type]
+        if expires_at is None:
+            return False
+        if expires_at < time.time():
+            del self._revoked[jti]  # type: ignore[arg-type]
+            return False
+        return True
+
+    def add(self, jti: str, expires_at: float) -> None:
+        self._revoked[jti] = expires_at
+
+    def purge(self) -> None:
+        now = time.time()
+        for jti in [j for j, exp in self._revoked.items() if exp < now]:
+            del self._revoked[jti]
+
+
+class RedisRevocations:
+    """Keeps a RevocationList in sync with Redis (load on start + pub/sub)"""
+
+    def __init__(self, url: Optional[str], revocations: RevocationList,
+                 retry_seconds: float = 5.0, purge_seconds: float = 60.0) -> None:
+        self._url = url
+        self.revocations = revocations
+        self._retry = retry_seconds
+        self._purge = purge_seconds
+        self._redis = None
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self) -> None:
+        self._tasks.append(asyncio.create_task(self._purge_expired()))
+        if not self._url:
+            logger.warning("REDIS_URL not set: token revocations stay local to this process")
+            return
+        import redis.asyncio as redis
+
+        self._redis = redis.from_url(self._url, decode_responses=True)
+        self._tasks.append(asyncio.create_task(self._listen()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+        if self._redis is not None:
+            await self._redis.aclose()
+
+    async def ping(self) -> None:
+        """Raise if Redis is unreachable"""
+        if self._redis is not None:
+            await self._redis.ping()
+
+    async def _load(self) -> None:
+        async for key in self._redis.scan_iter(match=f"{KEY_PREFIX}*", count=1000):
+            expires_at = await self._redis.get(key)
+            if expires_at:
+                self.revocations.add(key[len(KEY_PREFIX):], float(expires_at))
+
+    async def _listen(self) -> None:
+        while True:
+            try:
+                async with self._redis.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    # Load after subscribing so nothing published in between is missed
+                    await self._load()
+                    async for message in pubsub.listen():
+                        if message.get("type") != "message":
+                            continue
+                        jti, _, expires_at = message["data"].partition(" ")
+                        self.revocations.add(jti, float(expires_at))
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"Revocation feed unavailable, retrying in {self._retry}s: {e}")
+                await asyncio.sleep(self._retry)
+
+    async def _purge_expired(self) -> None:
+        while True:
+            await asyncio.sleep(self._purge)
+            self.revocations.purge()
+
+    async def revoke(self, jti: str, expires_at: float) -> None:
+        """Revoke locally, then persist and broadcast (best effort)"""
+        self.revocations.add(jti, expires_at)
+        if self._redis is None:
+            return
+        ttl = max(1, int(expires_at - time.time()))
+        try:
+            await self._redis.set(f"{KEY_PREFIX}{jti}", str(expires_at), ex=ttl)
+            await self._redis.publish(CHANNEL, f"{jti} {expires_at}")
+        except Exception as e:
+            logger.error(f"Failed to broadcast revocation of {jti}: {e}")
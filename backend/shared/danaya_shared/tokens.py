@@ -0,0 +1,155 @@
+"""
+JWT verification with a bounded cache of already-verified tokens.
+
+A token is verified (signature + claims) once; afterwards its claims are
+served from an LRU keyed by a digest of the token until the token's own
+``exp``. Raw tokens are never kept in memory. Revoked token IDs (``jti``)
+are checked on every call, cached or not.
+"""
+
+from collections import OrderedDict
+from types import MappingProxyType
+from typing import TYPE_CHECKING, Any, Iterable, Mapping, Optional, Tuple
+import hashlib
+import time
+
+from fastapi import Depends, HTTPException, status
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
+from jose import jwt
+from jose.exceptions import ExpiredSignatureError, JWTError
+
+if TYPE_CHECKING:
+    from .revocation import RevocationList
+
+# Cache lifetime for tokens that carry no exp claim
+DEFAULT_TTL = 300
+
+
+class TokenError(Exception):
+    pass
+
+
+class ExpiredToken(TokenError):
+    pass
+
+
+class InvalidToken(TokenError):
+    pass
+
+
+class RevokedToken(TokenError):
+    pass
+
+
+class UnknownKey(InvalidToken):
+    """Signed with a key id we do not (yet) know; the key set may need a refresh"""
+
+
+class TokenVerifier:
+    def __init__(self, key: Any, algorithms: Iterable[str], max_entries: int = 10_000,
+                 options: Optional[dict] = None,
+                 revocations: Optional["RevocationList"] = None) -> None:
+        self._key = key
+        self._algorithms = list(algorithms)
+        self._options = options
+        self._max_entries = max_entries
+        self.revocations = revocations
+        self._cache: "OrderedDict[bytes, Tuple[Mapping[str, Any], float]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def digest(token: str) -> bytes:
+        return hashlib.blake2b(token.encode(), digest_size=16).digest()
+
+    def __len__(self) -> int:
+        return len(self._cache)
+
+    def key_for(self, token: str) -> Any:
+        """Verification key for token; overridden by key-set based verifiers"""
+        return self._key
+
+    def decode(self, token: str) -> dict:
+        """Full verification, no cache"""
+        key = self.key_for(token)
+        try:
+            return jwt.decode(token, key, algorithms=self._algorithms, options=self._options)
+        except ExpiredSignatureError as exc:
+            raise ExpiredToken("Token has expired") from exc
+        except JWTError as exc:
+            raise InvalidToken("Could not validate credentials") from exc
+
+    def verify(self, token: str) -> Mapping[str, Any]:
+        """Verified, read-only claims for token (cached until it expires)"""
+        digest = self.digest(token)
+        cached = self._cache.get(digest)
+        now = time.time()
+        if cached is not None:
+            claims, expires_at = cached
+            if now < expires_at:
+                self.hits += 1
+                self._cache.move_to_end(digest)
+                self._check_revoked(claims)
+                return claims
+            del self._cache[digest]
+            if "exp" in claims:
+                raise ExpiredToken("Token has expired")
+
+        self.misses += 1
+        claims = MappingProxyType(self.decode(token))
+        exp = claims.get("exp")
+        expires_at = float(exp) if isinstance(exp, (int, float)) else now + DEFAULT_TTL
+        self._cache[digest] = (claims, expires_at)
+        if len(self._cache) > self._max_entries:
+            self._cache.popitem(last=False)
+        self._check_revoked(claims)
+        return claims
+
+    def _check_revoked(self, claims: Mapping[str, Any]) -> None:
+        if self.revocations is not None and claims.get("jti") in self.revocations:
+            raise RevokedToken("Token has been revoked")
+
+    def forget(self, token: str) -> None:
+        self._cache.pop(self.digest(token), None)
+
+    def clear(self) -> None:
+        self._cache.clear()
+
+
+def unauthorized(detail: str = "Could not validate credentials") -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_401_UNAUTHORIZED,
+        detail=detail,
+        headers={"WWW-Authenticate": "Bearer"},
+    )
+
+
+def claims_or_401(verifier: TokenVerifier, token: str) -> Mapping[str, Any]:
+    try:
+        return verifier.verify(token)
+    except ExpiredToken:
+        raise unauthorized("Token has expired")
+    except RevokedToken:
+        raise unauthorized("Token has been revoked")
+    except TokenError:
+        raise unauthorized()
+
+
+def bearer_claims(verifier: TokenVerifier):
+    """FastAPI dependency returning the verified claims of the bearer token.
+
+        require_claims = bearer_claims(TokenVerifier(secret, ["HS256"]))
+
+        @app.get("/patients")
+        async def list_patients(claims = Depends(require_claims)): ...
+    """
+    scheme = HTTPBearer(auto_error=False)
+
+    async def dependency(
+        credentials: Optional[HTTPAuthorizationCredentials] = Depends(scheme),
+    ) -> Mapping[str, Any]:
+        if credentials is None:
+            raise unauthorized("Not authenticated")
+        return claims_or_401(verifier, credentials.credentials)
+
+    return dependency
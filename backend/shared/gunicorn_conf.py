@@ -0,0 +1,67 @@
+"""
+Gunicorn settings shared by the service images.
+
+Gunicorn supervises WEB_CONCURRENCY uvicorn workers, each a separate process
+with its own event loop, so a service uses as many cores as it has workers.
+The app is imported in each worker (no preload): every worker runs its own
+lifespan, and SIGHUP starts fresh workers with the current code and keys
+before the old ones finish their in-flight requests (graceful reload).
+
+    gunicorn -c /app/shared/gunicorn_conf.py --bind 0.0.0.0:8002 src.main:app
+"""
+
+import os
+import shutil
+import tempfile
+
+
+def _cpus() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+workers = int(os.getenv("WEB_CONCURRENCY") or _cpus())
+worker_class = "uvicorn.workers.UvicornWorker"
+
+# Seconds a worker may be silent before it is killed and replaced
+timeout = int(os.getenv("WORKER_TIMEOUT", "60"))
+# Seconds old workers get to finish in-flight requests on reload / shutdown
+graceful_timeout = int(os.getenv("GRACEFUL_TIMEOUT", "30"))
+keepalive = 5
+
+# Recycle each worker after this many requests (0: never); the jitter keeps
+# workers from restarting all at once
+max_requests = int(os.getenv("MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+# Proxies whose X-Forwarded-* headers are believed: comma-separated IPs of
+# the nginx in front ("*": any peer, only where nothing else can connect)
+forwarded_allow_ips = os.getenv("FORWARDED_ALLOW_IPS", "127.0.0.1")
+
+accesslog = os.getenv("ACCESS_LOG") or None
+errorlog = "-"
+loglevel = os.getenv("LOG_LEVEL", "info")
+
+# Workers write their Prometheus samples here so that /metrics on any worker
+# reports all of them (danaya_shared.metrics). One directory per master,
+# emptied at startup and removed on exit.
+metrics_dir = os.environ.setdefault(
+    "PROMETHEUS_MULTIPROC_DIR", os.path.join(tempfile.gettempdir(), f"danaya-metrics-{os.getpid()}")
+)
+
+
+def on_starting(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
+    os.makedirs(metrics_dir, exist_ok=True)
+
+
+def child_exit(server, worker):
+    from prometheus_client import multiprocess
+
+    multiprocess.mark_process_dead(worker.pid, metrics_dir)
+
+
+def on_exit(server):
+    shutil.rmtree(metrics_dir, ignore_errors=True)
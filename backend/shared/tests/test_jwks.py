@@ -0,0 +1,47 @@
+import asyncio
+
+import httpx
+
+from danaya_shared.jwks import KeySet
+
+
+def failing_keyset(min_refresh_gap: float):
+    """A KeySet whose JWKS endpoint always answers 503, and its fetch count"""
+    fetches = []
+
+    def handler(request: httpx.Request) -> httpx.Response:
+        fetches.append(request.url)
+        return httpx.Response(503)
+
+    keys = KeySet("http://auth/.well-known/jwks.json", min_refresh_gap=min_refresh_gap)
+    keys._client = httpx.AsyncClient(transport=httpx.MockTransport(handler))
+    return keys, fetches
+
+
+def test_failed_fetches_respect_min_refresh_gap():
+    async def scenario():
+        keys, fetches = failing_keyset(min_refresh_gap=60)
+        try:
+            results = [await keys.refresh(force=True) for _ in range(50)]
+            results += await asyncio.gather(*(keys.refresh(force=True) for _ in range(50)))
+        finally:
+            await keys.stop()
+        assert not any(results)
+        assert len(fetches) == 1
+
+    asyncio.run(scenario())
+
+
+def test_failed_fetch_is_retried_after_the_gap():
+    async def scenario():
+        keys, fetches = failing_keyset(min_refresh_gap=0.05)
+        try:
+            assert not await keys.refresh(force=True)
+            assert not await keys.refresh(force=True)
+            await asyncio.sleep(0.06)
+            assert not await keys.refresh(force=True)
+        finally:
+            await keys.stop()
+        assert len(fetches) == 2
+
+    asyncio.run(scenario())
@@ -19,6 +19,17 @@ else
     echo "ℹ️  .env file already exists"
 fi
 
+# Generate the JWT signing key auth-service needs (infra/jwt-keys is mounted into it)
+mkdir -p infra/jwt-keys
+if ! ls infra/jwt-keys/*.pem > /dev/null 2>&1; then
+    (umask 077 && openssl genpkey -algorithm RSA -pkeyopt rsa_keygen_bits:2048 \
+        -out "infra/jwt-keys/$(date +%Y%m%d).pem" 2>/dev/null) \
+        && echo "✅ Generated JWT signing key in infra/jwt-keys/" \
+        || echo "❌ Could not generate a JWT signing key (is openssl installed?)"
+else
+    echo "ℹ️  JWT signing key already exists"
+fi
+
 # Check Docker
 if ! command -v docker &> /dev/null; then
     echo "❌ Docker not found. Please install Docker first."
@@ -28,16 +28,17 @@ echo "🔍 Checking service health..."
 check_service() {
     local name=$1
     local url=$2
-    if curl -s "$url" > /dev/null 2>&1; then
-        echo "✅ $name: Running"
+    if curl -sf "$url" > /dev/null 2>&1; then
+        echo "✅ $name: Ready"
     else
         echo "❌ $name: Not responding"
     fi
 }
 
-check_service "Registry  " "http://localhost:8003/health"
-check_service "Auth      " "http://localhost:8001/health"
-check_service "Patient   " "http://localhost:8002/health"
+check_service "Registry  " "http://localhost:8003/health/ready"
+check_service "Auth      " "http://localhost:8001/health/ready"
+check_service "Patient   " "http://localhost:8002/health/ready"
+check_service "Appointment" "http://localhost:8004/health/ready"
 check_service "Frontend  " "http://localhost:3000"
 
 echo ""
@@ -47,6 +48,7 @@ echo "🌐 Frontend:        http://localhost:3000"
 echo "🔐 Auth API:        http://localhost:8001/docs"
 echo "👥 Patient API:     http://localhost:8002/docs"
 echo "🏥 Registry API:    http://localhost:8003/docs"
+echo "🗓️ Appointment API: http://localhost:8004/docs"
 echo ""
 echo "📊 Monitor logs:    docker compose logs -f"
 echo "🛑 Stop platform:   docker compose down"